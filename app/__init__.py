@@ -1,7 +1,15 @@
 """
 App Package Initialization
+Import lười (PEP 562): chỉ nạp app/server khi thực sự dùng tới
 """
-from app.app import create_app
-from app.server import start_server
 
-__all__ = ['create_app', 'start_server']
\ No newline at end of file
+__all__ = ['create_app', 'start_server']
+
+def __getattr__(name):
+    if name == 'create_app':
+        from app.app import create_app
+        return create_app
+    if name == 'start_server':
+        from app.server import start_server
+        return start_server
+    raise AttributeError(f"module 'app' has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,228 @@
+"""
+Admission Control - Giới hạn việc đắt chạy cùng lúc theo từng tầng, quá tải thì từ chối sớm
+
+- Mỗi tầng (OCR, LLM, ghi storage) có số slot cố định và hàng đợi có giới hạn
+- Hàng đợi đầy / chờ quá ADMISSION_MAX_WAIT: trả 503 + Retry-After ngay (không để mọi request
+  cùng chậm rồi cùng timeout)
+- Lớp ưu tiên theo route: slot trống được trao cho việc ưu tiên cao nhất đang chờ, hàng đợi đầy thì
+  việc ưu tiên cao đẩy việc ưu tiên thấp nhất ra (vd. hoàn thành nhắc nhở trước phân tích nhật ký)
+- Chờ slot không quá deadline của request (app/deadline.py): hết thì DeadlineExceeded (504) thay vì 503
+- Chỉ dùng trong event loop (không cần khóa); việc chặn (tesseract, ghi file) chạy trong threadpool khi đã có slot
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, List, Optional
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from app.config import (
+    OCR_SLOTS, OCR_QUEUE_SIZE, LLM_SLOTS, LLM_QUEUE_SIZE,
+    STORAGE_WRITE_SLOTS, STORAGE_WRITE_QUEUE_SIZE, ADMISSION_MAX_WAIT
+)
+from app.deadline import remaining, exceeded
+from app.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT, ADMISSION_REJECTED
+
+# Lớp ưu tiên (số nhỏ = ưu tiên cao)
+PRIORITY_CRITICAL = 0  # Nhắc nhở: hoàn thành, ack/snooze, tạo chuỗi
+PRIORITY_INTERACTIVE = 1  # Mặc định: chat, ký ức, hồ sơ, sức khỏe...
+PRIORITY_BATCH = 2  # Ảnh -> OCR -> phân tích nhật ký/ghi chú
+PRIORITY_NAMES = {PRIORITY_CRITICAL: "critical", PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch"}
+
+# Tiền tố path -> lớp ưu tiên (khớp tiền tố đầu tiên)
+_ROUTE_PRIORITIES = (
+    ("/reminders", PRIORITY_CRITICAL),
+    ("/entry", PRIORITY_BATCH),
+)
+
+_current_priority: ContextVar[int] = ContextVar("priority", default=PRIORITY_INTERACTIVE)
+
+class Overloaded(HTTPException):
+    """Tầng đang quá tải: 503 kèm Retry-After (giây)"""
+
+    def __init__(self, stage: str, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail=f"Máy chủ đang bận ({stage}), vui lòng thử lại sau {retry_after} giây",
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.stage = stage
+        self.retry_after = retry_after
+
+def current_priority() -> int:
+    return _current_priority.get()
+
+@contextmanager
+def use_priority(priority: int):
+    """Chạy một đoạn code với lớp ưu tiên cho trước (tác vụ nền)"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+def route_priority(path: str) -> int:
+    for prefix, priority in _ROUTE_PRIORITIES:
+        if path.startswith(prefix):
+            return priority
+    return PRIORITY_INTERACTIVE
+
+class AdmissionMiddleware:
+    """ASGI middleware gắn lớp ưu tiên của route vào ContextVar (HTTP và WebSocket)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        token = _current_priority.set(route_priority(scope.get("path", "")))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_priority.reset(token)
+
+class Stage:
+    """
+    Một tầng tài nguyên: tối đa `slots` việc cùng lúc, tối đa `queue_size` việc chờ
+
+    Slot được trao thẳng cho việc chờ ưu tiên cao nhất (cùng lớp thì đến trước được trước),
+    Retry-After ước lượng từ thời gian giữ slot trung bình và độ dài hàng đợi
+    """
+
+    def __init__(self, name: str, slots: int, queue_size: int, max_wait: float = ADMISSION_MAX_WAIT):
+        self.name = name
+        self.slots = max(slots, 1)
+        self.queue_size = max(queue_size, 0)
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: List[List[Any]] = []  # heap [ưu tiên, seq, future]; future bị hủy = đã rời hàng
+        self._waiting = 0
+        self._seq = itertools.count()
+        self._avg_hold = 1.0  # Giây giữ slot trung bình (trung bình trượt)
+
+    def retry_after(self) -> int:
+        """Số giây gợi ý client chờ trước khi thử lại"""
+        seconds = (self._waiting + 1) * self._avg_hold / self.slots
+        return min(max(math.ceil(seconds), 1), 60)
+
+    def _reject(self, reason: str, priority: int) -> Overloaded:
+        ADMISSION_REJECTED.inc(stage=self.name, reason=reason, priority=PRIORITY_NAMES.get(priority, str(priority)))
+        return Overloaded(self.name, self.retry_after())
+
+    def _update_gauges(self):
+        ADMISSION_ACTIVE.set(self.active, stage=self.name)
+        ADMISSION_QUEUE_DEPTH.set(self._waiting, stage=self.name)
+
+    def _worst_waiter(self) -> Optional[List[Any]]:
+        """Việc chờ ưu tiên thấp nhất, đến sau cùng (bị đẩy ra khi hàng đợi đầy)"""
+        live = [entry for entry in self._waiters if not entry[2].done()]
+        return max(live, key=lambda entry: (entry[0], entry[1])) if live else None
+
+    def has_free_slot(self) -> bool:
+        """Có slot trống ngay (không ai đang chờ): acquire() không phải xếp hàng"""
+        return self.active < self.slots and not self._waiting
+
+    def would_admit(self, priority: Optional[int] = None) -> bool:
+        """Có nhận thêm việc với lớp ưu tiên này không (kiểm tra sớm, trước khi bắt đầu request)"""
+        priority = current_priority() if priority is None else priority
+        if self.active < self.slots or self._waiting < self.queue_size:
+            return True
+        worst = self._worst_waiter()
+        return worst is not None and worst[0] > priority
+
+    async def acquire(self):
+        priority = current_priority()
+        if self.active < self.slots and not self._waiting:
+            self.active += 1
+            self._update_gauges()
+            ADMISSION_WAIT.observe(0, stage=self.name)
+            return
+
+        if self._waiting >= self.queue_size:
+            worst = self._worst_waiter()
+            if worst is None or worst[0] <= priority:
+                raise self._reject("queue_full", priority)
+            # Đẩy việc ưu tiên thấp nhất ra để nhường chỗ
+            worst[2].set_exception(self._reject("displaced", worst[0]))
+            self._waiting -= 1
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._seq), future])
+        self._waiting += 1
+        self._update_gauges()
+        start = time.perf_counter()
+        # Không chờ quá deadline của request
+        left = remaining()
+        by_deadline = left is not None and left < self.max_wait
+        try:
+            await asyncio.wait({future}, timeout=max(left, 0) if by_deadline else self.max_wait)
+        except BaseException:
+            # Request bị hủy (client ngắt kết nối) lúc đang chờ
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release(hold=None)  # Slot đã được trao: chuyển tiếp cho việc khác
+            elif not future.done():
+                future.cancel()
+                self._waiting -= 1
+                self._update_gauges()
+            raise
+
+        if not future.done():
+            future.cancel()
+            self._waiting -= 1
+            self._update_gauges()
+            if by_deadline:
+                raise exceeded(self.name)
+            raise self._reject("timeout", priority)
+        future.result()  # Bị đẩy ra: raise Overloaded
+        ADMISSION_WAIT.observe(time.perf_counter() - start, stage=self.name)
+
+    def release(self, hold: Optional[float]):
+        """Trả slot: trao thẳng cho việc chờ ưu tiên cao nhất nếu có"""
+        if hold is not None:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * hold
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            future.set_result(None)
+            self._waiting -= 1
+            self._update_gauges()
+            return
+        self.active -= 1
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(self):
+        """async with stage.slot(): ... - giữ một slot (Overloaded nếu quá tải)"""
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Chạy hàm chặn (ghi file, tesseract) trong threadpool khi đã có slot"""
+        async with self.slot():
+            return await run_in_threadpool(func, *args, **kwargs)
+
+class Admission:
+    """Các tầng dùng chung trong process"""
+
+    ocr = Stage("ocr", OCR_SLOTS, OCR_QUEUE_SIZE)
+    llm = Stage("llm", LLM_SLOTS, LLM_QUEUE_SIZE)
+    storage = Stage("storage", STORAGE_WRITE_SLOTS, STORAGE_WRITE_QUEUE_SIZE)
+
+    @staticmethod
+    def admit(*stages: Stage):
+        """Từ chối ngay (Overloaded) nếu một tầng request sẽ cần đang đầy - trước khi nhận upload/tốn công"""
+        priority = current_priority()
+        for stage in stages:
+            if not stage.would_admit(priority):
+                raise stage._reject("admission", priority)
@@ -1,15 +1,81 @@
 """
 FastAPI Application Setup
 """
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.config import API_TITLE, API_VERSION
+from app.admission import AdmissionMiddleware
+from app.capture import TrafficCaptureMiddleware
+from app.deadline import DeadlineMiddleware
+from app.config import (
+    API_TITLE, API_VERSION, WARMUP_ENABLED, WARMUP_DELAY, REMINDER_SCHEDULER_ENABLED,
+    DIGEST_SCHEDULER_ENABLED
+)
+from app.idempotency import IdempotencyMiddleware
+from app.metrics import MetricsMiddleware
+from app.profiling import ProfilingMiddleware
+from app.tenancy import TenantMiddleware
+from app.services.digest_service import DigestService
+from app.services.enrichment_service import EnrichmentService
+from app.services.reminder_service import ReminderService
+from app.services.upload_service import UploadLimitMiddleware
+from app.services.usage_service import LLMUsageService
+from app.warmup import warm_up_in_background
 from app import routes
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Khởi động/tắt các tác vụ nền của ứng dụng"""
+    warmup_task = None
+    if WARMUP_ENABLED:
+        # Server mở cổng ngay, module nặng và cache được nạp trong nền
+        warmup_task = asyncio.create_task(warm_up_in_background(WARMUP_DELAY))
+    
+    scheduler_task = None
+    if REMINDER_SCHEDULER_ENABLED:
+        # Đẩy nhắc nhở đến hạn cho client /reminders/stream
+        scheduler_task = asyncio.create_task(ReminderService.run())
+    
+    # Chạy lại các bước làm giàu bị hoãn vì hết deadline (tóm tắt, phân tích ghi chú...)
+    enrichment_task = asyncio.create_task(EnrichmentService.run())
+    
+    # Ghi định kỳ sổ cái token Groq (/admin/llm-usage, ngân sách ngày)
+    usage_task = asyncio.create_task(LLMUsageService.run())
+    
+    digest_task = None
+    if DIGEST_SCHEDULER_ENABLED:
+        # Tóm tắt ngày hôm trước của từng người dùng vào giờ thấp điểm (/digest)
+        digest_task = asyncio.create_task(DigestService.run())
+    
+    yield
+    
+    for task in (warmup_task, scheduler_task, enrichment_task, usage_task, digest_task):
+        if task and not task.done():
+            task.cancel()
+    
+    # Phần sổ cái chưa ghi
+    try:
+        LLMUsageService.flush()
+    except Exception as e:
+        print(f"Error flushing LLM usage: {e}")
+
 def create_app() -> FastAPI:
     """Tạo và cấu hình FastAPI application"""
     
-    app = FastAPI(title=API_TITLE, version="3.0.0")
+    app = FastAPI(title=API_TITLE, version="3.0.0", lifespan=lifespan)
+    
+    # Idempotency-Key: gửi lại /entry, /chat... nhận kết quả cũ (thêm trước TenantMiddleware để chạy bên trong, biết tenant)
+    app.add_middleware(IdempotencyMiddleware)
+    
+    # Tenant (user id) của request -> thư mục dữ liệu riêng; thêm trước CORS để preflight không cần user id
+    app.add_middleware(TenantMiddleware)
+    
+    # Lớp ưu tiên của route cho admission control (quá tải: 503 + Retry-After, việc ưu tiên thấp bị từ chối trước)
+    app.add_middleware(AdmissionMiddleware)
+    
+    # Deadline của request (/entry, /chat hoặc header X-Request-Timeout), tính từ lúc nhận request
+    app.add_middleware(DeadlineMiddleware)
     
     # Cấu hình CORS
     app.add_middleware(
@@ -20,9 +86,22 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     
+    # Từ chối sớm upload quá lớn: theo Content-Length, hoặc đếm byte trên luồng nhận (chunked), trước khi parse multipart
+    app.add_middleware(UploadLimitMiddleware)
+    
+    # Profile request được chọn mẫu hoặc có header X-Debug-Profile
+    app.add_middleware(ProfilingMiddleware)
+    
+    # Ghi traffic thật để phát lại khi đo tải (CAPTURE_TRAFFIC=1)
+    app.add_middleware(TrafficCaptureMiddleware)
+    
+    # Đo latency/status của mọi request (/metrics) - thêm sau cùng để bọc ngoài cùng
+    app.add_middleware(MetricsMiddleware)
+    
     # Đăng ký routes
     app.get("/")(routes.root)
     app.get("/test-ai")(routes.test_ai_connection)
+    app.get("/metrics")(routes.metrics)
     
     # OCR
     app.post("/ocr")(routes.extract_text_from_image)
@@ -30,11 +109,18 @@ def create_app() -> FastAPI:
     # Diary & Note
     app.post("/entry")(routes.create_entry)
     app.get("/diaries")(routes.list_diaries)
+    app.get("/diaries/{diary_id}")(routes.get_diary)
+    app.get("/diaries/{diary_id}/image")(routes.get_diary_image)
     app.get("/notes")(routes.list_notes)
+    app.get("/notes/{note_id}")(routes.get_note)
     
     # Reminders
     app.get("/reminders")(routes.list_reminders)
     app.put("/reminders/{reminder_id}/complete")(routes.complete_reminder)
+    app.post("/reminders/series")(routes.create_reminder_series)
+    app.post("/reminders/series/medications")(routes.create_medication_series)
+    app.websocket("/reminders/stream")(routes.reminder_stream)
+    app.get("/reminders/{reminder_id}")(routes.get_reminder)
     
     # User Profile
     app.get("/profile")(routes.get_profile)
@@ -51,5 +137,20 @@ def create_app() -> FastAPI:
     # Memory
     app.post("/memory")(routes.save_memory)
     app.get("/memories")(routes.list_memories)
+    app.get("/memories/tags")(routes.list_memory_tags)
+    app.get("/memories/{memory_id}")(routes.get_memory)
+    
+    # Search
+    app.get("/search")(routes.search)
+    
+    # Timeline
+    app.get("/timeline")(routes.timeline)
+    app.get("/digest")(routes.get_digest)
+    
+    # Admin
+    app.get("/admin/profiles")(routes.list_profiles)
+    app.get("/admin/profiles/{profile_id}")(routes.download_profile)
+    app.get("/admin/profiles/{profile_id}/flamegraph")(routes.download_flamegraph)
+    app.get("/admin/llm-usage")(routes.llm_usage)
     
     return app
\ No newline at end of file
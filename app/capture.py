@@ -0,0 +1,235 @@
+"""
+Traffic Capture
+Ghi lại request thật (metadata + body) và phản hồi Groq vào trace JSONL để phát lại
+bằng bench/replay.py. File upload được tách khỏi multipart và lưu một lần theo sha256.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, parse_qsl, urlencode
+from app.config import (
+    CAPTURE_DIR, CAPTURE_ENABLED, CAPTURE_MAX_BODY, TENANT_HEADER, TENANT_TOKEN_HEADER, DEADLINE_HEADER
+)
+
+# Header cần cho việc phát lại (không ghi token/cookie): deadline của client; tenant ghi riêng
+# thành "user_id" (token ký HMAC không hết hạn - replay.py ký lại bằng --tenant-secret)
+CAPTURED_HEADERS = {
+    b"content-type", b"accept", b"if-none-match", b"range", b"idempotency-key", DEADLINE_HEADER.lower().encode()
+}
+SKIP_PATH_PREFIXES = ("/metrics", "/admin")
+TEXT_CONTENT_TYPES = ("application/json", "application/x-www-form-urlencoded", "text/")
+
+_PARAM_RE = re.compile(r'(\w+)="?([^";]*)"?')
+
+def _user_id(scope) -> Optional[str]:
+    """User id của request (X-User-Id hoặc phần user id trong token, không kiểm chữ ký), None nếu không có"""
+    headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope.get("headers", [])}
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    authorization = headers.get("authorization", "")
+    token = (
+        headers.get(TENANT_TOKEN_HEADER.lower())
+        or (authorization[7:] if authorization.lower().startswith("bearer ") else "")
+        or query.get("token", [""])[0]
+    )
+    if token:
+        return token.rpartition(".")[0] or None
+    return headers.get(TENANT_HEADER.lower()) or query.get("user_id", [""])[0] or None
+
+def _redacted_query(scope) -> str:
+    """Query string bỏ ?token="""
+    query = scope.get("query_string", b"").decode("latin-1")
+    if "token=" not in query:
+        return query
+    return urlencode([(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k != "token"])
+
+class _CaptureContext:
+    def __init__(self):
+        self.llm: List[Dict] = []
+
+_active_capture: ContextVar[Optional[_CaptureContext]] = ContextVar("active_capture", default=None)
+
+def llm_key(messages: List[Dict]) -> str:
+    """Khóa tra cứu phản hồi đã ghi (theo toàn bộ messages gửi lên Groq)"""
+    return hashlib.sha256(json.dumps(messages, ensure_ascii=False, sort_keys=True).encode()).hexdigest()[:32]
+
+def system_key(system_prompt: str) -> str:
+    """Khóa theo system prompt (mỗi loại tác vụ AI một system prompt riêng)"""
+    return hashlib.sha256(system_prompt.encode()).hexdigest()[:32]
+
+def record_llm_exchange(messages: List[Dict], content: str, duration: float):
+    """
+    Ghi một lần gọi Groq thành công vào trace của request hiện tại (nếu đang capture)
+
+    Args:
+        messages: Messages đã gửi
+        content: Nội dung trả về
+        duration: Số giây chờ Groq
+    """
+    ctx = _active_capture.get()
+    if ctx is not None:
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        ctx.llm.append({
+            "key": llm_key(messages),
+            "system_key": system_key(system),
+            "content": content,
+            "latency_ms": round(duration * 1000, 3)
+        })
+
+# ========== TRACE STORE ==========
+
+def _header_params(value: str) -> Dict[str, str]:
+    return {k.lower(): v for k, v in _PARAM_RE.findall(value)}
+
+class TraceStore:
+    """Ghi trace vào CAPTURE_DIR: mỗi process một file JSONL theo ngày, file upload trong blobs/"""
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def trace_path():
+        return CAPTURE_DIR / f"trace_{datetime.now().strftime('%Y%m%d')}_{os.getpid()}.jsonl"
+
+    @staticmethod
+    def save_blob(data: bytes) -> str:
+        """Lưu nội dung theo sha256 (bỏ qua nếu đã có), trả về hash"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = CAPTURE_DIR / "blobs" / digest
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return digest
+
+    @staticmethod
+    def encode_body(body: bytes, content_type: str) -> Optional[Dict]:
+        """
+        Mô tả body để phát lại:
+        - multipart: {"parts": [{"name", "value"} | {"name", "filename", "content_type", "blob"}]}
+        - JSON/form/text: {"text": ...}
+        - khác: {"blob": sha256}
+        """
+        if not body:
+            return None
+        if content_type.startswith("multipart/form-data"):
+            boundary = _header_params(content_type).get("boundary")
+            if boundary:
+                return {"parts": TraceStore._split_multipart(body, boundary.encode("latin-1"))}
+        if content_type.startswith(TEXT_CONTENT_TYPES):
+            try:
+                return {"text": body.decode("utf-8")}
+            except UnicodeDecodeError:
+                pass
+        return {"blob": TraceStore.save_blob(body)}
+
+    @staticmethod
+    def _split_multipart(body: bytes, boundary: bytes) -> List[Dict]:
+        parts = []
+        for chunk in body.split(b"--" + boundary)[1:]:
+            if chunk.startswith(b"--"):
+                break
+            head, _, content = chunk.removeprefix(b"\r\n").partition(b"\r\n\r\n")
+            content = content.removesuffix(b"\r\n")
+            headers = {}
+            for line in head.decode("utf-8", "replace").split("\r\n"):
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            params = _header_params(headers.get("content-disposition", ""))
+            if "filename" in params:
+                parts.append({
+                    "name": params.get("name", ""),
+                    "filename": params["filename"],
+                    "content_type": headers.get("content-type", "application/octet-stream"),
+                    "blob": TraceStore.save_blob(content)
+                })
+            else:
+                parts.append({"name": params.get("name", ""), "value": content.decode("utf-8", "replace")})
+        return parts
+
+    @staticmethod
+    def write(record: Dict, body: bytes):
+        """Ghi một request (gọi trong executor)"""
+        CAPTURE_DIR.mkdir(parents=True, exist_ok=True)
+        encoded = TraceStore.encode_body(body, record["headers"].get("content-type", ""))
+        if encoded is not None:
+            record["body"] = encoded
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with TraceStore._lock:
+            with open(TraceStore.trace_path(), 'a', encoding='utf-8') as f:
+                f.write(line)
+
+# ========== MIDDLEWARE ==========
+
+class TrafficCaptureMiddleware:
+    """ASGI middleware ghi mọi request (trừ /metrics, /admin) vào trace khi CAPTURE_TRAFFIC=1"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not CAPTURE_ENABLED or scope["path"].startswith(SKIP_PATH_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        chunks: List[bytes] = []
+        size = 0
+        truncated = False
+        status = 500
+
+        async def receive_and_record():
+            nonlocal size, truncated
+            message = await receive()
+            if message["type"] == "http.request" and not truncated:
+                body = message.get("body", b"")
+                size += len(body)
+                if size > CAPTURE_MAX_BODY:
+                    truncated = True
+                    chunks.clear()
+                else:
+                    chunks.append(body)
+            return message
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        ctx = _CaptureContext()
+        token = _active_capture.set(ctx)
+        wall_time = time.time()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_and_record, send_and_record)
+        finally:
+            duration = time.perf_counter() - start
+            _active_capture.reset(token)
+
+            record = {
+                "ts": round(wall_time, 6),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": _redacted_query(scope),
+                "user_id": _user_id(scope),
+                "route": getattr(scope.get("route"), "path", None),
+                "headers": {
+                    name.decode("latin-1"): value.decode("latin-1")
+                    for name, value in scope.get("headers", []) if name in CAPTURED_HEADERS
+                },
+                "status": status,
+                "duration_ms": round(duration * 1000, 3),
+                "llm": ctx.llm
+            }
+            if truncated:
+                record["body_truncated"] = size
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, TraceStore.write, record, b"".join(chunks))
+            except Exception as e:
+                print(f"Error writing traffic capture: {e}")
@@ -3,21 +3,27 @@ Configuration Settings
 """
 import os
 from pathlib import Path
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# Load environment variables (chỉ import python-dotenv khi có file .env)
+ENV_FILE = Path(__file__).resolve().parent.parent / ".env"
+if ENV_FILE.exists() or Path(".env").exists():
+    from dotenv import load_dotenv
+    load_dotenv(ENV_FILE if ENV_FILE.exists() else Path(".env"))
 
 # API Keys
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 NGROK_TOKEN = os.getenv("NGROK_TOKEN", "")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # Bắt buộc cho các endpoint /admin/*, để trống = tắt
+
+# Server Configuration
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))  # Số process uvicorn, mỗi worker dùng một core
 
 # Tesseract Configuration
 TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
-# Storage Configuration
+# Storage Configuration (thư mục được tạo khi ghi lần đầu)
 STORAGE_DIR = Path("storage")
-STORAGE_DIR.mkdir(exist_ok=True)
 DIARY_FILE = STORAGE_DIR / "diaries.json"
 MEMORY_FILE = STORAGE_DIR / "memories.json"
 NOTE_FILE = STORAGE_DIR / "notes.json"
@@ -25,6 +31,133 @@ REMINDER_FILE = STORAGE_DIR / "reminders.json"
 USER_PROFILE_FILE = STORAGE_DIR / "user_profile.json"
 HEALTH_LOG_FILE = STORAGE_DIR / "health_logs.json"
 CONVERSATION_FILE = STORAGE_DIR / "conversations.json"
+IMAGE_DIR = STORAGE_DIR / "images"  # Ảnh gốc lưu theo hash nội dung
+IMAGE_CACHE_DIR = STORAGE_DIR / "image_cache"  # Ảnh thu nhỏ sinh ra khi cần
+PROFILE_DIR = STORAGE_DIR / "profiles"  # Vòng đệm profile request
+CAPTURE_DIR = STORAGE_DIR / "captures"  # Trace traffic thật (bench/replay.py)
+TENANT_DIR = STORAGE_DIR / "tenants"  # Dữ liệu từng người dùng: tenants/<2 ký tự băm>/<user id>/diaries.json...
+TIMELINE_FILE = STORAGE_DIR / "timeline.json"  # Tổng hợp theo ngày/tuần (cảm xúc, số nhật ký...) cho /timeline, theo tenant
+DIGEST_FILE = STORAGE_DIR / "digests.json"  # Bản tóm tắt từng ngày (job ban đêm) cho /digest, theo tenant
+DIGEST_CHECKPOINT_FILE = STORAGE_DIR / "digest_checkpoint.json"  # Tiến độ job tóm tắt (tenant đã xong/lỗi), chạy lại sau crash
+
+# Multi-tenant Configuration - một process phục vụ nhiều gia đình, mỗi người dùng một thư mục dữ liệu
+TENANT_HEADER = "X-User-Id"  # Request không có user id dùng dữ liệu cũ ngay trong STORAGE_DIR
+TENANT_TOKEN_HEADER = "X-User-Token"  # Token "<user id>.<chữ ký>" (hoặc Authorization: Bearer ...)
+TENANT_SECRET = os.getenv("TENANT_SECRET", "")  # Có = chỉ nhận token ký HMAC, không tin X-User-Id
+TENANT_REQUIRED = os.getenv("TENANT_REQUIRED", "0") == "1"  # 1 = từ chối (401) request dữ liệu không có user id
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "256"))  # Số tenant giữ index trong bộ nhớ (mỗi loại index)
+TENANT_IDLE_SECONDS = float(os.getenv("TENANT_IDLE_SECONDS", "1800"))  # Tenant không dùng lâu hơn thế bị giải phóng khỏi bộ nhớ
+
+# Admission Control - giới hạn việc đắt chạy cùng lúc; quá tải thì trả 503 + Retry-After ngay thay vì chậm rồi lỗi
+OCR_SLOTS = int(os.getenv("OCR_SLOTS", str(os.cpu_count() or 2)))  # Tesseract chạy song song tối đa (mỗi lượt ~1 core)
+OCR_QUEUE_SIZE = int(os.getenv("OCR_QUEUE_SIZE", "16"))  # Số việc được chờ slot, đầy thì từ chối
+LLM_SLOTS = int(os.getenv("LLM_SLOTS", "8"))  # Request Groq đang chờ phản hồi cùng lúc
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "32"))
+STORAGE_WRITE_SLOTS = int(os.getenv("STORAGE_WRITE_SLOTS", "4"))  # Thread ghi file cùng lúc
+STORAGE_WRITE_QUEUE_SIZE = int(os.getenv("STORAGE_WRITE_QUEUE_SIZE", "64"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))  # Giây chờ slot tối đa trước khi trả 503
+
+# Idempotency - client gửi lại (sau timeout) cùng Idempotency-Key thì nhận lại kết quả cũ, không OCR/gọi Groq/lưu lần nữa
+IDEMPOTENCY_DIR = STORAGE_DIR / "idempotency"  # Kết quả đã lưu: một file mỗi key (theo tenant)
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))  # Giây giữ kết quả để phát lại
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "120"))  # Giây tối đa request trùng chờ lần xử lý đang chạy
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "300"))  # Khóa "đang xử lý" cũ hơn = process đã chết
+IDEMPOTENCY_MAX_BODY = int(os.getenv("IDEMPOTENCY_MAX_BODY", str(1024 * 1024)))  # Phản hồi lớn hơn không lưu
+
+# Deadline - thời gian tối đa của một request, truyền xuống OCR và mọi lần gọi Groq
+# Hết ngân sách thì bỏ qua bước làm giàu (tóm tắt, cảm xúc, phân tích ghi chú), lưu bản ghi và bổ sung sau
+DEADLINE_HEADER = "X-Request-Timeout"  # Client gửi số giây sẵn sàng chờ (vd. 5 hoặc 2.5)
+DEADLINE_ENTRY = float(os.getenv("DEADLINE_ENTRY", "10"))  # Mặc định cho /entry (giây)
+DEADLINE_CHAT = float(os.getenv("DEADLINE_CHAT", "8"))  # Mặc định cho /chat (giây)
+DEADLINE_MAX = 60.0  # Header lớn hơn bị chặn về mức này
+DEADLINE_RESERVE = 0.3  # Giây giữ lại để lưu bản ghi và trả phản hồi
+DEADLINE_MIN_OCR = 0.5  # Còn ít hơn thì không chạy tesseract (504)
+DEADLINE_MIN_LLM = 1.0  # Còn ít hơn thì không gọi Groq (bước đó được bổ sung sau)
+DEFERRED_FILE = STORAGE_DIR / "deferred.jsonl"  # Hàng đợi bước làm giàu bị hoãn (tenant, bản ghi, bước)
+DEFERRED_RETRY_SECONDS = float(os.getenv("DEFERRED_RETRY_SECONDS", "300"))  # Chu kỳ chạy lại bước hoãn chưa xong
+
+# LLM Usage Ledger - token Groq theo tính năng, người dùng, giờ; vượt ngân sách ngày thì tắt trước tính năng không thiết yếu
+LLM_USAGE_DIR = STORAGE_DIR / "llm_usage"  # Mỗi ngày một file JSONL, mỗi dòng = lượng dùng cộng dồn của (giờ, user, tính năng, model, cache)
+LLM_USAGE_FLUSH_SECONDS = float(os.getenv("LLM_USAGE_FLUSH_SECONDS", "60"))  # Chu kỳ ghi phần cộng dồn xuống đĩa
+LLM_USAGE_RETENTION_DAYS = int(os.getenv("LLM_USAGE_RETENTION_DAYS", "90"))
+LLM_DAILY_TOKEN_BUDGET = int(os.getenv("LLM_DAILY_TOKEN_BUDGET", "0"))  # Tổng token/ngày mọi tính năng (0 = không giới hạn)
+LLM_DEGRADE_RATIO = float(os.getenv("LLM_DEGRADE_RATIO", "0.8"))  # Tổng vượt tỉ lệ này của ngân sách thì tắt tính năng không thiết yếu
+LLM_FEATURES = ("summary", "emotion", "note_analysis", "chat", "health_insight", "memory_prompt", "digest")
+LLM_FEATURE_BUDGETS = {  # Token/ngày theo tính năng (0 = không giới hạn), env LLM_BUDGET_SUMMARY, LLM_BUDGET_CHAT...
+    feature: int(os.getenv(f"LLM_BUDGET_{feature.upper()}", "0")) for feature in LLM_FEATURES
+}
+LLM_NONCRITICAL_FEATURES = ("memory_prompt", "health_insight", "digest")  # Bị tắt (trả lời mặc định) khi có ngân sách bị vượt
+
+# Startup Configuration
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"  # Nạp trước module nặng/cache sau khi mở cổng
+WARMUP_DELAY = float(os.getenv("WARMUP_DELAY", "0.5"))  # Giây chờ trước khi warm-up
+
+# Profiling Configuration
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # Tỉ lệ request được profile ngẫu nhiên (0 = tắt)
+PROFILE_INTERVAL = 0.005  # Giây giữa hai lần lấy mẫu stack
+PROFILE_RING_SIZE = int(os.getenv("PROFILE_RING_SIZE", "50"))  # Số profile giữ lại trên đĩa
+
+# Traffic Capture Configuration (chứa dữ liệu cá nhân - chỉ bật khi cần đo tải)
+CAPTURE_ENABLED = os.getenv("CAPTURE_TRAFFIC", "0") == "1"
+CAPTURE_MAX_BODY = int(os.getenv("CAPTURE_MAX_BODY", str(25 * 1024 * 1024)))  # Body lớn hơn thì chỉ ghi metadata
+
+# Upload Configuration
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))  # Tối đa 20 MB/ảnh
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", str(1024 * 1024)))  # Trên 1 MB thì ghi ra file tạm
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Image Derivatives Configuration
+IMAGE_SIZES = {
+    "thumb": 320,    # Cạnh dài tối đa (px) cho timeline
+    "medium": 1280   # Xem chi tiết trên điện thoại
+}
+IMAGE_QUALITY = 80
+IMAGE_CACHE_MAX_AGE = 7 * 24 * 3600  # Giây, ảnh của một nhật ký không đổi sau khi tạo
+
+# Search Configuration
+SEARCH_BM25_K1 = 1.2
+SEARCH_BM25_B = 0.75
+SEARCH_MAX_LIMIT = 50
+SEARCH_SNIPPET_CHARS = 160  # Độ dài đoạn trích quanh từ khớp
+
+# Retrieval (RAG) Configuration - ngữ cảnh liên quan cho chat và gợi nhớ
+VECTOR_DIMENSIONS = int(os.getenv("VECTOR_DIMENSIONS", "512"))  # Số chiều vector băm (lũy thừa của 2), 2 KB/bản ghi
+RAG_TOP_K = 5  # Số đoạn liên quan tối đa trong một prompt
+RAG_TOKEN_BUDGET = int(os.getenv("RAG_TOKEN_BUDGET", "400"))  # Token tối đa dành cho các đoạn liên quan
+RAG_SNIPPET_CHARS = 300  # Độ dài tối đa mỗi đoạn
+RAG_MIN_SIMILARITY = 0.1  # Cosine tối thiểu để coi là liên quan
+
+# Near-duplicate Note Configuration - ảnh chụp lại cùng một tờ giấy không gọi lại Groq
+NOTE_DUPLICATE_THRESHOLD = float(os.getenv("NOTE_DUPLICATE_THRESHOLD", "0.8"))  # Độ tương đồng Jaccard (ước lượng MinHash)
+NOTE_DUPLICATE_WINDOW_HOURS = float(os.getenv("NOTE_DUPLICATE_WINDOW_HOURS", "72"))  # Chỉ so với ghi chú trong khoảng này
+NOTE_SHINGLE_CHARS = 5  # Độ dài shingle ký tự (chịu được lỗi OCR lẻ tẻ tốt hơn shingle theo từ)
+NOTE_LSH_BANDS = 16  # MinHash = NOTE_LSH_BANDS x NOTE_LSH_ROWS hàm băm
+NOTE_LSH_ROWS = 4
+
+# Reminder Scheduler Configuration - đẩy nhắc nhở đến hạn qua WebSocket /reminders/stream
+REMINDER_SCHEDULER_ENABLED = os.getenv("REMINDER_SCHEDULER", "1") == "1"
+REMINDER_POLL_SECONDS = 1.0  # Chu kỳ kiểm tra reminders.json đổi do worker khác ghi
+REMINDER_MISSED_GRACE_SECONDS = 3600  # Quá hạn lâu hơn thế (vd. server tắt) thì không đẩy, chỉ gửi trong danh sách quá hạn
+REMINDER_SNOOZE_MINUTES = 10  # Mặc định khi client gửi snooze không kèm số phút
+REMINDER_MAX_SNOOZE_MINUTES = 24 * 60
+REMINDER_OVERDUE_LIMIT = 50  # Số nhắc nhở quá hạn gửi khi client vừa kết nối
+REMINDER_OVERDUE_HOURS = 24  # Chuỗi lặp: chỉ coi các lần trong khoảng này là quá hạn
+REMINDER_LIST_DAYS = 7  # /reminders mặc định trải chuỗi lặp từ đầu hôm nay tới N ngày sau
+
+# Timeline - tổng hợp cập nhật mỗi lần ghi nhật ký/ghi chú/sức khỏe/nhắc nhở, /timeline đọc thẳng không quét dữ liệu gốc
+TIMELINE_GRANULARITIES = ("day", "week")
+TIMELINE_DEFAULT_BUCKETS = {"day": 30, "week": 12}  # Khoảng mặc định khi không có from
+TIMELINE_MAX_BUCKETS = 400  # Số bucket tối đa một lần hỏi
+
+# Daily Digest - job giờ thấp điểm: mỗi người dùng một lần gọi Groq tóm tắt cả ngày hôm trước (/digest)
+DIGEST_SCHEDULER_ENABLED = os.getenv("DIGEST_SCHEDULER", "1") == "1"
+DIGEST_HOUR = int(os.getenv("DIGEST_HOUR", "2"))  # Giờ bắt đầu chạy (giờ server), tóm tắt ngày hôm trước
+DIGEST_WINDOW_HOURS = int(os.getenv("DIGEST_WINDOW_HOURS", "4"))  # Chỉ chạy/chạy tiếp trong khoảng này, ngoài giờ thì chờ hôm sau
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "4"))  # Số người dùng xử lý cùng lúc (mỗi người một lời gọi Groq)
+DIGEST_CHECK_SECONDS = float(os.getenv("DIGEST_CHECK_SECONDS", "300"))  # Chu kỳ kiểm tra tới giờ chạy / còn người dùng lỗi cần thử lại
+DIGEST_MAX_ATTEMPTS = 3  # Một người dùng lỗi (Groq lỗi, quá tải) quá số lần này trong ngày thì bỏ qua
+DIGEST_LOCK_TIMEOUT = 1800  # Giây, khóa job không được làm mới lâu hơn thế = worker giữ khóa đã chết
+DIGEST_MAX_ITEMS = 20  # Số mục tối đa mỗi loại (nhật ký, ghi chú...) đưa vào prompt
 
 # API Configuration
 API_TITLE = "Memory & Diary OCR API (Groq Edition)"
@@ -32,6 +165,39 @@ API_VERSION = "2.2.0"
 
 # AI Model Configuration
 GROQ_MODEL = "llama-3.1-8b-instant"
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
 GROQ_TEMPERATURE = 0.7
-GROQ_MAX_TOKENS = 1000
\ No newline at end of file
+GROQ_MAX_TOKENS = 1000
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "2"))  # Gọi lại khi gặp 429/5xx/lỗi mạng
+GROQ_RETRY_BACKOFF = 0.5  # Giây, nhân đôi sau mỗi lần thử lại
+GROQ_RETRY_MAX_WAIT = 5.0  # Giây, chặn trên cho Retry-After
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "30"))  # Giây tối đa cho một lần gọi (request có deadline: phần còn lại nếu ít hơn)
+# Hedging: chưa có phản hồi sau percentile latency gần đây thì gửi thêm một bản, lấy bản về trước
+GROQ_HEDGE_ENABLED = os.getenv("GROQ_HEDGE", "0") == "1"
+GROQ_HEDGE_PERCENTILE = float(os.getenv("GROQ_HEDGE_PERCENTILE", "95"))  # Ngưỡng chờ trước khi gửi bản dự phòng
+GROQ_HEDGE_BUDGET = float(os.getenv("GROQ_HEDGE_BUDGET", "0.05"))  # Tỉ lệ request gửi thêm tối đa (dài hạn)
+GROQ_HEDGE_MIN_SAMPLES = 50  # Số mẫu latency tối thiểu của một loại tác vụ trước khi hedge
+GROQ_HEDGE_MIN_DELAY = 0.05  # Giây, không hedge sớm hơn mức này
+# Định tuyến theo tác vụ: model, max_tokens, temperature, timeout (giây) riêng cho từng loại lời gọi
+# slow_p95: p95 latency (giây) của model chính vượt mức này thì chuyển sang model dự phòng (fallback)
+# Dự phòng phải nhanh/rẻ tương đương model chính (chậm -> sang model còn chậm hơn, 429 -> sang model giới hạn chặt hơn
+# là ngược mục đích); chỉ chat dùng model lớn để giữ chất lượng câu trả lời
+GROQ_FALLBACK_MODEL = os.getenv("GROQ_FALLBACK_MODEL", "llama-3.3-70b-versatile")  # Dự phòng của chat
+GROQ_SMALL_FALLBACK_MODEL = os.getenv("GROQ_SMALL_FALLBACK_MODEL", "meta-llama/llama-4-scout-17b-16e-instruct")
+GROQ_TASKS = {
+    # Phân loại: trả lời một từ / một đoạn JSON ngắn, không cần ngẫu nhiên
+    "emotion": {"model": GROQ_MODEL, "max_tokens": 16, "temperature": 0.0, "timeout": 5.0, "slow_p95": 2.0, "fallback": GROQ_SMALL_FALLBACK_MODEL},
+    "note_analysis": {"model": GROQ_MODEL, "max_tokens": 400, "temperature": 0.1, "timeout": 10.0, "slow_p95": 4.0, "fallback": GROQ_SMALL_FALLBACK_MODEL},
+    "summary": {"model": GROQ_MODEL, "max_tokens": 300, "temperature": 0.5, "timeout": 15.0, "slow_p95": 5.0, "fallback": GROQ_SMALL_FALLBACK_MODEL},
+    "memory_prompt": {"model": GROQ_MODEL, "max_tokens": 200, "temperature": 0.8, "timeout": 15.0, "slow_p95": 5.0, "fallback": GROQ_SMALL_FALLBACK_MODEL},
+    "health_insight": {"model": GROQ_MODEL, "max_tokens": 400, "temperature": 0.4, "timeout": 20.0, "slow_p95": 8.0, "fallback": GROQ_SMALL_FALLBACK_MODEL},
+    # Job ban đêm: không có người chờ, cho phép chậm hơn
+    "digest": {"model": GROQ_MODEL, "max_tokens": 600, "temperature": 0.5, "timeout": 60.0, "slow_p95": 20.0, "fallback": GROQ_SMALL_FALLBACK_MODEL},
+    # Chat giữ nguyên cấu hình cũ (chất lượng câu trả lời)
+    "chat": {"model": GROQ_MODEL, "max_tokens": GROQ_MAX_TOKENS, "temperature": GROQ_TEMPERATURE, "timeout": GROQ_TIMEOUT, "slow_p95": 8.0, "fallback": GROQ_FALLBACK_MODEL},
+    "default": {"model": GROQ_MODEL, "max_tokens": GROQ_MAX_TOKENS, "temperature": GROQ_TEMPERATURE, "timeout": GROQ_TIMEOUT, "slow_p95": 10.0, "fallback": GROQ_SMALL_FALLBACK_MODEL},
+}
+GROQ_ROUTE_WINDOW = 50  # Số lần gọi gần nhất của model chính (theo tác vụ) dùng để đánh giá
+GROQ_ROUTE_MIN_SAMPLES = 10  # Ít mẫu hơn thì chưa chuyển model
+GROQ_FALLBACK_ERROR_RATE = float(os.getenv("GROQ_FALLBACK_ERROR_RATE", "0.3"))  # Tỉ lệ lỗi (429/5xx/timeout/...) để chuyển model
+GROQ_FALLBACK_COOLDOWN = float(os.getenv("GROQ_FALLBACK_COOLDOWN", "30"))  # Giây trên model dự phòng trước khi thử lại model chính
@@ -3,17 +3,287 @@ Database/Storage Layer
 Tách riêng để dễ dàng thay thế bằng PostgreSQL, MongoDB, etc.
 """
 import json
+import mmap
+import os
+import tempfile
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Tuple
 from app.config import (
     DIARY_FILE, MEMORY_FILE, NOTE_FILE, REMINDER_FILE, 
-    USER_PROFILE_FILE, HEALTH_LOG_FILE, CONVERSATION_FILE
+    USER_PROFILE_FILE, HEALTH_LOG_FILE, CONVERSATION_FILE, DIGEST_FILE, TENANT_CACHE_SIZE
 )
+from app.metrics import (
+    STORAGE_READ_LATENCY, STORAGE_WRITE_LATENCY, STORAGE_READ_BYTES, STORAGE_WRITE_BYTES, STORAGE_POINT_READ_LATENCY
+)
+from app.profiling import record_span
+from app.tenancy import TenantCache, tenant_path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Hàm được gọi sau mỗi lần ghi một collection: (file_path, records, chữ ký trước, chữ ký sau)
+_write_listeners: List[Callable[[Path, List[Dict[str, Any]], Optional[Tuple], Optional[Tuple]], None]] = []
+
+def register_write_listener(listener):
+    """Đăng ký hàm cập nhật dữ liệu phụ (index tìm kiếm...) mỗi khi StorageManager ghi file"""
+    _write_listeners.append(listener)
+    return listener
+
+def file_signature(file_path: Path) -> Optional[Tuple[int, int, int]]:
+    """(inode, mtime, size) của file - đổi sau mỗi lần ghi, kể cả do process khác"""
+    try:
+        stat = file_path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def _stat_signature(fd: int) -> Tuple[int, int, int]:
+    """Như file_signature nhưng của file đang mở (đúng file đã đọc dù có process vừa thay file)"""
+    stat = os.fstat(fd)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+_RECORD_ENCODER = json.JSONEncoder(ensure_ascii=False)  # Không indent: dùng bộ mã hóa C của json
+
+def _dump_records(f, data: List[Dict[str, Any]]) -> Dict[str, Tuple[int, int]]:
+    """
+    Ghi list bản ghi ra file nhị phân: vẫn là một mảng JSON, mỗi bản ghi một dòng
+    (nhanh hơn json.dump indent=2, và biết ngay vị trí từng bản ghi)
+    Returns: id -> (vị trí byte, độ dài byte) của từng bản ghi (id trùng: giữ bản ghi đầu)
+    """
+    if not data:
+        f.write(b"[]")
+        return {}
+    offsets: Dict[str, Tuple[int, int]] = {}
+    chunks = []
+    position = 2  # Sau "[\n"
+    for record in data:
+        chunk = _RECORD_ENCODER.encode(record).encode("utf-8")
+        if isinstance(record, dict) and "id" in record:
+            offsets.setdefault(str(record["id"]), (position, len(chunk)))
+        chunks.append(chunk)
+        position += len(chunk) + 2  # ",\n" giữa hai bản ghi
+    f.write(b"[\n" + b",\n".join(chunks) + b"\n]")
+    return offsets
+
+def _scan_records(raw: bytes) -> Dict[str, Tuple[int, int]]:
+    """id -> (vị trí byte, độ dài byte) của một file collection bất kỳ (file cũ, sửa tay...)"""
+    offsets: Dict[str, Tuple[int, int]] = {}
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return offsets
+    decoder = json.JSONDecoder()
+    index = text.find("[") + 1
+    if not index:
+        return offsets
+    char_position, byte_position = 0, 0
+    while True:
+        while index < len(text) and text[index] in " \t\r\n,":
+            index += 1
+        if index >= len(text) or text[index] == "]":
+            return offsets
+        try:
+            record, end = decoder.raw_decode(text, index)
+        except ValueError:
+            return offsets
+        byte_position += len(text[char_position:index].encode("utf-8"))
+        length = len(text[index:end].encode("utf-8"))
+        if isinstance(record, dict) and "id" in record:
+            offsets.setdefault(str(record["id"]), (byte_position, length))
+        char_position, byte_position = end, byte_position + length
+        index = end
+
+@contextmanager
+def file_lock(file_path: Path):
+    """
+    Khóa độc quyền liên process cho một file dữ liệu (qua file .lock đi kèm)
+    Dùng cho mọi thao tác đọc-sửa-ghi để chạy được nhiều worker cùng lúc
+    """
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_path = file_path.with_name(file_path.name + ".lock")
+    with open(lock_path, 'a+b') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+class RecordIndex:
+    """
+    id -> (vị trí byte, độ dài) của từng bản ghi trong file collection, để đọc một bản ghi
+    (GET theo id) bằng mmap mà không parse cả collection
+
+    - Ghi cùng lúc với file (save_json_file), lưu cạnh file: <file>.idx kèm chữ ký file đã đánh chỉ mục
+    - Chữ ký lệch (file cũ, process khác ghi dở giữa hai bước, sửa tay): quét lại file một lần rồi lưu lại
+    - Bản nạp trong bộ nhớ giữ theo file trong TenantCache (LRU)
+    """
+
+    files = TenantCache("record", lambda key: {}, max_size=TENANT_CACHE_SIZE * 4)  # file -> {"state": (chữ ký, chỉ mục)}
+
+    @staticmethod
+    def path_for(file_path: Path) -> Path:
+        return file_path.with_name(file_path.name + ".idx")
+
+    @staticmethod
+    def store(file_path: Path, signature: Optional[Tuple], offsets: Dict[str, Tuple[int, int]]):
+        """Lưu chỉ mục của file vừa ghi (lỗi chỉ in ra: lần đọc sau sẽ quét lại file)"""
+        index_path = RecordIndex.path_for(file_path)
+        if not offsets and not index_path.exists():
+            return
+        entry = RecordIndex.files.peek(str(file_path))
+        if entry is not None:
+            entry["state"] = (signature, offsets)
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, prefix=index_path.name, suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({"signature": signature, "offsets": offsets}, ensure_ascii=False, separators=(",", ":")))
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            print(f"Không ghi được chỉ mục {index_path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    @staticmethod
+    def _offsets(file_path: Path, f, signature: Tuple, rescan: bool = False) -> Dict[str, Tuple[int, int]]:
+        """Chỉ mục khớp với file đang mở f (chữ ký signature)"""
+        entry = RecordIndex.files.get(str(file_path))
+        state = entry.get("state")
+        if not rescan and state is not None and state[0] == signature:
+            return state[1]
+
+        offsets = None
+        if not rescan:
+            try:
+                with open(RecordIndex.path_for(file_path), 'r', encoding='utf-8') as index_file:
+                    stored = json.load(index_file)
+                if tuple(stored["signature"] or ()) == signature:
+                    offsets = {key: tuple(value) for key, value in stored["offsets"].items()}
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+        if offsets is None:
+            f.seek(0)
+            offsets = _scan_records(f.read())
+            RecordIndex.store(file_path, signature, offsets)
+        entry["state"] = (signature, offsets)
+        return offsets
+
+    @staticmethod
+    def read(file_path: Path, record_id: str) -> Optional[Dict[str, Any]]:
+        """Một bản ghi theo id (None nếu không có), chỉ đọc đúng đoạn byte của bản ghi"""
+        start = time.perf_counter()
+        try:
+            with open(file_path, 'rb') as f:
+                signature = _stat_signature(f.fileno())
+                for rescan in (False, True):
+                    span = RecordIndex._offsets(file_path, f, signature, rescan).get(record_id)
+                    if span is None:
+                        return None
+                    offset, length = span
+                    if offset + length <= signature[2]:
+                        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                            raw = mapped[offset:offset + length]
+                        try:
+                            record = json.loads(raw)
+                        except ValueError:
+                            record = None
+                        if isinstance(record, dict) and str(record.get("id")) == record_id:
+                            STORAGE_READ_BYTES.inc(length, collection=file_path.stem)
+                            return record
+                    # Chỉ mục không khớp nội dung file: quét lại một lần
+                return None
+        except FileNotFoundError:
+            return None
+        finally:
+            elapsed = time.perf_counter() - start
+            STORAGE_POINT_READ_LATENCY.observe(elapsed, collection=file_path.stem)
+            record_span("storage", f"read {file_path.stem}#id", start, elapsed)
+
+class CollectionVersion:
+    """
+    Phiên bản tăng dần của từng file collection: +1 sau mỗi lần ghi (dùng cho ETag của các route đọc)
+
+    - Lưu cạnh file: <file>.ver = {"version": n, "signature": chữ ký file ứng với phiên bản n}
+    - Hỏi phiên bản chỉ tốn một lần stat khi file không đổi; file đổi do worker khác thì đọc lại .ver
+    - Chữ ký lệch .ver (file sửa tay, ghi bởi bản cũ): tăng phiên bản trong khóa file
+    """
+
+    files = TenantCache("version", lambda key: {}, max_size=TENANT_CACHE_SIZE * 8)  # file -> {"state": (chữ ký, phiên bản)}
+
+    @staticmethod
+    def path_for(file_path: Path) -> Path:
+        return file_path.with_name(file_path.name + ".ver")
+
+    @staticmethod
+    def _read(file_path: Path) -> Tuple[int, Optional[Tuple]]:
+        try:
+            with open(CollectionVersion.path_for(file_path), 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            return int(stored["version"]), tuple(stored["signature"]) if stored["signature"] else None
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, None
+
+    @staticmethod
+    def _write(file_path: Path, version: int, signature: Optional[Tuple]):
+        version_path = CollectionVersion.path_for(file_path)
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, prefix=version_path.name, suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({"version": version, "signature": signature}))
+            os.replace(tmp_path, version_path)
+        except OSError as e:
+            print(f"Không ghi được phiên bản {version_path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    @staticmethod
+    def bump(file_path: Path, signature: Optional[Tuple]) -> int:
+        """Tăng phiên bản sau khi ghi file (gọi trong file_lock)"""
+        version = CollectionVersion._read(file_path)[0] + 1
+        CollectionVersion._write(file_path, version, signature)
+        CollectionVersion.files.get(str(file_path))["state"] = (signature, version)
+        return version
+
+    @staticmethod
+    def get(file_path: Path) -> int:
+        """Phiên bản hiện tại (0 = file chưa từng được ghi)"""
+        signature = file_signature(file_path)
+        if signature is None:
+            return 0
+        entry = CollectionVersion.files.get(str(file_path))
+        state = entry.get("state")
+        if state is not None and state[0] == signature:
+            return state[1]
+
+        version, stored = CollectionVersion._read(file_path)
+        if stored != signature:
+            with file_lock(file_path):
+                signature = file_signature(file_path)
+                version, stored = CollectionVersion._read(file_path)
+                if stored != signature:
+                    version += 1
+                    CollectionVersion._write(file_path, version, signature)
+        entry["state"] = (signature, version)
+        return version
 
 class StorageManager:
     """
     Quản lý lưu trữ dữ liệu
-    Hiện tại: JSON file
+    Hiện tại: JSON file, mỗi tenant (user id của request) một thư mục - xem app/tenancy.py
     Tương lai: Có thể thay thế bằng database khác
     """
     
@@ -21,33 +291,78 @@ class StorageManager:
     def load_json_file(file_path: Path) -> List[Dict[str, Any]]:
         """Đọc dữ liệu từ file JSON"""
         if file_path.exists():
+            start = time.perf_counter()
             try:
                 with open(file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    data = json.load(f)
+                    STORAGE_READ_BYTES.inc(f.buffer.tell(), collection=file_path.stem)
+                return data
             except json.JSONDecodeError:
                 return []
+            finally:
+                elapsed = time.perf_counter() - start
+                STORAGE_READ_LATENCY.observe(elapsed, collection=file_path.stem)
+                record_span("storage", f"read {file_path.stem}", start, elapsed)
         return []
     
     @staticmethod
     def save_json_file(file_path: Path, data: List[Dict[str, Any]]):
-        """Lưu dữ liệu vào file JSON"""
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        """
+        Lưu dữ liệu vào file JSON
+        Ghi ra file tạm rồi os.replace để process khác không bao giờ đọc phải file ghi dở
+        Gọi trong file_lock: các listener nhận chữ ký file trước/sau để biết có bỏ lỡ ghi nào không
+        """
+        start = time.perf_counter()
+        before = file_signature(file_path)
+        fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, prefix=file_path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                offsets = _dump_records(f, data)
+                f.flush()
+                STORAGE_WRITE_BYTES.inc(f.tell(), collection=file_path.stem)
+            os.replace(tmp_path, file_path)
+            elapsed = time.perf_counter() - start
+            STORAGE_WRITE_LATENCY.observe(elapsed, collection=file_path.stem)
+            record_span("storage", f"write {file_path.stem}", start, elapsed)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        
+        after = file_signature(file_path)
+        RecordIndex.store(file_path, after, offsets)
+        CollectionVersion.bump(file_path, after)
+        for listener in _write_listeners:
+            try:
+                listener(file_path, data, before, after)
+            except Exception as e:
+                print(f"Write listener {listener.__qualname__} lỗi: {e}")
+    
+    @staticmethod
+    def append_json_file(file_path: Path, item: Dict[str, Any]):
+        """Thêm một bản ghi vào file JSON (đọc-sửa-ghi trong khóa)"""
+        with file_lock(file_path):
+            data = StorageManager.load_json_file(file_path)
+            data.append(item)
+            StorageManager.save_json_file(file_path, data)
+    
+    @staticmethod
+    def collection_version(file_path: Path) -> int:
+        """Phiên bản của một collection (vd. DIARY_FILE) của tenant hiện tại, tăng sau mỗi lần ghi"""
+        return CollectionVersion.get(tenant_path(file_path))
     
     # ========== DIARY OPERATIONS ==========
     
     @staticmethod
     def get_all_diaries() -> List[Dict[str, Any]]:
         """Lấy tất cả nhật ký"""
-        return StorageManager.load_json_file(DIARY_FILE)
+        return StorageManager.load_json_file(tenant_path(DIARY_FILE))
     
     @staticmethod
     def save_diary(diary: Dict[str, Any]) -> bool:
         """Lưu một nhật ký mới"""
         try:
-            diaries = StorageManager.get_all_diaries()
-            diaries.append(diary)
-            StorageManager.save_json_file(DIARY_FILE, diaries)
+            StorageManager.append_json_file(tenant_path(DIARY_FILE), diary)
             return True
         except Exception as e:
             print(f"Error saving diary: {e}")
@@ -59,20 +374,44 @@ class StorageManager:
         diaries = StorageManager.get_all_diaries()
         return sorted(diaries, key=lambda x: x['created_at'], reverse=True)[:limit]
     
+    @staticmethod
+    def get_diary(diary_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy một nhật ký theo id"""
+        return RecordIndex.read(tenant_path(DIARY_FILE), diary_id)
+    
+    @staticmethod
+    def update_diary(diary_id: str, fields: Dict[str, Any], remove: Optional[List[str]] = None) -> bool:
+        """Cập nhật một số trường của nhật ký"""
+        try:
+            path = tenant_path(DIARY_FILE)
+            with file_lock(path):
+                diaries = StorageManager.load_json_file(path)
+                found = False
+                for d in diaries:
+                    if d['id'] == diary_id:
+                        d.update(fields)
+                        for key in remove or []:
+                            d.pop(key, None)
+                        found = True
+                if found:
+                    StorageManager.save_json_file(path, diaries)
+            return found
+        except Exception as e:
+            print(f"Error updating diary: {e}")
+            return False
+    
     # ========== MEMORY OPERATIONS ==========
     
     @staticmethod
     def get_all_memories() -> List[Dict[str, Any]]:
         """Lấy tất cả ký ức"""
-        return StorageManager.load_json_file(MEMORY_FILE)
+        return StorageManager.load_json_file(tenant_path(MEMORY_FILE))
     
     @staticmethod
     def save_memory(memory: Dict[str, Any]) -> bool:
         """Lưu một ký ức mới"""
         try:
-            memories = StorageManager.get_all_memories()
-            memories.append(memory)
-            StorageManager.save_json_file(MEMORY_FILE, memories)
+            StorageManager.append_json_file(tenant_path(MEMORY_FILE), memory)
             return True
         except Exception as e:
             print(f"Error saving memory: {e}")
@@ -84,20 +423,23 @@ class StorageManager:
         memories = StorageManager.get_all_memories()
         return sorted(memories, key=lambda x: x['created_at'], reverse=True)[:limit]
     
+    @staticmethod
+    def get_memory(memory_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy một ký ức theo id"""
+        return RecordIndex.read(tenant_path(MEMORY_FILE), memory_id)
+    
     # ========== NOTE OPERATIONS ==========
     
     @staticmethod
     def get_all_notes() -> List[Dict[str, Any]]:
         """Lấy tất cả ghi chú"""
-        return StorageManager.load_json_file(NOTE_FILE)
+        return StorageManager.load_json_file(tenant_path(NOTE_FILE))
     
     @staticmethod
     def save_note(note: Dict[str, Any]) -> bool:
         """Lưu ghi chú mới"""
         try:
-            notes = StorageManager.get_all_notes()
-            notes.append(note)
-            StorageManager.save_json_file(NOTE_FILE, notes)
+            StorageManager.append_json_file(tenant_path(NOTE_FILE), note)
             return True
         except Exception as e:
             print(f"Error saving note: {e}")
@@ -109,25 +451,58 @@ class StorageManager:
         notes = StorageManager.get_all_notes()
         return sorted(notes, key=lambda x: x['created_at'], reverse=True)[:limit]
     
+    @staticmethod
+    def get_note(note_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy một ghi chú theo id"""
+        return RecordIndex.read(tenant_path(NOTE_FILE), note_id)
+    
+    @staticmethod
+    def update_note(note_id: str, fields: Dict[str, Any], remove: Optional[List[str]] = None,
+                    require: Optional[Callable[[Dict[str, Any]], bool]] = None) -> bool:
+        """
+        Cập nhật một số trường của ghi chú, False nếu không tìm thấy
+        require: điều kiện kiểm tra trong khóa, không thỏa thì không ghi và trả về False
+        """
+        try:
+            path = tenant_path(NOTE_FILE)
+            with file_lock(path):
+                notes = StorageManager.load_json_file(path)
+                found = False
+                for n in notes:
+                    if n['id'] == note_id and (require is None or require(n)):
+                        n.update(fields)
+                        for key in remove or []:
+                            n.pop(key, None)
+                        found = True
+                if found:
+                    StorageManager.save_json_file(path, notes)
+            return found
+        except Exception as e:
+            print(f"Error updating note: {e}")
+            return False
+    
     # ========== REMINDER OPERATIONS ==========
     
     @staticmethod
     def get_all_reminders() -> List[Dict[str, Any]]:
         """Lấy tất cả nhắc nhở"""
-        return StorageManager.load_json_file(REMINDER_FILE)
+        return StorageManager.load_json_file(tenant_path(REMINDER_FILE))
     
     @staticmethod
     def save_reminder(reminder: Dict[str, Any]) -> bool:
         """Lưu nhắc nhở mới"""
         try:
-            reminders = StorageManager.get_all_reminders()
-            reminders.append(reminder)
-            StorageManager.save_json_file(REMINDER_FILE, reminders)
+            StorageManager.append_json_file(tenant_path(REMINDER_FILE), reminder)
             return True
         except Exception as e:
             print(f"Error saving reminder: {e}")
             return False
     
+    @staticmethod
+    def get_reminder(reminder_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy một nhắc nhở (hoặc chuỗi nhắc nhở) theo id"""
+        return RecordIndex.read(tenant_path(REMINDER_FILE), reminder_id)
+    
     @staticmethod
     def get_pending_reminders() -> List[Dict[str, Any]]:
         """Lấy các nhắc nhở chưa hoàn thành"""
@@ -135,15 +510,33 @@ class StorageManager:
         return [r for r in reminders if not r.get('is_completed', False)]
     
     @staticmethod
-    def update_reminder_status(reminder_id: str, is_completed: bool) -> bool:
-        """Cập nhật trạng thái nhắc nhở"""
-        try:
-            reminders = StorageManager.get_all_reminders()
+    def modify_reminder(reminder_id: str, modify: Callable[[Dict[str, Any]], None]) -> bool:
+        """
+        Sửa tại chỗ một nhắc nhở trong khóa (đọc-sửa-ghi), False nếu không tìm thấy
+        modify raise thì không ghi gì
+        """
+        path = tenant_path(REMINDER_FILE)
+        with file_lock(path):
+            reminders = StorageManager.load_json_file(path)
+            found = False
             for r in reminders:
                 if r['id'] == reminder_id:
-                    r['is_completed'] = is_completed
-            StorageManager.save_json_file(REMINDER_FILE, reminders)
-            return True
+                    modify(r)
+                    found = True
+            if found:
+                StorageManager.save_json_file(path, reminders)
+        return found
+    
+    @staticmethod
+    def update_reminder(reminder_id: str, fields: Dict[str, Any]) -> bool:
+        """Cập nhật một số trường của nhắc nhở, False nếu không tìm thấy"""
+        return StorageManager.modify_reminder(reminder_id, lambda r: r.update(fields))
+    
+    @staticmethod
+    def update_reminder_status(reminder_id: str, is_completed: bool) -> bool:
+        """Cập nhật trạng thái nhắc nhở, False nếu không tìm thấy"""
+        try:
+            return StorageManager.update_reminder(reminder_id, {'is_completed': is_completed})
         except Exception as e:
             print(f"Error updating reminder: {e}")
             return False
@@ -153,14 +546,16 @@ class StorageManager:
     @staticmethod
     def get_user_profile() -> Optional[Dict[str, Any]]:
         """Lấy thông tin người dùng"""
-        profiles = StorageManager.load_json_file(USER_PROFILE_FILE)
+        profiles = StorageManager.load_json_file(tenant_path(USER_PROFILE_FILE))
         return profiles[0] if profiles else None
     
     @staticmethod
     def save_user_profile(profile: Dict[str, Any]) -> bool:
         """Lưu/cập nhật thông tin người dùng"""
         try:
-            StorageManager.save_json_file(USER_PROFILE_FILE, [profile])
+            path = tenant_path(USER_PROFILE_FILE)
+            with file_lock(path):
+                StorageManager.save_json_file(path, [profile])
             return True
         except Exception as e:
             print(f"Error saving profile: {e}")
@@ -171,15 +566,13 @@ class StorageManager:
     @staticmethod
     def get_all_health_logs() -> List[Dict[str, Any]]:
         """Lấy tất cả nhật ký sức khỏe"""
-        return StorageManager.load_json_file(HEALTH_LOG_FILE)
+        return StorageManager.load_json_file(tenant_path(HEALTH_LOG_FILE))
     
     @staticmethod
     def save_health_log(log: Dict[str, Any]) -> bool:
         """Lưu nhật ký sức khỏe"""
         try:
-            logs = StorageManager.get_all_health_logs()
-            logs.append(log)
-            StorageManager.save_json_file(HEALTH_LOG_FILE, logs)
+            StorageManager.append_json_file(tenant_path(HEALTH_LOG_FILE), log)
             return True
         except Exception as e:
             print(f"Error saving health log: {e}")
@@ -190,19 +583,46 @@ class StorageManager:
     @staticmethod
     def get_all_conversations() -> List[Dict[str, Any]]:
         """Lấy tất cả hội thoại"""
-        return StorageManager.load_json_file(CONVERSATION_FILE)
+        return StorageManager.load_json_file(tenant_path(CONVERSATION_FILE))
     
     @staticmethod
     def save_conversation(conversation: Dict[str, Any]) -> bool:
         """Lưu hội thoại"""
         try:
-            conversations = StorageManager.get_all_conversations()
-            conversations.append(conversation)
-            StorageManager.save_json_file(CONVERSATION_FILE, conversations)
+            StorageManager.append_json_file(tenant_path(CONVERSATION_FILE), conversation)
             return True
         except Exception as e:
             print(f"Error saving conversation: {e}")
             return False
+    
+    # ========== DIGEST OPERATIONS ==========
+    
+    @staticmethod
+    def get_all_digests() -> List[Dict[str, Any]]:
+        """Lấy tất cả bản tóm tắt ngày"""
+        return StorageManager.load_json_file(tenant_path(DIGEST_FILE))
+    
+    @staticmethod
+    def get_digest(day: str) -> Optional[Dict[str, Any]]:
+        """Lấy bản tóm tắt của một ngày (YYYY-MM-DD)"""
+        for digest in StorageManager.get_all_digests():
+            if digest.get('date') == day:
+                return digest
+        return None
+    
+    @staticmethod
+    def save_digest(digest: Dict[str, Any]) -> bool:
+        """Lưu bản tóm tắt ngày, thay bản cũ cùng ngày nếu có"""
+        try:
+            path = tenant_path(DIGEST_FILE)
+            with file_lock(path):
+                digests = [d for d in StorageManager.load_json_file(path) if d.get('date') != digest['date']]
+                digests.append(digest)
+                StorageManager.save_json_file(path, digests)
+            return True
+        except Exception as e:
+            print(f"Error saving digest: {e}")
+            return False
 
 
 # ========== FUTURE: DATABASE IMPLEMENTATIONS ==========
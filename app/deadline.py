@@ -0,0 +1,117 @@
+"""
+Deadline - Ngân sách thời gian của một request, đi theo request (ContextVar) xuống OCR và mọi lần gọi Groq
+
+- Lấy từ header X-Request-Timeout (giây) hoặc mặc định theo route (/entry, /chat); route khác không có deadline
+- Bước bắt buộc hết ngân sách (OCR, câu trả lời chat): 504, không chờ vô hạn
+- Bước làm giàu hết ngân sách (tóm tắt, cảm xúc, phân tích ghi chú): trả DEFERRED, bản ghi vẫn được lưu
+  và EnrichmentService bổ sung sau; phản hồi liệt kê các bước bị hoãn trong "deferred"
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+from fastapi import HTTPException
+from app.config import (
+    DEADLINE_HEADER, DEADLINE_ENTRY, DEADLINE_CHAT, DEADLINE_MAX, DEADLINE_RESERVE, DEADLINE_MIN_LLM
+)
+from app.metrics import DEADLINE_EXCEEDED
+
+# Tiền tố path -> số giây mặc định (khớp tiền tố đầu tiên)
+_ROUTE_DEADLINES = (
+    ("/entry", DEADLINE_ENTRY),
+    ("/chat", DEADLINE_CHAT),
+)
+
+_current_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)  # time.monotonic()
+
+DEFERRED = object()  # Kết quả của bước làm giàu bị hoãn
+
+class DeadlineExceeded(HTTPException):
+    """Hết ngân sách thời gian ở một bước: 504"""
+
+    def __init__(self, stage: str):
+        super().__init__(status_code=504, detail=f"Xử lý quá thời gian cho phép ({stage}), vui lòng thử lại")
+        self.stage = stage
+
+def remaining() -> Optional[float]:
+    """Số giây còn lại của request (đã trừ phần giữ lại để lưu/trả lời), None nếu không có deadline"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic() - DEADLINE_RESERVE
+
+def budget(stage: str, min_seconds: float, cap: Optional[float] = None) -> Optional[float]:
+    """
+    Số giây dành cho một bước: phần còn lại (chặn trên bởi cap), None nếu không giới hạn
+
+    Raise DeadlineExceeded nếu còn ít hơn min_seconds (không bắt đầu việc chắc chắn không kịp)
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    if left < min_seconds:
+        DEADLINE_EXCEEDED.inc(stage=stage)
+        raise DeadlineExceeded(stage)
+    return min(left, cap) if cap is not None else left
+
+def exceeded(stage: str) -> DeadlineExceeded:
+    """DeadlineExceeded cho bước vừa bị cắt giữa chừng (đếm vào metric)"""
+    DEADLINE_EXCEEDED.inc(stage=stage)
+    return DeadlineExceeded(stage)
+
+@contextmanager
+def no_deadline():
+    """Chạy không giới hạn thời gian (tác vụ nền kế thừa context của request)"""
+    token = _current_deadline.set(None)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+async def enrich(func: Callable, *args, min_seconds: float = DEADLINE_MIN_LLM) -> Any:
+    """Chạy một bước làm giàu trong ngân sách còn lại; hết thời gian hoặc tầng quá tải thì trả DEFERRED"""
+    from app.admission import Overloaded
+
+    try:
+        budget(func.__name__, min_seconds)
+        return await func(*args)
+    except (DeadlineExceeded, Overloaded):
+        return DEFERRED
+
+def route_deadline(path: str, header: Optional[str]) -> Optional[float]:
+    """Số giây cho request: header hợp lệ (chặn ở DEADLINE_MAX), không thì mặc định của route"""
+    if header:
+        try:
+            seconds = float(header)
+            if seconds > 0:
+                return min(seconds, DEADLINE_MAX)
+        except ValueError:
+            pass
+    for prefix, seconds in _ROUTE_DEADLINES:
+        if path.startswith(prefix):
+            return seconds
+    return None
+
+class DeadlineMiddleware:
+    """ASGI middleware tính deadline của request HTTP (từ lúc nhận) và gắn vào ContextVar"""
+
+    def __init__(self, app):
+        self.app = app
+        self._header = DEADLINE_HEADER.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = next((value.decode("latin-1") for name, value in scope.get("headers", []) if name == self._header), None)
+        seconds = route_deadline(scope.get("path", ""), header)
+        if seconds is None:
+            await self.app(scope, receive, send)
+            return
+
+        token = _current_deadline.set(time.monotonic() + seconds)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_deadline.reset(token)
@@ -0,0 +1,339 @@
+"""
+Idempotency - Client gửi lại request (mạng chập chờn, timeout) với cùng header Idempotency-Key
+
+- Lần đầu: chạy bình thường, lưu phản hồi (theo tenant, giữ IDEMPOTENCY_TTL giây)
+- Gửi lại khi lần đầu đang chạy: chờ lần đó xong rồi nhận cùng phản hồi (không OCR/gọi Groq lần hai)
+- Gửi lại sau khi xong: phát lại phản hồi đã lưu (header Idempotent-Replayed: true), không lưu bản ghi trùng
+- Cùng key nhưng nội dung request khác: 422
+- Lần đầu lỗi tạm thời (5xx, 503 quá tải, 429...): không lưu, lần gửi lại được chạy lại
+
+Nhiều worker: khóa "đang xử lý" là file tạo độc quyền (O_EXCL) cạnh file kết quả,
+request trùng ở worker khác chờ bằng cách đọc lại file kết quả.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from starlette.concurrency import run_in_threadpool
+from app.config import (
+    IDEMPOTENCY_DIR, IDEMPOTENCY_TTL, IDEMPOTENCY_WAIT, IDEMPOTENCY_LOCK_TIMEOUT, IDEMPOTENCY_MAX_BODY,
+    UPLOAD_SPOOL_THRESHOLD, UPLOAD_CHUNK_SIZE
+)
+from app.metrics import IDEMPOTENT_REQUESTS
+from app.tenancy import tenant_path
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENT_ROUTES = {("POST", "/entry"), ("POST", "/chat"), ("POST", "/memory"), ("POST", "/health/log")}
+
+_KEY_RE = re.compile(r"^[\x21-\x7e]{1,255}$")  # ASCII in được, không khoảng trắng (UUID, ULID...)
+_BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?', re.IGNORECASE)
+_RETRYABLE_STATUSES = {408, 409, 425, 429}  # Lỗi tạm thời dưới 500: không lưu
+_POLL_INTERVAL = 0.1  # Giây giữa hai lần đọc lại kết quả khi worker khác đang xử lý
+_SWEEP_INTERVAL = 3600
+
+# Lần xử lý đang chạy trong process này: file kết quả -> future xong khi lần đó kết thúc
+_in_flight: Dict[str, asyncio.Future] = {}
+
+class BodyFingerprint:
+    """
+    sha256 của body, cập nhật dần theo từng chunk
+
+    Multipart: bỏ chuỗi boundary (client sinh ngẫu nhiên mỗi lần gửi) để lần gửi lại cùng nội dung
+    vẫn cùng dấu vân tay
+    """
+
+    def __init__(self, content_type: str):
+        match = _BOUNDARY_RE.search(content_type) if content_type.startswith("multipart/") else None
+        self._boundary = match.group(1).encode("latin-1") if match else b""
+        self._hash = hashlib.sha256()
+        self._tail = b""
+
+    def update(self, chunk: bytes):
+        if not self._boundary:
+            self._hash.update(chunk)
+            return
+        # Giữ lại đuôi ngắn hơn boundary: boundary có thể nằm vắt qua hai chunk
+        data = (self._tail + chunk).replace(self._boundary, b"")
+        keep = min(len(self._boundary) - 1, len(data))
+        self._hash.update(data[:len(data) - keep])
+        self._tail = data[len(data) - keep:]
+
+    def hexdigest(self) -> str:
+        final = self._hash.copy()
+        final.update(self._tail)
+        return final.hexdigest()
+
+class IdempotencyStore:
+    """Kết quả đã lưu: <IDEMPOTENCY_DIR của tenant>/<sha256(method path key)>.json, khóa đang xử lý: .lock"""
+
+    @staticmethod
+    def record_path(method: str, path: str, key: str) -> Path:
+        digest = hashlib.sha256(f"{method} {path}\n{key}".encode("utf-8")).hexdigest()
+        return tenant_path(IDEMPOTENCY_DIR) / f"{digest}.json"
+
+    @staticmethod
+    def load(record_path: Path) -> Optional[Dict]:
+        """Kết quả đã lưu còn hạn, không thì None (file hết hạn bị xóa)"""
+        try:
+            with open(record_path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get("expires_at", 0) < time.time():
+            record_path.unlink(missing_ok=True)
+            return None
+        return record
+
+    @staticmethod
+    def save(record_path: Path, record: Dict):
+        record_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = record_path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(tmp, record_path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        IdempotencyStore.sweep(record_path.parent)
+
+    @staticmethod
+    def claim(record_path: Path) -> bool:
+        """Giành quyền xử lý key (tạo file khóa độc quyền), False nếu request khác đang xử lý"""
+        lock_path = record_path.with_suffix(".lock")
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    stale = time.time() - lock_path.stat().st_mtime > IDEMPOTENCY_LOCK_TIMEOUT
+                except FileNotFoundError:
+                    continue  # Vừa được nhả: thử lại
+                if not stale:
+                    return False
+                lock_path.unlink(missing_ok=True)  # Process giữ khóa đã chết
+                continue
+            os.write(fd, str(os.getpid()).encode("ascii"))
+            os.close(fd)
+            return True
+        return False
+
+    @staticmethod
+    def release(record_path: Path):
+        record_path.with_suffix(".lock").unlink(missing_ok=True)
+
+    @staticmethod
+    def sweep(directory: Path):
+        """Xóa kết quả hết hạn và khóa bỏ dở, tối đa mỗi giờ một lần cho một thư mục"""
+        marker = directory / ".sweep"
+        now = time.time()
+        try:
+            if now - marker.stat().st_mtime < _SWEEP_INTERVAL:
+                return
+        except FileNotFoundError:
+            pass
+        marker.touch()
+        for path in directory.iterdir():
+            try:
+                age = now - path.stat().st_mtime
+                if (path.suffix == ".json" and age > IDEMPOTENCY_TTL) or (path.suffix == ".lock" and age > IDEMPOTENCY_LOCK_TIMEOUT):
+                    path.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+class BufferedBody:
+    """
+    Body của request trùng, đọc trước trong lúc chờ (để so dấu vân tay, và chạy lại nếu lần đầu lỗi)
+
+    Spool ra file tạm như file upload: quá UPLOAD_SPOOL_THRESHOLD thì nằm trên đĩa, không giữ cả body trong RAM
+    """
+
+    def __init__(self):
+        self.file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD)
+        self.size = 0
+        self.complete = False  # Đã nhận hết body (client không ngắt giữa chừng)
+        self._sent = 0
+
+    @property
+    def _in_memory(self) -> bool:
+        return not getattr(self.file, "_rolled", True)
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self._in_memory:
+            self.file.write(chunk)
+        else:
+            await run_in_threadpool(self.file.write, chunk)
+
+    async def next_message(self) -> Dict:
+        """Message http.request kế tiếp để đưa lại body cho app (từng chunk UPLOAD_CHUNK_SIZE)"""
+        if self._sent == 0:
+            self.file.seek(0)
+        chunk = self.file.read(UPLOAD_CHUNK_SIZE) if self._in_memory else await run_in_threadpool(self.file.read, UPLOAD_CHUNK_SIZE)
+        self._sent += len(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": self._sent < self.size}
+
+    def close(self):
+        self.file.close()
+
+async def _read_body(receive, fingerprint: BodyFingerprint) -> BufferedBody:
+    """Đọc hết body của request trùng, cập nhật dấu vân tay theo từng chunk"""
+    body = BufferedBody()
+    try:
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                return body
+            chunk = message.get("body", b"")
+            fingerprint.update(chunk)
+            await body.write(chunk)
+            if not message.get("more_body", False):
+                body.complete = True
+                return body
+    except BaseException:
+        body.close()
+        raise
+
+async def _send_json(scope, receive, send, status: int, detail: str, headers: Optional[Dict[str, str]] = None):
+    from fastapi.responses import JSONResponse
+
+    await JSONResponse(status_code=status, content={"detail": detail}, headers=headers)(scope, receive, send)
+
+async def _replay(send, record: Dict):
+    headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in record["headers"]]
+    headers.append((b"idempotent-replayed", b"true"))
+    await send({"type": "http.response.start", "status": record["status"], "headers": headers})
+    await send({"type": "http.response.body", "body": base64.b64decode(record["body"])})
+
+class IdempotencyMiddleware:
+    """ASGI middleware cho các route trong IDEMPOTENT_ROUTES khi request có header Idempotency-Key"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in IDEMPOTENT_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope.get("headers", [])}
+        key = headers.get(IDEMPOTENCY_HEADER.lower())
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        route = scope["path"]
+        if not _KEY_RE.match(key):
+            await _send_json(scope, receive, send, 400, f"{IDEMPOTENCY_HEADER} gồm 1-255 ký tự ASCII, không có khoảng trắng")
+            return
+
+        record_path = IdempotencyStore.record_path(scope["method"], route, key)
+        fingerprint = BodyFingerprint(headers.get("content-type", ""))
+        body: Optional[BufferedBody] = None  # Body đã đọc trước khi xử lý (request trùng phải chờ)
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT
+        attached = False
+
+        try:
+            while True:
+                record = IdempotencyStore.load(record_path)
+                if record is not None:
+                    if body is None:
+                        body = await _read_body(receive, fingerprint)
+                    if record["fingerprint"] != fingerprint.hexdigest():
+                        IDEMPOTENT_REQUESTS.inc(route=route, outcome="mismatch")
+                        await _send_json(scope, receive, send, 422, f"{IDEMPOTENCY_HEADER} này đã dùng cho một request có nội dung khác")
+                        return
+                    IDEMPOTENT_REQUESTS.inc(route=route, outcome="attached" if attached else "replayed")
+                    await _replay(send, record)
+                    return
+
+                pending = _in_flight.get(str(record_path))
+                if pending is None and IdempotencyStore.claim(record_path):
+                    break
+
+                # Lần xử lý khác (process này hoặc worker khác) đang chạy: chờ kết quả của nó
+                if body is None:
+                    body = await _read_body(receive, fingerprint)
+                attached = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    IDEMPOTENT_REQUESTS.inc(route=route, outcome="busy")
+                    await _send_json(scope, receive, send, 409, f"Request với {IDEMPOTENCY_HEADER} này vẫn đang được xử lý, vui lòng thử lại sau",
+                                     headers={"Retry-After": "5"})
+                    return
+                if pending is not None and pending.get_loop() is asyncio.get_running_loop():
+                    await asyncio.wait({pending}, timeout=remaining)
+                else:
+                    await asyncio.sleep(min(_POLL_INTERVAL, remaining))
+
+            await self._execute(scope, receive, send, record_path, fingerprint, body)
+            IDEMPOTENT_REQUESTS.inc(route=route, outcome="executed")
+        finally:
+            if body is not None:
+                body.close()
+
+    async def _execute(self, scope, receive, send, record_path: Path, fingerprint: BodyFingerprint,
+                       body: Optional[BufferedBody]):
+        """Chạy request (đã giữ khóa), lưu phản hồi nếu không phải lỗi tạm thời"""
+        done = asyncio.get_running_loop().create_future()
+        _in_flight[str(record_path)] = done
+        body_complete = body is not None and body.complete
+        status = None
+        response_headers: List = []
+        chunks: List[bytes] = []
+        size = 0
+
+        async def receive_and_hash():
+            nonlocal body, body_complete
+            if body is not None:
+                # Body đã đọc khi chờ: đưa lại cho app theo từng chunk từ file spool
+                message = await body.next_message()
+                if not message["more_body"]:
+                    body = None
+                return message
+            message = await receive()
+            if message["type"] == "http.request":
+                fingerprint.update(message.get("body", b""))
+                body_complete = not message.get("more_body", False)
+            return message
+
+        async def send_and_record(message):
+            nonlocal status, response_headers, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = message.get("headers", [])
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+                if size <= IDEMPOTENCY_MAX_BODY:
+                    chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_and_hash, send_and_record)
+        finally:
+            try:
+                # Chỉ lưu khi đã đọc hết body (dấu vân tay đầy đủ) và có phản hồi trọn vẹn
+                if (status is not None and 200 <= status < 500 and status not in _RETRYABLE_STATUSES
+                        and body_complete and size <= IDEMPOTENCY_MAX_BODY):
+                    record = {
+                        "fingerprint": fingerprint.hexdigest(),
+                        "status": status,
+                        "headers": [
+                            [name.decode("latin-1"), value.decode("latin-1")] for name, value in response_headers
+                        ],
+                        "body": base64.b64encode(b"".join(chunks)).decode("ascii"),
+                        "created_at": time.time(),
+                        "expires_at": time.time() + IDEMPOTENCY_TTL
+                    }
+                    await run_in_threadpool(IdempotencyStore.save, record_path, record)
+            except Exception as e:
+                print(f"Error saving idempotent response: {e}")
+            finally:
+                IdempotencyStore.release(record_path)
+                _in_flight.pop(str(record_path), None)
+                done.set_result(None)
@@ -0,0 +1,64 @@
+"""
+IDs - Id bản ghi duy nhất, sắp xếp được theo thời gian (kiểu ULID)
+
+    diary_01J9ZQ4K7M3X8T2V6B0N5R1C4D
+          └── 10 ký tự thời điểm (ms) ─┘└── 16 ký tự ngẫu nhiên ──┘ (Crockford base32)
+
+- Hai id tạo cùng một mili giây trong một process: phần ngẫu nhiên tăng dần, không trùng và vẫn đúng thứ tự
+- Nhiều worker: 80 bit ngẫu nhiên, xác suất trùng không đáng kể
+- So sánh chuỗi id (cùng tiền tố) = so sánh thời điểm tạo
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RANDOM_BITS = 80
+
+_lock = threading.Lock()
+_last_ms = -1
+_last_random = 0
+
+def _encode(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+def new_ulid() -> str:
+    """ULID 26 ký tự, tăng dần trong process kể cả khi gọi nhiều lần cùng mili giây"""
+    global _last_ms, _last_random
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms <= _last_ms:
+            # Cùng mili giây (hoặc đồng hồ lùi): giữ thời điểm cũ, tăng phần ngẫu nhiên
+            now_ms = _last_ms
+            _last_random += 1
+            if _last_random >> _RANDOM_BITS:  # Tràn: mượn mili giây kế tiếp
+                now_ms += 1
+                _last_random = int.from_bytes(os.urandom(10), "big") >> 1
+        else:
+            # Bỏ bit cao nhất để còn chỗ tăng trong cùng mili giây
+            _last_random = int.from_bytes(os.urandom(10), "big") >> 1
+        _last_ms = now_ms
+        return _encode(now_ms, 10) + _encode(_last_random, 16)
+
+def new_id(prefix: str) -> str:
+    """Id bản ghi mới, vd. new_id("diary") -> 'diary_01J9ZQ4K7M3X8T2V6B0N5R1C4D'"""
+    return f"{prefix}_{new_ulid()}"
+
+def id_time(record_id: str) -> Optional[datetime]:
+    """Thời điểm tạo (giờ địa phương) của id do new_id sinh ra, None với id kiểu cũ"""
+    ulid = record_id.rpartition("_")[2]
+    if len(ulid) != 26:
+        return None
+    try:
+        ms = 0
+        for char in ulid[:10].upper():
+            ms = ms * 32 + _ALPHABET.index(char)
+        return datetime.fromtimestamp(ms / 1000)
+    except (ValueError, OverflowError, OSError):
+        return None
@@ -0,0 +1,231 @@
+"""
+Metrics - Prometheus text exposition format
+Counter/Gauge/Histogram nhẹ trong process, không cần thư viện hay dịch vụ ngoài
+Mỗi worker có bộ số liệu riêng (đọc qua /metrics của worker đó)
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+# Giây
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Bytes: 16 KB -> 32 MB
+SIZE_BUCKETS = tuple(16 * 1024 * 4 ** i for i in range(7)) + (32 * 1024 * 1024,)
+
+_registry: List["_Metric"] = []
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [số lượng theo từng bucket (không cộng dồn) + bucket +Inf, tổng, đếm]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Đo thời gian một khối code"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_sample(self, key, value) -> List[str]:
+        counts, total, count = value[0][:], value[1], value[2]
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+def render_metrics() -> str:
+    """Xuất toàn bộ metrics theo định dạng text của Prometheus"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# ========== HTTP ==========
+
+HTTP_REQUESTS = Counter("http_requests_total", "Số request HTTP", ["method", "route", "status"])
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Thời gian xử lý request HTTP", ["method", "route"])
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Số request HTTP đang xử lý", ["method"])
+
+# ========== OCR ==========
+
+OCR_LATENCY = Histogram("ocr_duration_seconds", "Thời gian chạy OCR (tesseract)")
+OCR_IMAGE_BYTES = Histogram("ocr_image_bytes", "Dung lượng ảnh upload cho OCR", ["route"], buckets=SIZE_BUCKETS)
+
+# ========== LLM (Groq) ==========
+
+LLM_REQUESTS = Counter("groq_requests_total", "Số lần gọi Groq API", ["status"])
+LLM_LATENCY = Histogram("groq_request_duration_seconds", "Thời gian một lần gọi Groq API", ["status"])
+LLM_TOKENS = Counter("groq_tokens_total", "Token đã dùng theo báo cáo của Groq", ["type"])
+LLM_RETRIES = Counter("groq_retries_total", "Số lần gọi lại Groq API sau lỗi tạm thời", ["reason"])
+LLM_CALLS_SAVED = Counter("groq_calls_saved_total", "Số lần bỏ qua gọi Groq vì dùng lại kết quả cũ", ["reason"])
+LLM_HEDGES = Counter("groq_hedges_total", "Hedging: request dự phòng thắng/thua, hoặc bỏ qua vì hết ngân sách/không còn slot", ["outcome"])
+LLM_HEDGE_SAVED = Histogram("groq_hedge_saved_seconds", "Ước lượng thời gian tiết kiệm khi request dự phòng về trước (từ histogram latency)")
+LLM_TASK_REQUESTS = Counter("groq_task_requests_total", "Số lần gọi Groq theo tác vụ, model và kết quả", ["task", "model", "status"])
+LLM_FALLBACKS = Counter("groq_model_fallbacks_total", "Số lần chuyển sang model dự phòng (lý do: errors, slow) hoặc trở lại model chính (recovered)", ["task", "reason"])
+LLM_FALLBACK_ACTIVE = Gauge("groq_model_fallback_active", "1 nếu tác vụ đang dùng model dự phòng", ["task"])
+LLM_FEATURE_TOKENS = Counter("groq_feature_tokens_total", "Token Groq theo tính năng và loại (prompt, completion)", ["feature", "type"])
+LLM_BUDGET_DEGRADED = Counter("groq_budget_degraded_total", "Số lần bỏ gọi Groq của tính năng không thiết yếu vì vượt ngân sách", ["feature", "reason"])
+
+# ========== REMINDERS ==========
+
+REMINDERS_FIRED = Counter("reminders_fired_total", "Số nhắc nhở đã đến hạn và được đẩy")
+REMINDER_DELIVERY_LAG = Histogram("reminder_delivery_lag_seconds", "Độ trễ từ lúc đến hạn tới lúc đẩy cho client")
+REMINDER_STREAM_CLIENTS = Gauge("reminder_stream_clients", "Số client đang kết nối /reminders/stream")
+
+# ========== ADMISSION ==========
+
+ADMISSION_ACTIVE = Gauge("admission_active", "Số việc đang giữ slot của một tầng (ocr, llm, storage)", ["stage"])
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "Số việc đang chờ slot của một tầng", ["stage"])
+ADMISSION_WAIT = Histogram("admission_wait_seconds", "Thời gian chờ slot (việc được nhận)", ["stage"])
+ADMISSION_REJECTED = Counter("admission_rejected_total", "Số việc bị từ chối (503) theo tầng, lý do và lớp ưu tiên", ["stage", "reason", "priority"])
+
+# ========== DEADLINE ==========
+
+DEADLINE_EXCEEDED = Counter("deadline_exceeded_total", "Số bước bị bỏ/cắt vì hết ngân sách thời gian của request", ["stage"])
+ENRICHMENTS_DEFERRED = Counter("enrichments_deferred_total", "Số bước làm giàu bị hoãn để bổ sung sau", ["step"])
+ENRICHMENTS_BACKFILLED = Counter("enrichments_backfilled_total", "Số lần bổ sung bước bị hoãn theo kết quả", ["kind", "outcome"])
+
+# ========== DIGEST ==========
+
+DIGEST_JOBS = Counter("digest_jobs_total", "Số người dùng được job tóm tắt ngày xử lý theo kết quả (done, empty, failed, gave_up)", ["outcome"])
+DIGEST_RUN_DURATION = Histogram("digest_run_duration_seconds", "Thời gian một lượt chạy job tóm tắt ngày (mọi người dùng)", buckets=(1, 5, 15, 60, 300, 900, 1800, 3600))
+
+# ========== IDEMPOTENCY ==========
+
+IDEMPOTENT_REQUESTS = Counter("idempotent_requests_total", "Request có Idempotency-Key theo kết quả (executed, replayed, attached, mismatch, busy)", ["route", "outcome"])
+
+# ========== TENANTS ==========
+
+TENANT_CACHE_ENTRIES = Gauge("tenant_cache_entries", "Số tenant đang giữ dữ liệu trong bộ nhớ", ["cache"])
+TENANT_CACHE_LOADS = Counter("tenant_cache_loads_total", "Số lần nạp dữ liệu một tenant vào bộ nhớ", ["cache"])
+TENANT_CACHE_EVICTIONS = Counter("tenant_cache_evictions_total", "Số lần giải phóng một tenant khỏi bộ nhớ", ["cache", "reason"])
+
+# ========== STORAGE ==========
+
+STORAGE_READ_LATENCY = Histogram("storage_read_duration_seconds", "Thời gian đọc một collection", ["collection"])
+STORAGE_WRITE_LATENCY = Histogram("storage_write_duration_seconds", "Thời gian ghi một collection", ["collection"])
+STORAGE_READ_BYTES = Counter("storage_read_bytes_total", "Số byte đã đọc từ storage", ["collection"])
+STORAGE_WRITE_BYTES = Counter("storage_write_bytes_total", "Số byte đã ghi vào storage", ["collection"])
+STORAGE_POINT_READ_LATENCY = Histogram("storage_point_read_duration_seconds", "Thời gian đọc một bản ghi theo id (mmap)", ["collection"])
+
+class MetricsMiddleware:
+    """
+    ASGI middleware đo request HTTP (không dùng BaseHTTPMiddleware để overhead thấp)
+    Nhãn route là path template (vd. /diaries/{diary_id}/image) để số series không tăng vô hạn
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        HTTP_IN_FLIGHT.inc(method=method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec(method=method)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.inc(method=method, route=route, status=status)
+            HTTP_LATENCY.observe(elapsed, method=method, route=route)
@@ -9,7 +9,8 @@ class DiaryEntry(BaseModel):
     id: str
     content: str
     summary: Optional[str] = None
-    image_base64: Optional[str] = None
+    image_base64: Optional[str] = None  # Định dạng cũ, bản ghi mới dùng image_id
+    image_id: Optional[str] = None  # SHA-256 của ảnh gốc trong storage/images
     created_at: str
     entry_type: str = "diary"  # "diary" or "note"
     emotion: Optional[str] = None  # AI phân tích cảm xúc
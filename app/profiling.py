@@ -0,0 +1,196 @@
+"""
+Per-request Profiling
+Sampling profiler (stdlib) cho một phần request được chọn mẫu hoặc có header debug,
+kèm thời gian từng giai đoạn (OCR, LLM, storage). Profile lưu trong vòng đệm trên đĩa.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.config import ADMIN_TOKEN, PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL, PROFILE_RING_SIZE
+
+PROFILE_HEADER = b"x-debug-profile"
+MAX_STACK_DEPTH = 128
+
+class _ProfileContext:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: List[Dict] = []
+
+_active_profile: ContextVar[Optional[_ProfileContext]] = ContextVar("active_profile", default=None)
+
+def record_span(stage: str, name: str, start: float, duration: float):
+    """
+    Ghi thời gian một giai đoạn vào profile của request hiện tại (nếu đang profile)
+
+    Args:
+        stage: "ocr", "llm", "storage"...
+        name: Mô tả ngắn (vd. "read diaries")
+        start: time.perf_counter() lúc bắt đầu
+        duration: Số giây
+    """
+    ctx = _active_profile.get()
+    if ctx is not None:
+        ctx.spans.append({
+            "stage": stage,
+            "name": name,
+            "start_ms": round((start - ctx.start) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3)
+        })
+
+class StackSampler:
+    """Lấy mẫu stack của một thread theo chu kỳ, gom thành collapsed stacks (định dạng flamegraph)"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and len(names) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+# ========== PROFILE STORE (vòng đệm trên đĩa) ==========
+
+class ProfileStore:
+    """Lưu tối đa PROFILE_RING_SIZE profile gần nhất trong PROFILE_DIR"""
+
+    @staticmethod
+    def save(profile_id: str, meta: Dict, stacks: Counter):
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(PROFILE_DIR / f"{profile_id}.collapsed", 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(PROFILE_DIR / f"{profile_id}.json", 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        ProfileStore.evict()
+
+    @staticmethod
+    def evict():
+        """Xóa profile cũ nhất khi vượt quá kích thước vòng đệm"""
+        metas = sorted(PROFILE_DIR.glob("*.json"))
+        for old in metas[:max(len(metas) - PROFILE_RING_SIZE, 0)]:
+            old.unlink(missing_ok=True)
+            old.with_suffix(".collapsed").unlink(missing_ok=True)
+
+    @staticmethod
+    def list_profiles() -> List[Dict]:
+        """Danh sách profile, mới nhất trước (không kèm spans)"""
+        if not PROFILE_DIR.exists():
+            return []
+        result = []
+        for path in sorted(PROFILE_DIR.glob("*.json"), reverse=True):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            meta.pop("spans", None)
+            result.append(meta)
+        return result
+
+    @staticmethod
+    def path_for(profile_id: str, kind: str) -> Optional[Path]:
+        """Đường dẫn file profile ("json" hoặc "collapsed"), None nếu không có"""
+        if not profile_id.replace("_", "").replace("-", "").isalnum():
+            return None
+        path = PROFILE_DIR / f"{profile_id}.{kind}"
+        return path if path.exists() else None
+
+# ========== MIDDLEWARE ==========
+
+def _new_profile_id() -> str:
+    return f"prof_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{os.getpid()}"
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profile request khi:
+    - Được chọn ngẫu nhiên theo PROFILE_SAMPLE_RATE, hoặc
+    - Có header X-Debug-Profile bằng ADMIN_TOKEN
+    Response trả về header X-Profile-Id để tải profile qua /admin/profiles/{id}
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _should_profile(self, scope) -> bool:
+        if ADMIN_TOKEN:
+            for name, value in scope.get("headers", []):
+                if name == PROFILE_HEADER:
+                    return value.decode("latin-1") == ADMIN_TOKEN
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = _new_profile_id()
+        status = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        ctx = _ProfileContext()
+        token = _active_profile.set(ctx)
+        sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            stacks = sampler.stop()
+            duration = time.perf_counter() - ctx.start
+            _active_profile.reset(token)
+
+            stage_totals: Dict[str, float] = {}
+            for span in ctx.spans:
+                stage_totals[span["stage"]] = round(stage_totals.get(span["stage"], 0) + span["duration_ms"], 3)
+
+            meta = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(scope.get("route"), "path", None),
+                "status": status,
+                "duration_ms": round(duration * 1000, 3),
+                "created_at": datetime.now().isoformat(),
+                "sample_interval_ms": PROFILE_INTERVAL * 1000,
+                "samples": sum(stacks.values()),
+                "stage_totals_ms": stage_totals,
+                "spans": ctx.spans
+            }
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, ProfileStore.save, profile_id, meta, stacks)
+            except Exception as e:
+                print(f"Error saving profile: {e}")
@@ -1,17 +1,158 @@
 """
 API Routes/Endpoints - Enhanced Version
 """
-from fastapi import File, UploadFile, HTTPException, Form, Body
-from fastapi.responses import JSONResponse
-from typing import Optional, List
-from datetime import datetime
+from fastapi import File, UploadFile, HTTPException, Form, Body, Request, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pathlib import Path
+from typing import Optional, List, Tuple
+from datetime import date, datetime, timedelta
+import asyncio
 import base64
+import hashlib
 import json
 
+from app.config import (
+    ADMIN_TOKEN, IMAGE_SIZES, IMAGE_CACHE_MAX_AGE, UPLOAD_CHUNK_SIZE, SEARCH_MAX_LIMIT, REMINDER_LIST_DAYS,
+    DIARY_FILE, NOTE_FILE, REMINDER_FILE, USER_PROFILE_FILE, TENANT_HEADER, TENANT_TOKEN_HEADER,
+    LLM_USAGE_RETENTION_DAYS
+)
+from app.metrics import OCR_IMAGE_BYTES, LLM_CALLS_SAVED, render_metrics
+from app.admission import Admission, Overloaded
+from app.deadline import DEFERRED, enrich
+from app.ids import new_id
+from app.profiling import ProfileStore
+from app.tenancy import current_tenant
 from app.services.ocr_service import OCRService
-from app.services.ai_service import AIService
+from app.services.ai_service import AIService, NOTE_ANALYSIS_FALLBACK
+from app.services.dedup_service import DuplicateNoteService
+from app.services.enrichment_service import EnrichmentService
+from app.services.image_service import ImageService
+from app.services.reminder_service import ReminderService
+from app.services.search_service import SearchService, KINDS as SEARCH_KINDS
+from app.services.tag_service import TagService, TAG_MODES
+from app.services.timeline_service import TimelineService
+from app.services.upload_service import UploadService
+from app.services.usage_service import LLMUsageService
 from app.database import StorageManager
 
+# ========== HELPERS ==========
+
+def _require_admin(request: Request):
+    """Endpoint /admin/* cần header X-Admin-Token khớp ADMIN_TOKEN (tắt nếu chưa cấu hình)"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Chưa cấu hình ADMIN_TOKEN")
+    if request.headers.get("x-admin-token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Sai hoặc thiếu X-Admin-Token")
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Kiểm tra header If-None-Match có khớp ETag hiện tại không (so sánh yếu: bỏ qua tiền tố W/)"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+def _collection_etag(collections: List[Path], *params) -> str:
+    """
+    ETag yếu cho response chỉ phụ thuộc vào các collection và tham số truy vấn:
+    băm phiên bản collection (tăng sau mỗi lần ghi) + tenant + tham số - không đọc dữ liệu
+    """
+    versions = [StorageManager.collection_version(c) for c in collections]
+    key = json.dumps([current_tenant(), versions, params], ensure_ascii=False, default=str)
+    return f'W/"{hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]}"'
+
+def _revalidate_headers(etag: str) -> dict:
+    """Client giữ bản cũ nhưng phải hỏi lại (If-None-Match) mỗi lần dùng"""
+    return {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Vary": f"{TENANT_HEADER}, {TENANT_TOKEN_HEADER}, Authorization"
+    }
+
+def _parse_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse header Range dạng "bytes=start-end" (chỉ hỗ trợ một khoảng)
+    
+    Returns:
+        (start, end) bao gồm cả hai đầu, None nếu không thỏa mãn được
+        
+    Raises:
+        ValueError nếu header sai cú pháp hoặc có nhiều khoảng
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError("Range không hỗ trợ")
+    
+    start_text, _, end_text = spec.strip().partition("-")
+    if not start_text:
+        # bytes=-N: N byte cuối
+        length = int(end_text)
+        if length == 0:
+            return None
+        return max(file_size - length, 0), file_size - 1
+    
+    start = int(start_text)
+    end = int(end_text) if end_text else file_size - 1
+    if start > end or start >= file_size:
+        return None
+    return start, min(end, file_size - 1)
+
+def _iter_file_range(path: Path, start: int, end: int):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _migrate_legacy_image(diary_id: str, image_base64: str) -> str:
+    """Lưu ảnh base64 của nhật ký cũ vào storage/images, bỏ image_base64 khỏi bản ghi; trả về image_id"""
+    image_id = ImageService.save_original_bytes(base64.b64decode(image_base64))
+    StorageManager.update_diary(diary_id, {"image_id": image_id}, remove=['image_base64'])
+    return image_id
+
+def _file_response(request: Request, path: Path, media_type: str, etag: str, vary: Optional[str] = None) -> Response:
+    """Trả file với ETag, Cache-Control, 304 Not Modified và hỗ trợ Range (206)"""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={IMAGE_CACHE_MAX_AGE}",
+        "Accept-Ranges": "bytes"
+    }
+    if vary:
+        headers["Vary"] = vary
+    
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        file_size = path.stat().st_size
+        try:
+            byte_range = _parse_range(range_header, file_size)
+        except ValueError:
+            return FileResponse(path, media_type=media_type, headers=headers)
+        
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{file_size}"
+            return Response(status_code=416, headers=headers)
+        
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            _iter_file_range(path, start, end),
+            status_code=206,
+            media_type=media_type,
+            headers=headers
+        )
+    
+    return FileResponse(path, media_type=media_type, headers=headers)
+
 # ========== ROOT & TEST ==========
 
 async def root():
@@ -29,19 +170,30 @@ async def root():
             "Phân tích xu hướng sức khỏe",
             "Chat AI có ngữ cảnh"
         ],
+        "user_id": "Header X-User-Id (hoặc X-User-Token khi server đặt TENANT_SECRET): mỗi người dùng một kho dữ liệu riêng",
+        "deadline": "Header X-Request-Timeout (giây) cho /entry, /chat: hết thời gian thì bỏ bước AI chưa kịp (trả về trong \"deferred\", bổ sung sau)",
+        "idempotency": "Header Idempotency-Key cho /entry, /chat, /memory, /health/log (POST): gửi lại cùng key nhận lại kết quả cũ, không xử lý lần hai",
         "endpoints": {
             "basic": {
                 "ocr": "/ocr (POST)",
-                "test_ai": "/test-ai (GET)"
+                "test_ai": "/test-ai (GET)",
+                "metrics": "/metrics (GET)"
             },
             "diary_note": {
                 "create_entry": "/entry (POST) - Tạo nhật ký hoặc note",
                 "list_diaries": "/diaries (GET)",
-                "list_notes": "/notes (GET)"
+                "get_diary": "/diaries/{id} (GET)",
+                "diary_image": "/diaries/{id}/image?size=thumb|medium|original (GET)",
+                "list_notes": "/notes (GET)",
+                "get_note": "/notes/{id} (GET)"
             },
             "reminder": {
-                "list_reminders": "/reminders (GET)",
-                "complete_reminder": "/reminders/{id}/complete (PUT)"
+                "list_reminders": "/reminders?start=&end= (GET) - Gồm các lần của chuỗi lặp trong khoảng",
+                "get_reminder": "/reminders/{id} (GET) - id của nhắc nhở, chuỗi hoặc một lần (series@giờ)",
+                "complete_reminder": "/reminders/{id}/complete (PUT) - id của nhắc nhở, một lần (series@giờ) hoặc cả chuỗi",
+                "create_series": "/reminders/series (POST) - Nhắc nhở lặp lại",
+                "medication_series": "/reminders/series/medications (POST) - Từ danh sách thuốc trong hồ sơ",
+                "reminder_stream": "/reminders/stream (WebSocket) - Đẩy nhắc nhở khi đến hạn, nhận ack/snooze"
             },
             "user": {
                 "get_profile": "/profile (GET)",
@@ -57,7 +209,23 @@ async def root():
             },
             "memory": {
                 "save_memory": "/memory (POST)",
-                "list_memories": "/memories (GET)"
+                "list_memories": "/memories (GET)",
+                "get_memory": "/memories/{id} (GET)",
+                "filter_by_tag": "/memories?tag=quê hương&tag=gia đình&mode=any|all (GET)",
+                "list_tags": "/memories/tags (GET) - Tag kèm số ký ức"
+            },
+            "search": {
+                "search": "/search?q=...&type=diary,note,memory (GET) - Tìm kiếm không phân biệt dấu"
+            },
+            "timeline": {
+                "timeline": "/timeline?from=YYYY-MM-DD&to=YYYY-MM-DD&granularity=day|week (GET) - Cảm xúc, số nhật ký/ghi chú, tỉ lệ hoàn thành nhắc nhở theo ngày/tuần",
+                "digest": "/digest?date=YYYY-MM-DD (GET) - Bản tóm tắt cả ngày (tạo ban đêm, mặc định hôm qua)"
+            },
+            "admin": {
+                "list_profiles": "/admin/profiles (GET)",
+                "download_profile": "/admin/profiles/{id} (GET)",
+                "download_flamegraph": "/admin/profiles/{id}/flamegraph (GET)",
+                "llm_usage": "/admin/llm-usage?days=1&user=... (GET) - Token Groq theo tính năng/giờ/người dùng, ngân sách hôm nay"
             }
         }
     }
@@ -82,6 +250,10 @@ async def test_ai_connection():
             "guide": "Lấy API key tại: https://console.groq.com/"
         }
 
+async def metrics():
+    """Metrics cho Prometheus (text exposition format)"""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
 # ========== OCR ==========
 
 async def extract_text_from_image(file: UploadFile = File(...)):
@@ -90,8 +262,11 @@ async def extract_text_from_image(file: UploadFile = File(...)):
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File phải là ảnh")
         
-        contents = await file.read()
-        extracted_text = await OCRService.extract_text_from_image(contents)
+        Admission.admit(Admission.ocr)
+        
+        with await UploadService.receive(file) as upload:
+            OCR_IMAGE_BYTES.observe(upload.size, route="/ocr")
+            extracted_text = await OCRService.extract_text_from_image(upload.open())
         
         return JSONResponse(
             status_code=200,
@@ -103,6 +278,8 @@ async def extract_text_from_image(file: UploadFile = File(...)):
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi xử lý ảnh: {str(e)}")
 
@@ -117,6 +294,8 @@ async def create_entry(
     Tạo nhật ký hoặc ghi chú từ ảnh
     - entry_type="diary": Tạo nhật ký + tóm tắt + phân tích cảm xúc
     - entry_type="note": Tạo ghi chú + phân tích thông minh + tự động tạo reminder
+    - Hết deadline (header X-Request-Timeout hoặc mặc định): vẫn lưu, các bước AI chưa kịp nằm trong
+      "deferred" và được bổ sung sau
     """
     try:
         if entry_type not in ["diary", "note"]:
@@ -125,35 +304,50 @@ async def create_entry(
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File phải là ảnh")
         
-        # OCR
-        contents = await file.read()
-        extracted_text = await OCRService.extract_text_from_image(contents)
-        
-        if not extracted_text:
-            raise HTTPException(status_code=400, detail="Không đọc được text từ ảnh")
+        # Quá tải thì trả 503 ngay, trước khi tốn công OCR
+        Admission.admit(Admission.ocr, *([Admission.llm] if auto_analyze else []), Admission.storage)
         
-        image_base64 = base64.b64encode(contents).decode('utf-8')
+        # OCR (đọc trực tiếp từ file spool, không giữ bản sao toàn bộ ảnh trong RAM)
+        with await UploadService.receive(file) as upload:
+            OCR_IMAGE_BYTES.observe(upload.size, route="/entry")
+            extracted_text = await OCRService.extract_text_from_image(upload.open())
+            
+            if not extracted_text:
+                raise HTTPException(status_code=400, detail="Không đọc được text từ ảnh")
+            
+            image_id = UploadService.store_image(upload) if entry_type == "diary" else None
         
         # ===== XỬ LÝ DIARY =====
         if entry_type == "diary":
             summary = None
             emotion = None
+            deferred = []
             
             if auto_analyze:
-                summary = await AIService.summarize_diary(extracted_text)
-                emotion = await AIService.analyze_emotion(extracted_text)
+                # Hai bước độc lập: chạy song song trong ngân sách còn lại
+                summary, emotion = await asyncio.gather(
+                    enrich(AIService.summarize_diary, extracted_text),
+                    enrich(AIService.analyze_emotion, extracted_text)
+                )
+                deferred = [step for step, value in (("summary", summary), ("emotion", emotion)) if value is DEFERRED]
+                summary = None if summary is DEFERRED else summary
+                emotion = None if emotion is DEFERRED else emotion
             
             diary_entry = {
-                "id": f"diary_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                "id": new_id("diary"),
                 "content": extracted_text,
                 "summary": summary,
                 "emotion": emotion,
-                "image_base64": image_base64,
+                "image_id": image_id,
                 "entry_type": "diary",
                 "created_at": datetime.now().isoformat()
             }
+            if deferred:
+                diary_entry["deferred"] = deferred
             
-            StorageManager.save_diary(diary_entry)
+            await Admission.storage.run(StorageManager.save_diary, diary_entry)
+            if deferred:
+                EnrichmentService.defer("diary", diary_entry["id"], deferred)
             
             return JSONResponse(
                 status_code=200,
@@ -164,7 +358,8 @@ async def create_entry(
                     "original_text": extracted_text,
                     "summary": summary,
                     "emotion": emotion,
-                    "message": "Nhật ký đã được lưu!"
+                    "deferred": deferred,
+                    "message": "Nhật ký đã được lưu!" + (" Tóm tắt và cảm xúc sẽ được bổ sung sau." if deferred else "")
                 }
             )
         
@@ -176,13 +371,75 @@ async def create_entry(
             # AI phân tích note
             analysis = None
             created_reminders = []
+            duplicate = None
             
             if auto_analyze:
-                analysis = await AIService.analyze_note(extracted_text, user_profile)
+                # Ảnh chụp lại ghi chú vừa phân tích: dùng lại phân tích + nhắc nhở cũ, không gọi Groq
+                try:
+                    duplicate = await run_in_threadpool(DuplicateNoteService.find_duplicate, extracted_text)
+                except Exception as e:
+                    print(f"Error finding duplicate note: {e}")
+            
+            if duplicate:
+                original, similarity = duplicate
+                original_id = original.get('duplicate_of') or original['id']
+                analysis = original['analysis']
+                LLM_CALLS_SAVED.inc(reason="duplicate_note")
+                LLMUsageService.record("note_analysis", "", cache="hit")
+                
+                note = {
+                    "id": new_id("note"),
+                    "content": extracted_text,
+                    "category": analysis.get('category'),
+                    "extracted_datetime": analysis.get('extracted_datetime'),
+                    "priority": analysis.get('priority'),
+                    "is_reminder": analysis.get('should_create_reminder', False),
+                    "analysis": analysis,
+                    "duplicate_of": original_id,
+                    "created_at": datetime.now().isoformat()
+                }
+                await Admission.storage.run(StorageManager.save_note, note)
+                
+                existing_reminders = [
+                    r for r in StorageManager.get_all_reminders() if r.get('note_id') == original_id
+                ]
                 
+                return JSONResponse(
+                    status_code=200,
+                    content={
+                        "success": True,
+                        "type": "note",
+                        "note_id": note["id"],
+                        "original_text": extracted_text,
+                        "analysis": analysis,
+                        "duplicate_of": original_id,
+                        "similarity": round(similarity, 3),
+                        "reminders_created": 0,
+                        "reminders": [
+                            {
+                                "id": r["id"],
+                                "title": r["title"],
+                                "remind_at": r["remind_at"]
+                            }
+                            for r in existing_reminders
+                        ],
+                        "deferred": [],
+                        "message": "Ghi chú này trùng với ghi chú đã lưu, dùng lại phân tích và nhắc nhở cũ."
+                    }
+                )
+            
+            deferred = []
+            if auto_analyze:
+                analysis = await enrich(AIService.analyze_note, extracted_text, user_profile)
+                if analysis is DEFERRED:
+                    # Hết thời gian: lưu ghi chú cơ bản, phân tích + nhắc nhở bổ sung sau
+                    analysis = None
+                    deferred = ["analysis"]
+            
+            if analysis is not None:
                 # Tạo note
                 note = {
-                    "id": f"note_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                    "id": new_id("note"),
                     "content": extracted_text,
                     "category": analysis.get('category'),
                     "extracted_datetime": analysis.get('extracted_datetime'),
@@ -190,20 +447,22 @@ async def create_entry(
                     "is_reminder": analysis.get('should_create_reminder', False),
                     "created_at": datetime.now().isoformat()
                 }
+                if analysis != NOTE_ANALYSIS_FALLBACK:
+                    note["analysis"] = analysis  # Để ảnh chụp lại dùng lại, không gọi Groq lần nữa
                 
-                StorageManager.save_note(note)
+                await Admission.storage.run(StorageManager.save_note, note)
                 
                 # Tự động tạo reminders nếu cần
                 if analysis.get('should_create_reminder'):
                     reminders = await AIService.generate_reminders_from_note(note, analysis)
                     for reminder in reminders:
-                        StorageManager.save_reminder(reminder)
+                        await Admission.storage.run(StorageManager.save_reminder, reminder)
                         created_reminders.append(reminder)
             
             else:
                 # Không phân tích, lưu note cơ bản
                 note = {
-                    "id": f"note_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                    "id": new_id("note"),
                     "content": extracted_text,
                     "category": "other",
                     "extracted_datetime": None,
@@ -211,7 +470,11 @@ async def create_entry(
                     "is_reminder": False,
                     "created_at": datetime.now().isoformat()
                 }
-                StorageManager.save_note(note)
+                if deferred:
+                    note["deferred"] = deferred
+                await Admission.storage.run(StorageManager.save_note, note)
+                if deferred:
+                    EnrichmentService.defer("note", note["id"], deferred)
             
             return JSONResponse(
                 status_code=200,
@@ -230,20 +493,32 @@ async def create_entry(
                         }
                         for r in created_reminders
                     ],
-                    "message": f"Ghi chú đã lưu! {'Đã tạo ' + str(len(created_reminders)) + ' nhắc nhở.' if created_reminders else ''}"
+                    "deferred": deferred,
+                    "message": (
+                        "Ghi chú đã lưu! Phân tích và nhắc nhở sẽ được bổ sung sau." if deferred else
+                        f"Ghi chú đã lưu! {'Đã tạo ' + str(len(created_reminders)) + ' nhắc nhở.' if created_reminders else ''}"
+                    )
                 }
             )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi tạo entry: {str(e)}")
 
-async def list_diaries(limit: int = 10):
-    """Xem danh sách nhật ký"""
+async def list_diaries(request: Request, limit: int = 10):
+    """Xem danh sách nhật ký (ETag: 304 nếu không đổi từ lần trước)"""
     try:
+        etag = _collection_etag([DIARY_FILE], limit)
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=_revalidate_headers(etag))
+        
         diaries = StorageManager.get_recent_diaries(limit)
         
         for d in diaries:
-            d.pop('image_base64', None)
+            has_image = d.pop('image_base64', None) or d.get('image_id')
+            if has_image:
+                d['thumbnail_url'] = f"/diaries/{d['id']}/image?size=thumb"
         
         return JSONResponse(
             status_code=200,
@@ -251,14 +526,77 @@ async def list_diaries(limit: int = 10):
                 "success": True,
                 "total": len(StorageManager.get_all_diaries()),
                 "diaries": diaries
-            }
+            },
+            headers=_revalidate_headers(etag)
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
 
-async def list_notes(limit: int = 10):
-    """Xem danh sách ghi chú"""
+async def get_diary(diary_id: str):
+    """Xem một nhật ký theo id (chỉ đọc bản ghi đó, không đọc cả danh sách)"""
     try:
+        diary = StorageManager.get_diary(diary_id)
+        if not diary:
+            raise HTTPException(status_code=404, detail="Không tìm thấy nhật ký")
+        
+        has_image = diary.pop('image_base64', None) or diary.get('image_id')
+        if has_image:
+            diary['thumbnail_url'] = f"/diaries/{diary['id']}/image?size=thumb"
+        
+        return JSONResponse(status_code=200, content={"success": True, "diary": diary})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
+
+async def get_diary_image(diary_id: str, request: Request, size: str = "thumb"):
+    """
+    Lấy ảnh của nhật ký
+    - size="thumb": Ảnh nhỏ cho timeline (~20 KB)
+    - size="medium": Ảnh xem chi tiết
+    - size="original": Ảnh gốc
+    Ảnh thu nhỏ được sinh lần đầu khi có request rồi cache trên đĩa
+    """
+    try:
+        if size != "original" and size not in IMAGE_SIZES:
+            raise HTTPException(status_code=400, detail="size phải là 'thumb', 'medium' hoặc 'original'")
+        
+        diary = StorageManager.get_diary(diary_id)
+        if not diary:
+            raise HTTPException(status_code=404, detail="Không tìm thấy nhật ký")
+        
+        image_id = diary.get('image_id')
+        if not image_id and diary.get('image_base64'):
+            # Bản ghi cũ: chuyển ảnh base64 ra storage/images một lần duy nhất (giải mã, ghi file trong threadpool)
+            image_id = await Admission.storage.run(_migrate_legacy_image, diary_id, diary['image_base64'])
+        
+        if not image_id or not ImageService.original_path(image_id).exists():
+            raise HTTPException(status_code=404, detail="Nhật ký không có ảnh")
+        
+        if size == "original":
+            path = ImageService.original_path(image_id)
+            return _file_response(request, path, ImageService.detect_media_type(path), f'"{image_id}"')
+        
+        fmt = ImageService.choose_format(request.headers.get("accept"))
+        etag = f'"{image_id}-{size}-{fmt}"'
+        if _etag_matches(request, etag):
+            return _file_response(request, ImageService.derivative_path(image_id, size, fmt), f"image/{fmt}", etag, vary="Accept")
+        
+        path = await run_in_threadpool(ImageService.get_derivative, image_id, size, fmt)
+        return _file_response(request, path, f"image/{fmt}", etag, vary="Accept")
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
+
+async def list_notes(request: Request, limit: int = 10):
+    """Xem danh sách ghi chú (ETag: 304 nếu không đổi từ lần trước)"""
+    try:
+        etag = _collection_etag([NOTE_FILE], limit)
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=_revalidate_headers(etag))
+        
         notes = StorageManager.get_recent_notes(limit)
         
         return JSONResponse(
@@ -267,27 +605,52 @@ async def list_notes(limit: int = 10):
                 "success": True,
                 "total": len(StorageManager.get_all_notes()),
                 "notes": notes
-            }
+            },
+            headers=_revalidate_headers(etag)
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
 
+async def get_note(note_id: str):
+    """Xem một ghi chú theo id"""
+    try:
+        note = StorageManager.get_note(note_id)
+        if not note:
+            raise HTTPException(status_code=404, detail="Không tìm thấy ghi chú")
+        
+        return JSONResponse(status_code=200, content={"success": True, "note": note})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
+
 # ========== REMINDERS ==========
 
-async def list_reminders(status: str = "pending"):
+async def list_reminders(
+    request: Request, status: str = "pending", start: Optional[str] = None, end: Optional[str] = None
+):
     """
-    Xem danh sách nhắc nhở
+    Xem danh sách nhắc nhở (ETag: 304 nếu không đổi từ lần trước)
     - status="pending": Chưa hoàn thành
     - status="all": Tất cả
+    - start/end (ISO): khoảng trải các lần của chuỗi lặp, mặc định từ đầu hôm nay tới REMINDER_LIST_DAYS ngày sau
+      (làm tròn tới phút: trong cùng một phút, cùng dữ liệu thì cùng kết quả và cùng ETag)
     """
     try:
-        if status == "pending":
-            reminders = StorageManager.get_pending_reminders()
-        else:
-            reminders = StorageManager.get_all_reminders()
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+        window_start = datetime.fromisoformat(start) if start else today
+        default_end = datetime.now().replace(second=0, microsecond=0) + timedelta(days=REMINDER_LIST_DAYS)
+        window_end = datetime.fromisoformat(end) if end else default_end
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start/end phải là ngày giờ ISO (vd. 2024-05-01T00:00)")
+    
+    try:
+        etag = _collection_etag([REMINDER_FILE], status, window_start, window_end)
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=_revalidate_headers(etag))
         
         # Sắp xếp theo thời gian nhắc
-        reminders = sorted(reminders, key=lambda x: x['remind_at'])
+        reminders = await run_in_threadpool(ReminderService.list_reminders, status, window_start, window_end)
         
         return JSONResponse(
             status_code=200,
@@ -295,15 +658,121 @@ async def list_reminders(status: str = "pending"):
                 "success": True,
                 "total": len(reminders),
                 "reminders": reminders
+            },
+            headers=_revalidate_headers(etag)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
+
+async def get_reminder(reminder_id: str):
+    """Xem một nhắc nhở theo id (id của chuỗi lặp, hoặc một lần của chuỗi: 'series_x@2024-05-01T08:00')"""
+    try:
+        reminder = ReminderService.get_reminder(reminder_id)
+        if not reminder:
+            raise HTTPException(status_code=404, detail="Không tìm thấy nhắc nhở")
+        
+        return JSONResponse(status_code=200, content={"success": True, "reminder": reminder})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
+
+async def create_reminder_series(data: dict = Body(...)):
+    """
+    Tạo chuỗi nhắc nhở lặp lại (lưu một bản ghi, các lần nhắc được sinh khi cần)
+    
+    Body: {"title": ..., "description": ..., "remind_at": "2024-05-01T08:00",
+           "recurrence": {"freq": "daily|weekly|hourly", "interval": 1, "times": ["08:00"],
+                          "weekdays": [0, 2, 4], "until": "2024-12-31", "count": 30}}
+    """
+    try:
+        series = ReminderService.build_series(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        await Admission.storage.run(StorageManager.save_reminder, series)
+        
+        return JSONResponse(
+            status_code=200,
+            content={
+                "success": True,
+                "series": series,
+                "message": "Đã tạo nhắc nhở lặp lại!"
+            }
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
+
+async def create_medication_series():
+    """Tạo chuỗi nhắc uống thuốc hằng ngày từ danh sách thuốc trong hồ sơ (bỏ qua thuốc đã có chuỗi)"""
+    try:
+        user_profile = StorageManager.get_user_profile()
+        if not user_profile or not user_profile.get('medications'):
+            raise HTTPException(status_code=404, detail="Hồ sơ chưa có danh sách thuốc")
+        
+        try:
+            created, skipped = ReminderService.medication_series(user_profile)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Thông tin thuốc không hợp lệ: {e}")
+        for series in created:
+            await Admission.storage.run(StorageManager.save_reminder, series)
+        
+        return JSONResponse(
+            status_code=200,
+            content={
+                "success": True,
+                "created": created,
+                "skipped": skipped,
+                "message": f"Đã tạo {len(created)} chuỗi nhắc uống thuốc."
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
 
+async def reminder_stream(websocket: WebSocket):
+    """
+    WebSocket nhận nhắc nhở đúng lúc đến hạn (thay cho poll /reminders)
+    
+    Server gửi: {"type": "overdue", "reminders": [...]} khi vừa kết nối,
+    {"type": "reminder", "reminder": {...}, "due_at": ..., "lag_ms": ...} khi đến hạn
+    Client gửi: {"type": "ack", "id": ...} hoặc {"type": "snooze", "id": ..., "minutes": 10}
+    """
+    await websocket.accept()
+    tenant = current_tenant()
+    await run_in_threadpool(ReminderService.prepare, tenant)
+    overdue = ReminderService.overdue_message(tenant)
+    ReminderService.connect(tenant, websocket)
+    try:
+        await websocket.send_json(overdue)
+        while True:
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+                if not isinstance(message, dict):
+                    raise ValueError
+            except ValueError:
+                await websocket.send_json({"type": "error", "detail": "Tin nhắn phải là JSON object"})
+                continue
+            try:
+                reply = await Admission.storage.run(ReminderService.handle_message, message)
+            except Overloaded as e:
+                reply = {"type": "error", "id": message.get("id"), "detail": e.detail, "retry_after": e.retry_after}
+            await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        ReminderService.disconnect(tenant, websocket)
+
 async def complete_reminder(reminder_id: str):
     """Đánh dấu nhắc nhở đã hoàn thành"""
     try:
-        success = StorageManager.update_reminder_status(reminder_id, True)
+        # Nhắc nhở đơn lẻ, một lần của chuỗi (series_x@2024-05-01T08:00) hoặc dừng cả chuỗi
+        success = await Admission.storage.run(ReminderService.complete, reminder_id)
         
         if success:
             return JSONResponse(
@@ -316,14 +785,20 @@ async def complete_reminder(reminder_id: str):
         else:
             raise HTTPException(status_code=404, detail="Không tìm thấy nhắc nhở")
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
 
 # ========== USER PROFILE ==========
 
-async def get_profile():
-    """Lấy thông tin người dùng"""
+async def get_profile(request: Request):
+    """Lấy thông tin người dùng (ETag: 304 nếu không đổi từ lần trước)"""
     try:
+        etag = _collection_etag([USER_PROFILE_FILE])
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=_revalidate_headers(etag))
+        
         profile = StorageManager.get_user_profile()
         
         if not profile:
@@ -333,7 +808,8 @@ async def get_profile():
                     "success": True,
                     "profile": None,
                     "message": "Chưa có thông tin người dùng"
-                }
+                },
+                headers=_revalidate_headers(etag)
             )
         
         return JSONResponse(
@@ -341,7 +817,8 @@ async def get_profile():
             content={
                 "success": True,
                 "profile": profile
-            }
+            },
+            headers=_revalidate_headers(etag)
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
@@ -362,7 +839,7 @@ async def update_profile(profile_data: dict = Body(...)):
             profile_data['created_at'] = datetime.now().isoformat()
             profile_data['updated_at'] = datetime.now().isoformat()
         
-        StorageManager.save_user_profile(profile_data)
+        await Admission.storage.run(StorageManager.save_user_profile, profile_data)
         
         return JSONResponse(
             status_code=200,
@@ -372,6 +849,8 @@ async def update_profile(profile_data: dict = Body(...)):
                 "message": "Đã cập nhật thông tin!"
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
 
@@ -388,14 +867,14 @@ async def log_health(
     """
     try:
         health_log = {
-            "id": f"health_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            "id": new_id("health"),
             "log_type": log_type,
             "value": value,
             "note": note,
             "created_at": datetime.now().isoformat()
         }
         
-        StorageManager.save_health_log(health_log)
+        await Admission.storage.run(StorageManager.save_health_log, health_log)
         
         return JSONResponse(
             status_code=200,
@@ -405,6 +884,8 @@ async def log_health(
                 "message": "Đã ghi nhận thông tin sức khỏe!"
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
 
@@ -435,6 +916,8 @@ async def health_insights():
                 "recent_logs": StorageManager.get_all_health_logs()[-5:]
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
 
@@ -472,12 +955,16 @@ async def get_memory_prompt():
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
 
 async def chat(message: str = Body(..., embed=True)):
     """Chat với AI có ngữ cảnh"""
     try:
+        Admission.admit(Admission.llm, Admission.storage)
+        
         user_profile = StorageManager.get_user_profile()
         
         # Lấy lịch sử hội thoại gần nhất
@@ -500,11 +987,11 @@ async def chat(message: str = Body(..., embed=True)):
         conversation_history.append({"role": "assistant", "content": response})
         
         conversation = {
-            "id": f"conv_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            "id": new_id("conv"),
             "messages": conversation_history,
             "created_at": datetime.now().isoformat()
         }
-        StorageManager.save_conversation(conversation)
+        await Admission.storage.run(StorageManager.save_conversation, conversation)
         
         return JSONResponse(
             status_code=200,
@@ -514,6 +1001,8 @@ async def chat(message: str = Body(..., embed=True)):
                 "conversation_id": conversation["id"]
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
 
@@ -527,16 +1016,16 @@ async def save_memory(
     try:
         tag_list = []
         if tags:
-            tag_list = [t.strip() for t in tags.split(',')]
+            tag_list = [t.strip() for t in tags.split(',') if t.strip()]
         
         memory = {
-            "id": f"memory_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            "id": new_id("memory"),
             "content": content,
             "tags": tag_list,
             "created_at": datetime.now().isoformat()
         }
         
-        StorageManager.save_memory(memory)
+        await Admission.storage.run(StorageManager.save_memory, memory)
         
         return JSONResponse(
             status_code=200,
@@ -547,12 +1036,37 @@ async def save_memory(
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
 
-async def list_memories(limit: int = 10):
-    """Xem danh sách ký ức"""
+async def list_memories(limit: int = 10, tag: Optional[List[str]] = Query(None), mode: str = "any"):
+    """
+    Xem danh sách ký ức
+    
+    Args:
+        limit: Số ký ức tối đa (mới nhất trước)
+        tag: Lọc theo tag, lặp lại để lọc nhiều tag (?tag=a&tag=b)
+        mode: any = có ít nhất một tag, all = có đủ mọi tag
+    """
+    if mode not in TAG_MODES:
+        raise HTTPException(status_code=400, detail=f"mode không hợp lệ. Chọn trong: {', '.join(TAG_MODES)}")
+    
     try:
+        if tag:
+            total, memories = await run_in_threadpool(TagService.memories_with_tags, tag, mode, max(limit, 0))
+            return JSONResponse(
+                status_code=200,
+                content={
+                    "success": True,
+                    "total": total,
+                    "tags": tag,
+                    "mode": mode,
+                    "memories": memories
+                }
+            )
+        
         memories = StorageManager.get_recent_memories(limit)
         
         return JSONResponse(
@@ -564,4 +1078,168 @@ async def list_memories(limit: int = 10):
             }
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
+
+async def get_memory(memory_id: str):
+    """Xem một ký ức theo id"""
+    try:
+        memory = StorageManager.get_memory(memory_id)
+        if not memory:
+            raise HTTPException(status_code=404, detail="Không tìm thấy ký ức")
+        
+        return JSONResponse(status_code=200, content={"success": True, "memory": memory})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
+
+async def list_memory_tags():
+    """Các tag đã dùng kèm số ký ức, nhiều nhất trước"""
+    try:
+        tags = await run_in_threadpool(TagService.tag_counts)
+        
+        return JSONResponse(
+            status_code=200,
+            content={
+                "success": True,
+                "total": len(tags),
+                "tags": tags
+            }
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
+
+# ========== SEARCH ==========
+
+async def search(q: str = "", type: Optional[str] = None, limit: int = 10):
+    """
+    Tìm kiếm toàn văn trong nhật ký, ghi chú, ký ức (BM25, không phân biệt dấu)
+    
+    Args:
+        q: Từ khóa ("uong thuoc" khớp "uống thuốc")
+        type: Lọc loại dữ liệu, phân tách bằng dấu phẩy (diary, note, memory)
+        limit: Số kết quả tối đa
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Thiếu từ khóa tìm kiếm (q)")
+    
+    kinds = None
+    if type:
+        kinds = [k.strip() for k in type.split(",") if k.strip()]
+        invalid = [k for k in kinds if k not in SEARCH_KINDS]
+        if invalid:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Loại không hợp lệ: {', '.join(invalid)}. Chọn trong: {', '.join(SEARCH_KINDS)}"
+            )
+    
+    try:
+        result = await run_in_threadpool(SearchService.search, q, kinds, max(1, min(limit, SEARCH_MAX_LIMIT)))
+        return JSONResponse(
+            status_code=200,
+            content={
+                "success": True,
+                "query": q,
+                **result
+            }
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi tìm kiếm: {str(e)}")
+
+# ========== TIMELINE ==========
+
+async def timeline(
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    granularity: str = "day"
+):
+    """
+    Diễn biến theo ngày/tuần: cảm xúc nhật ký, số nhật ký/ghi chú/lần đo sức khỏe, tỉ lệ hoàn thành nhắc nhở
+    Nhắc nhở (kể cả từng lần của chuỗi lặp) tính vào bucket của ngày đến hạn, kể cả lần chưa tới giờ
+    Đọc tổng hợp có sẵn (TimelineService), không quét dữ liệu gốc
+    """
+    try:
+        first, last = TimelineService.parse_range(start, end, granularity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        result = await run_in_threadpool(TimelineService.query, first, last, granularity)
+        return JSONResponse(
+            status_code=200,
+            content={
+                "success": True,
+                "granularity": granularity,
+                "from": first.isoformat(),
+                "to": last.isoformat(),
+                **result
+            }
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi: {str(e)}")
+
+async def get_digest(day: Optional[str] = Query(None, alias="date")):
+    """
+    Bản tóm tắt một ngày (mặc định hôm qua): nhật ký, ghi chú, sức khỏe, nhắc nhở đã hoàn thành
+    Được tạo bởi job giờ thấp điểm (DigestService), không gọi Groq khi đọc
+    """
+    try:
+        day = date.fromisoformat(day).isoformat() if day else (date.today() - timedelta(days=1)).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date phải có dạng YYYY-MM-DD")
+    digest = await run_in_threadpool(StorageManager.get_digest, day)
+    if not digest:
+        raise HTTPException(status_code=404, detail="Chưa có bản tóm tắt cho ngày này")
+    return JSONResponse(
+        status_code=200,
+        content={
+            "success": True,
+            "digest": digest
+        }
+    )
+
+# ========== ADMIN: PROFILING ==========
+
+async def list_profiles(request: Request):
+    """Danh sách profile request đã lưu (mới nhất trước)"""
+    _require_admin(request)
+    profiles = ProfileStore.list_profiles()
+    return JSONResponse(
+        status_code=200,
+        content={
+            "success": True,
+            "total": len(profiles),
+            "profiles": profiles
+        }
+    )
+
+async def download_profile(profile_id: str, request: Request):
+    """Tải profile (JSON: thông tin request + spans OCR/LLM/storage)"""
+    _require_admin(request)
+    path = ProfileStore.path_for(profile_id, "json")
+    if not path:
+        raise HTTPException(status_code=404, detail="Không tìm thấy profile")
+    return FileResponse(path, media_type="application/json", filename=path.name)
+
+async def download_flamegraph(profile_id: str, request: Request):
+    """Tải collapsed stacks (dùng với flamegraph.pl hoặc speedscope)"""
+    _require_admin(request)
+    path = ProfileStore.path_for(profile_id, "collapsed")
+    if not path:
+        raise HTTPException(status_code=404, detail="Không tìm thấy profile")
+    return FileResponse(path, media_type="text/plain", filename=path.name)
+
+# ========== ADMIN: LLM USAGE ==========
+
+async def llm_usage(request: Request, days: int = 1, user: Optional[str] = None):
+    """Lượng dùng Groq (token, lỗi, latency, cache) theo tính năng, giờ và người dùng; ngân sách hôm nay"""
+    _require_admin(request)
+    if not 1 <= days <= LLM_USAGE_RETENTION_DAYS:
+        raise HTTPException(status_code=400, detail=f"days phải từ 1 đến {LLM_USAGE_RETENTION_DAYS}")
+    report = await run_in_threadpool(LLMUsageService.report, days, user)
+    return JSONResponse(
+        status_code=200,
+        content={
+            "success": True,
+            **report
+        }
+    )
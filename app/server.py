@@ -1,42 +1,53 @@
 """
 Server Startup & Configuration
 """
-import uvicorn
-from pyngrok import ngrok
-import nest_asyncio
-from app.app import create_app
+import asyncio
 from app.config import GROQ_API_KEY
 
-# Cho phép chạy uvicorn trong môi trường async
-nest_asyncio.apply()
+def _inside_running_loop() -> bool:
+    """Đang chạy trong một event loop có sẵn (Jupyter/Colab)?"""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
 
-def start_server(port: int = 8000, ngrok_token: str = None):
+def start_server(port: int = 8000, ngrok_token: str = None, workers: int = 1):
     """
     Khởi động server FastAPI với Ngrok
-    
+
     Args:
         port: Cổng chạy server (default: 8000)
         ngrok_token: Token ngrok để tạo public URL
+        workers: Số process uvicorn. Ngrok chỉ được mở một lần ở process chính,
+            các worker dùng chung cổng và chung storage (có khóa file liên process)
     """
     try:
+        import uvicorn
+        
         # Kiểm tra API key
         if not GROQ_API_KEY:
             print("\n⚠️  CẢNH BÁO: Chưa cấu hình GROQ_API_KEY trong file .env!")
             print("📝 Lấy API key tại: https://console.groq.com/")
-        
-        # Tạo FastAPI app
-        app = create_app()
-        
+
+        if _inside_running_loop():
+            # Cho phép chạy uvicorn trong môi trường async (notebook), chỉ hỗ trợ 1 worker
+            import nest_asyncio
+            nest_asyncio.apply()
+            workers = 1
+
         # Ngrok setup
         public_url = None
         if ngrok_token:
+            from pyngrok import ngrok
             ngrok.set_auth_token(ngrok_token)
             public_url = ngrok.connect(port)
-        
+
         # Print server info
         print(f"\n{'='*70}")
         print(f"🚀 Server đang chạy tại: http://localhost:{port}")
-        
+        print(f"⚙️  Workers: {workers}")
+
         if public_url:
             print(f"🌐 Public URL (Ngrok): {public_url}")
             print(f"🤖 AI Provider: Groq (Llama 3)")
@@ -51,11 +62,16 @@ def start_server(port: int = 8000, ngrok_token: str = None):
             print("🌐 Ngrok: Bị tắt (không tìm thấy NGROK_TOKEN trong .env)")
             print(f"🤖 AI Provider: Groq (Llama 3)")
             print(f"   • API Docs (local): http://localhost:{port}/docs")
-        
+
         print(f"{'='*70}\n")
-        
+
         # Start server
-        uvicorn.run(app, host="0.0.0.0", port=port)
-        
+        if workers > 1:
+            # Nhiều worker: uvicorn cần import string để mỗi process tự tạo app
+            uvicorn.run("app.app:create_app", factory=True, host="0.0.0.0", port=port, workers=workers)
+        else:
+            from app.app import create_app
+            uvicorn.run(create_app(), host="0.0.0.0", port=port)
+
     except Exception as e:
         print(f"❌ Lỗi server: {e}")
@@ -2,6 +2,13 @@
 Services Package Initialization
 """
 from app.services.ai_service import AIService
+from app.services.dedup_service import DuplicateNoteService
+from app.services.image_service import ImageService
 from app.services.ocr_service import OCRService
+from app.services.reminder_service import ReminderService
+from app.services.search_service import SearchService
+from app.services.tag_service import TagService
+from app.services.upload_service import UploadService
+from app.services.vector_service import VectorService
 
-__all__ = ['AIService', 'OCRService']
\ No newline at end of file
+__all__ = ['AIService', 'DuplicateNoteService', 'ImageService', 'OCRService', 'ReminderService', 'SearchService', 'TagService', 'UploadService', 'VectorService']
\ No newline at end of file
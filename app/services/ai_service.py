@@ -2,54 +2,203 @@
 AI Service Layer - Groq API Integration
 Các tính năng AI thông minh
 """
-import aiohttp
+import asyncio
 import re
+import time
 from typing import Optional, List, Dict, Tuple
 from datetime import datetime, timedelta
+from starlette.concurrency import run_in_threadpool
+from app.admission import Admission, Overloaded
+from app.capture import record_llm_exchange
+from app.deadline import DeadlineExceeded, budget, exceeded, remaining
+from app.ids import new_id
+from app.metrics import LLM_REQUESTS, LLM_LATENCY, LLM_TOKENS, LLM_RETRIES, LLM_TASK_REQUESTS
+from app.profiling import record_span
+from app.services.hedging import GROQ_HEDGE
+from app.services.model_routing import GROQ_ROUTER
+from app.services.usage_service import LLMUsageService
+from app.services.vector_service import VectorService
+from app.warmup import register_warmup
 from app.config import (
     GROQ_API_KEY, 
     GROQ_API_URL, 
-    GROQ_MODEL, 
-    GROQ_TEMPERATURE, 
-    GROQ_MAX_TOKENS
+    GROQ_MAX_RETRIES,
+    GROQ_RETRY_BACKOFF,
+    GROQ_RETRY_MAX_WAIT,
+    DEADLINE_MIN_LLM
 )
 
+def _is_retryable(status: str) -> bool:
+    return status in ("429", "error") or status.startswith("5")
+
+def _retry_delay(attempt: int, retry_after: Optional[str]) -> float:
+    """Thời gian chờ trước lần thử lại: theo Retry-After nếu có, không thì backoff lũy thừa"""
+    if retry_after:
+        try:
+            return min(float(retry_after), GROQ_RETRY_MAX_WAIT)
+        except ValueError:
+            pass
+    return min(GROQ_RETRY_BACKOFF * (2 ** attempt), GROQ_RETRY_MAX_WAIT)
+
+# Kết quả analyze_note khi Groq lỗi/trả sai định dạng (không lưu để dùng lại)
+NOTE_ANALYSIS_FALLBACK = {
+    "category": "other",
+    "extracted_datetime": None,
+    "priority": "medium",
+    "should_create_reminder": False,
+    "reminder_suggestion": None,
+    "analysis": "Không thể phân tích"
+}
+
+_RELATED_LABELS = {"diary": "Nhật ký", "memory": "Ký ức", "note": "Ghi chú"}
+
+def _format_related(hits: List[Dict]) -> str:
+    """Các đoạn liên quan (VectorService.related) dạng '- [Nhật ký 2024-05-01] ...'"""
+    lines = []
+    for hit in hits:
+        label = _RELATED_LABELS.get(hit["type"], hit["type"])
+        date = (hit.get("created_at") or "")[:10]
+        lines.append(f"- [{label}{' ' + date if date else ''}] {hit['text']}")
+    return "\n".join(lines)
+
+async def _retrieve_related(query: str, **kwargs) -> List[Dict]:
+    """Truy xuất đoạn liên quan; lỗi thì bỏ qua (không làm hỏng chat/gợi nhớ)"""
+    try:
+        return await run_in_threadpool(VectorService.related, query, **kwargs)
+    except Exception as e:
+        print(f"Error retrieving related context: {e}")
+        return []
+
 class AIService:
     """Service xử lý các tác vụ AI"""
     
     @staticmethod
-    async def call_groq_api(prompt: str, system_prompt: str = "") -> Optional[str]:
-        """Gọi Groq API (Llama 3)"""
+    def load_modules():
+        """Import aiohttp trước khi có request AI đầu tiên (dùng cho warm-up)"""
+        import aiohttp
+    
+    @staticmethod
+    async def _post_groq(session, payload: Dict, headers: Dict, max_timeout: float) -> Tuple[str, Optional[Dict], str, Optional[str], float, float]:
+        """
+        Gửi một request tới Groq, giữ một slot LLM trong lúc chờ (tối đa max_timeout giây)
+
+        Returns:
+            (status, data, error_text, retry_after, start, elapsed); status "error" = lỗi mạng/timeout
+        """
+        import aiohttp
+        
+        data = None
+        error_text = ""
+        retry_after = None
+        async with Admission.llm.slot():
+            start = time.perf_counter()  # Không tính thời gian chờ slot
+            timeout = budget("llm", DEADLINE_MIN_LLM, max_timeout)
+            try:
+                async with session.post(GROQ_API_URL, json=payload, headers=headers,
+                                        timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    status = str(response.status)
+                    if response.status == 200:
+                        data = await response.json()
+                    else:
+                        error_text = await response.text()
+                        retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = "error"
+                error_text = str(e)
+        
+        elapsed = time.perf_counter() - start
+        LLM_REQUESTS.inc(status=status)
+        LLM_LATENCY.observe(elapsed, status=status)
+        record_span("llm", f"groq {status}", start, elapsed)
+        if status == "error" and timeout < max_timeout and elapsed >= timeout:
+            raise exceeded("llm")  # Bị cắt theo deadline của request
+        return status, data, error_text, retry_after, start, elapsed
+
+    @staticmethod
+    def _record_hedge_loser(task: str, model: str, result: Optional[Tuple], seconds: float):
+        """Ghi sổ bản hedge không được dùng: bị hủy/lỗi -> lời gọi lỗi (cache "cancelled"), xong -> như bình thường"""
+        if result is None:
+            LLMUsageService.record(task, model, False, seconds, cache="cancelled")
+            return
+        status, data, _, _, _, elapsed = result
+        LLMUsageService.record(task, model, status == "200", elapsed, (data or {}).get('usage'))
+
+    @staticmethod
+    async def call_groq_api(prompt: str, system_prompt: str = "", task: str = "default") -> Optional[str]:
+        """
+        Gọi Groq API (Llama 3), mỗi lần thử giữ một slot LLM (Overloaded nếu quá tải)
+
+        Model, max_tokens, temperature, timeout theo tác vụ `task` (GROQ_TASKS, services/model_routing.py);
+        model chính lỗi/chậm kéo dài thì dùng model dự phòng, lần thử lại sau lỗi cũng đổi sang model còn lại.
+        Mỗi lần thử tối đa timeout của tác vụ hoặc phần còn lại của deadline request;
+        không đủ thời gian cho lần thử (kể cả thử lại) thì raise DeadlineExceeded.
+        Mỗi lần thử được ghi vào sổ cái token (services/usage_service.py); tính năng không thiết yếu
+        vượt ngân sách ngày thì không gọi, trả về None.
+        Bật GROQ_HEDGE: lần thử chậm hơn percentile latency gần đây được gửi thêm một bản (services/hedging.py)
+        """
         try:
             if not GROQ_API_KEY:
                 print("Lỗi: GROQ_API_KEY không được tìm thấy trong .env")
                 return None
+            if LLMUsageService.skip_if_degraded(task):
+                return None
+            
+            import aiohttp
             
             headers = {
                 "Authorization": f"Bearer {GROQ_API_KEY}",
                 "Content-Type": "application/json"
             }
             
-            payload = {
-                "model": GROQ_MODEL,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": GROQ_TEMPERATURE,
-                "max_tokens": GROQ_MAX_TOKENS
-            }
+            config = GROQ_ROUTER.config(task)
+            model = GROQ_ROUTER.choose(task)
             
             async with aiohttp.ClientSession() as session:
-                async with session.post(GROQ_API_URL, json=payload, headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data['choices'][0]['message']['content']
-                    else:
-                        error_text = await response.text()
-                        print(f"Groq API Error: {error_text}")
-                        return None
+                for attempt in range(GROQ_MAX_RETRIES + 1):
+                    payload = {
+                        "model": model,
+                        "messages": [
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": prompt}
+                        ],
+                        "temperature": config["temperature"],
+                        "max_tokens": config["max_tokens"]
+                    }
+                    budget("llm", DEADLINE_MIN_LLM)  # Không xếp hàng chờ slot nếu chắc chắn không kịp
+                    status, data, error_text, retry_after, _, elapsed = await GROQ_HEDGE.run(
+                        f"{task}/{model}",  # Latency theo tác vụ và model
+                        lambda: AIService._post_groq(session, payload, headers, config["timeout"]),
+                        lambda result: result[0] == "200",
+                        Admission.llm.has_free_slot,
+                        lambda result, seconds: AIService._record_hedge_loser(task, model, result, seconds)
+                    )
+                    LLM_TASK_REQUESTS.inc(task=task, model=model, status=status)
+                    GROQ_ROUTER.record(task, model, status == "200", elapsed)
+                    usage = (data or {}).get('usage') or {}
+                    LLMUsageService.record(task, model, status == "200", elapsed, usage)
+                    
+                    if status == "200":
+                        LLM_TOKENS.inc(usage.get('prompt_tokens', 0), type="prompt")
+                        LLM_TOKENS.inc(usage.get('completion_tokens', 0), type="completion")
+                        content = data['choices'][0]['message']['content']
+                        record_llm_exchange(payload["messages"], content, elapsed)
+                        return content
+                    
+                    if attempt < GROQ_MAX_RETRIES and _is_retryable(status):
+                        delay = _retry_delay(attempt, retry_after)
+                        left = remaining()
+                        if left is not None and left - delay < DEADLINE_MIN_LLM:
+                            raise exceeded("llm")  # Không còn thời gian thử lại
+                        LLM_RETRIES.inc(reason=status)
+                        await asyncio.sleep(delay)
+                        model = GROQ_ROUTER.alternate(task, model)
+                        continue
+                    
+                    print(f"Groq API Error: {error_text}")
+                    return None
                         
+        except (Overloaded, DeadlineExceeded):
+            raise
         except Exception as e:
             print(f"Error calling Groq API: {e}")
             return None
@@ -74,7 +223,8 @@ Tóm tắt (2-3 câu ngắn gọn):"""
         """Tóm tắt nội dung nhật ký"""
         return await AIService.call_groq_api(
             AIService.generate_summary_prompt(text),
-            "Bạn là trợ lý tóm tắt nhật ký cho người cao tuổi."
+            "Bạn là trợ lý tóm tắt nhật ký cho người cao tuổi.",
+            task="summary"
         )
     
     @staticmethod
@@ -87,7 +237,7 @@ Text: {text}
 
 Cảm xúc:"""
         
-        result = await AIService.call_groq_api(prompt, "Bạn là chuyên gia phân tích cảm xúc.")
+        result = await AIService.call_groq_api(prompt, "Bạn là chuyên gia phân tích cảm xúc.", task="emotion")
         return result.strip().lower() if result else "bình_thường"
     
     # ========== NOTE INTELLIGENCE ==========
@@ -129,7 +279,8 @@ Ghi chú: "{content}"
         
         result = await AIService.call_groq_api(
             prompt,
-            "Bạn là AI phân tích ghi chú thông minh. Trả lời CHỈ JSON, không có text khác."
+            "Bạn là AI phân tích ghi chú thông minh. Trả lời CHỈ JSON, không có text khác.",
+            task="note_analysis"
         )
         
         if result:
@@ -146,14 +297,7 @@ Ghi chú: "{content}"
                 pass
         
         # Fallback
-        return {
-            "category": "other",
-            "extracted_datetime": None,
-            "priority": "medium",
-            "should_create_reminder": False,
-            "reminder_suggestion": None,
-            "analysis": "Không thể phân tích"
-        }
+        return dict(NOTE_ANALYSIS_FALLBACK)
     
     # ========== REMINDER GENERATION ==========
     
@@ -179,7 +323,7 @@ Ghi chú: "{content}"
             if category == 'medication':
                 # Nhắc trước 30 phút
                 reminders.append({
-                    "id": f"reminder_{datetime.now().strftime('%Y%m%d_%H%M%S')}_1",
+                    "id": new_id("reminder"),
                     "note_id": note['id'],
                     "title": f"🔔 {analysis.get('reminder_suggestion', 'Uống thuốc')}",
                     "description": note['content'],
@@ -191,7 +335,7 @@ Ghi chú: "{content}"
             elif category == 'appointment':
                 # Nhắc trước 1 ngày và 1 giờ
                 reminders.append({
-                    "id": f"reminder_{datetime.now().strftime('%Y%m%d_%H%M%S')}_1",
+                    "id": new_id("reminder"),
                     "note_id": note['id'],
                     "title": f"📅 Nhắc lịch hẹn ngày mai",
                     "description": note['content'],
@@ -200,7 +344,7 @@ Ghi chú: "{content}"
                     "created_at": datetime.now().isoformat()
                 })
                 reminders.append({
-                    "id": f"reminder_{datetime.now().strftime('%Y%m%d_%H%M%S')}_2",
+                    "id": new_id("reminder"),
                     "note_id": note['id'],
                     "title": f"⏰ {analysis.get('reminder_suggestion', 'Chuẩn bị đi khám')}",
                     "description": note['content'],
@@ -212,7 +356,7 @@ Ghi chú: "{content}"
             elif category == 'event':
                 # Nhắc trước 1 ngày
                 reminders.append({
-                    "id": f"reminder_{datetime.now().strftime('%Y%m%d_%H%M%S')}_1",
+                    "id": new_id("reminder"),
                     "note_id": note['id'],
                     "title": f"🎉 {analysis.get('reminder_suggestion', 'Sự kiện sắp diễn ra')}",
                     "description": note['content'],
@@ -224,7 +368,7 @@ Ghi chú: "{content}"
             else:
                 # Default: nhắc đúng giờ
                 reminders.append({
-                    "id": f"reminder_{datetime.now().strftime('%Y%m%d_%H%M%S')}_1",
+                    "id": new_id("reminder"),
                     "note_id": note['id'],
                     "title": analysis.get('reminder_suggestion', 'Nhắc nhở'),
                     "description": note['content'],
@@ -241,8 +385,13 @@ Ghi chú: "{content}"
     # ========== MEMORY PROMPTS ==========
     
     @staticmethod
-    def generate_memory_prompt(diaries: List[Dict], memories: List[Dict], user_profile: Optional[Dict] = None) -> str:
-        """Tạo prompt gợi ý hồi tưởng có cá nhân hóa"""
+    def generate_memory_prompt(
+        diaries: List[Dict],
+        memories: List[Dict],
+        user_profile: Optional[Dict] = None,
+        related: Optional[List[Dict]] = None
+    ) -> str:
+        """Tạo prompt gợi ý hồi tưởng có cá nhân hóa (related: đoạn cũ liên quan từ VectorService)"""
         
         recent_diaries = sorted(diaries, key=lambda x: x['created_at'], reverse=True)[:3]
         diary_context = "\n".join([f"- {d.get('summary', d['content'][:100])}" for d in recent_diaries])
@@ -258,6 +407,13 @@ Ghi chú: "{content}"
 Thông tin cá nhân:
 - Sở thích: {', '.join(hobbies) if hobbies else 'Chưa có'}
 - Ngày quan trọng: {', '.join([d.get('name', '') for d in important_dates]) if important_dates else 'Chưa có'}
+"""
+        
+        related_context = ""
+        if related:
+            related_context = f"""
+Kỷ niệm cũ liên quan:
+{_format_related(related)}
 """
         
         return f"""Bạn là trợ lý AI thân thiện giúp người cao tuổi gợi nhớ lại kỷ niệm.
@@ -269,6 +425,7 @@ Nhật ký gần đây:
 
 Ký ức đã lưu:
 {memory_context if memory_context else "Chưa có ký ức"}
+{related_context}
 
 Yêu cầu:
 - Tạo MỘT câu hỏi gợi mở sâu sắc, ấm áp để khơi gợi ký ức đẹp
@@ -280,10 +437,21 @@ Câu hỏi gợi nhớ:"""
     
     @staticmethod
     async def generate_memory_prompt_text(diaries: List[Dict], memories: List[Dict], user_profile: Optional[Dict] = None) -> Optional[str]:
-        """Tạo câu hỏi gợi nhớ dựa trên dữ liệu"""
+        """Tạo câu hỏi gợi nhớ dựa trên dữ liệu (kèm kỷ niệm cũ liên quan tới nhật ký gần đây)"""
+        recent_diaries = sorted(diaries, key=lambda x: x['created_at'], reverse=True)[:3]
+        recent_memories = sorted(memories, key=lambda x: x['created_at'], reverse=True)[:3]
+        related = []
+        query = " ".join(d.get('summary') or d.get('content', '') for d in recent_diaries)
+        if query:
+            # Bỏ các bản ghi đã có sẵn trong prompt
+            exclude = [("diary", str(d.get('id'))) for d in recent_diaries]
+            exclude += [("memory", str(m.get('id'))) for m in recent_memories]
+            related = await _retrieve_related(query, kinds=["memory", "diary"], exclude=exclude)
+        
         return await AIService.call_groq_api(
-            AIService.generate_memory_prompt(diaries, memories, user_profile),
-            "Bạn là trợ lý tạo câu hỏi gợi nhớ cho người cao tuổi."
+            AIService.generate_memory_prompt(diaries, memories, user_profile, related),
+            "Bạn là trợ lý tạo câu hỏi gợi nhớ cho người cao tuổi.",
+            task="memory_prompt"
         )
     
     # ========== HEALTH INSIGHTS ==========
@@ -316,7 +484,63 @@ Nếu thấy dấu hiệu bất thường, khuyên nên gặp bác sĩ."""
         
         return await AIService.call_groq_api(
             prompt,
-            "Bạn là trợ lý sức khỏe AI, không phải bác sĩ, chỉ đưa ra lời khuyên tham khảo."
+            "Bạn là trợ lý sức khỏe AI, không phải bác sĩ, chỉ đưa ra lời khuyên tham khảo.",
+            task="health_insight"
+        )
+    
+    # ========== DAILY DIGEST ==========
+    
+    @staticmethod
+    async def generate_daily_digest(
+        day: str,
+        diaries: List[Dict],
+        notes: List[Dict],
+        health_logs: List[Dict],
+        reminders: List[Dict],
+        user_profile: Optional[Dict] = None
+    ) -> Optional[str]:
+        """Tóm tắt cả một ngày (nhật ký, ghi chú, chỉ số sức khỏe, nhắc nhở đã hoàn thành) trong một lần gọi"""
+        sections = []
+        if diaries:
+            sections.append("Nhật ký:\n" + "\n".join(
+                f"- {d.get('summary') or d.get('content', '')[:300]}"
+                + (f" (cảm xúc: {d['emotion']})" if d.get('emotion') else "")
+                for d in diaries
+            ))
+        if notes:
+            sections.append("Ghi chú:\n" + "\n".join(
+                f"- [{n.get('category') or 'other'}] {n.get('content', '')[:200]}" for n in notes
+            ))
+        if health_logs:
+            sections.append("Sức khỏe:\n" + "\n".join(
+                f"- {log.get('log_type')}: {log.get('value')} ({str(log.get('created_at', ''))[11:16]})" for log in health_logs
+            ))
+        if reminders:
+            sections.append("Nhắc nhở đã hoàn thành:\n" + "\n".join(
+                f"- {r.get('title')} ({str(r.get('remind_at', ''))[11:16]})" for r in reminders
+            ))
+        
+        profile_context = ""
+        if user_profile:
+            if user_profile.get('full_name'):
+                profile_context += f"Người dùng: {user_profile['full_name']}\n"
+            if user_profile.get('medical_conditions'):
+                profile_context += f"Bệnh lý hiện tại: {', '.join(user_profile['medical_conditions'])}\n"
+        
+        prompt = f"""{profile_context}Dữ liệu ngày {day} của người cao tuổi:
+
+{chr(10).join(sections)}
+
+Hãy viết BẢN TÓM TẮT NGÀY ngắn gọn (4-6 câu), ấm áp, dễ hiểu cho người thân đọc:
+- Tâm trạng và hoạt động chính trong ngày
+- Sức khỏe (nếu có chỉ số bất thường thì nêu rõ, khuyên gặp bác sĩ)
+- Các việc đã hoàn thành
+- Một điều nên hỏi thăm hoặc chú ý ngày mai"""
+        
+        return await AIService.call_groq_api(
+            prompt,
+            "Bạn là trợ lý AI tổng hợp nhật ký hằng ngày cho người cao tuổi và gia đình.",
+            task="digest"
         )
     
     # ========== CONVERSATIONAL AI ==========
@@ -331,6 +555,7 @@ Nếu thấy dấu hiệu bất thường, khuyên nên gặp bác sĩ."""
         Chat AI với ngữ cảnh
         - Nhớ lịch sử hội thoại
         - Biết thông tin người dùng
+        - Nhắc lại nhật ký/ký ức/ghi chú cũ liên quan tới tin nhắn
         """
         
         profile_context = ""
@@ -349,8 +574,18 @@ Thông tin người dùng:
                 for msg in conversation_history[-5:]  # 5 tin nhắn gần nhất
             ])
         
+        # Sắp hết thời gian của request: bỏ phần nhắc lại ký ức, dành thời gian cho câu trả lời
+        left = remaining()
+        related = await _retrieve_related(user_message) if left is None or left >= 2 * DEADLINE_MIN_LLM else []
+        related_context = ""
+        if related:
+            related_context = f"""
+Những điều người dùng từng ghi lại có liên quan:
+{_format_related(related)}
+"""
+        
         prompt = f"""{profile_context}
-
+{related_context}
 Lịch sử hội thoại:
 {history_text if history_text else "Đây là cuộc trò chuyện mới"}
 
@@ -360,5 +595,8 @@ Hãy trả lời thân thiện, ấm áp như một người cháu đang trò ch
         
         return await AIService.call_groq_api(
             prompt,
-            "Bạn là trợ lý AI thân thiện, hỗ trợ người cao tuổi. Luôn lịch sự, kiên nhẫn và dễ hiểu."
-        )
\ No newline at end of file
+            "Bạn là trợ lý AI thân thiện, hỗ trợ người cao tuổi. Luôn lịch sự, kiên nhẫn và dễ hiểu.",
+            task="chat"
+        )
+
+register_warmup(AIService.load_modules)
\ No newline at end of file
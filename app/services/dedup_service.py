@@ -0,0 +1,196 @@
+"""
+Dedup Service - Phát hiện ghi chú gần trùng (cùng một tờ giấy chụp lại, OCR lệch vài ký tự)
+MinHash trên shingle ký tự + LSH theo band: tra cứu O(1) trung bình, không so với từng ghi chú
+"""
+import threading
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+from app.config import (
+    NOTE_FILE, NOTE_DUPLICATE_THRESHOLD, NOTE_DUPLICATE_WINDOW_HOURS,
+    NOTE_SHINGLE_CHARS, NOTE_LSH_BANDS, NOTE_LSH_ROWS
+)
+from app.services.index_sync import TenantIndexSync
+from app.services.search_service import tokenize
+from app.warmup import register_warmup
+
+_PERMUTATIONS = NOTE_LSH_BANDS * NOTE_LSH_ROWS
+_HASH_PARAMS = None
+
+def _hash_params():
+    """Tham số (a, b) cố định cho họ hàm băm multiply-shift: h(x) = (a*x + b) >> 32"""
+    global _HASH_PARAMS
+    if _HASH_PARAMS is None:
+        import numpy as np
+
+        rng = np.random.default_rng(20240501)
+        a = rng.integers(1, 2 ** 63, size=(_PERMUTATIONS, 1), dtype=np.uint64) | np.uint64(1)
+        b = rng.integers(0, 2 ** 63, size=(_PERMUTATIONS, 1), dtype=np.uint64)
+        _HASH_PARAMS = (a, b)
+    return _HASH_PARAMS
+
+def shingles(text: str, size: int = NOTE_SHINGLE_CHARS) -> Set[str]:
+    """Các đoạn `size` ký tự liên tiếp của văn bản đã bỏ dấu/dấu câu (lỗi OCR chỉ làm lệch vài shingle)"""
+    normalized = " ".join(tokenize(text))
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+def minhash(text: str):
+    """Chữ ký MinHash (uint32 x NOTE_LSH_BANDS*NOTE_LSH_ROWS), None nếu văn bản rỗng"""
+    import numpy as np
+
+    grams = shingles(text)
+    if not grams:
+        return None
+    x = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+    a, b = _hash_params()
+    with np.errstate(over="ignore"):
+        hashed = (a * x + b) >> np.uint64(32)  # Tràn số uint64 = lấy mod 2^64, đúng ý đồ
+    return hashed.min(axis=1).astype(np.uint32)
+
+def _timestamp(record: Dict[str, Any]) -> float:
+    try:
+        return datetime.fromisoformat(record.get("created_at") or "").timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+class DuplicateIndex:
+    """
+    Index LSH: chữ ký chia NOTE_LSH_BANDS band x NOTE_LSH_ROWS hàng, mỗi band băm vào một bucket
+
+    Hai ghi chú có Jaccard s trùng ít nhất một band với xác suất 1 - (1 - s^r)^b
+    (16x4: ~100% ở s=0.8, ~64% ở s=0.5); ứng viên được kiểm lại bằng độ tương đồng ước lượng
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.buckets: Dict[Tuple[int, bytes], List[int]] = {}
+            self.doc_keys: List[Tuple[str, str]] = []
+            self.doc_text: List[Optional[str]] = []
+            self.doc_signature: List[Any] = []
+            self.doc_time: List[float] = []
+            self.records: List[Optional[Dict[str, Any]]] = []
+            self.ids: Dict[Tuple[str, str], int] = {}
+            self.dead: Set[int] = set()
+            self.kind_counts: Counter = Counter()
+
+    def _bands(self, signature) -> List[Tuple[int, bytes]]:
+        return [
+            (band, signature[band * NOTE_LSH_ROWS:(band + 1) * NOTE_LSH_ROWS].tobytes())
+            for band in range(NOTE_LSH_BANDS)
+        ]
+
+    def add(self, kind: str, record: Dict[str, Any]):
+        """Thêm hoặc cập nhật một ghi chú"""
+        text = record.get("content") or ""
+        key = (kind, str(record.get("id")))
+        with self._lock:
+            old = self.ids.get(key)
+            if old is not None:
+                if self.doc_text[old] == text:
+                    self.records[old] = record
+                    return
+                self._delete(old)
+
+            signature = minhash(text)
+            doc = len(self.doc_keys)
+            if signature is not None:
+                for band in self._bands(signature):
+                    self.buckets.setdefault(band, []).append(doc)
+            self.doc_keys.append(key)
+            self.doc_text.append(text)
+            self.doc_signature.append(signature)
+            self.doc_time.append(_timestamp(record))
+            self.records.append(record)
+            self.ids[key] = doc
+            self.kind_counts[kind] += 1
+
+    def needs_compaction(self) -> bool:
+        return len(self.dead) > len(self.doc_keys) // 4
+
+    def _delete(self, doc: int):
+        kind, _ = self.doc_keys[doc]
+        del self.ids[self.doc_keys[doc]]
+        self.dead.add(doc)
+        self.doc_text[doc] = None
+        self.records[doc] = None
+        self.kind_counts[kind] -= 1
+
+    def reconcile(self, kind: str, records: List[Dict[str, Any]]):
+        """Đưa index về đúng danh sách ghi chú hiện có"""
+        with self._lock:
+            present = set()
+            for record in records:
+                self.add(kind, record)
+                present.add((kind, str(record.get("id"))))
+            for key in [k for k in self.ids if k[0] == kind and k not in present]:
+                self._delete(self.ids[key])
+
+    def find(
+        self,
+        text: str,
+        since: float = 0.0,
+        threshold: float = NOTE_DUPLICATE_THRESHOLD,
+        require: Optional[str] = None
+    ) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        Ghi chú giống nhất có độ tương đồng >= threshold: (bản ghi, độ tương đồng)
+
+        Args:
+            since: Chỉ xét ghi chú tạo sau thời điểm này (timestamp)
+            require: Chỉ xét ghi chú có trường này
+        """
+        signature = minhash(text)
+        if signature is None:
+            return None
+        with self._lock:
+            candidates = set()
+            for band in self._bands(signature):
+                candidates.update(self.buckets.get(band, ()))
+            best = None
+            for doc in candidates:
+                if doc in self.dead or self.doc_time[doc] < since:
+                    continue
+                if require and not self.records[doc].get(require):
+                    continue
+                similarity = float((self.doc_signature[doc] == signature).mean())
+                if similarity < threshold:
+                    continue
+                # Giống nhất trước, bằng nhau thì lấy ghi chú mới hơn
+                rank = (similarity, self.doc_time[doc])
+                if best is None or rank > best[0]:
+                    best = (rank, doc)
+            if best is None:
+                return None
+            return self.records[best[1]], best[0][0]
+
+class DuplicateNoteService:
+    """Tìm ghi chú đã phân tích gần trùng để dùng lại phân tích + nhắc nhở thay vì gọi Groq"""
+
+    indexes = TenantIndexSync("dedup", DuplicateIndex, {"note": NOTE_FILE})
+
+    @staticmethod
+    def find_duplicate(text: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        Ghi chú đã phân tích trong NOTE_DUPLICATE_WINDOW_HOURS gần trùng với text (đồng bộ, gọi qua threadpool)
+
+        Returns:
+            (ghi chú gốc, độ tương đồng) hoặc None
+        """
+        index = DuplicateNoteService.indexes.sync()
+        since = (datetime.now() - timedelta(hours=NOTE_DUPLICATE_WINDOW_HOURS)).timestamp()
+        # Chỉ ghi chú có lưu kết quả phân tích mới dùng lại được
+        return index.find(text, since, require="analysis")
+
+    @staticmethod
+    def warm_up():
+        """Build index LSH trong nền khi khởi động"""
+        DuplicateNoteService.indexes.sync()
+
+register_warmup(DuplicateNoteService.warm_up)
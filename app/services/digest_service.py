@@ -0,0 +1,296 @@
+"""
+Digest Service - Job giờ thấp điểm tóm tắt ngày hôm trước của từng người dùng (/digest)
+
+- Chạy trong process, mỗi ngày từ DIGEST_HOUR (trong DIGEST_WINDOW_HOURS giờ), ngoài giờ đó không gọi Groq
+- Mỗi người dùng một lần gọi Groq cho cả ngày: nhật ký, ghi chú, chỉ số sức khỏe, nhắc nhở đã hoàn thành
+  (thay vì nhiều lời gọi nhỏ lúc người dùng mở app); ngày không có gì thì bỏ qua, không gọi (đếm qua timeline)
+- Bản tóm tắt lưu thành collection riêng DIGEST_FILE của tenant, mỗi ngày một bản ghi
+- Tối đa DIGEST_CONCURRENCY người dùng cùng lúc, lớp ưu tiên batch (quá tải thì nhường request người dùng)
+- Checkpoint DIGEST_CHECKPOINT_FILE (mọi tenant) ghi sau mỗi người dùng: server tắt/crash giữa chừng thì
+  lần kiểm tra sau chạy tiếp phần còn lại; người dùng lỗi được thử lại tối đa DIGEST_MAX_ATTEMPTS lần
+- Nhiều worker: chỉ process giữ file khóa (O_EXCL, cạnh checkpoint) chạy job
+
+Chạy tay (chạy tiếp job dở; --force: bỏ checkpoint, tạo lại và thay mọi bản tóm tắt của ngày, vd. sau khi sửa prompt):
+    python -m app.services.digest_service [--date YYYY-MM-DD] [--concurrency N] [--force]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from starlette.concurrency import run_in_threadpool
+from app.admission import Admission, Overloaded, PRIORITY_BATCH, use_priority
+from app.config import (
+    DIGEST_CHECKPOINT_FILE, DIGEST_HOUR, DIGEST_WINDOW_HOURS, DIGEST_CONCURRENCY, DIGEST_CHECK_SECONDS,
+    DIGEST_MAX_ATTEMPTS, DIGEST_LOCK_TIMEOUT, DIGEST_MAX_ITEMS
+)
+from app.database import StorageManager
+from app.deadline import DeadlineExceeded, no_deadline
+from app.ids import new_id
+from app.metrics import DIGEST_JOBS, DIGEST_RUN_DURATION
+from app.tenancy import all_tenants, use_tenant
+from app.services import recurrence
+from app.services.ai_service import AIService
+from app.services.timeline_service import TimelineService
+from app.services.usage_service import LLMUsageService
+
+def _on_day(value: Any, day: date) -> bool:
+    try:
+        return datetime.fromisoformat(value).date() == day
+    except (TypeError, ValueError):
+        return False
+
+def _holder_gone(lock_path: Path) -> bool:
+    """Process ghi trong file khóa không còn chạy job (đã chết, hoặc là process này trước khi khởi động lại)"""
+    try:
+        pid = int(lock_path.read_text(encoding="ascii"))
+    except (OSError, ValueError):
+        return False
+    if pid == os.getpid():
+        return not DigestService._running
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+class DigestService:
+    """Lập lịch, checkpoint và thực thi job tóm tắt ngày"""
+
+    _running = False  # Process này đang chạy job
+
+    # ========== CHECKPOINT & KHÓA JOB ==========
+
+    @staticmethod
+    def _lock_path() -> Path:
+        return DIGEST_CHECKPOINT_FILE.with_suffix(".lock")
+
+    @staticmethod
+    def claim() -> bool:
+        """Giành quyền chạy job (file khóa độc quyền), False nếu worker khác đang chạy"""
+        lock_path = DigestService._lock_path()
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    stale = time.time() - lock_path.stat().st_mtime > DIGEST_LOCK_TIMEOUT
+                except FileNotFoundError:
+                    continue  # Vừa được nhả: thử lại
+                if not stale and not _holder_gone(lock_path):
+                    return False
+                lock_path.unlink(missing_ok=True)  # Worker giữ khóa đã chết (crash: chạy tiếp ngay, không chờ hết hạn)
+                continue
+            os.write(fd, str(os.getpid()).encode("ascii"))
+            os.close(fd)
+            return True
+        return False
+
+    @staticmethod
+    def release():
+        DigestService._lock_path().unlink(missing_ok=True)
+
+    @staticmethod
+    def new_checkpoint(day: str, force: bool = False) -> Dict[str, Any]:
+        """Checkpoint trống; force = thay cả bản tóm tắt đã có (giữ qua crash để chạy tiếp vẫn thay)"""
+        return {
+            "date": day, "force": force, "started_at": datetime.now().isoformat(), "finished_at": None,
+            "done": [], "failed": {}
+        }
+
+    @staticmethod
+    def load_checkpoint(day: str) -> Dict[str, Any]:
+        """Tiến độ job của ngày `day` (checkpoint của ngày khác = bắt đầu lại)"""
+        try:
+            with open(DIGEST_CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if checkpoint.get("date") == day:
+                return checkpoint
+        except (FileNotFoundError, ValueError):
+            pass
+        return DigestService.new_checkpoint(day)
+
+    @staticmethod
+    def save_checkpoint(checkpoint: Dict[str, Any]):
+        """Ghi checkpoint (file tạm + os.replace) và làm mới file khóa"""
+        DIGEST_CHECKPOINT_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = DIGEST_CHECKPOINT_FILE.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(checkpoint, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, DIGEST_CHECKPOINT_FILE)
+        finally:
+            tmp.unlink(missing_ok=True)
+        try:
+            os.utime(DigestService._lock_path())
+        except FileNotFoundError:
+            pass
+
+    # ========== MỘT NGƯỜI DÙNG ==========
+
+    @staticmethod
+    def collect(day: date) -> Dict[str, List[Dict[str, Any]]]:
+        """Dữ liệu ngày `day` của tenant hiện tại (mỗi loại tối đa DIGEST_MAX_ITEMS mục, theo thời gian)"""
+        def of_day(records: List[Dict[str, Any]], field: str = "created_at") -> List[Dict[str, Any]]:
+            selected = sorted((r for r in records if _on_day(r.get(field), day)), key=lambda r: r[field])
+            return selected[:DIGEST_MAX_ITEMS]
+
+        start = datetime.combine(day, datetime.min.time())
+        reminders = []
+        for reminder in StorageManager.get_all_reminders():
+            if "recurrence" in reminder:
+                # Chuỗi lặp: các lần nhắc trong ngày đã hoàn thành (dừng cả chuỗi không tính các lần sau đó)
+                reminders += [r for r in recurrence.expand(reminder, start, start + timedelta(days=1)) if r["is_completed"]]
+            elif reminder.get("is_completed") and _on_day(reminder.get("remind_at"), day):
+                reminders.append(reminder)
+
+        return {
+            "diaries": of_day(StorageManager.get_all_diaries()),
+            "notes": of_day(StorageManager.get_all_notes()),
+            "health_logs": of_day(StorageManager.get_all_health_logs()),
+            "reminders": of_day(reminders, "remind_at")
+        }
+
+    @staticmethod
+    async def digest_tenant(tenant: str, day: date, replace: bool = False) -> str:
+        """
+        Tóm tắt ngày `day` của một tenant: "done", "empty" (không có dữ liệu) hoặc "failed" (thử lại sau)
+        Đã có bản tóm tắt thì giữ nguyên, trừ khi `replace`
+        """
+        key = day.isoformat()
+        try:
+            with use_tenant(tenant), no_deadline(), use_priority(PRIORITY_BATCH):
+                totals = (await run_in_threadpool(TimelineService.query, day, day, "day"))["totals"]
+                if not (totals["diaries"] or totals["notes"] or totals["health_logs"] or totals["reminders_completed"]):
+                    return "empty"
+                if not replace and await run_in_threadpool(StorageManager.get_digest, key):
+                    return "done"  # Đã lưu trước lần crash, checkpoint chưa kịp ghi
+
+                items = await run_in_threadpool(DigestService.collect, day)
+                profile = await run_in_threadpool(StorageManager.get_user_profile)
+                content = await AIService.generate_daily_digest(key, **items, user_profile=profile)
+                if content is None:
+                    return "failed"
+
+                digest = {
+                    "id": new_id("digest"),
+                    "date": key,
+                    "content": content.strip(),
+                    "stats": {field: totals[field] for field in ("diaries", "notes", "health_logs", "emotions", "reminders_completed")},
+                    "created_at": datetime.now().isoformat()
+                }
+                saved = await Admission.storage.run(StorageManager.save_digest, digest)
+                return "done" if saved else "failed"
+        except (Overloaded, DeadlineExceeded):
+            return "failed"
+        except Exception as e:
+            print(f"Error generating digest for {tenant or '<default>'} {key}: {e}")
+            return "failed"
+
+    # ========== CẢ JOB ==========
+
+    @staticmethod
+    async def run_job(day: date, concurrency: int = DIGEST_CONCURRENCY) -> Dict[str, Any]:
+        """
+        Tóm tắt ngày `day` cho mọi tenant chưa xong theo checkpoint, tối đa `concurrency` tenant cùng lúc
+
+        Gọi khi đang giữ khóa job (claim). Trả về checkpoint sau lượt chạy
+        (finished_at khác None khi không còn tenant nào cần thử lại)
+        """
+        start = time.perf_counter()
+        checkpoint = await run_in_threadpool(DigestService.load_checkpoint, day.isoformat())
+        done = set(checkpoint["done"])
+        failed = checkpoint["failed"]
+        replace = checkpoint.get("force", False)
+        tenants = await run_in_threadpool(all_tenants)
+        pending = [t for t in tenants if t not in done and failed.get(t, 0) < DIGEST_MAX_ATTEMPTS]
+
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        checkpoint_lock = asyncio.Lock()
+
+        async def process(tenant: str):
+            async with semaphore:
+                outcome = await DigestService.digest_tenant(tenant, day, replace)
+            async with checkpoint_lock:
+                if outcome == "failed":
+                    failed[tenant] = failed.get(tenant, 0) + 1
+                    if failed[tenant] >= DIGEST_MAX_ATTEMPTS:
+                        outcome = "gave_up"
+                        print(f"Bỏ tóm tắt ngày {day} của {tenant or '<default>'} sau {failed[tenant]} lần thử")
+                else:
+                    failed.pop(tenant, None)
+                    checkpoint["done"].append(tenant)
+                DIGEST_JOBS.inc(outcome=outcome)
+                await run_in_threadpool(DigestService.save_checkpoint, checkpoint)
+
+        await asyncio.gather(*(process(tenant) for tenant in pending))
+
+        done = set(checkpoint["done"])
+        if all(failed.get(t, 0) >= DIGEST_MAX_ATTEMPTS for t in tenants if t not in done):
+            checkpoint["finished_at"] = datetime.now().isoformat()
+            await run_in_threadpool(DigestService.save_checkpoint, checkpoint)
+        DIGEST_RUN_DURATION.observe(time.perf_counter() - start)
+        return checkpoint
+
+    @staticmethod
+    def due_day(now: Optional[datetime] = None) -> Optional[date]:
+        """Ngày cần tóm tắt nếu đang trong khung giờ chạy (ngày hôm trước), None nếu ngoài giờ"""
+        now = now or datetime.now()
+        window_start = now.replace(hour=DIGEST_HOUR, minute=0, second=0, microsecond=0)
+        if window_start <= now < window_start + timedelta(hours=DIGEST_WINDOW_HOURS):
+            return now.date() - timedelta(days=1)
+        return None
+
+    @staticmethod
+    async def run_once(day: date, concurrency: int = DIGEST_CONCURRENCY, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Chạy (tiếp) job của ngày `day` nếu chưa xong và giành được khóa; None nếu không chạy
+        force: chạy lại từ đầu kể cả khi đã xong, thay các bản tóm tắt đã có
+        """
+        checkpoint = await run_in_threadpool(DigestService.load_checkpoint, day.isoformat())
+        if (checkpoint["finished_at"] and not force) or not await run_in_threadpool(DigestService.claim):
+            return None
+        DigestService._running = True
+        try:
+            if force:
+                await run_in_threadpool(DigestService.save_checkpoint, DigestService.new_checkpoint(day.isoformat(), True))
+            return await DigestService.run_job(day, concurrency)
+        finally:
+            DigestService._running = False
+            DigestService.release()
+
+    @staticmethod
+    async def run():
+        """Mỗi DIGEST_CHECK_SECONDS giây: trong khung giờ thấp điểm thì chạy/chạy tiếp job; chạy tới khi bị cancel"""
+        while True:
+            try:
+                day = DigestService.due_day()
+                if day is not None:
+                    await DigestService.run_once(day)
+            except Exception as e:
+                print(f"Error running daily digest job: {e}")
+            await asyncio.sleep(DIGEST_CHECK_SECONDS)
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy job tóm tắt ngày cho mọi người dùng (bỏ qua khung giờ)")
+    parser.add_argument("--date", type=date.fromisoformat, default=date.today() - timedelta(days=1),
+                        help="Ngày cần tóm tắt (mặc định hôm qua)")
+    parser.add_argument("--concurrency", type=int, default=DIGEST_CONCURRENCY)
+    parser.add_argument("--force", action="store_true", help="Bỏ checkpoint, tạo lại và thay mọi bản tóm tắt của ngày")
+    args = parser.parse_args()
+
+    checkpoint = asyncio.run(DigestService.run_once(args.date, args.concurrency, args.force))
+    LLMUsageService.flush()
+    if checkpoint is None:
+        print(f"Job ngày {args.date} đã xong hoặc worker khác đang chạy ({DIGEST_CHECKPOINT_FILE})")
+        return
+    print(f"{args.date}: {len(checkpoint['done'])} người dùng xong, {len(checkpoint['failed'])} lỗi")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Enrichment Service - Bổ sung các bước làm giàu bị hoãn vì hết deadline của request (app/deadline.py)
+
+- Nhật ký: tóm tắt, cảm xúc; ghi chú: phân tích + tạo nhắc nhở
+- Bản ghi được lưu ngay với trường "deferred" (các bước còn thiếu), bổ sung xong thì bỏ trường này
+- Ngay sau request: chạy nền một lần (lớp ưu tiên batch, không deadline)
+- Hàng đợi bền DEFERRED_FILE (JSONL, mọi tenant): bước chưa xong (Groq lỗi, quá tải, server tắt)
+  được chạy lại mỗi DEFERRED_RETRY_SECONDS giây; mục đang chạy trong process thì bỏ qua lượt đó
+- Ghi chú: chỉ lần chạy bỏ được "deferred" (kiểm tra trong khóa ghi) mới tạo nhắc nhở, hai lần chạy chồng nhau
+  (kể cả ở hai worker) không sinh nhắc nhở trùng
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.admission import Admission, PRIORITY_BATCH, use_priority
+from app.config import DEFERRED_FILE, DEFERRED_RETRY_SECONDS
+from app.database import StorageManager, file_lock
+from app.deadline import no_deadline
+from app.metrics import ENRICHMENTS_DEFERRED, ENRICHMENTS_BACKFILLED
+from app.tenancy import current_tenant, use_tenant
+from app.services.ai_service import AIService, NOTE_ANALYSIS_FALLBACK
+
+_FRESH_SECONDS = 60  # Mục mới hơn thế vẫn đang được chạy nền ngay sau request: vòng lặp bỏ qua
+_MAX_ATTEMPTS = 12  # Số lần chạy lại tối đa của một mục trước khi bỏ
+
+class EnrichmentService:
+    """Hàng đợi và thực thi các bước làm giàu bị hoãn"""
+
+    _tasks: Set[asyncio.Task] = set()  # Giữ tham chiếu tới task nền (tránh bị thu gom giữa chừng)
+    _running: Set[Tuple[str, str, str]] = set()  # (tenant, loại, id) đang được bổ sung trong process này
+
+    @staticmethod
+    def defer(kind: str, record_id: str, steps: List[str]):
+        """Ghi nhận bản ghi còn thiếu các bước `steps` và chạy bổ sung ngay trong nền (gọi trong event loop)"""
+        entry = {"tenant": current_tenant(), "kind": kind, "id": record_id, "steps": steps, "at": time.time(), "attempts": 0}
+        for step in steps:
+            ENRICHMENTS_DEFERRED.inc(step=step)
+        try:
+            EnrichmentService._append([entry])
+        except OSError as e:
+            print(f"Error queueing deferred enrichment: {e}")
+        task = asyncio.get_running_loop().create_task(EnrichmentService.enrich(entry))
+        EnrichmentService._tasks.add(task)
+        task.add_done_callback(EnrichmentService._tasks.discard)
+
+    @staticmethod
+    def _append(entries: List[Dict[str, Any]]):
+        DEFERRED_FILE.parent.mkdir(parents=True, exist_ok=True)
+        lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        with file_lock(DEFERRED_FILE):
+            with open(DEFERRED_FILE, 'a', encoding='utf-8') as f:
+                f.write(lines)
+
+    @staticmethod
+    def _take() -> List[Dict[str, Any]]:
+        """
+        Lấy toàn bộ hàng đợi (đổi tên file trước khi đọc: worker khác không lấy trùng)
+
+        Ghi thêm và đổi tên cùng giữ file_lock: process khác không thể mở file ngay trước lúc đổi tên
+        rồi ghi vào file .work đã đọc xong (mục bị mất)
+        """
+        work = DEFERRED_FILE.with_suffix(f".{os.getpid()}.work")
+        with file_lock(DEFERRED_FILE):
+            try:
+                os.replace(DEFERRED_FILE, work)
+            except FileNotFoundError:
+                return []
+        entries = []
+        try:
+            with open(work, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        pass
+        finally:
+            work.unlink(missing_ok=True)
+        return entries
+
+    @staticmethod
+    async def enrich(entry: Dict[str, Any]) -> bool:
+        """Bổ sung một bản ghi; True nếu xong (hoặc bản ghi không còn gì để bổ sung/đã bị xóa)"""
+        key = EnrichmentService._key(entry)
+        EnrichmentService._running.add(key)
+        try:
+            with use_tenant(entry["tenant"]), no_deadline(), use_priority(PRIORITY_BATCH):
+                if entry["kind"] == "diary":
+                    done = await EnrichmentService._enrich_diary(entry["id"])
+                elif entry["kind"] == "note":
+                    done = await EnrichmentService._enrich_note(entry["id"])
+                else:
+                    done = True
+        except Exception as e:
+            print(f"Error enriching {entry.get('kind')} {entry.get('id')}: {e}")
+            done = False
+        finally:
+            EnrichmentService._running.discard(key)
+        ENRICHMENTS_BACKFILLED.inc(kind=entry.get("kind", ""), outcome="done" if done else "retry")
+        return done
+
+    @staticmethod
+    def _key(entry: Dict[str, Any]) -> Tuple[str, str, str]:
+        return entry.get("tenant", ""), entry.get("kind", ""), str(entry.get("id"))
+
+    @staticmethod
+    async def _enrich_diary(diary_id: str) -> bool:
+        diary = StorageManager.get_diary(diary_id)
+        if not diary or not diary.get("deferred"):
+            return True
+
+        fields: Dict[str, Any] = {}
+        pending = []
+        for step in diary["deferred"]:
+            if step == "summary":
+                summary = await AIService.summarize_diary(diary["content"])
+                if summary is None:
+                    pending.append(step)
+                else:
+                    fields["summary"] = summary
+            elif step == "emotion":
+                fields["emotion"] = await AIService.analyze_emotion(diary["content"])
+
+        if pending:
+            fields["deferred"] = pending
+        await Admission.storage.run(StorageManager.update_diary, diary_id, fields, None if pending else ["deferred"])
+        return not pending
+
+    @staticmethod
+    async def _enrich_note(note_id: str) -> bool:
+        note = StorageManager.get_note(note_id)
+        if not note or "analysis" not in note.get("deferred", []):
+            return True
+
+        analysis = await AIService.analyze_note(note["content"], StorageManager.get_user_profile())
+        if analysis == NOTE_ANALYSIS_FALLBACK:
+            return False  # Groq lỗi/trả sai định dạng: thử lại lần sau
+
+        fields = {
+            "category": analysis.get('category'),
+            "extracted_datetime": analysis.get('extracted_datetime'),
+            "priority": analysis.get('priority'),
+            "is_reminder": analysis.get('should_create_reminder', False),
+            "analysis": analysis
+        }
+        won = await Admission.storage.run(
+            StorageManager.update_note, note_id, fields, ["deferred"],
+            lambda n: "analysis" in n.get("deferred", [])
+        )
+        if not won:
+            return True  # Lần chạy khác đã bổ sung xong (và tạo nhắc nhở) hoặc ghi chú đã bị xóa
+
+        if analysis.get('should_create_reminder'):
+            for reminder in await AIService.generate_reminders_from_note({**note, **fields}, analysis):
+                await Admission.storage.run(StorageManager.save_reminder, reminder)
+        return True
+
+    @staticmethod
+    async def retry_pending():
+        """Chạy lại các mục trong hàng đợi, mục chưa xong được ghi lại (tối đa _MAX_ATTEMPTS lần)"""
+        entries = await run_in_threadpool(EnrichmentService._take)
+        keep = []
+        for entry in entries:
+            if time.time() - entry.get("at", 0) < _FRESH_SECONDS or EnrichmentService._key(entry) in EnrichmentService._running:
+                keep.append(entry)
+                continue
+            if await EnrichmentService.enrich(entry):
+                continue
+            entry["attempts"] = entry.get("attempts", 0) + 1
+            if entry["attempts"] >= _MAX_ATTEMPTS:
+                print(f"Bỏ bổ sung {entry['kind']} {entry['id']} sau {entry['attempts']} lần thử")
+                continue
+            keep.append(entry)
+        if keep:
+            await run_in_threadpool(EnrichmentService._append, keep)
+
+    @staticmethod
+    async def run():
+        """Định kỳ chạy lại hàng đợi; chạy tới khi bị cancel"""
+        while True:
+            await asyncio.sleep(DEFERRED_RETRY_SECONDS)
+            try:
+                await EnrichmentService.retry_pending()
+            except Exception as e:
+                print(f"Error retrying deferred enrichments: {e}")
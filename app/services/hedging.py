@@ -0,0 +1,180 @@
+"""
+Hedging - Gửi thêm một request dự phòng khi request Groq chậm bất thường, lấy kết quả về trước
+
+- Latency gần đây của từng loại tác vụ (theo tác vụ và model) nằm trong histogram online (bucket log,
+  hai cửa sổ trượt): ngưỡng hedge = percentile GROQ_HEDGE_PERCENTILE của phân phối đó
+- Quá ngưỡng mà chưa có phản hồi: gửi bản sao, bản nào xong (thành công) trước thì dùng, bản kia bị hủy
+- Ngân sách toàn cục (token bucket): mỗi request góp GROQ_HEDGE_BUDGET token, mỗi lần hedge tốn 1 token
+  -> số request gửi thêm không quá ~GROQ_HEDGE_BUDGET (vd. 5%) trong dài hạn
+- Không chờ slot cho bản dự phòng: tầng LLM đang đầy thì không hedge (hedge lúc quá tải chỉ làm tệ hơn)
+- Chỉ dùng trong event loop (không cần khóa)
+"""
+import asyncio
+import bisect
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.config import (
+    GROQ_HEDGE_ENABLED, GROQ_HEDGE_PERCENTILE, GROQ_HEDGE_BUDGET, GROQ_HEDGE_MIN_SAMPLES, GROQ_HEDGE_MIN_DELAY
+)
+from app.metrics import LLM_HEDGES, LLM_HEDGE_SAVED
+
+_BUCKET_START = 0.01  # Giây, cận trên bucket đầu
+_BUCKET_GROWTH = 1.1  # Mỗi bucket rộng hơn bucket trước 10% (sai số percentile <= 10%)
+_BUCKET_COUNT = 100  # Tới ~125 giây, bucket cuối nhận mọi giá trị lớn hơn
+_WINDOW = 1000  # Số mẫu mỗi cửa sổ: phân phối = cửa sổ hiện tại + cửa sổ trước
+_MAX_TOKENS = 10.0  # Số hedge dồn tối đa (chịu được một đợt chậm ngắn)
+
+_BOUNDS = [_BUCKET_START * _BUCKET_GROWTH ** i for i in range(_BUCKET_COUNT)]
+
+class LatencyHistogram:
+    """Histogram latency (giây) trên bucket log, quên dần mẫu cũ theo cửa sổ _WINDOW mẫu"""
+
+    def __init__(self):
+        self._current = [0] * _BUCKET_COUNT
+        self._previous = [0] * _BUCKET_COUNT
+        self._current_size = 0
+        self._previous_size = 0
+
+    def observe(self, seconds: float):
+        if self._current_size >= _WINDOW:
+            self._previous, self._previous_size = self._current, self._current_size
+            self._current, self._current_size = [0] * _BUCKET_COUNT, 0
+        self._current[min(bisect.bisect_left(_BOUNDS, seconds), _BUCKET_COUNT - 1)] += 1
+        self._current_size += 1
+
+    def __len__(self) -> int:
+        return self._current_size + self._previous_size
+
+    def _counts(self) -> List[int]:
+        return [a + b for a, b in zip(self._current, self._previous)]
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Cận trên của bucket chứa percentile p, None nếu chưa có mẫu"""
+        total = len(self)
+        if not total:
+            return None
+        rank = math.ceil(p / 100 * total)
+        seen = 0
+        for i, count in enumerate(self._counts()):
+            seen += count
+            if seen >= rank:
+                return _BOUNDS[i]
+        return _BOUNDS[-1]
+
+    def mean_above(self, seconds: float) -> Optional[float]:
+        """Latency trung bình của các mẫu lớn hơn `seconds` (điểm giữa bucket), None nếu không có"""
+        start = bisect.bisect_left(_BOUNDS, seconds)
+        weighted = 0.0
+        count = 0
+        for i, n in enumerate(self._counts()[start:], start):
+            if n:
+                lower = _BOUNDS[i - 1] if i else 0.0
+                weighted += n * max((lower + _BOUNDS[i]) / 2, seconds)
+                count += n
+        return weighted / count if count else None
+
+class HedgePolicy:
+    """Theo dõi latency theo loại tác vụ và quyết định khi nào gửi request dự phòng"""
+
+    def __init__(self, enabled: bool = GROQ_HEDGE_ENABLED, percentile: float = GROQ_HEDGE_PERCENTILE,
+                 budget: float = GROQ_HEDGE_BUDGET, min_samples: int = GROQ_HEDGE_MIN_SAMPLES):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._tokens = 0.0
+
+    def histogram(self, key: str) -> LatencyHistogram:
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        return histogram
+
+    def delay(self, key: str) -> Optional[float]:
+        """Số giây chờ trước khi hedge, None nếu không hedge (tắt hoặc chưa đủ mẫu)"""
+        histogram = self.histograms.get(key)
+        if not self.enabled or histogram is None or len(histogram) < self.min_samples:
+            return None
+        return max(histogram.percentile(self.percentile), GROQ_HEDGE_MIN_DELAY)
+
+    def _spend(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def run(
+        self,
+        key: str,
+        send: Callable[[], Awaitable[Any]],
+        succeeded: Callable[[Any], bool],
+        can_hedge: Callable[[], bool],
+        on_loser: Optional[Callable[[Optional[Any], float], None]] = None
+    ) -> Any:
+        """
+        Chạy send() (trả về kết quả, succeeded(kết quả) = thành công), hedge một lần nếu chậm
+
+        Kết quả: bản thành công về trước; cả hai thất bại thì kết quả/exception của request đầu
+        on_loser(kết quả, giây): gọi cho bản không được dùng (kết quả None nếu bị hủy hoặc lỗi),
+        để request đã gửi tới Groq vẫn được ghi sổ
+        """
+        self._tokens = min(self._tokens + self.budget, _MAX_TOKENS)
+        histogram = self.histogram(key)
+        delay = self.delay(key)
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(send())
+        tasks = [primary]
+        hedge_start = None
+        winner = None
+        try:
+            if delay is not None:
+                await asyncio.wait({primary}, timeout=delay)
+                if not primary.done():
+                    if not can_hedge():
+                        LLM_HEDGES.inc(outcome="no_slot")
+                    elif not self._spend():
+                        LLM_HEDGES.inc(outcome="no_budget")
+                    else:
+                        hedge_start = time.perf_counter()
+                        tasks.append(asyncio.ensure_future(send()))
+
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:
+                    if task in done and task.exception() is None and succeeded(task.result()):
+                        winner = task
+                        break
+            winner = winner or primary
+        finally:
+            now = time.perf_counter()
+            cancelled = [task for task in tasks if not task.done()]
+            for task in cancelled:
+                task.cancel()
+            if len(tasks) > 1:
+                await asyncio.gather(*tasks, return_exceptions=True)
+                if on_loser is not None and winner is not None:
+                    for task in tasks:
+                        if task is not winner:
+                            failed = task in cancelled or task.exception() is not None
+                            on_loser(None if failed else task.result(), now - (start if task is primary else hedge_start))
+
+        if hedge_start is not None:
+            if winner is primary:
+                LLM_HEDGES.inc(outcome="primary_won")
+            else:
+                LLM_HEDGES.inc(outcome="hedge_won")
+                # Request đầu chưa xong sau (now - start) giây: ước lượng nó còn chậm thêm bao lâu từ histogram
+                expected = histogram.mean_above(now - start)
+                if expected is not None:
+                    LLM_HEDGE_SAVED.observe(expected - (now - start))
+                # Mẫu bị hủy vẫn được tính (cận dưới), không thì đuôi chậm biến mất khỏi histogram
+                histogram.observe(now - start)
+        if winner.exception() is None and succeeded(winner.result()):
+            histogram.observe(now - (hedge_start if winner is not primary else start))
+        return winner.result()
+
+# Dùng chung trong process cho mọi lần gọi Groq
+GROQ_HEDGE = HedgePolicy()
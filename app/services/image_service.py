@@ -0,0 +1,119 @@
+"""
+Image Service Layer
+Lưu ảnh gốc theo hash nội dung và sinh ảnh thu nhỏ (WebP/JPEG) khi cần
+"""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Optional
+from app.config import IMAGE_DIR, IMAGE_CACHE_DIR, IMAGE_SIZES, IMAGE_QUALITY, UPLOAD_CHUNK_SIZE
+
+MEDIA_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+    "BMP": "image/bmp",
+    "TIFF": "image/tiff"
+}
+
+def _write_atomic(directory: Path, name: str, source: BinaryIO):
+    """Ghi file qua file tạm + os.replace để request khác không đọc phải file dở dang"""
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            shutil.copyfileobj(source, out, UPLOAD_CHUNK_SIZE)
+        os.replace(tmp_path, directory / name)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+@lru_cache(maxsize=1)
+def _webp_supported() -> bool:
+    from PIL import features
+    return features.check('webp')
+
+class ImageService:
+    """Service quản lý ảnh gốc và ảnh thu nhỏ"""
+
+    # ========== ORIGINALS ==========
+
+    @staticmethod
+    def original_path(image_id: str) -> Path:
+        return IMAGE_DIR / image_id
+
+    @staticmethod
+    def save_original(image_id: str, source: BinaryIO) -> str:
+        """Lưu ảnh gốc (bỏ qua nếu đã có ảnh cùng hash)"""
+        if not ImageService.original_path(image_id).exists():
+            _write_atomic(IMAGE_DIR, image_id, source)
+        return image_id
+
+    @staticmethod
+    def save_original_bytes(data: bytes) -> str:
+        """Lưu ảnh gốc từ bytes (dùng khi chuyển đổi bản ghi image_base64 cũ)"""
+        image_id = hashlib.sha256(data).hexdigest()
+        return ImageService.save_original(image_id, io.BytesIO(data))
+
+    @staticmethod
+    def detect_media_type(path: Path) -> str:
+        """Nhận diện định dạng ảnh (Pillow chỉ đọc header)"""
+        from PIL import Image
+        try:
+            with Image.open(path) as image:
+                return MEDIA_TYPES.get(image.format, "application/octet-stream")
+        except Exception:
+            return "application/octet-stream"
+
+    # ========== DERIVATIVES ==========
+
+    @staticmethod
+    def choose_format(accept_header: Optional[str]) -> str:
+        """Ưu tiên WebP nếu client hỗ trợ, ngược lại dùng JPEG"""
+        if accept_header and "image/webp" in accept_header and _webp_supported():
+            return "webp"
+        return "jpeg"
+
+    @staticmethod
+    def derivative_path(image_id: str, size: str, fmt: str) -> Path:
+        return IMAGE_CACHE_DIR / f"{image_id}_{size}.{fmt}"
+
+    @staticmethod
+    def get_derivative(image_id: str, size: str, fmt: str) -> Path:
+        """
+        Lấy ảnh thu nhỏ, sinh và cache trên đĩa nếu chưa có
+        (hàm đồng bộ, tốn CPU - nên gọi trong threadpool)
+
+        Args:
+            image_id: Hash ảnh gốc
+            size: Một khóa trong IMAGE_SIZES ("thumb", "medium")
+            fmt: "webp" hoặc "jpeg"
+        """
+        path = ImageService.derivative_path(image_id, size, fmt)
+        if path.exists():
+            return path
+
+        from PIL import Image, ImageOps
+
+        max_side = IMAGE_SIZES[size]
+        with Image.open(ImageService.original_path(image_id)) as image:
+            # JPEG: giải mã trực tiếp ở độ phân giải thấp, nhanh và ít RAM hơn nhiều
+            image.draft("RGB", (max_side, max_side))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_side, max_side))
+
+            if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+
+            buffer = io.BytesIO()
+            image.save(buffer, format=fmt.upper(), quality=IMAGE_QUALITY)
+
+        buffer.seek(0)
+        _write_atomic(IMAGE_CACHE_DIR, path.name, buffer)
+        return path
@@ -0,0 +1,117 @@
+"""
+Index Sync - Giữ index trong bộ nhớ (tìm kiếm, vector...) đồng bộ với storage
+"""
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from app.database import StorageManager, file_signature, register_write_listener
+from app.tenancy import TenantCache, current_tenant, tenant_path
+
+class IndexSync:
+    """
+    Đồng bộ một index trong bộ nhớ với các file collection
+
+    Index cần có: add(kind, record), reconcile(kind, records), reset(),
+    kind_counts (Counter theo kind), needs_compaction()
+    - Ghi từ process này: cập nhật ngay qua write listener (thêm một bản ghi = add)
+    - Ghi từ process khác: chữ ký file lệch, đọc lại file ở lần truy vấn sau
+    """
+
+    def __init__(self, index, collections: Dict[str, Path], listen: bool = True):
+        self.index = index
+        self.collections = collections
+        # Chữ ký file mà index đang phản ánh, theo kind (chưa có = chưa build)
+        self._signatures: Dict[str, Optional[Tuple]] = {}
+        self._lock = threading.Lock()
+        if listen:
+            register_write_listener(self.on_write)
+
+    def _kind_for(self, file_path: Path) -> Optional[str]:
+        for kind, path in self.collections.items():
+            if path == file_path:
+                return kind
+        return None
+
+    def _in_sync(self, kind: str, signature: Optional[Tuple]) -> bool:
+        return kind in self._signatures and self._signatures[kind] == signature
+
+    def sync(self, kinds: Optional[Iterable[str]] = None, compact: bool = True):
+        """Build/đồng bộ lại index của các kind có file đã đổi mà index chưa biết"""
+        compacted = False
+        for kind in kinds or self.collections:
+            path = self.collections[kind]
+            if self._in_sync(kind, file_signature(path)):
+                continue
+            with self._lock:
+                signature = file_signature(path)
+                if self._in_sync(kind, signature):
+                    continue
+                self.index.reconcile(kind, StorageManager.load_json_file(path))
+                self._signatures[kind] = signature
+                if compact:
+                    compacted = self._compact_if_needed() or compacted
+        if compacted:
+            # Index vừa bị xóa trắng: build lại ngay, không trả kết quả rỗng cho truy vấn này.
+            # Không compact lần nữa: file có id trùng (ghi cùng giây) thì doc "đã xóa" sinh lại ngay khi build
+            self.sync(compact=False)
+
+    def _compact_if_needed(self) -> bool:
+        """Quá nhiều doc đã xóa thì xóa index, build lại từ đầu ở lần đồng bộ sau"""
+        if self.index.needs_compaction():
+            self.index.reset()
+            self._signatures.clear()
+            return True
+        return False
+
+    def on_write(self, file_path: Path, records: List[Dict[str, Any]], before: Optional[Tuple], after: Optional[Tuple]):
+        """Listener của StorageManager: cập nhật index ngay khi ghi (chạy trong file_lock)"""
+        kind = self._kind_for(file_path)
+        if kind is None or kind not in self._signatures:
+            return
+        # Đang build/đồng bộ: bỏ qua, chữ ký lệch nên lần truy vấn sau sẽ tự đồng bộ
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self._signatures.get(kind) != before:
+                return
+            if records and len(records) == self.index.kind_counts[kind] + 1:
+                self.index.add(kind, records[-1])
+            else:
+                self.index.reconcile(kind, records)
+            self._signatures[kind] = after
+            self._compact_if_needed()
+        finally:
+            self._lock.release()
+
+class TenantIndexSync:
+    """
+    Mỗi tenant một index + IndexSync riêng, tạo khi tenant dùng tới lần đầu (build ở lần sync đầu)
+
+    Tenant rảnh/quá TENANT_CACHE_SIZE bị giải phóng khỏi bộ nhớ (TenantCache), dùng lại thì build lại từ file
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], collections: Dict[str, Path], **cache_options):
+        self.factory = factory
+        self.collections = collections  # Đường dẫn trong config, đổi sang thư mục của từng tenant
+        self.tenants = TenantCache(name, self._create, **cache_options)
+        register_write_listener(self.on_write)
+
+    def _create(self, tenant: str) -> IndexSync:
+        collections = {kind: tenant_path(path, tenant) for kind, path in self.collections.items()}
+        return IndexSync(self.factory(), collections, listen=False)
+
+    def get(self, tenant: Optional[str] = None) -> IndexSync:
+        """IndexSync của tenant (mặc định tenant hiện tại)"""
+        return self.tenants.get(current_tenant() if tenant is None else tenant)
+
+    def sync(self, kinds: Optional[Iterable[str]] = None, tenant: Optional[str] = None):
+        """Đồng bộ index của tenant (mặc định tenant hiện tại) rồi trả về index"""
+        synced = self.get(tenant)
+        synced.sync(kinds)
+        return synced.index
+
+    def on_write(self, file_path: Path, records: List[Dict[str, Any]], before: Optional[Tuple], after: Optional[Tuple]):
+        """Chỉ cập nhật index của tenant đang ghi nếu nó đang trong bộ nhớ (không nạp tenant chỉ để ghi)"""
+        synced = self.tenants.peek(current_tenant())
+        if synced is not None:
+            synced.on_write(file_path, records, before, after)
@@ -0,0 +1,108 @@
+"""
+Model Routing - Chọn model và tham số gọi Groq theo tác vụ (GROQ_TASKS), tự chuyển sang model dự phòng
+
+- Mỗi tác vụ (emotion, note_analysis, summary, chat, ...) có model, max_tokens, temperature, timeout riêng
+- Theo dõi GROQ_ROUTE_WINDOW lần gọi gần nhất của model chính cho từng tác vụ: tỉ lệ lỗi
+  >= GROQ_FALLBACK_ERROR_RATE hoặc p95 latency >= slow_p95 của tác vụ -> dùng model dự phòng của tác vụ
+  ("fallback" trong GROQ_TASKS: model nhỏ cùng cỡ cho tác vụ phân loại/tóm tắt, model lớn chỉ cho chat)
+- Sau GROQ_FALLBACK_COOLDOWN giây trên model dự phòng: cho một lần gọi đi lại model chính (thăm dò),
+  thành công và đủ nhanh thì trở lại model chính, không thì chờ thêm một chu kỳ
+- Chỉ dùng trong event loop (không cần khóa)
+"""
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from app.config import (
+    GROQ_TASKS, GROQ_FALLBACK_MODEL, GROQ_ROUTE_WINDOW, GROQ_ROUTE_MIN_SAMPLES,
+    GROQ_FALLBACK_ERROR_RATE, GROQ_FALLBACK_COOLDOWN
+)
+from app.metrics import LLM_FALLBACKS, LLM_FALLBACK_ACTIVE
+
+class _TaskState:
+    """Các lần gọi gần đây của model chính và trạng thái fallback của một tác vụ"""
+
+    def __init__(self):
+        self.samples: Deque[Tuple[bool, float]] = deque(maxlen=GROQ_ROUTE_WINDOW)  # (thành công, giây)
+        self.fallback_since: Optional[float] = None  # time.monotonic() lúc chuyển/lần thăm dò gần nhất
+
+class ModelRouter:
+    """Bảng định tuyến tác vụ -> cấu hình gọi Groq, kèm fallback theo sức khỏe của model chính"""
+
+    def __init__(self, tasks: Dict[str, Dict[str, Any]] = GROQ_TASKS, fallback_model: str = GROQ_FALLBACK_MODEL):
+        self.tasks = tasks
+        self.fallback_model = fallback_model
+        self._states: Dict[str, _TaskState] = {}
+
+    def config(self, task: str) -> Dict[str, Any]:
+        """Cấu hình của tác vụ (tác vụ lạ dùng "default")"""
+        return self.tasks.get(task) or self.tasks["default"]
+
+    def _state(self, task: str) -> _TaskState:
+        state = self._states.get(task)
+        if state is None:
+            state = self._states[task] = _TaskState()
+        return state
+
+    def fallback_for(self, task: str) -> Optional[str]:
+        """Model dự phòng của tác vụ, None nếu trùng model chính"""
+        fallback = self.config(task).get("fallback", self.fallback_model)
+        return fallback if fallback and fallback != self.config(task)["model"] else None
+
+    def choose(self, task: str) -> str:
+        """Model cho lần gọi tiếp theo của tác vụ"""
+        primary = self.config(task)["model"]
+        state = self._states.get(task)
+        fallback = self.fallback_for(task)
+        if state is None or state.fallback_since is None or fallback is None:
+            return primary
+        now = time.monotonic()
+        if now - state.fallback_since >= GROQ_FALLBACK_COOLDOWN:
+            state.fallback_since = now  # Thăm dò: lần gọi này đi model chính, các lần khác chờ chu kỳ sau
+            return primary
+        return fallback
+
+    def alternate(self, task: str, model: str) -> str:
+        """Model cho lần thử lại sau khi `model` lỗi: đổi sang model còn lại (giới hạn rate của Groq theo model)"""
+        primary = self.config(task)["model"]
+        fallback = self.fallback_for(task)
+        if fallback is None:
+            return primary
+        return fallback if model == primary else primary
+
+    def record(self, task: str, model: str, ok: bool, seconds: float):
+        """Ghi kết quả một lần gọi (chỉ model chính được theo dõi)"""
+        config = self.config(task)
+        if model != config["model"]:
+            return
+        state = self._state(task)
+        if state.fallback_since is not None:
+            if ok and seconds < config["slow_p95"]:
+                state.fallback_since = None
+                state.samples.clear()
+                LLM_FALLBACKS.inc(task=task, reason="recovered")
+                LLM_FALLBACK_ACTIVE.set(0, task=task)
+            return
+
+        state.samples.append((ok, seconds))
+        reason = self._unhealthy(state, config["slow_p95"])
+        if reason and self.fallback_for(task):
+            state.fallback_since = time.monotonic()
+            LLM_FALLBACKS.inc(task=task, reason=reason)
+            LLM_FALLBACK_ACTIVE.set(1, task=task)
+
+    @staticmethod
+    def _unhealthy(state: _TaskState, slow_p95: float) -> Optional[str]:
+        """"errors"/"slow" nếu model chính vượt ngưỡng, None nếu ổn hoặc chưa đủ mẫu"""
+        if len(state.samples) < GROQ_ROUTE_MIN_SAMPLES:
+            return None
+        errors = sum(1 for ok, _ in state.samples if not ok)
+        if errors / len(state.samples) >= GROQ_FALLBACK_ERROR_RATE:
+            return "errors"
+        latencies = sorted(seconds for ok, seconds in state.samples if ok)
+        if latencies and latencies[math.ceil(0.95 * len(latencies)) - 1] >= slow_p95:
+            return "slow"
+        return None
+
+# Dùng chung trong process cho mọi lần gọi Groq
+GROQ_ROUTER = ModelRouter()
@@ -1,31 +1,75 @@
 """
 OCR Service Layer
 """
-import pytesseract
-from PIL import Image
 import io
-from app.config import TESSERACT_CMD
-
-# Cấu hình Tesseract
-pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+import time
+from typing import BinaryIO, Union
+from starlette.concurrency import run_in_threadpool
+from app.admission import Admission, Overloaded
+from app.config import TESSERACT_CMD, DEADLINE_MIN_OCR
+from app.deadline import DeadlineExceeded, budget, exceeded
+from app.metrics import OCR_LATENCY
+from app.profiling import record_span
+from app.warmup import register_warmup
 
 class OCRService:
     """Service xử lý OCR"""
     
+    _pytesseract = None
+    
+    @staticmethod
+    def load_modules():
+        """Import pytesseract + Pillow ở lần dùng đầu tiên (không làm chậm lúc khởi động)"""
+        if OCRService._pytesseract is None:
+            import pytesseract
+            from PIL import Image
+            
+            # Cấu hình Tesseract
+            pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+            Image.init()
+            OCRService._pytesseract = pytesseract
+        return OCRService._pytesseract
+    
     @staticmethod
-    async def extract_text_from_image(image_bytes: bytes) -> str:
+    async def extract_text_from_image(image_source: Union[bytes, BinaryIO]) -> str:
         """
         Trích xuất text từ ảnh
         
         Args:
-            image_bytes: Dữ liệu ảnh dạng bytes
+            image_source: Dữ liệu ảnh dạng bytes hoặc file object (vd. file spool của upload).
+                Pillow chỉ đọc header khi mở, pixel được giải mã trực tiếp từ file khi cần.
             
         Returns:
             Text đã trích xuất
+        
+        Tesseract chạy trong threadpool, tối đa OCR_SLOTS lượt cùng lúc (Overloaded nếu quá tải).
+        Request có deadline: tesseract bị dừng khi hết phần thời gian còn lại (DeadlineExceeded)
         """
         try:
-            image = Image.open(io.BytesIO(image_bytes))
-            extracted_text = pytesseract.image_to_string(image, lang='vie+eng')
+            pytesseract = OCRService.load_modules()
+            from PIL import Image
+            
+            if isinstance(image_source, (bytes, bytearray)):
+                image_source = io.BytesIO(image_source)
+            image = Image.open(image_source)
+            budget("ocr", DEADLINE_MIN_OCR)
+            async with Admission.ocr.slot():
+                start = time.perf_counter()
+                timeout = budget("ocr", DEADLINE_MIN_OCR)
+                kwargs = {"timeout": timeout} if timeout is not None else {}
+                try:
+                    extracted_text = await run_in_threadpool(pytesseract.image_to_string, image, lang='vie+eng', **kwargs)
+                except RuntimeError as e:
+                    if timeout is not None and "timeout" in str(e).lower():
+                        raise exceeded("ocr")  # pytesseract đã dừng tiến trình tesseract
+                    raise
+                elapsed = time.perf_counter() - start
+            OCR_LATENCY.observe(elapsed)
+            record_span("ocr", "tesseract", start, elapsed)
             return extracted_text.strip()
+        except (Overloaded, DeadlineExceeded):
+            raise
         except Exception as e:
-            raise Exception(f"Lỗi OCR: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Lỗi OCR: {str(e)}")
+
+register_warmup(OCRService.load_modules)
\ No newline at end of file
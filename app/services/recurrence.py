@@ -0,0 +1,196 @@
+"""
+Recurrence - Nhắc nhở lặp lại (uống thuốc hằng ngày, tập thể dục thứ 2-4-6...)
+
+Một chuỗi nhắc nhở lưu MỘT bản ghi trong reminders.json:
+    {
+        "id": "series_...", "title": ..., "description": ...,
+        "remind_at": "2024-05-01T08:00",           # lần đầu tiên
+        "recurrence": {"freq": "daily", "interval": 1, "times": ["08:00", "20:00"],
+                       "weekdays": [0, 2, 4], "until": "2024-12-31", "count": 60},
+        "exceptions": {"2024-05-02T08:00": {"completed": true}},  # theo từng lần
+        "completed_through": "2024-05-01T20:00",   # mọi lần tới đây đã hoàn thành
+        "is_completed": false                       # true = dừng cả chuỗi
+    }
+Các lần nhắc chỉ được sinh ra khi cần, trong khoảng thời gian đang hỏi (không lưu từng lần)
+"""
+import math
+from datetime import datetime, timedelta, time as dt_time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+FREQUENCIES = ("daily", "weekly", "hourly")
+WEEKDAY_NAMES = ["Thứ 2", "Thứ 3", "Thứ 4", "Thứ 5", "Thứ 6", "Thứ 7", "Chủ nhật"]
+
+def occurrence_key(moment: datetime) -> str:
+    """Khóa của một lần nhắc (ISO tới phút) - dùng trong id và exceptions"""
+    return moment.isoformat(timespec="minutes")
+
+def occurrence_id(series_id: str, moment: datetime) -> str:
+    return f"{series_id}@{occurrence_key(moment)}"
+
+def split_occurrence_id(reminder_id: str) -> Optional[Tuple[str, datetime]]:
+    """'series_x@2024-05-01T08:00' -> ('series_x', datetime); None nếu không phải id của một lần nhắc"""
+    series_id, sep, key = reminder_id.rpartition("@")
+    if not sep or not series_id:
+        return None
+    try:
+        return series_id, datetime.fromisoformat(key)
+    except ValueError:
+        return None
+
+def _parse_time(value: str) -> dt_time:
+    hour, minute = (int(part) for part in str(value).split(":")[:2])
+    return dt_time(hour, minute)
+
+def _parse_until(value: str) -> datetime:
+    until = datetime.fromisoformat(str(value))
+    # Chỉ có ngày: tính hết ngày đó
+    return until + timedelta(days=1) - timedelta(seconds=1) if len(str(value)) <= 10 else until
+
+def validate_rule(rule: Dict[str, Any], start: datetime) -> Dict[str, Any]:
+    """Chuẩn hóa luật lặp, ValueError (thông báo tiếng Việt) nếu không hợp lệ"""
+    freq = rule.get("freq")
+    if freq not in FREQUENCIES:
+        raise ValueError(f"freq phải là một trong: {', '.join(FREQUENCIES)}")
+    try:
+        interval = int(rule.get("interval") or 1)
+    except (TypeError, ValueError):
+        raise ValueError("interval phải là số nguyên")
+    if interval < 1:
+        raise ValueError("interval phải >= 1")
+
+    normalized: Dict[str, Any] = {"freq": freq, "interval": interval}
+    if freq != "hourly":
+        try:
+            times = sorted({_parse_time(t) for t in rule.get("times") or [start.strftime("%H:%M")]})
+        except (TypeError, ValueError):
+            raise ValueError("times phải có dạng ['HH:MM', ...]")
+        normalized["times"] = [t.strftime("%H:%M") for t in times]
+    if freq == "weekly":
+        weekdays = rule.get("weekdays")
+        if weekdays is None:
+            weekdays = [start.weekday()]
+        if not weekdays or any(not isinstance(d, int) or not 0 <= d <= 6 for d in weekdays):
+            raise ValueError("weekdays phải là danh sách số 0 (Thứ 2) .. 6 (Chủ nhật)")
+        normalized["weekdays"] = sorted(set(weekdays))
+    if rule.get("until"):
+        try:
+            _parse_until(rule["until"])
+        except ValueError:
+            raise ValueError("until phải là ngày/giờ ISO")
+        normalized["until"] = str(rule["until"])
+    if rule.get("count") is not None:
+        try:
+            count = int(rule["count"])
+        except (TypeError, ValueError):
+            raise ValueError("count phải là số nguyên")
+        if count < 1:
+            raise ValueError("count phải >= 1")
+        normalized["count"] = count
+    return normalized
+
+def _plan(series: Dict[str, Any]) -> Tuple[datetime, timedelta, List[timedelta], datetime]:
+    """
+    Luật lặp dạng chu kỳ: lần nhắc = anchor + p * period + slot (p = 0, 1, ...; slot theo thứ tự),
+    bỏ các lần trước dtstart. Returns: (anchor, period, slots, dtstart)
+    """
+    rule = series["recurrence"]
+    dtstart = datetime.fromisoformat(series["remind_at"]).replace(second=0, microsecond=0)
+    interval = rule.get("interval", 1)
+    if rule["freq"] == "hourly":
+        return dtstart, timedelta(hours=interval), [timedelta(0)], dtstart
+
+    times = [_parse_time(t) for t in rule["times"]]
+    day_slots = [timedelta(hours=t.hour, minutes=t.minute) for t in times]
+    midnight = datetime.combine(dtstart.date(), dt_time())
+    if rule["freq"] == "daily":
+        return midnight, timedelta(days=interval), day_slots, dtstart
+
+    monday = midnight - timedelta(days=dtstart.weekday())
+    slots = [timedelta(days=d) + s for d in rule["weekdays"] for s in day_slots]
+    return monday, timedelta(weeks=interval), slots, dtstart
+
+def iter_occurrences(series: Dict[str, Any], start: Optional[datetime] = None) -> Iterator[datetime]:
+    """
+    Các lần nhắc từ `start` trở đi, theo thứ tự thời gian (vô hạn nếu không có until/count)
+
+    Nhảy thẳng tới chu kỳ chứa `start` bằng phép chia: chi phí không phụ thuộc chuỗi đã chạy bao lâu
+    """
+    anchor, period, slots, dtstart = _plan(series)
+    rule = series["recurrence"]
+    until = _parse_until(rule["until"]) if rule.get("until") else None
+    count = rule.get("count")
+    # Số slot của chu kỳ đầu nằm trước dtstart (không tính vào count)
+    skipped = sum(1 for slot in slots if anchor + slot < dtstart)
+
+    start = max(start or dtstart, dtstart)
+    p = max(0, math.floor((start - anchor) / period))
+    while True:
+        try:
+            base = anchor + p * period
+        except OverflowError:  # Quá năm 9999
+            return
+        for i, slot in enumerate(slots):
+            moment = base + slot
+            if count is not None and p * len(slots) + i - skipped >= count:
+                return
+            if until is not None and moment > until:
+                return
+            if moment >= start:
+                yield moment
+        p += 1
+
+def is_occurrence(series: Dict[str, Any], moment: datetime) -> bool:
+    return next(iter_occurrences(series, moment), None) == moment
+
+def is_done(series: Dict[str, Any], moment: datetime) -> bool:
+    """Lần nhắc đã hoàn thành (trước completed_through hoặc có exception completed)"""
+    through = series.get("completed_through")
+    if through and moment <= datetime.fromisoformat(through):
+        return True
+    return bool((series.get("exceptions") or {}).get(occurrence_key(moment), {}).get("completed"))
+
+def occurrence_record(series: Dict[str, Any], moment: datetime) -> Dict[str, Any]:
+    """Một lần nhắc dưới dạng nhắc nhở thường (cùng các trường với bản ghi đơn lẻ)"""
+    exception = (series.get("exceptions") or {}).get(occurrence_key(moment), {})
+    record = {
+        "id": occurrence_id(series["id"], moment),
+        "series_id": series["id"],
+        "note_id": series.get("note_id"),
+        "title": series.get("title"),
+        "description": series.get("description"),
+        "remind_at": moment.isoformat(),
+        "is_completed": is_done(series, moment),
+        "recurrence": series["recurrence"],
+        "created_at": series.get("created_at")
+    }
+    if exception.get("snoozed_until"):
+        record["snoozed_until"] = exception["snoozed_until"]
+    return record
+
+def expand(series: Dict[str, Any], start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """Các lần nhắc trong [start, end)"""
+    records = []
+    for moment in iter_occurrences(series, start):
+        if moment >= end:
+            break
+        records.append(occurrence_record(series, moment))
+    return records
+
+def mark_occurrence(series: Dict[str, Any], moment: datetime, fields: Dict[str, Any]):
+    """
+    Ghi exception cho một lần nhắc (sửa series tại chỗ)
+
+    Hoàn thành liên tiếp từ đầu chuỗi được gộp vào completed_through và bỏ khỏi exceptions,
+    nên exceptions chỉ giữ các lần lẻ (hoãn, hoàn thành vượt trước) - kích thước chuỗi không tăng theo thời gian
+    """
+    exceptions = series.setdefault("exceptions", {})
+    exceptions.setdefault(occurrence_key(moment), {}).update(fields)
+
+    through = series.get("completed_through")
+    after = datetime.fromisoformat(through) + timedelta(minutes=1) if through else None
+    for candidate in iter_occurrences(series, after):
+        key = occurrence_key(candidate)
+        if not exceptions.get(key, {}).get("completed"):
+            break
+        series["completed_through"] = key
+        del exceptions[key]
@@ -0,0 +1,506 @@
+"""
+Reminder Service - Lịch nhắc nhở trong process, đẩy nhắc nhở đến hạn qua WebSocket
+
+- Heap theo thời điểm đến hạn, mỗi tenant một lịch, nạp từ reminders.json khi client đầu tiên kết nối
+- Ghi từ process này: cập nhật ngay qua write listener; worker khác ghi: phát hiện qua chữ ký file mỗi giây
+- Mỗi worker tự đẩy cho các client kết nối tới nó (không cần điều phối giữa các worker)
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.config import (
+    REMINDER_FILE, REMINDER_POLL_SECONDS, REMINDER_MISSED_GRACE_SECONDS,
+    REMINDER_SNOOZE_MINUTES, REMINDER_MAX_SNOOZE_MINUTES, REMINDER_OVERDUE_LIMIT, REMINDER_OVERDUE_HOURS
+)
+from app.database import StorageManager
+from app.ids import new_id
+from app.metrics import REMINDERS_FIRED, REMINDER_DELIVERY_LAG, REMINDER_STREAM_CLIENTS
+from app.services import recurrence
+from app.services.index_sync import TenantIndexSync
+
+def due_time(reminder: Dict[str, Any]) -> Optional[float]:
+    """Thời điểm đến hạn (timestamp): snoozed_until nếu đang hoãn, không thì remind_at"""
+    try:
+        return datetime.fromisoformat(reminder.get("snoozed_until") or reminder["remind_at"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def reminder_payload(reminder: Dict[str, Any]) -> Dict[str, Any]:
+    """Các trường gửi cho client"""
+    fields = ("id", "series_id", "note_id", "title", "description", "remind_at", "snoozed_until")
+    return {key: reminder[key] for key in fields if reminder.get(key) is not None}
+
+class ReminderSchedule:
+    """
+    Heap (đến hạn, seq, khóa) các lần nhắc đang chờ
+
+    Mỗi bản ghi sinh ra các "job" (khóa, đến hạn, nội dung gửi): nhắc nhở đơn lẻ có một job,
+    chuỗi lặp có job cho lần kế tiếp (sinh lại sau mỗi lần đẩy) và cho từng lần đang hoãn.
+    Hủy/đổi giờ không xóa khỏi heap: due_of giữ thời điểm hiện hành, phần tử lệch bị bỏ qua khi lấy ra.
+    Có giao diện index của IndexSync (add, reconcile, reset, kind_counts, needs_compaction)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        # Gọi sau mỗi thay đổi (từ thread bất kỳ) để đánh thức vòng lặp scheduler
+        self.on_change: Optional[Callable[[], None]] = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.heap: List[Tuple[float, int, str]] = []
+            self.due_of: Dict[str, float] = {}  # khóa -> thời điểm đến hạn đang chờ
+            self.fired: Dict[str, float] = {}  # khóa -> thời điểm đến hạn đã đẩy (không đẩy lại)
+            self.last_fired: Dict[str, float] = {}  # id chuỗi lặp -> lần nhắc đã đẩy gần nhất (_push không xóa)
+            self.payloads: Dict[str, Dict[str, Any]] = {}  # khóa -> nội dung gửi client
+            self.keys_of: Dict[str, Set[str]] = {}  # id bản ghi -> các khóa job
+            self.owner: Dict[str, str] = {}  # khóa -> id bản ghi
+            self.pending: Dict[str, Dict[str, Any]] = {}
+            self.ids: Set[str] = set()
+            self.kind_counts: Counter = Counter()
+
+    def needs_compaction(self) -> bool:
+        return False
+
+    def _jobs(self, reminder: Dict[str, Any]) -> List[Tuple[str, float, Dict[str, Any]]]:
+        reminder_id = str(reminder.get("id"))
+        if "recurrence" not in reminder:
+            due = due_time(reminder)
+            return [(reminder_id, due, reminder)] if due is not None else []
+
+        jobs = []
+        exceptions = reminder.get("exceptions") or {}
+        # Lần kế tiếp sau lần đã đẩy gần nhất (lần bị lỡ quá lâu thì bỏ qua)
+        after = max(time.time() - REMINDER_MISSED_GRACE_SECONDS, self.last_fired.get(reminder_id, 0.0) + 1)
+        try:
+            for moment in recurrence.iter_occurrences(reminder, datetime.fromtimestamp(after)):
+                key = recurrence.occurrence_key(moment)
+                if recurrence.is_done(reminder, moment) or exceptions.get(key, {}).get("snoozed_until"):
+                    continue
+                jobs.append((reminder_id, moment.timestamp(), recurrence.occurrence_record(reminder, moment)))
+                break
+            for key, exception in exceptions.items():
+                if exception.get("snoozed_until") and not exception.get("completed"):
+                    moment = datetime.fromisoformat(key)
+                    occurrence = recurrence.occurrence_record(reminder, moment)
+                    jobs.append((occurrence["id"], due_time(occurrence), occurrence))
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Chuỗi nhắc nhở {reminder_id} không hợp lệ: {e}")
+        return jobs
+
+    def _schedule(self, reminder: Dict[str, Any]) -> bool:
+        reminder_id = str(reminder.get("id"))
+        if reminder.get("is_completed"):
+            self._remove(reminder_id)
+            return False
+        self.pending[reminder_id] = reminder
+        jobs = self._jobs(reminder)
+        keys = {key for key, _, _ in jobs}
+        for key in self.keys_of.get(reminder_id, set()) - keys:
+            self._drop(key)
+        self.keys_of[reminder_id] = keys
+
+        changed = False
+        for key, due, payload in jobs:
+            self.payloads[key] = payload
+            self.owner[key] = reminder_id
+            changed = self._push(key, due) or changed
+        return changed
+
+    def _push(self, key: str, due: float) -> bool:
+        if self.fired.get(key) == due or self.due_of.get(key) == due:
+            return False
+        if due < time.time() - REMINDER_MISSED_GRACE_SECONDS:
+            # Lỡ từ lâu (server tắt...): chỉ gửi trong danh sách quá hạn khi client kết nối
+            self.fired[key] = due
+            self.due_of.pop(key, None)
+            return False
+        self.fired.pop(key, None)
+        self.due_of[key] = due
+        heapq.heappush(self.heap, (due, next(self._seq), key))
+        return True
+
+    def _drop(self, key: str):
+        self.due_of.pop(key, None)
+        self.fired.pop(key, None)
+        self.payloads.pop(key, None)
+        self.owner.pop(key, None)
+
+    def _remove(self, reminder_id: str):
+        for key in self.keys_of.pop(reminder_id, set()):
+            self._drop(key)
+        self.fired.pop(reminder_id, None)
+        self.last_fired.pop(reminder_id, None)
+        self.pending.pop(reminder_id, None)
+
+    def add(self, kind: str, reminder: Dict[str, Any]):
+        """Thêm hoặc cập nhật một nhắc nhở"""
+        with self._lock:
+            self.ids.add(str(reminder.get("id")))
+            self.kind_counts[kind] = len(self.ids)
+            changed = self._schedule(reminder)
+        if changed and self.on_change:
+            self.on_change()
+
+    def reconcile(self, kind: str, reminders: List[Dict[str, Any]]):
+        """Đưa lịch về đúng danh sách nhắc nhở hiện có"""
+        with self._lock:
+            present = {str(r.get("id")) for r in reminders}
+            for reminder_id in self.ids - present:
+                self._remove(reminder_id)
+            self.ids = present
+            self.kind_counts[kind] = len(present)
+            for reminder in reminders:
+                self._schedule(reminder)
+        if self.on_change:
+            self.on_change()
+
+    def next_due(self) -> Optional[float]:
+        """Thời điểm đến hạn sớm nhất đang chờ"""
+        with self._lock:
+            while self.heap and self.due_of.get(self.heap[0][2]) != self.heap[0][0]:
+                heapq.heappop(self.heap)
+            return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now: float) -> List[Tuple[Dict[str, Any], float]]:
+        """Lấy các lần nhắc đã đến hạn: [(nội dung gửi, thời điểm đến hạn)]"""
+        due = []
+        with self._lock:
+            while self.heap and self.heap[0][0] <= now:
+                when, _, key = heapq.heappop(self.heap)
+                if self.due_of.get(key) != when:
+                    continue
+                del self.due_of[key]
+                self.fired[key] = when
+                due.append((self.payloads[key], when))
+                # Chuỗi lặp: xếp lịch lần kế tiếp
+                reminder = self.pending.get(self.owner.get(key))
+                if reminder is not None and "recurrence" in reminder:
+                    if key == self.owner.get(key):
+                        self.last_fired[key] = max(self.last_fired.get(key, 0.0), when)
+                    self._schedule(reminder)
+        return due
+
+    def overdue(self, now: float, limit: int = REMINDER_OVERDUE_LIMIT) -> List[Dict[str, Any]]:
+        """Nhắc nhở chưa hoàn thành đã quá hạn, mới nhất trước (chuỗi lặp: các lần trong REMINDER_OVERDUE_HOURS)"""
+        with self._lock:
+            reminders = list(self.pending.values())
+        items = []
+        window_start = datetime.fromtimestamp(now) - timedelta(hours=REMINDER_OVERDUE_HOURS)
+        for reminder in reminders:
+            if "recurrence" in reminder:
+                try:
+                    occurrences = recurrence.expand(reminder, window_start, datetime.fromtimestamp(now + 1))
+                except (KeyError, TypeError, ValueError):
+                    continue
+                items.extend((due_time(o), o) for o in occurrences if not o["is_completed"])
+            else:
+                items.append((due_time(reminder), reminder))
+        items = [(due, r) for due, r in items if due is not None and due <= now]
+        return [r for _, r in heapq.nlargest(limit, items, key=lambda item: item[0])]
+
+class ReminderService:
+    """
+    Vòng lặp scheduler (chạy trong lifespan) và các client WebSocket nhận nhắc nhở
+
+    Chỉ tenant đang có client kết nối mới có lịch trong bộ nhớ: không ai nghe thì không cần đẩy,
+    nhắc nhở lỡ trong lúc đó nằm trong danh sách quá hạn gửi khi client kết nối lại
+    """
+
+    clients: Dict[str, Set[Any]] = {}  # tenant -> các WebSocket đang kết nối
+    schedules = TenantIndexSync(
+        "reminder", lambda: ReminderService._new_schedule(), {"reminder": REMINDER_FILE},
+        keep=lambda tenant: tenant in ReminderService.clients
+    )
+    _wake: Optional[asyncio.Event] = None
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @staticmethod
+    def _new_schedule() -> ReminderSchedule:
+        schedule = ReminderSchedule()
+        schedule.on_change = ReminderService._notify
+        return schedule
+
+    @staticmethod
+    def _notify():
+        """Đánh thức vòng lặp (gọi được từ thread ghi storage)"""
+        loop, wake = ReminderService._loop, ReminderService._wake
+        if loop is not None and wake is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wake.set)
+
+    @staticmethod
+    def _sync_all(tenants: List[str]) -> Dict[str, ReminderSchedule]:
+        """Đồng bộ lịch của các tenant đang có client (một lần qua threadpool cho cả vòng lặp)"""
+        schedules = {}
+        for tenant in tenants:
+            try:
+                schedules[tenant] = ReminderService.schedules.sync(tenant=tenant)
+            except Exception as e:
+                print(f"Reminder scheduler sync lỗi (tenant {tenant or 'mặc định'}): {e}")
+        return schedules
+
+    @staticmethod
+    async def run():
+        """Đẩy nhắc nhở đúng lúc đến hạn; chạy tới khi bị cancel"""
+        ReminderService._loop = asyncio.get_running_loop()
+        ReminderService._wake = asyncio.Event()
+        try:
+            while True:
+                ReminderService._wake.clear()
+                schedules = await run_in_threadpool(ReminderService._sync_all, list(ReminderService.clients))
+
+                next_due = None
+                for tenant, schedule in schedules.items():
+                    for reminder, due in schedule.pop_due(time.time()):
+                        await ReminderService.deliver(tenant, reminder, due)
+                    due = schedule.next_due()
+                    if due is not None and (next_due is None or due < next_due):
+                        next_due = due
+
+                timeout = REMINDER_POLL_SECONDS
+                if next_due is not None:
+                    timeout = max(0.0, min(next_due - time.time(), timeout))
+                try:
+                    await asyncio.wait_for(ReminderService._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            ReminderService._loop = None
+
+    @staticmethod
+    async def deliver(tenant: str, reminder: Dict[str, Any], due: float):
+        """Gửi nhắc nhở đến hạn cho mọi client của tenant"""
+        lag = max(time.time() - due, 0.0)
+        REMINDERS_FIRED.inc()
+        REMINDER_DELIVERY_LAG.observe(lag)
+        await ReminderService.broadcast(tenant, {
+            "type": "reminder",
+            "reminder": reminder_payload(reminder),
+            "due_at": datetime.fromtimestamp(due).isoformat(),
+            "lag_ms": round(lag * 1000, 1)
+        })
+
+    @staticmethod
+    async def broadcast(tenant: str, message: Dict[str, Any]):
+        """Gửi song song, client lỗi/đã ngắt bị loại khỏi danh sách"""
+        text = json.dumps(message, ensure_ascii=False)
+        clients = list(ReminderService.clients.get(tenant, ()))
+        results = await asyncio.gather(*[ws.send_text(text) for ws in clients], return_exceptions=True)
+        for ws, result in zip(clients, results):
+            if isinstance(result, Exception):
+                ReminderService.disconnect(tenant, ws)
+
+    @staticmethod
+    def prepare(tenant: str):
+        """
+        Nạp lịch của tenant trước khi client kết nối (đồng bộ, gọi qua threadpool)
+
+        Lịch vừa nạp: các lần đã đến hạn đã nằm trong danh sách quá hạn, không đẩy thêm lần nữa
+        """
+        loaded = tenant in ReminderService.schedules.tenants
+        schedule = ReminderService.schedules.sync(tenant=tenant)
+        if not loaded:
+            schedule.pop_due(time.time())
+
+    @staticmethod
+    def connect(tenant: str, websocket):
+        ReminderService.clients.setdefault(tenant, set()).add(websocket)
+        REMINDER_STREAM_CLIENTS.set(sum(len(c) for c in ReminderService.clients.values()))
+        ReminderService._notify()
+
+    @staticmethod
+    def disconnect(tenant: str, websocket):
+        clients = ReminderService.clients.get(tenant)
+        if clients is not None:
+            clients.discard(websocket)
+            if not clients:
+                del ReminderService.clients[tenant]
+        REMINDER_STREAM_CLIENTS.set(sum(len(c) for c in ReminderService.clients.values()))
+
+    @staticmethod
+    def overdue_message(tenant: str) -> Dict[str, Any]:
+        """
+        Tin nhắn đầu tiên khi client kết nối: các nhắc nhở đã quá hạn chưa hoàn thành
+
+        Chỉ đọc lịch trong bộ nhớ (đã nạp bằng prepare): gọi cùng lúc với connect,
+        không await ở giữa, để nhắc nhở đến hạn ngay lúc đó không bị lọt giữa hai bước
+        """
+        reminders = ReminderService.schedules.get(tenant).index.overdue(time.time())
+        return {"type": "overdue", "reminders": [reminder_payload(r) for r in reminders]}
+
+    @staticmethod
+    def handle_message(message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Xử lý tin nhắn client (đồng bộ, gọi qua threadpool)
+        - {"type": "ack", "id": ...}: đánh dấu hoàn thành
+        - {"type": "snooze", "id": ..., "minutes": 10}: hoãn, đẩy lại sau số phút này
+        """
+        kind = message.get("type")
+        reminder_id = message.get("id")
+        if kind not in ("ack", "snooze") or not reminder_id:
+            return {"type": "error", "detail": "Tin nhắn phải có type là 'ack' hoặc 'snooze' và id"}
+
+        if kind == "ack":
+            found = ReminderService.complete(reminder_id)
+            reply = {"type": "acknowledged", "id": reminder_id}
+        else:
+            try:
+                minutes = float(message.get("minutes") or REMINDER_SNOOZE_MINUTES)
+            except (TypeError, ValueError):
+                minutes = -1
+            if not 0 < minutes <= REMINDER_MAX_SNOOZE_MINUTES:
+                return {"type": "error", "id": reminder_id,
+                        "detail": f"minutes phải trong khoảng (0, {REMINDER_MAX_SNOOZE_MINUTES}]"}
+            until = (datetime.now() + timedelta(minutes=minutes)).isoformat()
+            found = ReminderService.snooze(reminder_id, until)
+            reply = {"type": "snoozed", "id": reminder_id, "snoozed_until": until}
+
+        if not found:
+            return {"type": "error", "id": reminder_id, "detail": "Không tìm thấy nhắc nhở"}
+        return reply
+
+    # ========== NHẮC NHỞ LẶP LẠI ==========
+
+    @staticmethod
+    def _update(reminder_id: str, fields: Dict[str, Any], occurrence_fields: Dict[str, Any]) -> bool:
+        """
+        Sửa nhắc nhở đơn lẻ/cả chuỗi (fields), hoặc ghi exception cho một lần của chuỗi
+        với id dạng 'series_x@2024-05-01T08:00' (occurrence_fields). False nếu không tìm thấy
+        """
+        occurrence = recurrence.split_occurrence_id(reminder_id)
+        if occurrence is None:
+            return StorageManager.update_reminder(reminder_id, fields)
+
+        series_id, moment = occurrence
+
+        def modify(series: Dict[str, Any]):
+            if "recurrence" not in series or not recurrence.is_occurrence(series, moment):
+                raise LookupError(reminder_id)
+            recurrence.mark_occurrence(series, moment, occurrence_fields)
+
+        try:
+            return StorageManager.modify_reminder(series_id, modify)
+        except LookupError:
+            return False
+
+    @staticmethod
+    def complete(reminder_id: str) -> bool:
+        """Hoàn thành một nhắc nhở, một lần của chuỗi, hoặc dừng cả chuỗi (id của chuỗi)"""
+        now = datetime.now().isoformat()
+        return ReminderService._update(
+            reminder_id,
+            {"is_completed": True, "completed_at": now},
+            {"completed": True, "completed_at": now}
+        )
+
+    @staticmethod
+    def snooze(reminder_id: str, until: str) -> bool:
+        """Hoãn một nhắc nhở (hoặc một lần của chuỗi) tới `until`"""
+        return ReminderService._update(reminder_id, {"snoozed_until": until}, {"snoozed_until": until})
+
+    @staticmethod
+    def get_reminder(reminder_id: str) -> Optional[Dict[str, Any]]:
+        """Một nhắc nhở/chuỗi theo id, hoặc một lần của chuỗi (id 'series_x@...'), None nếu không có"""
+        occurrence = recurrence.split_occurrence_id(reminder_id)
+        if occurrence is None:
+            return StorageManager.get_reminder(reminder_id)
+        series_id, moment = occurrence
+        series = StorageManager.get_reminder(series_id)
+        if not series or "recurrence" not in series or not recurrence.is_occurrence(series, moment):
+            return None
+        return recurrence.occurrence_record(series, moment)
+
+    @staticmethod
+    def list_reminders(status: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """
+        Nhắc nhở đơn lẻ + các lần của chuỗi lặp trong [start, end), theo giờ nhắc
+        (chuỗi chỉ được trải trong khoảng này, không phụ thuộc chuỗi dài bao lâu)
+        """
+        result = []
+        for reminder in StorageManager.get_all_reminders():
+            if "recurrence" not in reminder:
+                if status != "pending" or not reminder.get("is_completed", False):
+                    result.append(reminder)
+                continue
+            if status == "pending" and reminder.get("is_completed"):
+                continue
+            try:
+                occurrences = recurrence.expand(reminder, start, end)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Chuỗi nhắc nhở {reminder.get('id')} không hợp lệ: {e}")
+                continue
+            result.extend(o for o in occurrences if status != "pending" or not o["is_completed"])
+        return sorted(result, key=lambda x: x['remind_at'])
+
+    @staticmethod
+    def build_series(data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Tạo bản ghi chuỗi nhắc nhở từ dữ liệu client (ValueError nếu không hợp lệ)
+
+        data: {title, description?, note_id?, remind_at? (lần đầu, mặc định phút kế tiếp), recurrence: {...}}
+        """
+        if not data.get("title"):
+            raise ValueError("Thiếu title")
+        if not isinstance(data.get("recurrence"), dict):
+            raise ValueError("Thiếu recurrence")
+        now = datetime.now()
+        try:
+            start = datetime.fromisoformat(data["remind_at"]) if data.get("remind_at") else now + timedelta(minutes=1)
+        except (TypeError, ValueError):
+            raise ValueError("remind_at phải là ngày giờ ISO")
+        start = start.replace(second=0, microsecond=0)
+
+        series = {
+            "id": new_id("series"),
+            "note_id": data.get("note_id"),
+            "title": data["title"],
+            "description": data.get("description") or "",
+            "remind_at": start.isoformat(),
+            "recurrence": recurrence.validate_rule(data["recurrence"], start),
+            "exceptions": {},
+            "is_completed": False,
+            "created_at": now.isoformat()
+        }
+        if data.get("medication"):
+            series["medication"] = data["medication"]
+        return series
+
+    @staticmethod
+    def medication_series(user_profile: Optional[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Chuỗi uống thuốc hằng ngày cho các thuốc trong user_profile['medications'] chưa có chuỗi
+
+        Thuốc: {"name": ..., "dose": "5mg", "time": "08:00"} hoặc "times": ["08:00", "20:00"]
+        Returns:
+            (các chuỗi mới, tên thuốc đã có chuỗi nên bỏ qua)
+        """
+        existing = {
+            r.get("medication") for r in StorageManager.get_all_reminders()
+            if "recurrence" in r and not r.get("is_completed")
+        }
+        created, skipped = [], []
+        for medication in (user_profile or {}).get("medications", []):
+            name = (medication.get("name") or "").strip()
+            if not name:
+                continue
+            if name in existing:
+                skipped.append(name)
+                continue
+            times = medication.get("times") or [medication.get("time") or "08:00"]
+            dose = medication.get("dose") or medication.get("dosage")
+            created.append(ReminderService.build_series({
+                "title": f"💊 Uống thuốc {name}" + (f" ({dose})" if dose else ""),
+                "description": medication.get("note") or "",
+                "medication": name,
+                "recurrence": {"freq": "daily", "times": times}
+            }))
+            existing.add(name)
+        return created, skipped
@@ -0,0 +1,287 @@
+"""
+Search Service - Tìm kiếm toàn văn nhật ký, ghi chú, ký ức
+Inverted index trong bộ nhớ, cập nhật dần sau mỗi lần StorageManager ghi,
+xếp hạng BM25, bỏ dấu tiếng Việt ("uong thuoc" khớp "uống thuốc")
+"""
+import math
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import (
+    DIARY_FILE, NOTE_FILE, MEMORY_FILE,
+    SEARCH_BM25_K1, SEARCH_BM25_B, SEARCH_SNIPPET_CHARS
+)
+from app.profiling import record_span
+from app.services.index_sync import TenantIndexSync
+from app.warmup import register_warmup
+
+# Loại dữ liệu -> (file, các trường được index)
+SEARCH_COLLECTIONS: Dict[str, Tuple[Path, Tuple[str, ...]]] = {
+    "diary": (DIARY_FILE, ("content", "summary")),
+    "note": (NOTE_FILE, ("content",)),
+    "memory": (MEMORY_FILE, ("content", "tags"))
+}
+KINDS = list(SEARCH_COLLECTIONS)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def _build_fold_table() -> Dict[int, str]:
+    """Bảng bỏ dấu: ký tự Latin có dấu -> chữ cái gốc (ư -> u, ơ -> o, đ -> d)"""
+    table = {ord("đ"): "d", ord("Đ"): "D"}
+    for code in range(0xC0, 0x1F00):
+        char = chr(code)
+        base = unicodedata.normalize("NFD", char)[0]
+        if base != char and base.isascii():
+            table[code] = base
+    return table
+
+_FOLD_TABLE = _build_fold_table()
+
+def fold_text(text: str) -> str:
+    """Chuẩn hóa để so khớp: NFC, bỏ dấu, chữ thường (giữ nguyên độ dài với văn bản NFC)"""
+    return unicodedata.normalize("NFC", text).translate(_FOLD_TABLE).lower()
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(fold_text(text))
+
+def record_text(kind: str, record: Dict[str, Any]) -> str:
+    """Nối các trường được index của một bản ghi"""
+    parts = []
+    for field in SEARCH_COLLECTIONS[kind][1]:
+        value = record.get(field)
+        if isinstance(value, list):
+            value = ", ".join(str(v) for v in value)
+        if value:
+            parts.append(str(value))
+    return unicodedata.normalize("NFC", "\n".join(parts))
+
+def make_snippet(text: str, terms: List[str], width: int = SEARCH_SNIPPET_CHARS) -> str:
+    """Đoạn trích quanh từ khớp đầu tiên"""
+    if len(text) <= width:
+        return text
+    folded = fold_text(text)
+    match = re.search(r"\b(" + "|".join(re.escape(t) for t in terms) + r")\b", folded) if terms else None
+    start = 0
+    if match and len(folded) == len(text):
+        start = max(match.start() - width // 3, 0)
+        # Không cắt giữa từ
+        space = text.rfind(" ", 0, start + 1)
+        start = space + 1 if start and space >= 0 else start
+    snippet = text[start:start + width]
+    return ("…" if start else "") + snippet + ("…" if start + width < len(text) else "")
+
+def top_k(scores, k: int):
+    """
+    Chỉ số k điểm cao nhất, giảm dần
+
+    Lấy ngưỡng từ một mẫu thưa của mảng điểm rồi chỉ sắp xếp các doc vượt ngưỡng,
+    nhanh hơn nhiều so với argpartition trên cả triệu phần tử
+    """
+    import numpy as np
+
+    stride = 32
+    candidates = None
+    if len(scores) > stride * 64:
+        sample = scores[::stride]
+        rank = min(k // stride + 2, len(sample))
+        threshold = np.partition(sample, -rank)[-rank]
+        if threshold > 0:
+            candidates = np.flatnonzero(scores >= threshold)
+            if len(candidates) < k:
+                candidates = None
+    if candidates is None:
+        candidates = np.flatnonzero(scores > 0)
+    top = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+class SearchIndex:
+    """
+    Inverted index BM25
+
+    - Mỗi bản ghi là một doc (số thứ tự tăng dần, không tái sử dụng)
+    - Postings mỗi từ: array doc (uint32) + array tần suất (uint16)
+    - Sửa bản ghi = đánh dấu doc cũ đã xóa + thêm doc mới
+    Thread-safe (tìm kiếm chạy trong threadpool, cập nhật chạy khi ghi storage)
+    """
+
+    def __init__(self, k1: float = SEARCH_BM25_K1, b: float = SEARCH_BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.postings: Dict[str, Tuple[array, array]] = {}
+            self.doc_keys: List[Tuple[str, str]] = []
+            self.doc_kind = array("B")
+            self.doc_len = array("f")
+            self.doc_text: List[Optional[bytes]] = []
+            self.doc_created: List[Optional[str]] = []
+            self.ids: Dict[Tuple[str, str], int] = {}
+            self.dead: set = set()
+            self.kind_counts: Counter = Counter()
+            self.total_len = 0
+            # term -> (avgdl đã dùng, trọng số BM25 từng posting) - tránh tính lại mỗi truy vấn
+            self._weights: Dict[str, Tuple[float, Any]] = {}
+
+    @property
+    def live_docs(self) -> int:
+        return len(self.doc_keys) - len(self.dead)
+
+    def add(self, kind: str, record: Dict[str, Any]):
+        """Thêm hoặc cập nhật một bản ghi"""
+        text = record_text(kind, record)
+        encoded = text.encode("utf-8")
+        key = (kind, str(record.get("id")))
+        with self._lock:
+            old = self.ids.get(key)
+            if old is not None:
+                if self.doc_text[old] == encoded:
+                    return
+                self._delete(old)
+
+            tokens = _TOKEN_RE.findall(fold_text(text))
+            doc = len(self.doc_keys)
+            for term, tf in Counter(tokens).items():
+                entry = self.postings.get(term)
+                if entry is None:
+                    entry = self.postings[term] = (array("I"), array("H"))
+                entry[0].append(doc)
+                entry[1].append(min(tf, 65535))
+
+            self.doc_keys.append(key)
+            self.doc_kind.append(KINDS.index(kind))
+            self.doc_len.append(len(tokens))
+            self.doc_text.append(encoded)
+            self.doc_created.append(record.get("created_at"))
+            self.ids[key] = doc
+            self.kind_counts[kind] += 1
+            self.total_len += len(tokens)
+
+    def needs_compaction(self) -> bool:
+        """Doc đã xóa chiếm quá 1/4"""
+        return len(self.dead) > len(self.doc_keys) // 4
+
+    def _delete(self, doc: int):
+        kind, _ = self.doc_keys[doc]
+        del self.ids[self.doc_keys[doc]]
+        self.dead.add(doc)
+        self.doc_text[doc] = None
+        self.kind_counts[kind] -= 1
+        self.total_len -= int(self.doc_len[doc])
+
+    def reconcile(self, kind: str, records: List[Dict[str, Any]]):
+        """Đưa index của một loại dữ liệu về đúng danh sách bản ghi hiện có"""
+        with self._lock:
+            present = set()
+            for record in records:
+                self.add(kind, record)
+                present.add((kind, str(record.get("id"))))
+            for key in [k for k in self.ids if k[0] == kind and k not in present]:
+                self._delete(self.ids[key])
+
+    def _term_weights(self, term: str, avgdl: float):
+        """
+        Phần tf của BM25 cho từng posting của term (float32, cache theo term)
+
+        Postings mới thêm chỉ tính phần đuôi; tính lại toàn bộ khi avgdl lệch quá 5%
+        """
+        import numpy as np
+
+        docs, tfs = self.postings[term]
+        cached = self._weights.get(term)
+        done = 0
+        if cached and abs(cached[0] - avgdl) <= 0.05 * avgdl:
+            if len(cached[1]) == len(docs):
+                return cached[1]
+            done = len(cached[1])
+
+        tail_docs = np.frombuffer(docs, dtype=np.uint32)[done:]
+        tf = np.frombuffer(tfs, dtype=np.uint16)[done:].astype(np.float32)
+        doc_len = np.frombuffer(self.doc_len, dtype=np.float32)[tail_docs]
+        tail = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * doc_len / avgdl))
+        weights = np.concatenate((cached[1], tail)) if done else tail
+        self._weights[term] = (cached[0] if done else avgdl, weights)
+        return weights
+
+    def _scores(self, terms: List[str], kinds: Optional[List[str]]):
+        """Điểm BM25 của mọi doc (mảng dày, doc không khớp = 0)"""
+        import numpy as np
+
+        avgdl = self.total_len / max(self.live_docs, 1) or 1.0
+        scores = np.zeros(len(self.doc_keys), dtype=np.float32)
+        for term in terms:
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            df = len(entry[0])
+            idf = math.log(1 + (self.live_docs - df + 0.5) / (df + 0.5))
+            scores[np.frombuffer(entry[0], dtype=np.uint32)] += np.float32(idf) * self._term_weights(term, avgdl)
+        if kinds and set(kinds) != set(KINDS):
+            codes = [KINDS.index(k) for k in kinds]
+            scores[~np.isin(np.frombuffer(self.doc_kind, dtype=np.uint8), codes)] = 0
+        if self.dead:
+            scores[np.fromiter(self.dead, dtype=np.int64, count=len(self.dead))] = 0
+        return scores
+
+    def search(self, query: str, kinds: Optional[List[str]] = None, limit: int = 10) -> Tuple[int, List[Dict]]:
+        """
+        Tìm kiếm
+
+        Returns:
+            (số doc khớp, danh sách {type, id, score, created_at, snippet} theo điểm giảm dần)
+        """
+        import numpy as np
+
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            if not terms or not self.live_docs:
+                return 0, []
+            scores = self._scores(terms, kinds)
+            total = int(np.count_nonzero(scores > 0))
+            k = min(limit, total)
+            if not k:
+                return total, []
+            top = top_k(scores, k)
+
+            hits = []
+            for doc in top.tolist():
+                kind, doc_id = self.doc_keys[doc]
+                hits.append({
+                    "type": kind,
+                    "id": doc_id,
+                    "score": round(float(scores[doc]), 4),
+                    "created_at": self.doc_created[doc],
+                    "snippet": make_snippet(self.doc_text[doc].decode("utf-8"), terms)
+                })
+            return total, hits
+
+class SearchService:
+    """Giữ index đồng bộ với storage (kể cả khi process khác ghi) và phục vụ /search"""
+
+    indexes = TenantIndexSync("search", SearchIndex, {kind: path for kind, (path, _) in SEARCH_COLLECTIONS.items()})
+
+    @staticmethod
+    def search(query: str, kinds: Optional[List[str]] = None, limit: int = 10) -> Dict[str, Any]:
+        """Tìm kiếm (đồng bộ, gọi qua threadpool)"""
+        kinds = kinds or KINDS
+        index = SearchService.indexes.sync(kinds)
+        start = time.perf_counter()
+        total, hits = index.search(query, kinds, limit)
+        elapsed = time.perf_counter() - start
+        record_span("search", "bm25", start, elapsed)
+        return {"total": total, "took_ms": round(elapsed * 1000, 3), "results": hits}
+
+    @staticmethod
+    def warm_up():
+        """Build index trong nền khi khởi động"""
+        import numpy
+        SearchService.indexes.sync()
+
+register_warmup(SearchService.warm_up)
@@ -0,0 +1,187 @@
+"""
+Tag Service - Index tag -> ký ức, lọc /memories theo tag mà không phải đọc cả file
+"""
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from app.config import MEMORY_FILE
+from app.services.index_sync import TenantIndexSync
+from app.warmup import register_warmup
+
+TAG_MODES = ("any", "all")
+
+_SPACE_RE = re.compile(r"\s+")
+
+def normalize_tag(tag: str) -> str:
+    """Chuẩn hóa tag: NFC, chữ thường, bỏ '#' đầu, gộp khoảng trắng ("#Quê  Hương" -> "quê hương")"""
+    tag = unicodedata.normalize("NFC", str(tag)).lower().strip().lstrip("#")
+    return _SPACE_RE.sub(" ", tag).strip()
+
+def record_tags(record: Dict[str, Any]) -> List[str]:
+    """Các tag đã chuẩn hóa, không trùng, của một ký ức"""
+    tags = record.get("tags") or []
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    return list(dict.fromkeys(t for t in map(normalize_tag, tags) if t))
+
+def _timestamp(record: Dict[str, Any]) -> float:
+    try:
+        return datetime.fromisoformat(record.get("created_at") or "").timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+def intersect_sorted(lists: List[array]):
+    """
+    Giao các dãy doc đã sắp xếp: bắt đầu từ dãy ngắn nhất, tìm nhị phân từng doc
+    trong dãy tiếp theo (searchsorted) - O(m log n), không phụ thuộc độ dài dãy dài nhất
+    """
+    import numpy as np
+
+    if not lists:
+        return np.zeros(0, dtype=np.uint32)
+    lists = sorted(lists, key=len)
+    result = np.frombuffer(lists[0], dtype=np.uint32)
+    for other in lists[1:]:
+        other = np.frombuffer(other, dtype=np.uint32)
+        if not len(result) or not len(other):
+            return np.zeros(0, dtype=np.uint32)
+        pos = np.searchsorted(other, result)
+        pos[pos == len(other)] = 0
+        result = result[other[pos] == result]
+    return result
+
+def union_sorted(lists: List[array]):
+    """Hợp các dãy doc đã sắp xếp, bỏ trùng"""
+    import numpy as np
+
+    if not lists:
+        return np.zeros(0, dtype=np.uint32)
+    return np.unique(np.concatenate([np.frombuffer(docs, dtype=np.uint32) for docs in lists]))
+
+class TagIndex:
+    """
+    Index tag -> danh sách doc (array uint32 tăng dần, mỗi ký ức là một doc)
+
+    - Doc mới luôn có số lớn nhất nên postings chỉ cần append, luôn sắp xếp sẵn
+    - Sửa tag = đánh dấu doc cũ đã xóa + thêm doc mới
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.postings: Dict[str, array] = {}
+            self.doc_keys: List[Tuple[str, str]] = []
+            self.doc_tags: List[Optional[Tuple[str, ...]]] = []
+            self.records: List[Optional[Dict[str, Any]]] = []
+            self.doc_time = array("d")  # created_at dạng timestamp, để xếp mới nhất trước bằng numpy
+            self.ids: Dict[Tuple[str, str], int] = {}
+            self.dead: Set[int] = set()
+            self.kind_counts: Counter = Counter()
+            self.tag_counts: Counter = Counter()
+
+    def add(self, kind: str, record: Dict[str, Any]):
+        """Thêm hoặc cập nhật một ký ức"""
+        tags = tuple(record_tags(record))
+        key = (kind, str(record.get("id")))
+        with self._lock:
+            old = self.ids.get(key)
+            if old is not None:
+                if self.doc_tags[old] == tags and self.doc_time[old] == _timestamp(record):
+                    self.records[old] = record
+                    return
+                self._delete(old)
+
+            doc = len(self.doc_keys)
+            for tag in tags:
+                self.postings.setdefault(tag, array("I")).append(doc)
+            self.tag_counts.update(tags)
+            self.doc_keys.append(key)
+            self.doc_tags.append(tags)
+            self.records.append(record)
+            self.doc_time.append(_timestamp(record))
+            self.ids[key] = doc
+            self.kind_counts[kind] += 1
+
+    def needs_compaction(self) -> bool:
+        return len(self.dead) > len(self.doc_keys) // 4
+
+    def _delete(self, doc: int):
+        kind, _ = self.doc_keys[doc]
+        del self.ids[self.doc_keys[doc]]
+        self.dead.add(doc)
+        for tag in self.doc_tags[doc]:
+            self.tag_counts[tag] -= 1
+            if not self.tag_counts[tag]:
+                del self.tag_counts[tag]
+        self.doc_tags[doc] = None
+        self.records[doc] = None
+        self.kind_counts[kind] -= 1
+
+    def reconcile(self, kind: str, records: List[Dict[str, Any]]):
+        """Đưa index về đúng danh sách ký ức hiện có"""
+        with self._lock:
+            present = set()
+            for record in records:
+                self.add(kind, record)
+                present.add((kind, str(record.get("id"))))
+            for key in [k for k in self.ids if k[0] == kind and k not in present]:
+                self._delete(self.ids[key])
+
+    def query(self, tags: Iterable[str], mode: str = "any", limit: Optional[int] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Các ký ức có một (any) hoặc tất cả (all) các tag
+
+        Returns:
+            (số ký ức khớp, tối đa limit ký ức mới nhất trước)
+        """
+        import numpy as np
+
+        tags = list(dict.fromkeys(t for t in map(normalize_tag, tags) if t))
+        with self._lock:
+            lists = [self.postings.get(tag, array("I")) for tag in tags]
+            docs = intersect_sorted(lists) if mode == "all" else union_sorted(lists)
+            if self.dead and len(docs):
+                docs = docs[~np.isin(docs, np.fromiter(self.dead, dtype=np.uint32, count=len(self.dead)))]
+            total = len(docs)
+            times = np.frombuffer(self.doc_time, dtype=np.float64)[docs]
+            if limit is not None and limit < len(docs):
+                keep = np.argpartition(-times, limit)[:limit] if limit else np.zeros(0, dtype=np.int64)
+                docs, times = docs[keep], times[keep]
+            newest = docs[np.argsort(-times, kind="stable")]
+            return total, [self.records[doc] for doc in newest.tolist()]
+
+    def counts(self) -> List[Tuple[str, int]]:
+        """(tag, số ký ức) theo số lượng giảm dần"""
+        with self._lock:
+            counts = list(self.tag_counts.items())
+        counts.sort(key=lambda item: (-item[1], item[0]))
+        return counts
+
+class TagService:
+    """Lọc ký ức theo tag và thống kê tag (index tự đồng bộ với memories.json)"""
+
+    indexes = TenantIndexSync("tag", TagIndex, {"memory": MEMORY_FILE})
+
+    @staticmethod
+    def memories_with_tags(tags: List[str], mode: str = "any", limit: Optional[int] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """(số ký ức khớp tag, tối đa limit ký ức mới nhất trước) - đồng bộ, gọi qua threadpool"""
+        return TagService.indexes.sync().query(tags, mode, limit)
+
+    @staticmethod
+    def tag_counts() -> List[Dict[str, Any]]:
+        """[{tag, count}] theo số ký ức giảm dần"""
+        return [{"tag": tag, "count": count} for tag, count in TagService.indexes.sync().counts()]
+
+    @staticmethod
+    def warm_up():
+        """Build index tag trong nền khi khởi động"""
+        TagService.indexes.sync()
+
+register_warmup(TagService.warm_up)
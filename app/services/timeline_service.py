@@ -0,0 +1,301 @@
+"""
+Timeline Service - Tổng hợp theo ngày/tuần: cảm xúc nhật ký, số nhật ký/ghi chú/lần đo sức khỏe, tỉ lệ hoàn thành nhắc nhở
+
+- Lưu sẵn trong TIMELINE_FILE của từng tenant, cập nhật qua write listener của StorageManager
+  (save_diary, save_note, save_health_log, nhắc nhở): thêm một bản ghi = cộng phần đóng góp của nó,
+  sửa bản ghi (vd. cảm xúc bổ sung sau, hoàn thành nhắc nhở) = tính lại loại đó từ dữ liệu đang ghi
+- /timeline đọc thẳng các bucket trong khoảng hỏi, không quét collection gốc
+  (chỉ khi chữ ký file lệch - dữ liệu có trước tính năng này, ghi ngoài app - mới tính lại loại đó một lần)
+- Chuỗi nhắc nhở lặp lại chỉ lưu luật lặp + các lần đã hoàn thành, các lần nhắc sinh ra khi đọc trong khoảng hỏi
+
+Tính lại từ đầu:
+    python -m app.services.timeline_service [--all | <user_id> ...]
+"""
+import argparse
+import json
+import os
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import (
+    DIARY_FILE, NOTE_FILE, HEALTH_LOG_FILE, REMINDER_FILE, TIMELINE_FILE,
+    TIMELINE_GRANULARITIES, TIMELINE_DEFAULT_BUCKETS, TIMELINE_MAX_BUCKETS
+)
+from app.database import StorageManager, file_lock, file_signature, register_write_listener
+from app.tenancy import DEFAULT_TENANT, all_tenants, tenant_path, use_tenant
+from app.services import recurrence
+
+_VERSION = 1  # Đổi cấu trúc file: tăng lên để build lại
+_SOURCES = {"diary": DIARY_FILE, "note": NOTE_FILE, "health": HEALTH_LOG_FILE, "reminder": REMINDER_FILE}
+_EMOTION_PREFIX = "emotion:"  # Trường đếm cảm xúc trong bucket nhật ký: "emotion:vui_vẻ"
+
+def _empty_timeline() -> Dict[str, Any]:
+    return {
+        "version": _VERSION,
+        "sources": {},  # kind -> {"signature": chữ ký file đã phản ánh, "count": số bản ghi}
+        "buckets": {g: {kind: {} for kind in _SOURCES} for g in TIMELINE_GRANULARITIES},
+        "series": {}  # id chuỗi nhắc nhở -> luật lặp + các lần đã hoàn thành
+    }
+
+def _signature(signature: Optional[Tuple]) -> Optional[List[int]]:
+    return list(signature) if signature else None
+
+def _parse_day(value: Any) -> Optional[date]:
+    try:
+        return datetime.fromisoformat(value).date()
+    except (TypeError, ValueError):
+        return None
+
+def bucket_start(day: date, granularity: str) -> date:
+    """Ngày đầu bucket chứa `day` (tuần bắt đầu thứ 2)"""
+    return day - timedelta(days=day.weekday()) if granularity == "week" else day
+
+def _step(granularity: str) -> timedelta:
+    return timedelta(weeks=1) if granularity == "week" else timedelta(days=1)
+
+def _contribution(kind: str, record: Dict[str, Any]) -> Optional[Tuple[date, Dict[str, int]]]:
+    """(ngày, các trường đếm) mà một bản ghi cộng vào bucket; None nếu không tính (chuỗi nhắc nhở: tính khi đọc)"""
+    if kind == "reminder":
+        if "recurrence" in record:
+            return None
+        day = _parse_day(record.get("remind_at"))
+        return (day, {"due": 1, "completed": 1 if record.get("is_completed") else 0}) if day else None
+
+    day = _parse_day(record.get("created_at"))
+    if day is None:
+        return None
+    fields = {"count": 1}
+    if kind == "diary" and record.get("emotion"):
+        fields[_EMOTION_PREFIX + str(record["emotion"])] = 1
+    return day, fields
+
+def _series_stub(series: Dict[str, Any]) -> Dict[str, Any]:
+    """Phần của chuỗi nhắc nhở đủ để sinh các lần nhắc và biết lần nào đã hoàn thành"""
+    stub = {"id": series["id"], "remind_at": series["remind_at"], "recurrence": series["recurrence"]}
+    if series.get("completed_through"):
+        stub["completed_through"] = series["completed_through"]
+    done = {key: {"completed": True} for key, value in (series.get("exceptions") or {}).items() if value.get("completed")}
+    if done:
+        stub["exceptions"] = done
+    if series.get("is_completed"):
+        # Dừng cả chuỗi: các lần sau thời điểm dừng không tính là đến hạn
+        stub["stopped_at"] = series.get("completed_at") or series.get("completed_through") or series["remind_at"]
+    return stub
+
+def _apply(timeline: Dict[str, Any], kind: str, record: Dict[str, Any]):
+    """Cộng phần đóng góp của một bản ghi vào bucket ngày và tuần"""
+    if kind == "reminder" and "recurrence" in record:
+        timeline["series"][record["id"]] = _series_stub(record)
+        return
+    contribution = _contribution(kind, record)
+    if contribution is None:
+        return
+    day, fields = contribution
+    for granularity in TIMELINE_GRANULARITIES:
+        buckets = timeline["buckets"][granularity][kind]
+        bucket = buckets.setdefault(bucket_start(day, granularity).isoformat(), {})
+        for name, value in fields.items():
+            bucket[name] = bucket.get(name, 0) + value
+
+def _rebuild_kind(timeline: Dict[str, Any], kind: str, records: List[Dict[str, Any]], signature: Optional[Tuple]):
+    """Tính lại toàn bộ một loại từ danh sách bản ghi"""
+    for granularity in TIMELINE_GRANULARITIES:
+        timeline["buckets"][granularity][kind] = {}
+    if kind == "reminder":
+        timeline["series"] = {}
+    for record in records:
+        _apply(timeline, kind, record)
+    timeline["sources"][kind] = {"signature": _signature(signature), "count": len(records)}
+
+def _load(path: Path) -> Dict[str, Any]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            timeline = json.load(f)
+        if timeline.get("version") == _VERSION:
+            return timeline
+    except (FileNotFoundError, ValueError):
+        pass
+    return _empty_timeline()
+
+def _save(path: Path, timeline: Dict[str, Any]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(timeline, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+@register_write_listener
+def _on_write(file_path: Path, records: List[Dict[str, Any]], before: Optional[Tuple], after: Optional[Tuple]):
+    """Listener của StorageManager (chạy trong file_lock của collection, tenant của request đang ghi)"""
+    kind = next((kind for kind, path in _SOURCES.items() if tenant_path(path) == file_path), None)
+    if kind is None:
+        return
+    path = tenant_path(TIMELINE_FILE)
+    with file_lock(path):
+        timeline = _load(path)
+        source = timeline["sources"].get(kind)
+        if records and source == {"signature": _signature(before), "count": len(records) - 1}:
+            _apply(timeline, kind, records[-1])
+            timeline["sources"][kind] = {"signature": _signature(after), "count": len(records)}
+        else:
+            _rebuild_kind(timeline, kind, records, after)
+        _save(path, timeline)
+
+class TimelineService:
+    """Đọc/tính lại tổng hợp timeline của tenant hiện tại"""
+
+    @staticmethod
+    def _refresh(path: Path, timeline: Dict[str, Any]) -> Dict[str, Any]:
+        """Tính lại các loại có file đã đổi mà timeline chưa phản ánh (bình thường: không có)"""
+        stale = [
+            kind for kind, source in _SOURCES.items()
+            if (timeline["sources"].get(kind) or {}).get("signature", False) != _signature(file_signature(tenant_path(source)))
+        ]
+        if not stale:
+            return timeline
+        with file_lock(path):
+            timeline = _load(path)
+            for kind in stale:
+                source = tenant_path(_SOURCES[kind])
+                signature = file_signature(source)
+                if (timeline["sources"].get(kind) or {}).get("signature", False) == _signature(signature):
+                    continue  # Vừa được cập nhật
+                records = StorageManager.load_json_file(source)
+                if file_signature(source) != signature:
+                    continue  # Đang bị ghi: listener sẽ cập nhật, lần đọc sau tính lại nếu cần
+                _rebuild_kind(timeline, kind, records, signature)
+            _save(path, timeline)
+        return timeline
+
+    @staticmethod
+    def rebuild() -> Dict[str, Any]:
+        """Tính lại toàn bộ timeline của tenant hiện tại từ dữ liệu gốc"""
+        loaded = {}
+        for kind, source in _SOURCES.items():
+            source = tenant_path(source)
+            with file_lock(source):
+                loaded[kind] = (StorageManager.load_json_file(source), file_signature(source))
+        # Khóa collection rồi mới khóa timeline (cùng thứ tự với listener); ghi chen giữa thì chữ ký lệch,
+        # lần đọc sau tự tính lại loại đó
+        path = tenant_path(TIMELINE_FILE)
+        with file_lock(path):
+            timeline = _empty_timeline()
+            for kind, (records, signature) in loaded.items():
+                _rebuild_kind(timeline, kind, records, signature)
+            _save(path, timeline)
+        return timeline
+
+    @staticmethod
+    def parse_range(start: Optional[str], end: Optional[str], granularity: str) -> Tuple[date, date]:
+        """
+        Khoảng [start, end] (ngày đầu bucket) từ tham số from/to dạng YYYY-MM-DD
+
+        Raises:
+            ValueError: granularity/ngày không hợp lệ hoặc quá TIMELINE_MAX_BUCKETS bucket
+        """
+        if granularity not in TIMELINE_GRANULARITIES:
+            raise ValueError(f"granularity phải là một trong: {', '.join(TIMELINE_GRANULARITIES)}")
+        try:
+            last = date.fromisoformat(end) if end else date.today()
+            first = date.fromisoformat(start) if start else None
+        except ValueError:
+            raise ValueError("from/to phải có dạng YYYY-MM-DD")
+        last = bucket_start(last, granularity)
+        if first is None:
+            first = last - _step(granularity) * (TIMELINE_DEFAULT_BUCKETS[granularity] - 1)
+        first = bucket_start(first, granularity)
+        if first > last:
+            raise ValueError("from phải trước to")
+        if (last - first) // _step(granularity) + 1 > TIMELINE_MAX_BUCKETS:
+            raise ValueError(f"Tối đa {TIMELINE_MAX_BUCKETS} bucket mỗi lần")
+        return first, last
+
+    @staticmethod
+    def query(first: date, last: date, granularity: str) -> Dict[str, Any]:
+        """Các bucket từ first tới last (kể cả bucket rỗng) và tổng cả khoảng"""
+        path = tenant_path(TIMELINE_FILE)
+        timeline = TimelineService._refresh(path, _load(path))
+        buckets = timeline["buckets"][granularity]
+        step = _step(granularity)
+
+        series_counts = TimelineService._series_counts(timeline["series"].values(), first, last + step, granularity)
+        result = []
+        day = first
+        while day <= last:
+            key = day.isoformat()
+            diary = buckets["diary"].get(key, {})
+            reminder = buckets["reminder"].get(key, {})
+            due, completed = series_counts.get(key, (0, 0))
+            result.append(TimelineService._bucket(
+                key,
+                diary.get("count", 0),
+                buckets["note"].get(key, {}).get("count", 0),
+                buckets["health"].get(key, {}).get("count", 0),
+                {name[len(_EMOTION_PREFIX):]: n for name, n in diary.items() if name.startswith(_EMOTION_PREFIX) and n},
+                reminder.get("due", 0) + due,
+                reminder.get("completed", 0) + completed
+            ))
+            day += step
+
+        emotions: Dict[str, int] = {}
+        for bucket in result:
+            for name, n in bucket["emotions"].items():
+                emotions[name] = emotions.get(name, 0) + n
+        totals = TimelineService._bucket(
+            None,
+            *(sum(bucket[field] for bucket in result) for field in ("diaries", "notes", "health_logs")),
+            emotions,
+            *(sum(bucket[field] for bucket in result) for field in ("reminders_due", "reminders_completed"))
+        )
+        totals.pop("start")
+        return {"buckets": result, "totals": totals}
+
+    @staticmethod
+    def _bucket(start: Optional[str], diaries: int, notes: int, health_logs: int, emotions: Dict[str, int],
+                due: int, completed: int) -> Dict[str, Any]:
+        return {
+            "start": start,
+            "diaries": diaries,
+            "notes": notes,
+            "health_logs": health_logs,
+            "emotions": dict(sorted(emotions.items(), key=lambda item: -item[1])),
+            "reminders_due": due,
+            "reminders_completed": completed,
+            "completion_rate": round(completed / due, 4) if due else None
+        }
+
+    @staticmethod
+    def _series_counts(series_list, first: date, end: date, granularity: str) -> Dict[str, Tuple[int, int]]:
+        """(số lần đến hạn, số lần hoàn thành) theo bucket của các chuỗi nhắc nhở trong [first, end)"""
+        counts: Dict[str, Tuple[int, int]] = {}
+        start = datetime.combine(first, datetime.min.time())
+        stop = datetime.combine(end, datetime.min.time())
+        for series in series_list:
+            until = stop
+            if series.get("stopped_at"):
+                until = min(until, datetime.fromisoformat(series["stopped_at"]))
+            for moment in recurrence.iter_occurrences(series, start):
+                if moment >= until:
+                    break
+                key = bucket_start(moment.date(), granularity).isoformat()
+                due, completed = counts.get(key, (0, 0))
+                counts[key] = (due + 1, completed + recurrence.is_done(series, moment))
+        return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Tính lại timeline (tổng hợp theo ngày/tuần) từ dữ liệu gốc")
+    parser.add_argument("users", nargs="*", help="User id (mặc định: dữ liệu không có user id)")
+    parser.add_argument("--all", action="store_true", help="Mọi tenant trong storage")
+    args = parser.parse_args()
+
+    for tenant in all_tenants() if args.all else args.users or [DEFAULT_TENANT]:
+        with use_tenant(tenant):
+            timeline = TimelineService.rebuild()
+        counts = {kind: source["count"] for kind, source in timeline["sources"].items()}
+        print(f"{tenant or '(mặc định)'}: {counts}, {len(timeline['buckets']['day']['diary'])} ngày có nhật ký")
+
+if __name__ == "__main__":
+    main()
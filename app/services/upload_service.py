@@ -0,0 +1,155 @@
+"""
+Upload Service Layer
+Giới hạn dung lượng upload ngay trên luồng nhận (ASGI), băm SHA-256 file multipart đã spool
+"""
+import hashlib
+from typing import BinaryIO, Optional
+from fastapi import UploadFile, HTTPException
+from starlette.concurrency import run_in_threadpool
+from app.config import MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE
+from app.services.image_service import ImageService
+
+# Phần dư cho header multipart và các field form đi kèm file
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+class UploadTooLarge(HTTPException):
+    """Upload vượt quá giới hạn dung lượng (413)"""
+
+    def __init__(self, max_bytes: int = MAX_UPLOAD_BYTES):
+        super().__init__(status_code=413, detail=f"Ảnh vượt quá {max_bytes // (1024 * 1024)} MB")
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware: từ chối upload quá lớn (413) khi body vượt MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD
+
+    - Có Content-Length: từ chối trước khi đọc body
+    - Không có (chunked): đếm byte trên luồng receive, dừng ngay khi vượt,
+      trước khi multipart parser kịp spool cả body ra đĩa
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = next((value for name, value in scope.get("headers", []) if name == b"content-length"), b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise UploadTooLarge()
+            return message
+
+        async def send_and_track(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, send_and_track)
+        except UploadTooLarge:
+            # Trong route FastAPI tự trả 413; tới đây là lúc middleware bên trong đang đọc body
+            if started:
+                raise
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope, receive, send):
+        from fastapi.responses import JSONResponse
+
+        error = UploadTooLarge()
+        await JSONResponse(status_code=error.status_code, content={"detail": error.detail})(scope, receive, send)
+
+class SpooledUpload:
+    """
+    File upload đã nhận xong (file spool của multipart parser, không chép thêm bản nào)
+    - Nhỏ: nằm trong RAM
+    - Lớn: parser đã ghi ra file tạm trên đĩa
+    """
+
+    def __init__(self, spool: BinaryIO, size: int, sha256: str,
+                 content_type: Optional[str], filename: Optional[str]):
+        self.spool = spool
+        self.size = size
+        self.sha256 = sha256
+        self.content_type = content_type
+        self.filename = filename
+
+    def open(self) -> BinaryIO:
+        """Trả về file object đã tua về đầu để đọc"""
+        self.spool.seek(0)
+        return self.spool
+
+    def close(self):
+        self.spool.close()
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _hash_file(source: BinaryIO, max_bytes: int):
+    """(số byte, sha256) của file, đọc theo từng chunk; UploadTooLarge ngay khi vượt max_bytes"""
+    digest = hashlib.sha256()
+    size = 0
+    source.seek(0)
+    while True:
+        chunk = source.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(max_bytes)
+        digest.update(chunk)
+    source.seek(0)
+    return size, digest.hexdigest()
+
+class UploadService:
+    """Service xử lý file upload với bộ nhớ giới hạn"""
+
+    @staticmethod
+    async def receive(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> SpooledUpload:
+        """
+        Kiểm tra dung lượng và băm file upload ngay trên file spool của multipart parser
+        (đọc từng chunk trong threadpool, không giữ toàn bộ file trong RAM, không ghi thêm bản sao)
+
+        Args:
+            file: File upload từ FastAPI
+            max_bytes: Dung lượng tối đa cho phép
+
+        Returns:
+            SpooledUpload (cần close() sau khi dùng)
+
+        Raises:
+            HTTPException 413 nếu vượt quá max_bytes
+        """
+        if file.size is not None and file.size > max_bytes:
+            raise UploadTooLarge(max_bytes)
+
+        size, sha256 = await run_in_threadpool(_hash_file, file.file, max_bytes)
+        return SpooledUpload(file.file, size, sha256, file.content_type, file.filename)
+
+    @staticmethod
+    def store_image(upload: SpooledUpload) -> str:
+        """
+        Lưu ảnh gốc vào IMAGE_DIR theo hash nội dung
+        Ảnh trùng nội dung chỉ được lưu một lần
+
+        Returns:
+            image_id (SHA-256 của ảnh)
+        """
+        return ImageService.save_original(upload.sha256, upload.open())
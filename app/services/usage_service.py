@@ -0,0 +1,272 @@
+"""
+LLM Usage Service - Sổ cái token Groq theo tính năng, người dùng (tenant) và giờ
+
+- Mỗi lần gọi Groq (kể cả lỗi) và mỗi lần dùng lại kết quả cũ (cache hit) được cộng vào
+  dòng (giờ, tenant, tính năng, model, cache): số lần gọi, lỗi, token prompt/completion/cached, latency
+- Phần cộng dồn nằm trong bộ nhớ, mỗi LLM_USAGE_FLUSH_SECONDS giây ghi thêm vào LLM_USAGE_DIR/<ngày>.jsonl
+  (mỗi dòng một mảng JSON, nhiều worker cùng ghi nối đuôi); đọc lại thì cộng các dòng trùng khóa
+- Ngân sách token/ngày (LLM_FEATURE_BUDGETS, LLM_DAILY_TOKEN_BUDGET): có ngân sách bị vượt thì
+  tính năng không thiết yếu (LLM_NONCRITICAL_FEATURES) không gọi Groq, trả lời mặc định;
+  tính năng chính (chat, tóm tắt, phân tích ghi chú...) vẫn chạy
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.config import (
+    LLM_USAGE_DIR, LLM_USAGE_FLUSH_SECONDS, LLM_USAGE_RETENTION_DAYS, LLM_DAILY_TOKEN_BUDGET,
+    LLM_DEGRADE_RATIO, LLM_FEATURE_BUDGETS, LLM_NONCRITICAL_FEATURES
+)
+from app.metrics import LLM_FEATURE_TOKENS, LLM_BUDGET_DEGRADED
+from app.tenancy import current_tenant
+
+# Khóa một dòng: (giờ "YYYY-MM-DDTHH", tenant, tính năng, model, cache: miss | hit | degraded | cancelled)
+_Key = Tuple[str, str, str, str, str]
+# Giá trị cộng dồn theo thứ tự
+_FIELDS = ("calls", "errors", "prompt_tokens", "completion_tokens", "cached_tokens", "latency_ms")
+
+def _empty() -> Dict[str, float]:
+    return dict.fromkeys(_FIELDS, 0)
+
+def _add(total: Dict[str, float], values) -> Dict[str, float]:
+    for name, value in zip(_FIELDS, values):
+        total[name] += value
+    return total
+
+def _merge(rows: Dict[_Key, List[float]], key: _Key, values):
+    row = rows.get(key)
+    if row is None:
+        rows[key] = list(values)
+    else:
+        for i, value in enumerate(values):
+            row[i] += value
+
+def _tokens(values) -> float:
+    return values[2] + values[3]
+
+class LLMUsageService:
+    """Ghi, lưu và tổng hợp lượng dùng Groq; kiểm tra ngân sách ngày"""
+
+    _lock = threading.Lock()
+    _pending: Dict[_Key, List[float]] = {}  # Chưa ghi xuống đĩa
+    _day: Optional[str] = None  # Ngày của _day_tokens
+    _day_tokens: Dict[str, int] = defaultdict(int)  # Token hôm nay theo tính năng (mọi worker, tính tới lần ghi gần nhất)
+
+    @staticmethod
+    def record(
+        feature: str,
+        model: str,
+        ok: bool = True,
+        seconds: float = 0.0,
+        usage: Optional[Dict[str, Any]] = None,
+        cache: str = "miss"
+    ):
+        """
+        Cộng một lần gọi vào sổ cái
+
+        Args:
+            feature: Tính năng (tác vụ trong GROQ_TASKS)
+            model: Model đã gọi ("" nếu không gọi)
+            ok: Groq trả 200
+            seconds: Thời gian chờ Groq
+            usage: Khối "usage" trong phản hồi của Groq
+            cache: "miss" (gọi Groq), "hit" (dùng lại kết quả cũ), "degraded" (bỏ qua vì vượt ngân sách),
+                "cancelled" (bản hedge bị hủy, tính là lỗi)
+        """
+        usage = usage or {}
+        prompt_tokens = usage.get("prompt_tokens", 0) or 0
+        completion_tokens = usage.get("completion_tokens", 0) or 0
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+        now = datetime.now()
+        key = (now.strftime("%Y-%m-%dT%H"), current_tenant(), feature, model, cache)
+        values = (1, 0 if ok else 1, prompt_tokens, completion_tokens, cached_tokens, round(seconds * 1000, 3))
+
+        with LLMUsageService._lock:
+            _merge(LLMUsageService._pending, key, values)
+            LLMUsageService._roll_day(now.strftime("%Y-%m-%d"))
+            LLMUsageService._day_tokens[feature] += prompt_tokens + completion_tokens
+
+        if prompt_tokens or completion_tokens:
+            LLM_FEATURE_TOKENS.inc(prompt_tokens, feature=feature, type="prompt")
+            LLM_FEATURE_TOKENS.inc(completion_tokens, feature=feature, type="completion")
+
+    @staticmethod
+    def _roll_day(day: str):
+        """Sang ngày mới: ngân sách tính lại từ 0 (gọi khi đang giữ _lock)"""
+        if LLMUsageService._day != day:
+            LLMUsageService._day = day
+            LLMUsageService._day_tokens = defaultdict(int)
+
+    # ========== BUDGETS ==========
+
+    @staticmethod
+    def _over_budget(feature: str) -> bool:
+        budget = LLM_FEATURE_BUDGETS.get(feature, 0)
+        return bool(budget) and LLMUsageService._day_tokens.get(feature, 0) >= budget
+
+    @staticmethod
+    def degraded(feature: str) -> Optional[str]:
+        """
+        Lý do tắt tính năng hôm nay, None nếu được gọi Groq
+
+        - "feature_budget": tính năng không thiết yếu vượt ngân sách của chính nó
+        - "daily_budget": tổng vượt LLM_DEGRADE_RATIO ngân sách ngày, hoặc tính năng chính vượt ngân sách
+        Tính năng chính luôn None
+        """
+        if feature not in LLM_NONCRITICAL_FEATURES:
+            return None
+        with LLMUsageService._lock:
+            LLMUsageService._roll_day(datetime.now().strftime("%Y-%m-%d"))
+            if LLMUsageService._over_budget(feature):
+                return "feature_budget"
+            total = sum(LLMUsageService._day_tokens.values())
+            if LLM_DAILY_TOKEN_BUDGET and total >= LLM_DAILY_TOKEN_BUDGET * LLM_DEGRADE_RATIO:
+                return "daily_budget"
+            if any(LLMUsageService._over_budget(f) for f in LLM_FEATURE_BUDGETS if f not in LLM_NONCRITICAL_FEATURES):
+                return "daily_budget"
+        return None
+
+    @staticmethod
+    def skip_if_degraded(feature: str) -> bool:
+        """True nếu tính năng đang bị tắt (đếm vào metric và sổ cái), người gọi dùng câu trả lời mặc định"""
+        reason = LLMUsageService.degraded(feature)
+        if reason is None:
+            return False
+        LLM_BUDGET_DEGRADED.inc(feature=feature, reason=reason)
+        LLMUsageService.record(feature, "", cache="degraded")
+        return True
+
+    # ========== PERSISTENCE ==========
+
+    @staticmethod
+    def _day_file(day: str):
+        return LLM_USAGE_DIR / f"{day}.jsonl"
+
+    @staticmethod
+    def _read_day(day: str) -> Dict[_Key, List[float]]:
+        """Các dòng đã ghi của một ngày, cộng theo khóa"""
+        rows: Dict[_Key, List[float]] = {}
+        try:
+            with open(LLMUsageService._day_file(day), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue
+                    _merge(rows, tuple(item[:5]), item[5:])
+        except FileNotFoundError:
+            pass
+        return rows
+
+    @staticmethod
+    def flush():
+        """Ghi phần cộng dồn xuống đĩa, cập nhật token hôm nay từ file (gồm cả worker khác)"""
+        with LLMUsageService._lock:
+            pending, LLMUsageService._pending = LLMUsageService._pending, {}
+        if pending:
+            by_day: Dict[str, List[str]] = defaultdict(list)
+            for key, values in pending.items():
+                by_day[key[0][:10]].append(json.dumps([*key, *values], ensure_ascii=False) + "\n")
+            LLM_USAGE_DIR.mkdir(parents=True, exist_ok=True)
+            for day, lines in by_day.items():
+                try:
+                    with open(LLMUsageService._day_file(day), 'a', encoding='utf-8') as f:
+                        f.write("".join(lines))
+                except OSError as e:
+                    print(f"Error writing LLM usage: {e}")
+                    with LLMUsageService._lock:  # Giữ lại, ghi ở lần sau
+                        for key, values in pending.items():
+                            if key[0][:10] == day:
+                                _merge(LLMUsageService._pending, key, values)
+
+        today = datetime.now().strftime("%Y-%m-%d")
+        tokens: Dict[str, int] = defaultdict(int)
+        for key, values in LLMUsageService._read_day(today).items():
+            tokens[key[2]] += _tokens(values)
+        with LLMUsageService._lock:
+            for key, values in LLMUsageService._pending.items():  # Ghi lỗi hoặc mới thêm trong lúc đọc
+                if key[0][:10] == today:
+                    tokens[key[2]] += _tokens(values)
+            LLMUsageService._day = today
+            LLMUsageService._day_tokens = tokens
+
+    @staticmethod
+    def prune():
+        """Xóa file cũ hơn LLM_USAGE_RETENTION_DAYS ngày"""
+        oldest = (datetime.now() - timedelta(days=LLM_USAGE_RETENTION_DAYS)).strftime("%Y-%m-%d")
+        if not LLM_USAGE_DIR.exists():
+            return
+        for path in LLM_USAGE_DIR.glob("*.jsonl"):
+            if path.stem < oldest:
+                path.unlink(missing_ok=True)
+
+    @staticmethod
+    async def run():
+        """Định kỳ ghi sổ cái xuống đĩa (lần đầu ngay khi khởi động: nạp token hôm nay); chạy tới khi bị cancel"""
+        while True:
+            try:
+                await run_in_threadpool(LLMUsageService.prune)
+                await run_in_threadpool(LLMUsageService.flush)
+            except Exception as e:
+                print(f"Error flushing LLM usage: {e}")
+            await asyncio.sleep(LLM_USAGE_FLUSH_SECONDS)
+
+    # ========== REPORT ==========
+
+    @staticmethod
+    def report(days: int = 1, tenant: Optional[str] = None, top_users: int = 50) -> Dict[str, Any]:
+        """
+        Tổng hợp `days` ngày gần nhất (tính cả hôm nay, gồm phần chưa ghi xuống đĩa)
+
+        Returns:
+            totals, by_feature (theo cache), by_hour, by_user (nhiều token nhất trước), budgets hôm nay
+        """
+        now = datetime.now()
+        day_list = [(now - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days - 1, -1, -1)]
+        rows: Dict[_Key, List[float]] = {}
+        for day in day_list:
+            rows.update(LLMUsageService._read_day(day))
+        with LLMUsageService._lock:
+            pending = {key: list(values) for key, values in LLMUsageService._pending.items()}
+            day_tokens = dict(LLMUsageService._day_tokens) if LLMUsageService._day == day_list[-1] else {}
+        for key, values in pending.items():
+            if key[0][:10] in day_list:
+                _merge(rows, key, values)
+
+        totals = _empty()
+        by_feature: Dict[str, Dict[str, Dict[str, float]]] = defaultdict(lambda: defaultdict(_empty))
+        by_hour: Dict[str, Dict[str, float]] = defaultdict(_empty)
+        by_user: Dict[str, Dict[str, float]] = defaultdict(_empty)
+        for (hour, user, feature, model, cache), values in rows.items():
+            if tenant is not None and user != tenant:
+                continue
+            _add(totals, values)
+            _add(by_feature[feature][cache], values)
+            _add(by_hour[hour], values)
+            _add(by_user[user], values)
+
+        users = sorted(by_user.items(), key=lambda item: -(item[1]["prompt_tokens"] + item[1]["completion_tokens"]))
+        budgets = {
+            feature: {
+                "budget": budget or None,
+                "used_today": day_tokens.get(feature, 0),
+                "over_budget": bool(budget) and day_tokens.get(feature, 0) >= budget,
+                "degraded": LLMUsageService.degraded(feature)
+            }
+            for feature, budget in LLM_FEATURE_BUDGETS.items()
+        }
+        return {
+            "from": day_list[0],
+            "to": day_list[-1],
+            "totals": totals,
+            "by_feature": {feature: dict(caches) for feature, caches in sorted(by_feature.items())},
+            "by_hour": [{"hour": hour, **values} for hour, values in sorted(by_hour.items())],
+            "by_user": [{"user": user, **values} for user, values in users[:top_users]],
+            "total_users": len(users),
+            "budgets": budgets,
+            "daily_budget": LLM_DAILY_TOKEN_BUDGET or None,
+            "used_today": sum(day_tokens.values())
+        }
@@ -0,0 +1,214 @@
+"""
+Vector Service - Truy xuất đoạn liên quan cho chat và gợi nhớ (RAG), chạy hoàn toàn offline
+Vector TF-IDF băm (từ + cặp từ, đã bỏ dấu) lưu trong ma trận NumPy, tìm top-k theo cosine
+"""
+import math
+import threading
+import zlib
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from app.config import (
+    VECTOR_DIMENSIONS, RAG_TOP_K, RAG_TOKEN_BUDGET, RAG_SNIPPET_CHARS, RAG_MIN_SIMILARITY
+)
+from app.services.index_sync import TenantIndexSync
+from app.services.search_service import SEARCH_COLLECTIONS, KINDS, record_text, tokenize, top_k
+from app.warmup import register_warmup
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (tiếng Việt ~3 ký tự/token với tokenizer của Llama)"""
+    return len(text) // 3 + 1
+
+def _hashed_features(text: str) -> Counter:
+    """Đặc trưng từ + cặp từ liền nhau, băm vào VECTOR_DIMENSIONS chiều (có dấu +/- để giảm lệch do va chạm)"""
+    words = tokenize(text)
+    features: Counter = Counter()
+    mask = VECTOR_DIMENSIONS - 1
+    for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        h = zlib.crc32(feature.encode("utf-8"))
+        features[(h & mask, 1 if h & 0x80000000 else -1)] += 1
+    return features
+
+class VectorIndex:
+    """
+    Ma trận vector (SMART lnc.ltc): doc = log-tf chuẩn hóa, truy vấn = log-tf x idf chuẩn hóa
+
+    - Thêm doc = ghi thêm một hàng (ma trận tăng gấp đôi khi đầy)
+    - Tìm kiếm = nhân ma trận-vector (brute-force, đủ nhanh với vài trăm nghìn bản ghi)
+    """
+
+    def __init__(self, dimensions: int = VECTOR_DIMENSIONS):
+        self.dimensions = dimensions
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # Cấp phát khi thêm doc đầu tiên (numpy chỉ nạp khi cần)
+            self.matrix = None
+            self.df = None
+            self.doc_keys: List[Tuple[str, str]] = []
+            self.doc_kind = array("B")
+            self.doc_text: List[Optional[str]] = []
+            self.doc_created: List[Optional[str]] = []
+            self.ids: Dict[Tuple[str, str], int] = {}
+            self.dead: Set[int] = set()
+            self.kind_counts: Counter = Counter()
+
+    @property
+    def live_docs(self) -> int:
+        return len(self.doc_keys) - len(self.dead)
+
+    def needs_compaction(self) -> bool:
+        return len(self.dead) > len(self.doc_keys) // 4
+
+    def _vector(self, text: str, idf=None):
+        import numpy as np
+
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for (dim, sign), tf in _hashed_features(text).items():
+            vector[dim] += sign * (1 + math.log(tf))
+        if idf is not None:
+            vector *= idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def add(self, kind: str, record: Dict[str, Any]):
+        """Thêm hoặc cập nhật một bản ghi"""
+        import numpy as np
+
+        text = record_text(kind, record)
+        key = (kind, str(record.get("id")))
+        with self._lock:
+            old = self.ids.get(key)
+            if old is not None:
+                if self.doc_text[old] == text:
+                    return
+                self._delete(old)
+
+            vector = self._vector(text)
+            doc = len(self.doc_keys)
+            if self.matrix is None:
+                # Nhỏ lúc đầu (64 x 2 KB): mỗi tenant một ma trận, đa số tenant chỉ có ít bản ghi
+                self.matrix = np.zeros((64, self.dimensions), dtype=np.float32)
+                self.df = np.zeros(self.dimensions, dtype=np.int64)
+            elif doc == len(self.matrix):
+                grown = np.zeros((len(self.matrix) * 2, self.dimensions), dtype=np.float32)
+                grown[:doc] = self.matrix
+                self.matrix = grown
+            if vector is not None:
+                self.matrix[doc] = vector
+                self.df[vector != 0] += 1
+
+            self.doc_keys.append(key)
+            self.doc_kind.append(KINDS.index(kind))
+            self.doc_text.append(text)
+            self.doc_created.append(record.get("created_at"))
+            self.ids[key] = doc
+            self.kind_counts[kind] += 1
+
+    def _delete(self, doc: int):
+        kind, _ = self.doc_keys[doc]
+        del self.ids[self.doc_keys[doc]]
+        self.dead.add(doc)
+        self.df[self.matrix[doc] != 0] -= 1
+        self.matrix[doc] = 0
+        self.doc_text[doc] = None
+        self.kind_counts[kind] -= 1
+
+    def reconcile(self, kind: str, records: List[Dict[str, Any]]):
+        """Đưa index của một loại dữ liệu về đúng danh sách bản ghi hiện có"""
+        with self._lock:
+            present = set()
+            for record in records:
+                self.add(kind, record)
+                present.add((kind, str(record.get("id"))))
+            for key in [k for k in self.ids if k[0] == kind and k not in present]:
+                self._delete(self.ids[key])
+
+    def search(
+        self,
+        query: str,
+        kinds: Optional[List[str]] = None,
+        limit: int = RAG_TOP_K,
+        exclude: Iterable[Tuple[str, str]] = (),
+        min_similarity: float = RAG_MIN_SIMILARITY
+    ) -> List[Dict[str, Any]]:
+        """Các doc gần truy vấn nhất theo cosine: [{type, id, score, created_at, text}]"""
+        import numpy as np
+
+        with self._lock:
+            if not self.live_docs:
+                return []
+            idf = np.log((self.live_docs + 1) / (self.df + 1)).astype(np.float32)
+            query_vector = self._vector(query, idf)
+            if query_vector is None:
+                return []
+
+            scores = self.matrix[:len(self.doc_keys)] @ query_vector
+            scores[scores < min_similarity] = 0
+            if kinds and set(kinds) != set(KINDS):
+                codes = [KINDS.index(k) for k in kinds]
+                scores[~np.isin(np.frombuffer(self.doc_kind, dtype=np.uint8), codes)] = 0
+            for key in exclude:
+                if key in self.ids:
+                    scores[self.ids[key]] = 0
+
+            k = min(limit, int(np.count_nonzero(scores > 0)))
+            if not k:
+                return []
+            return [
+                {
+                    "type": self.doc_keys[doc][0],
+                    "id": self.doc_keys[doc][1],
+                    "score": round(float(scores[doc]), 4),
+                    "created_at": self.doc_created[doc],
+                    "text": self.doc_text[doc]
+                }
+                for doc in top_k(scores, k).tolist()
+            ]
+
+class VectorService:
+    """Chọn các đoạn nhật ký/ký ức/ghi chú liên quan để đưa vào prompt, trong ngân sách token cố định"""
+
+    indexes = TenantIndexSync("vector", VectorIndex, {kind: path for kind, (path, _) in SEARCH_COLLECTIONS.items()})
+
+    @staticmethod
+    def related(
+        query: str,
+        kinds: Optional[List[str]] = None,
+        exclude: Iterable[Tuple[str, str]] = (),
+        limit: int = RAG_TOP_K,
+        token_budget: int = RAG_TOKEN_BUDGET
+    ) -> List[Dict[str, Any]]:
+        """
+        Top-k đoạn liên quan tới query, mỗi đoạn cắt còn RAG_SNIPPET_CHARS ký tự,
+        tổng không vượt token_budget (đồng bộ, gọi qua threadpool)
+        """
+        if not query or not query.strip():
+            return []
+        hits = VectorService.indexes.sync(kinds).search(query, kinds, limit, exclude)
+
+        result = []
+        used = 0
+        for hit in hits:
+            text = " ".join(hit.pop("text").split())
+            if len(text) > RAG_SNIPPET_CHARS:
+                text = text[:RAG_SNIPPET_CHARS].rsplit(" ", 1)[0] + "…"
+            remaining = token_budget - used
+            if estimate_tokens(text) > remaining:
+                # Đoạn cuối: cắt cho vừa nếu còn đủ chỗ cho một câu ngắn
+                if remaining < 20:
+                    break
+                text = text[:remaining * 3].rsplit(" ", 1)[0] + "…"
+            used += estimate_tokens(text)
+            hit["text"] = text
+            result.append(hit)
+        return result
+
+    @staticmethod
+    def warm_up():
+        """Build ma trận vector trong nền khi khởi động"""
+        VectorService.indexes.sync()
+
+register_warmup(VectorService.warm_up)
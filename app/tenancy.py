@@ -0,0 +1,248 @@
+"""
+Tenancy - Một process phục vụ nhiều người dùng (tenant), dữ liệu mỗi người một thư mục
+
+- User id lấy từ header X-User-Id, hoặc từ token ký HMAC khi đặt TENANT_SECRET
+- Tenant của request nằm trong ContextVar (đi theo request, kể cả vào threadpool):
+  StorageManager đổi đường dẫn collection sang thư mục của tenant
+- Dữ liệu trong bộ nhớ (index...) giữ theo tenant trong TenantCache: chỉ tenant đang dùng được nạp
+
+Cách cấp token cho một người dùng:
+    python -m app.tenancy <user_id>
+"""
+import hashlib
+import hmac
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+from urllib.parse import parse_qs
+from app.config import (
+    STORAGE_DIR, TENANT_DIR, TENANT_HEADER, TENANT_TOKEN_HEADER, TENANT_SECRET, TENANT_REQUIRED,
+    TENANT_CACHE_SIZE, TENANT_IDLE_SECONDS
+)
+from app.metrics import TENANT_CACHE_ENTRIES, TENANT_CACHE_LOADS, TENANT_CACHE_EVICTIONS
+
+DEFAULT_TENANT = ""  # Không có user id: dữ liệu cũ (một người dùng) ngay trong STORAGE_DIR
+
+# Route không đụng tới dữ liệu người dùng: không cần user id kể cả khi TENANT_REQUIRED
+_EXEMPT_PATHS = {"/", "/metrics", "/test-ai", "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json"}
+_EXEMPT_PREFIXES = ("/admin/",)
+
+_TENANT_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+_current_tenant: ContextVar[str] = ContextVar("tenant", default=DEFAULT_TENANT)
+
+class TenantError(Exception):
+    """User id/token không hợp lệ hoặc thiếu"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def current_tenant() -> str:
+    """Tenant của request đang xử lý (DEFAULT_TENANT nếu không có)"""
+    return _current_tenant.get()
+
+@contextmanager
+def use_tenant(tenant: str):
+    """Chạy một đoạn code với tenant cho trước (tác vụ nền không có request)"""
+    token = _current_tenant.set(tenant)
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+def tenant_dir(tenant: str) -> Path:
+    """Thư mục dữ liệu của tenant, chia 256 thư mục con theo băm để mỗi thư mục không quá nhiều mục"""
+    if not tenant:
+        return STORAGE_DIR
+    return TENANT_DIR / f"{zlib.crc32(tenant.encode('utf-8')) & 0xff:02x}" / tenant
+
+def tenant_path(path: Path, tenant: Optional[str] = None) -> Path:
+    """File collection trong config (vd. DIARY_FILE) -> file tương ứng của tenant (mặc định tenant hiện tại)"""
+    tenant = current_tenant() if tenant is None else tenant
+    if not tenant:
+        return path
+    return tenant_dir(tenant) / path.relative_to(STORAGE_DIR)
+
+def all_tenants() -> List[str]:
+    """Mọi tenant có dữ liệu trên đĩa (DEFAULT_TENANT đứng đầu) - cho job chạy qua mọi người dùng"""
+    tenants = [DEFAULT_TENANT]
+    if TENANT_DIR.exists():
+        tenants += sorted(path.name for path in TENANT_DIR.glob("*/*") if path.is_dir())
+    return tenants
+
+def _signature(user_id: str, secret: str = TENANT_SECRET) -> str:
+    return hmac.new(secret.encode("utf-8"), user_id.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+def sign_tenant(user_id: str, secret: Optional[str] = None) -> str:
+    """Token của user id: '<user id>.<HMAC-SHA256>' (client gửi trong X-User-Token); mặc định ký bằng TENANT_SECRET"""
+    secret = secret or TENANT_SECRET
+    if not secret:
+        raise ValueError("Chưa cấu hình TENANT_SECRET")
+    if not _TENANT_RE.match(user_id):
+        raise ValueError("User id chỉ gồm chữ, số, '_', '-' (tối đa 64 ký tự)")
+    return f"{user_id}.{_signature(user_id, secret)}"
+
+def verify_token(token: str) -> Optional[str]:
+    """User id trong token nếu chữ ký đúng, không thì None"""
+    user_id, _, signature = token.rpartition(".")
+    if not _TENANT_RE.match(user_id):
+        return None
+    return user_id if hmac.compare_digest(signature, _signature(user_id)) else None
+
+def tenant_from_scope(scope) -> str:
+    """User id của một request HTTP/WebSocket (TenantError nếu không hợp lệ)"""
+    headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope.get("headers", [])}
+    # WebSocket trên trình duyệt không gửi được header tùy ý: cho phép ?user_id= / ?token=
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    user_id = headers.get(TENANT_HEADER.lower()) or query.get("user_id", [""])[0]
+
+    if TENANT_SECRET:
+        authorization = headers.get("authorization", "")
+        token = (
+            headers.get(TENANT_TOKEN_HEADER.lower())
+            or (authorization[7:] if authorization.lower().startswith("bearer ") else "")
+            or query.get("token", [""])[0]
+        )
+        if token:
+            verified = verify_token(token)
+            if verified is None:
+                raise TenantError(401, "Token người dùng không hợp lệ")
+            return verified
+        if user_id:
+            raise TenantError(401, f"Cần token người dùng ({TENANT_TOKEN_HEADER}), không nhận {TENANT_HEADER}")
+    elif user_id:
+        if not _TENANT_RE.match(user_id):
+            raise TenantError(400, "User id chỉ gồm chữ, số, '_', '-' (tối đa 64 ký tự)")
+        return user_id
+
+    path = scope.get("path", "")
+    if TENANT_REQUIRED and path not in _EXEMPT_PATHS and not path.startswith(_EXEMPT_PREFIXES):
+        raise TenantError(401, f"Thiếu user id ({TENANT_TOKEN_HEADER if TENANT_SECRET else TENANT_HEADER})")
+    return DEFAULT_TENANT
+
+class TenantMiddleware:
+    """ASGI middleware gắn tenant của request (HTTP và WebSocket) vào ContextVar"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            tenant = tenant_from_scope(scope)
+        except TenantError as e:
+            if scope["type"] == "http":
+                from fastapi.responses import JSONResponse
+
+                await JSONResponse(status_code=e.status_code, content={"detail": e.detail})(scope, receive, send)
+            else:
+                await send({"type": "websocket.close", "code": 1008, "reason": e.detail})
+            return
+
+        token = _current_tenant.set(tenant)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_tenant.reset(token)
+
+class TenantCache:
+    """
+    Dữ liệu trong bộ nhớ theo tenant (index...), tạo bằng factory(tenant) khi tenant dùng tới lần đầu
+
+    - Giữ tối đa max_size tenant: vượt quá thì bỏ tenant lâu không dùng nhất (LRU)
+    - Tenant không dùng quá idle_seconds cũng bị bỏ (kiểm tra ở mỗi lần get, từ đầu danh sách LRU)
+    - keep(tenant) True = không bỏ (vd. tenant đang có client WebSocket)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[str], Any],
+        max_size: int = TENANT_CACHE_SIZE,
+        idle_seconds: float = TENANT_IDLE_SECONDS,
+        keep: Optional[Callable[[str], bool]] = None
+    ):
+        self.name = name
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()  # tenant -> (giá trị, lần dùng cuối)
+
+    def get(self, tenant: str) -> Any:
+        """Giá trị của tenant (tạo nếu chưa có), đánh dấu vừa dùng"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(tenant)
+            if entry is None:
+                value = self.factory(tenant)
+                TENANT_CACHE_LOADS.inc(cache=self.name)
+            else:
+                value = entry[0]
+            self._entries[tenant] = (value, now)
+            self._entries.move_to_end(tenant)
+            self._evict(now)
+            TENANT_CACHE_ENTRIES.set(len(self._entries), cache=self.name)
+        return value
+
+    def peek(self, tenant: str) -> Optional[Any]:
+        """Giá trị của tenant nếu đang trong bộ nhớ (không tạo, không đánh dấu vừa dùng)"""
+        with self._lock:
+            entry = self._entries.get(tenant)
+        return entry[0] if entry is not None else None
+
+    def __contains__(self, tenant: str) -> bool:
+        with self._lock:
+            return tenant in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def items(self) -> List[Tuple[str, Any]]:
+        with self._lock:
+            return [(tenant, entry[0]) for tenant, entry in self._entries.items()]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            TENANT_CACHE_ENTRIES.set(0, cache=self.name)
+
+    def _evict(self, now: float):
+        """Bỏ tenant rảnh quá lâu hoặc vượt max_size, bắt đầu từ tenant lâu không dùng nhất (gọi trong khóa)"""
+        checked = 0
+        while self._entries and checked < len(self._entries):
+            tenant, (value, last_used) = next(iter(self._entries.items()))
+            idle = now - last_used > self.idle_seconds
+            if not idle and len(self._entries) <= self.max_size:
+                break
+            checked += 1
+            if self.keep is not None and self.keep(tenant):
+                # Đang dùng (kết nối mở...): coi như vừa dùng
+                self._entries[tenant] = (value, now)
+                self._entries.move_to_end(tenant)
+                continue
+            del self._entries[tenant]
+            TENANT_CACHE_EVICTIONS.inc(cache=self.name, reason="idle" if idle else "size")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Cách dùng: python -m app.tenancy <user_id>")
+        sys.exit(2)
+    try:
+        print(sign_tenant(sys.argv[1]))
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
@@ -0,0 +1,29 @@
+"""
+Warm-up Hooks
+Nạp trước module nặng và cache trong nền, sau khi server đã nhận kết nối
+"""
+import asyncio
+import time
+from typing import Callable, List
+
+_hooks: List[Callable[[], None]] = []
+
+def register_warmup(hook: Callable[[], None]) -> Callable[[], None]:
+    """Đăng ký hàm warm-up (hàm đồng bộ, sẽ chạy trong thread riêng)"""
+    _hooks.append(hook)
+    return hook
+
+def run_warmup():
+    """Chạy lần lượt các hàm warm-up, lỗi ở một hàm không ảnh hưởng hàm khác"""
+    start = time.perf_counter()
+    for hook in list(_hooks):
+        try:
+            hook()
+        except Exception as e:
+            print(f"Warm-up {hook.__qualname__} lỗi: {e}")
+    print(f"🔥 Warm-up xong sau {(time.perf_counter() - start) * 1000:.0f} ms")
+
+async def warm_up_in_background(delay: float):
+    """Chờ server mở cổng rồi warm-up trong threadpool, không chặn event loop"""
+    await asyncio.sleep(delay)
+    await asyncio.get_running_loop().run_in_executor(None, run_warmup)
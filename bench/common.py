@@ -0,0 +1,77 @@
+"""
+Tiện ích dùng chung cho các script benchmark
+"""
+import json
+import socket
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Cận trên các bucket (ms) để so sánh phân phối latency giữa hai lần chạy
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000]
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_until_ready(port: int, timeout: float = 60.0):
+    """Chờ tới khi server nhận kết nối TCP"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server không khởi động được trên cổng {port}")
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """Percentile (nearest-rank) của danh sách đã sắp xếp"""
+    if not sorted_values:
+        return None
+    index = min(max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def latency_histogram(sorted_values: List[float]) -> List[int]:
+    """Số mẫu (giây) rơi vào từng bucket của HISTOGRAM_BUCKETS_MS, phần tử cuối là phần vượt quá"""
+    counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+    bucket = 0
+    for value in sorted_values:
+        while bucket < len(HISTOGRAM_BUCKETS_MS) and value * 1000 > HISTOGRAM_BUCKETS_MS[bucket]:
+            bucket += 1
+        counts[bucket] += 1
+    return counts
+
+def latency_summary(latencies: List[float], duration: float) -> Dict:
+    """Tóm tắt latency (giây) thành p50/p95/p99 (ms) + throughput + histogram"""
+    values = sorted(latencies)
+
+    def ms(v):
+        return round(v * 1000, 3) if v is not None else None
+
+    return {
+        "count": len(values),
+        "throughput_rps": round(len(values) / duration, 2) if duration > 0 else None,
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else None,
+        "histogram": latency_histogram(values)
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_json(path: Path, data: Dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,84 @@
+"""
+So sánh hai file kết quả benchmark (driver.py, replay.py) theo từng route
+
+In bảng chênh lệch p50/p95/p99/throughput, khoảng cách phân phối latency
+(Kolmogorov-Smirnov trên histogram) và đánh dấu route bị chậm đi quá ngưỡng.
+Thoát với mã 1 nếu có route hồi quy (dùng được trong CI).
+
+Cách chạy:
+    python bench/compare.py baseline.json candidate.json --threshold 10
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "throughput_rps"]
+
+def load_routes(path: Path) -> Dict[str, Dict]:
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    return {r["route"]: r for r in report.get("routes", []) if not r.get("skipped")}
+
+def change_pct(old: Optional[float], new: Optional[float]) -> Optional[float]:
+    if old is None or new is None or old == 0:
+        return None
+    return round((new - old) / old * 100, 1)
+
+def ks_distance(old: Optional[List[int]], new: Optional[List[int]]) -> Optional[float]:
+    """Khoảng cách lớn nhất giữa hai CDF (0 = giống hệt, 1 = tách rời hoàn toàn)"""
+    if not old or not new or len(old) != len(new) or not sum(old) or not sum(new):
+        return None
+    distance = cdf_old = cdf_new = 0.0
+    for a, b in zip(old, new):
+        cdf_old += a / sum(old)
+        cdf_new += b / sum(new)
+        distance = max(distance, abs(cdf_old - cdf_new))
+    return round(distance, 3)
+
+def compare(baseline: Dict[str, Dict], candidate: Dict[str, Dict], threshold: float) -> List[Dict]:
+    """
+    So sánh từng route có mặt ở cả hai bên
+
+    Hồi quy: p95 tăng hoặc throughput giảm quá threshold (%)
+    """
+    rows = []
+    for route in sorted(set(baseline) & set(candidate)):
+        old, new = baseline[route], candidate[route]
+        row = {"route": route}
+        for metric in METRICS:
+            row[metric] = {"old": old.get(metric), "new": new.get(metric), "change_pct": change_pct(old.get(metric), new.get(metric))}
+        row["ks"] = ks_distance(old.get("histogram"), new.get("histogram"))
+        p95_change = row["p95_ms"]["change_pct"]
+        rps_change = row["throughput_rps"]["change_pct"]
+        row["regression"] = bool(
+            (p95_change is not None and p95_change > threshold) or
+            (rps_change is not None and rps_change < -threshold)
+        )
+        rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    parser.add_argument("--threshold", type=float, default=10.0, help="Ngưỡng hồi quy (%)")
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    args = parser.parse_args()
+
+    rows = compare(load_routes(args.baseline), load_routes(args.candidate), args.threshold)
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'route':<50} {'p50 Δ%':>8} {'p95 Δ%':>8} {'p99 Δ%':>8} {'rps Δ%':>8} {'KS':>8}")
+        for row in rows:
+            cells = [row[m]["change_pct"] for m in METRICS] + [row["ks"]]
+            flag = "  <-- hồi quy" if row["regression"] else ""
+            print(f"{row['route']:<50} " + " ".join(f"{'-' if c is None else c:>8}" for c in cells) + flag)
+
+    sys.exit(1 if any(r["regression"] for r in rows) else 0)
+
+if __name__ == "__main__":
+    main()
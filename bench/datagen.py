@@ -0,0 +1,245 @@
+"""
+Sinh dữ liệu giả cho storage/ (diaries, notes, reminders, health logs, memories, conversations)
+
+Dữ liệu tất định (seed cố định), tiếng Việt có dấu, đúng định dạng các route đang ghi.
+File JSON được ghi theo kiểu stream nên sinh được quy mô 1M bản ghi mà không tốn nhiều RAM.
+
+Cách chạy:
+    python bench/datagen.py --scale 1k --out /tmp/bench_storage
+    python bench/datagen.py --scale 100k --out /tmp/bench_storage
+    python bench/datagen.py --scale 1m --out /tmp/bench_storage
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+import unicodedata
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+WORDS = (
+    "hôm nay trời đẹp bà đi chợ mua rau cháu về thăm ông uống thuốc huyết áp khám bệnh "
+    "buổi sáng tập thể dục công viên con gái gọi điện nhớ quê hương ngày xưa cánh đồng "
+    "lúa chín mẹ nấu canh chua cá kho tộ tết nguyên đán pháo hoa chùa làng đau lưng "
+    "ngủ ngon mệt mỏi vui vẻ hàng xóm sang chơi cờ tướng đọc báo nghe đài tivi "
+    "bác sĩ dặn kiêng mặn ăn nhạt đường huyết tái khám bệnh viện thứ hai tuần sau"
+).split()
+
+EMOTIONS = ["vui_vẻ", "hạnh_phúc", "buồn", "lo_lắng", "bình_thường", "nhớ_nhung", "biết_ơn", "cô_đơn"]
+NOTE_CATEGORIES = ["medication", "event", "appointment", "task", "health", "other"]
+HEALTH_TYPES = {
+    "blood_pressure": lambda rng: f"{rng.randint(100, 160)}/{rng.randint(60, 100)}",
+    "blood_sugar": lambda rng: f"{rng.uniform(4.0, 11.0):.1f}",
+    "weight": lambda rng: f"{rng.uniform(45, 75):.1f}",
+    "medication": lambda rng: rng.choice(["Amlodipin 5mg", "Metformin 500mg", "Aspirin 81mg"]),
+    "symptom": lambda rng: rng.choice(["đau đầu", "chóng mặt", "mất ngủ", "đau khớp"])
+}
+# Âm tiết giả để mở rộng từ vựng (--vocabulary): phụ âm đầu x vần x thanh
+ONSETS = ["", "b", "c", "ch", "d", "đ", "g", "gi", "h", "kh", "l", "m", "n", "ng", "nh", "ph", "qu", "s", "t", "th", "tr", "v", "x"]
+RHYMES = ["a", "ai", "an", "ang", "anh", "ao", "ay", "e", "em", "en", "i", "im", "in", "inh", "o", "oi", "on", "ong",
+          "u", "ui", "un", "ung", "ơ", "ơi", "ư", "ưa", "ưng", "ương", "iên", "uôn", "ât", "ăn", "ôm", "ôi"]
+TONES = ["", "\u0300", "\u0301", "\u0303", "\u0309", "\u0323"]
+
+TAGS = ["quê hương", "gia đình", "tuổi thơ", "món ăn", "bạn bè", "chiến tranh", "đám cưới", "tết"]
+
+def zipf_vocabulary(size: int, seed: int) -> Tuple[List[str], List[float]]:
+    """
+    Từ vựng `size` âm tiết với tần suất kiểu Zipf (giống văn bản thật hơn WORDS phân bố đều)
+
+    Các từ trong WORDS nằm rải rác trong ~2000 hạng đầu, phần còn lại là âm tiết ghép ngẫu nhiên.
+    """
+    rng = random.Random(seed)
+    syllables = sorted({
+        unicodedata.normalize("NFC", onset + rhyme[0] + tone + rhyme[1:])
+        for onset in ONSETS for rhyme in RHYMES for tone in TONES
+    } - set(WORDS))
+    rng.shuffle(syllables)
+    words = syllables[:max(size - len(WORDS), 0)]
+    for word in WORDS:
+        words.insert(rng.randrange(min(len(words), 2000) + 1), word)
+    words = words[:size]
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    return words, cum_weights
+
+class Generator:
+    """Sinh bản ghi tất định cho từng collection"""
+
+    def __init__(self, count: int, seed: int = 42, start: datetime = datetime(2020, 1, 1), vocabulary: int = 0):
+        self.count = count
+        self.rng = random.Random(seed)
+        self.start = start
+        # Trải đều bản ghi trong ~5 năm
+        self.step = timedelta(seconds=max(int(5 * 365 * 86400 / max(count, 1)), 1))
+        self.words = WORDS
+        self.cum_weights = None
+        if vocabulary > len(WORDS):
+            self.words, self.cum_weights = zipf_vocabulary(vocabulary, seed)
+
+    def text(self, n: int) -> str:
+        if self.cum_weights:
+            return " ".join(self.rng.choices(self.words, cum_weights=self.cum_weights, k=n))
+        return " ".join(self.rng.choice(self.words) for _ in range(n))
+
+    def created_at(self, i: int) -> str:
+        return (self.start + self.step * i + timedelta(microseconds=i % 1_000_000)).isoformat()
+
+    def diaries(self) -> Iterator[Dict]:
+        for i in range(self.count):
+            yield {
+                "id": f"diary_{i:08d}",
+                "content": self.text(self.rng.randint(40, 160)),
+                "summary": self.text(25),
+                "emotion": self.rng.choice(EMOTIONS),
+                "image_id": None,
+                "entry_type": "diary",
+                "created_at": self.created_at(i)
+            }
+
+    def notes(self) -> Iterator[Dict]:
+        for i in range(self.count):
+            category = self.rng.choice(NOTE_CATEGORIES)
+            yield {
+                "id": f"note_{i:08d}",
+                "content": self.text(self.rng.randint(10, 50)),
+                "category": category,
+                "extracted_datetime": self.created_at(i)[:16].replace("T", " "),
+                "priority": self.rng.choice(["high", "medium", "low"]),
+                "is_reminder": category in ("medication", "appointment", "event"),
+                "created_at": self.created_at(i)
+            }
+
+    def reminders(self) -> Iterator[Dict]:
+        for i in range(self.count):
+            remind_at = self.start + self.step * i + timedelta(hours=self.rng.randint(1, 72))
+            yield {
+                "id": f"reminder_{i:08d}",
+                "note_id": f"note_{i:08d}",
+                "title": f"🔔 {self.text(3)}",
+                "description": self.text(15),
+                "remind_at": remind_at.isoformat(),
+                "is_completed": remind_at < datetime.now() and self.rng.random() < 0.8,
+                "created_at": self.created_at(i)
+            }
+
+    def health_logs(self) -> Iterator[Dict]:
+        types = list(HEALTH_TYPES)
+        for i in range(self.count):
+            log_type = self.rng.choice(types)
+            yield {
+                "id": f"health_{i:08d}",
+                "log_type": log_type,
+                "value": HEALTH_TYPES[log_type](self.rng),
+                "note": self.text(6) if self.rng.random() < 0.3 else None,
+                "created_at": self.created_at(i)
+            }
+
+    def memories(self) -> Iterator[Dict]:
+        for i in range(self.count):
+            yield {
+                "id": f"memory_{i:08d}",
+                "content": self.text(self.rng.randint(20, 80)),
+                "tags": self.rng.sample(TAGS, self.rng.randint(0, 3)),
+                "created_at": self.created_at(i)
+            }
+
+    def conversations(self) -> Iterator[Dict]:
+        # Mỗi bản ghi hội thoại chứa lịch sử tin nhắn, nên số lượng ít hơn các collection khác
+        for i in range(max(self.count // 100, 1)):
+            messages = []
+            for _ in range(self.rng.randint(2, 10)):
+                messages.append({"role": "user", "content": self.text(12)})
+                messages.append({"role": "assistant", "content": self.text(30)})
+            yield {"id": f"conv_{i:08d}", "messages": messages, "created_at": self.created_at(i * 100)}
+
+    def digests(self) -> Iterator[Dict]:
+        # Bản tóm tắt ngày (job ban đêm): một bản mỗi ngày, tới hôm qua
+        yesterday = datetime.now().date() - timedelta(days=1)
+        for i in range(min(self.count, 365)):
+            day = yesterday - timedelta(days=i)
+            yield {
+                "id": f"digest_{i:08d}",
+                "date": day.isoformat(),
+                "content": self.text(self.rng.randint(60, 120)),
+                "stats": {"diaries": self.rng.randint(0, 3), "notes": self.rng.randint(0, 3),
+                          "health_logs": self.rng.randint(0, 4), "emotions": {self.rng.choice(EMOTIONS): 1},
+                          "reminders_completed": self.rng.randint(0, 4)},
+                "created_at": datetime.combine(day + timedelta(days=1), datetime.min.time()).replace(hour=2).isoformat()
+            }
+
+    def profile(self) -> Dict:
+        now = datetime.now().isoformat()
+        return {
+            "id": "user_profile",
+            "full_name": "Nguyễn Thị Hoa",
+            "age": 78,
+            "birth_date": "1947-03-12",
+            "address": "Nam Định",
+            "phone": "0900000000",
+            "emergency_contact": "Con gái - 0911111111",
+            "medical_conditions": ["tăng huyết áp", "tiểu đường type 2"],
+            "medications": [{"name": "Amlodipin", "dose": "5mg", "time": "08:00"},
+                            {"name": "Metformin", "dose": "500mg", "time": "19:00"}],
+            "allergies": ["penicillin"],
+            "hobbies": ["trồng rau", "nghe cải lương", "đánh cờ"],
+            "important_dates": [{"name": "Sinh nhật cháu Minh", "date": "2015-06-01"}],
+            "daily_routine": "Dậy 5h, tập dưỡng sinh, ăn sáng, nghỉ trưa",
+            "created_at": now,
+            "updated_at": now
+        }
+
+def write_json_stream(path: Path, records: Iterator[Dict]) -> int:
+    """Ghi danh sách JSON theo từng bản ghi (không giữ cả collection trong RAM)"""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for record in records:
+            if count:
+                f.write(",\n")
+            f.write(json.dumps(record, ensure_ascii=False))
+            count += 1
+        f.write("\n]")
+    return count
+
+def generate(out_dir: Path, count: int, seed: int = 42, vocabulary: int = 0) -> Dict[str, int]:
+    """Sinh toàn bộ collection vào out_dir, trả về số bản ghi mỗi file"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    gen = Generator(count, seed, vocabulary=vocabulary)
+    collections: Dict[str, Callable[[], Iterator[Dict]]] = {
+        "diaries.json": gen.diaries,
+        "notes.json": gen.notes,
+        "reminders.json": gen.reminders,
+        "health_logs.json": gen.health_logs,
+        "memories.json": gen.memories,
+        "conversations.json": gen.conversations,
+        "digests.json": gen.digests
+    }
+    counts = {name: write_json_stream(out_dir / name, factory()) for name, factory in collections.items()}
+    counts["user_profile.json"] = write_json_stream(out_dir / "user_profile.json", iter([gen.profile()]))
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=list(SCALES), default="1k")
+    parser.add_argument("--count", type=int, help="Số bản ghi mỗi collection (ghi đè --scale)")
+    parser.add_argument("--out", type=Path, required=True, help="Thư mục storage đích")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--vocabulary", type=int, default=0,
+                        help="Số âm tiết phân bố Zipf (0 = dùng WORDS phân bố đều)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate(args.out, args.count or SCALES[args.scale], args.seed, args.vocabulary)
+    sizes = {name: (args.out / name).stat().st_size for name in counts}
+    print(json.dumps({
+        "out": str(args.out),
+        "records": counts,
+        "bytes": sizes,
+        "elapsed_s": round(time.perf_counter() - start, 2)
+    }, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
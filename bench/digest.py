@@ -0,0 +1,212 @@
+"""
+Benchmark: job tóm tắt ngày (DigestService) chạy với fake Groq
+
+Các bước:
+1. Storage tạm với --users người dùng (tenant); mỗi người có nhật ký, ghi chú, chỉ số sức khỏe, nhắc nhở
+   đã hoàn thành trong ngày hôm qua, riêng --empty-ratio người chỉ có dữ liệu cũ (job bỏ qua, không gọi Groq)
+2. Chạy fake Groq (fake_groq.py) với latency log-normal (--latency-ms, --tail) và --groq-capacity request cùng lúc
+3. Với mỗi mức --concurrency: xóa bản tóm tắt + checkpoint rồi chạy cả job, đo thời gian, số lời gọi Groq,
+   số mục dữ liệu gộp vào mỗi lời gọi (so với gọi riêng từng mục)
+4. Crash giữa chừng: hủy job khi đã xong --crash-after phần người dùng, để lại file khóa của một process đã chết
+   (như kill -9), chạy lại: phải tiếp tục ngay từ checkpoint, đủ bản tóm tắt, chỉ gọi lại các lời gọi đang dở
+
+Cách chạy:
+    python bench/digest.py --users 200 --concurrency 1 4 16 --latency-ms 300 --out digest.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from common import REPO_ROOT, free_port, git_commit, write_json
+
+def seed(users: int, empty_ratio: float, day: date):
+    """Sinh dữ liệu cho từng tenant, trả về danh sách tenant có dữ liệu ngày `day`"""
+    from app.database import StorageManager
+    from app.ids import new_id
+    from app.tenancy import use_tenant
+
+    active = []
+    empty_every = round(1 / empty_ratio) if empty_ratio else 0
+    for i in range(users):
+        tenant = f"bench-{i:05d}"
+        empty = empty_every and i % empty_every == 0
+        moment = datetime.combine(day - timedelta(days=3) if empty else day, datetime.min.time())
+        with use_tenant(tenant):
+            StorageManager.save_diary({
+                "id": new_id("diary"),
+                "content": "Sáng nay bà đi chợ với con gái, mua rau và cá. Chiều ngồi kể chuyện ngày xưa cho cháu nghe.",
+                "summary": "Bà đi chợ cùng con gái và kể chuyện cho cháu.",
+                "emotion": "vui_vẻ",
+                "created_at": (moment + timedelta(hours=9)).isoformat()
+            })
+            if empty:
+                continue
+            StorageManager.save_note({
+                "id": new_id("note"),
+                "content": "Thứ 5 tái khám huyết áp ở bệnh viện quận",
+                "category": "appointment",
+                "created_at": (moment + timedelta(hours=10)).isoformat()
+            })
+            for hour, value in ((7, "135/85"), (19, "128/82")):
+                StorageManager.save_health_log({
+                    "id": new_id("health"),
+                    "log_type": "blood_pressure",
+                    "value": value,
+                    "created_at": (moment + timedelta(hours=hour)).isoformat()
+                })
+            StorageManager.save_reminder({
+                "id": new_id("reminder"),
+                "title": "Uống thuốc huyết áp",
+                "remind_at": (moment + timedelta(hours=8)).isoformat(),
+                "is_completed": True,
+                "created_at": (moment - timedelta(days=1)).isoformat()
+            })
+        active.append(tenant)
+    return active
+
+def reset(tenants):
+    """Xóa bản tóm tắt và checkpoint (chạy lại từ đầu)"""
+    from app.config import DIGEST_CHECKPOINT_FILE, DIGEST_FILE
+    from app.tenancy import tenant_path, use_tenant
+
+    DIGEST_CHECKPOINT_FILE.unlink(missing_ok=True)
+    for tenant in tenants:
+        with use_tenant(tenant):
+            tenant_path(DIGEST_FILE).unlink(missing_ok=True)
+
+def count_digests(tenants, day: date) -> int:
+    from app.database import StorageManager
+    from app.tenancy import use_tenant
+
+    found = 0
+    for tenant in tenants:
+        with use_tenant(tenant):
+            found += StorageManager.get_digest(day.isoformat()) is not None
+    return found
+
+async def run_with_crash(day: date, concurrency: int, crash_at: int):
+    """Hủy job khi checkpoint có đủ crash_at người dùng, trả về số người dùng đã xong lúc hủy"""
+    from app.services.digest_service import DigestService
+
+    task = asyncio.create_task(DigestService.run_once(day, concurrency))
+    while not task.done():
+        checkpoint = DigestService.load_checkpoint(day.isoformat())
+        if len(checkpoint["done"]) >= crash_at:
+            task.cancel()
+            break
+        await asyncio.sleep(0.01)
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    return len(DigestService.load_checkpoint(day.isoformat())["done"])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--empty-ratio", type=float, default=0.2, help="Tỉ lệ người dùng không có dữ liệu hôm qua")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="DIGEST_CONCURRENCY cần đo")
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--tail", type=float, default=0.5)
+    parser.add_argument("--groq-capacity", type=int, default=0, help="Số request fake Groq xử lý cùng lúc (0 = không giới hạn)")
+    parser.add_argument("--crash-after", type=float, default=0.5, help="Phần người dùng đã xong lúc giả lập crash")
+    parser.add_argument("--seed", type=int, default=5)
+    parser.add_argument("--out", type=Path, help="File JSON kết quả (mặc định in ra stdout)")
+    args = parser.parse_args()
+
+    # Cấu hình phải có trước khi import app (app.config đọc env lúc import); storage tương đối -> thư mục tạm
+    port = free_port()
+    out = args.out.resolve() if args.out else None
+    workdir = tempfile.mkdtemp(prefix="bench_digest_")
+    os.chdir(workdir)
+    os.environ.update(
+        GROQ_API_URL=f"http://127.0.0.1:{port}/openai/v1/chat/completions", GROQ_API_KEY="bench",
+        LLM_SLOTS=str(max(args.concurrency) * 2), DIGEST_SCHEDULER="0"
+    )
+    sys.path.insert(0, str(REPO_ROOT))
+    import fake_groq
+    from app.config import DIGEST_CHECKPOINT_FILE
+    from app.services.digest_service import DigestService
+
+    config = fake_groq.FakeGroqConfig(args.latency_ms, args.tail, seed=args.seed, capacity=args.groq_capacity)
+    fake_groq.start_in_thread(config, port)
+
+    day = date.today() - timedelta(days=1)
+    start = time.perf_counter()
+    active = seed(args.users, args.empty_ratio, day)
+    seed_seconds = time.perf_counter() - start
+    tenants = [f"bench-{i:05d}" for i in range(args.users)]
+    items_per_user = 5  # nhật ký, ghi chú, 2 chỉ số sức khỏe, nhắc nhở
+
+    runs = {}
+    for concurrency in args.concurrency:
+        reset(tenants)
+        sent_before = sum(config.stats.values())
+        start = time.perf_counter()
+        checkpoint = asyncio.run(DigestService.run_once(day, concurrency))
+        elapsed = time.perf_counter() - start
+        calls = sum(config.stats.values()) - sent_before
+        runs[str(concurrency)] = {
+            "seconds": round(elapsed, 3),
+            "users_per_second": round(args.users / elapsed, 2),
+            "groq_requests": calls,
+            "digests": count_digests(tenants, day),
+            "skipped_empty": args.users - len(active),
+            "failed": len(checkpoint["failed"]),
+            "finished": checkpoint["finished_at"] is not None,
+            "items_per_call": round(len(active) * items_per_user / calls, 2) if calls else None
+        }
+
+    # Crash giữa chừng rồi chạy lại
+    concurrency = max(args.concurrency)
+    reset(tenants)
+    sent_before = sum(config.stats.values())
+    done_at_crash = asyncio.run(run_with_crash(day, concurrency, int(args.users * args.crash_after)))
+    calls_before_restart = sum(config.stats.values()) - sent_before
+    # Như kill -9: file khóa còn lại, ghi pid của một process đã kết thúc
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    DIGEST_CHECKPOINT_FILE.with_suffix(".lock").write_text(str(dead.pid), encoding="ascii")
+    start = time.perf_counter()
+    checkpoint = asyncio.run(DigestService.run_once(day, concurrency))
+    resume_seconds = time.perf_counter() - start
+    calls = sum(config.stats.values()) - sent_before
+    crash = {
+        "concurrency": concurrency,
+        "done_at_crash": done_at_crash,
+        "groq_requests_before_restart": calls_before_restart,
+        "resumed": checkpoint is not None,
+        "resume_seconds": round(resume_seconds, 3),
+        "digests": count_digests(tenants, day),
+        "groq_requests_total": calls,
+        "repeated_requests": calls - len(active)  # Lời gọi đang dở lúc crash (tối đa concurrency)
+    }
+
+    report = {
+        "meta": {
+            "kind": "digest",
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "users": args.users,
+            "active_users": len(active),
+            "seed_seconds": round(seed_seconds, 3),
+            "fake_groq": {"latency_ms": args.latency_ms, "tail": args.tail, "capacity": args.groq_capacity},
+            "workdir": workdir
+        },
+        "runs": runs,
+        "crash_resume": crash
+    }
+    if out:
+        write_json(out, report)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
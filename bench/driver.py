@@ -0,0 +1,292 @@
+"""
+Benchmark end-to-end cho mọi route đăng ký trong create_app()
+
+Các bước:
+1. Sinh storage giả (datagen.py) theo quy mô --scale và bộ ảnh mẫu (images.py)
+2. Chạy fake Groq (fake_groq.py) với độ trễ/lỗi/429 cấu hình được
+3. Chạy server thật trong process con, trỏ GROQ_API_URL vào fake Groq
+4. Lần lượt bắn tải closed-loop vào từng route, đo p50/p95/p99 và throughput
+5. Ghi kết quả JSON (kèm commit) để so sánh giữa các commit bằng compare.py
+
+Route mới chưa có request mẫu trong ROUTE_SPECS sẽ được báo "skipped" trong kết quả.
+Không có tesseract thì dùng --stub-ocr (OCR trả text cố định, vẫn giải mã header ảnh).
+
+Cách chạy:
+    python bench/driver.py --scale 1k --duration 5 --concurrency 8 --out bench_output.json
+    python bench/compare.py old.json bench_output.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from common import REPO_ROOT, free_port, git_commit, latency_summary, wait_until_ready, write_json
+import datagen
+import fake_groq
+import images
+
+ADMIN_TOKEN = "bench-admin"
+
+# ========== SERVER (process con) ==========
+
+def serve(port: int, stub_ocr: bool):
+    sys.path.insert(0, str(REPO_ROOT))
+    import uvicorn
+
+    if stub_ocr:
+        import pytesseract
+        pytesseract.image_to_string = lambda image, lang=None, **kwargs: "Uống thuốc huyết áp lúc 8 giờ sáng"
+
+    from app.app import create_app
+    uvicorn.run(create_app(), host="127.0.0.1", port=port, log_level="warning")
+
+def start_server(workdir: Path, port: int, groq_url: str, stub_ocr: bool,
+                 extra_env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    env = dict(os.environ, GROQ_API_URL=groq_url, GROQ_API_KEY="bench", ADMIN_TOKEN=ADMIN_TOKEN,
+               NGROK_TOKEN="", PROFILE_SAMPLE_RATE="0", **(extra_env or {}))
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--serve", "--port", str(port)]
+    if stub_ocr:
+        cmd.append("--stub-ocr")
+    return subprocess.Popen(cmd, cwd=workdir, env=env)
+
+# ========== REQUEST SPECS ==========
+
+class Context:
+    """Dữ liệu dùng chung khi tạo request (id có sẵn, ảnh mẫu...)"""
+
+    def __init__(self, image_dir: Path, count: int):
+        self.image_dir = image_dir
+        self.count = count
+        self.diary_id: Optional[str] = None
+        self.profile_id: Optional[str] = None
+
+    def image_form(self, name: str = "note_small.png", **fields):
+        import aiohttp
+        data = aiohttp.FormData()
+        for key, value in fields.items():
+            data.add_field(key, value)
+        content_type = "image/png" if name.endswith(".png") else "image/jpeg"
+        data.add_field("file", (self.image_dir / name).read_bytes(), filename=name, content_type=content_type)
+        return data
+
+    def reminder_id(self, rng: random.Random) -> str:
+        return f"reminder_{rng.randrange(self.count):08d}"
+
+    def record_id(self, prefix: str, rng: random.Random) -> str:
+        """Id một bản ghi có sẵn trong storage giả (datagen.py)"""
+        return f"{prefix}_{rng.randrange(self.count):08d}"
+
+ADMIN_HEADERS = {"X-Admin-Token": ADMIN_TOKEN}
+
+# (method, path) -> hàm tạo kwargs cho aiohttp (path thực tế, params, data, json, headers)
+ROUTE_SPECS: Dict[Tuple[str, str], Callable[[Context, random.Random], Dict]] = {
+    ("GET", "/"): lambda ctx, rng: {},
+    ("GET", "/test-ai"): lambda ctx, rng: {},
+    ("GET", "/metrics"): lambda ctx, rng: {},
+    ("POST", "/ocr"): lambda ctx, rng: {"data": ctx.image_form(rng.choice(["note_small.png", "prescription.jpg"]))},
+    ("POST", "/entry"): lambda ctx, rng: {"data": ctx.image_form(
+        "note_small.png", entry_type=rng.choice(["diary", "note"]), auto_analyze="true")},
+    ("GET", "/diaries"): lambda ctx, rng: {"params": {"limit": "20"}},
+    ("GET", "/diaries/{diary_id}"): lambda ctx, rng: {"path": f"/diaries/{ctx.record_id('diary', rng)}"},
+    ("GET", "/diaries/{diary_id}/image"): lambda ctx, rng: {
+        "path": f"/diaries/{ctx.diary_id}/image", "params": {"size": rng.choice(["thumb", "medium"])}},
+    ("GET", "/notes"): lambda ctx, rng: {"params": {"limit": "20"}},
+    ("GET", "/notes/{note_id}"): lambda ctx, rng: {"path": f"/notes/{ctx.record_id('note', rng)}"},
+    ("GET", "/reminders"): lambda ctx, rng: {"params": {"status": "pending"}},
+    ("GET", "/reminders/{reminder_id}"): lambda ctx, rng: {"path": f"/reminders/{ctx.reminder_id(rng)}"},
+    ("PUT", "/reminders/{reminder_id}/complete"): lambda ctx, rng: {
+        "path": f"/reminders/{ctx.reminder_id(rng)}/complete"},
+    ("POST", "/reminders/series"): lambda ctx, rng: {"json": {
+        "title": "Tập dưỡng sinh", "recurrence": {"freq": "weekly", "weekdays": [0, 2, 4], "times": ["06:00"]}}},
+    ("POST", "/reminders/series/medications"): lambda ctx, rng: {},
+    ("GET", "/profile"): lambda ctx, rng: {},
+    ("POST", "/profile"): lambda ctx, rng: {"json": datagen.Generator(1).profile()},
+    ("POST", "/health/log"): lambda ctx, rng: {"data": {
+        "log_type": "blood_pressure", "value": f"{rng.randint(110, 150)}/{rng.randint(70, 95)}", "note": "sáng"}},
+    ("GET", "/health/insights"): lambda ctx, rng: {},
+    ("GET", "/prompt"): lambda ctx, rng: {},
+    ("POST", "/chat"): lambda ctx, rng: {"json": {"message": "Hôm nay bà thấy hơi mệt"}},
+    ("POST", "/memory"): lambda ctx, rng: {"data": {"content": "Nhớ mùa gặt ở quê", "tags": "quê hương, tuổi thơ"}},
+    ("GET", "/memories"): lambda ctx, rng: {"params": [("limit", "20")] + rng.choice([
+        [], [("tag", "quê hương")], [("tag", "gia đình"), ("tag", "tết"), ("mode", "all")]])},
+    ("GET", "/memories/tags"): lambda ctx, rng: {},
+    ("GET", "/memories/{memory_id}"): lambda ctx, rng: {"path": f"/memories/{ctx.record_id('memory', rng)}"},
+    ("GET", "/search"): lambda ctx, rng: {"params": {"q": rng.choice(["uong thuoc", "huyết áp", "que huong", "tết"])}},
+    ("GET", "/timeline"): lambda ctx, rng: {"params": {"granularity": rng.choice(["day", "week"])}},
+    ("GET", "/digest"): lambda ctx, rng: {"params": {"date": (date.today() - timedelta(days=rng.randint(1, 7))).isoformat()}},
+    ("GET", "/admin/profiles"): lambda ctx, rng: {"headers": ADMIN_HEADERS},
+    ("GET", "/admin/profiles/{profile_id}"): lambda ctx, rng: {
+        "path": f"/admin/profiles/{ctx.profile_id}", "headers": ADMIN_HEADERS},
+    ("GET", "/admin/profiles/{profile_id}/flamegraph"): lambda ctx, rng: {
+        "path": f"/admin/profiles/{ctx.profile_id}/flamegraph", "headers": ADMIN_HEADERS},
+    ("GET", "/admin/llm-usage"): lambda ctx, rng: {"params": {"days": str(rng.choice([1, 7]))}, "headers": ADMIN_HEADERS},
+}
+
+def registered_routes() -> List[Tuple[str, str]]:
+    """Liệt kê (method, path) của mọi route API trong create_app()"""
+    sys.path.insert(0, str(REPO_ROOT))
+    from fastapi.routing import APIRoute
+    from app.app import create_app
+
+    routes = []
+    for route in create_app().routes:
+        if isinstance(route, APIRoute):
+            for method in sorted(route.methods):
+                routes.append((method, route.path))
+    return routes
+
+# ========== LOAD ==========
+
+async def setup_fixtures(base: str, ctx: Context):
+    """Tạo dữ liệu cần cho route có path param (nhật ký có ảnh, profile request)"""
+    import aiohttp
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{base}/entry", data=ctx.image_form(
+                "diary_page.png", entry_type="diary", auto_analyze="false")) as resp:
+            if resp.status == 200:
+                ctx.diary_id = (await resp.json())["diary_id"]
+        async with session.get(f"{base}/", headers={"X-Debug-Profile": ADMIN_TOKEN}) as resp:
+            await resp.read()
+            ctx.profile_id = resp.headers.get("X-Profile-Id")
+
+async def load_route(base: str, method: str, path: str, spec, ctx: Context,
+                     duration: float, concurrency: int, max_requests: int, revalidate: bool = False) -> Dict:
+    import aiohttp
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    stop_at = time.perf_counter() + duration
+    sent = 0
+    etags: Dict[str, str] = {}  # --revalidate: ETag lần trước theo URL + tham số (như app mobile làm mới màn hình)
+
+    async def worker(session, seed):
+        nonlocal sent
+        rng = random.Random(seed)
+        while time.perf_counter() < stop_at and sent < max_requests:
+            sent += 1
+            kwargs = spec(ctx, rng)
+            url = base + kwargs.pop("path", path)
+            cache_key = f"{url}?{kwargs.get('params')}"
+            if revalidate and method == "GET" and cache_key in etags:
+                kwargs["headers"] = {**kwargs.get("headers", {}), "If-None-Match": etags[cache_key]}
+            start = time.perf_counter()
+            try:
+                async with session.request(method, url, **kwargs) as resp:
+                    await resp.read()
+                    status = resp.status
+                    if revalidate and resp.headers.get("ETag"):
+                        etags[cache_key] = resp.headers["ETag"]
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                status = "error"
+            statuses[str(status)] += 1
+            if isinstance(status, int) and status < 400:
+                latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency), timeout=timeout) as session:
+        await asyncio.gather(*[worker(session, i) for i in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    result = {"route": f"{method} {path}"}
+    result.update(latency_summary(latencies, elapsed))
+    result["statuses"] = dict(statuses)
+    result["error_rate"] = round(1 - len(latencies) / max(sum(statuses.values()), 1), 4)
+    return result
+
+async def run_all(base: str, routes, ctx: Context, args) -> List[Dict]:
+    await setup_fixtures(base, ctx)
+    results = []
+    for method, path in routes:
+        spec = ROUTE_SPECS.get((method, path))
+        if spec is None:
+            results.append({"route": f"{method} {path}", "skipped": "no request spec"})
+            continue
+        result = await load_route(base, method, path, spec, ctx, args.duration, args.concurrency, args.max_requests,
+                                  args.revalidate)
+        results.append(result)
+        print(f"{result['route']:<50} p50={result['p50_ms']} p95={result['p95_ms']} p99={result['p99_ms']} "
+              f"rps={result['throughput_rps']} statuses={result['statuses']}", file=sys.stderr)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=list(datagen.SCALES), default="1k")
+    parser.add_argument("--count", type=int, help="Số bản ghi mỗi collection (ghi đè --scale)")
+    parser.add_argument("--duration", type=float, default=5.0, help="Giây tải cho mỗi route")
+    parser.add_argument("--max-requests", type=int, default=10_000, help="Số request tối đa mỗi route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--routes", nargs="*", help="Chỉ chạy các path này (vd. /diaries /chat)")
+    parser.add_argument("--groq-latency-ms", type=float, default=200.0)
+    parser.add_argument("--groq-tail", type=float, default=0.5)
+    parser.add_argument("--groq-error-rate", type=float, default=0.0)
+    parser.add_argument("--groq-429-rate", type=float, default=0.0)
+    parser.add_argument("--stub-ocr", action="store_true", help="Không gọi tesseract")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="GET gửi lại ETag lần trước (If-None-Match), đo trường hợp làm mới khi dữ liệu không đổi")
+    parser.add_argument("--out", type=Path, help="File JSON kết quả (mặc định in ra stdout)")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.stub_ocr)
+        return
+
+    count = args.count or datagen.SCALES[args.scale]
+    routes = registered_routes()
+    if args.routes:
+        routes = [r for r in routes if r[1] in args.routes]
+
+    groq_config = fake_groq.FakeGroqConfig(args.groq_latency_ms, args.groq_tail, args.groq_error_rate,
+                                           args.groq_429_rate, seed=1)
+    groq_url = fake_groq.start_in_thread(groq_config, free_port())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        datagen.generate(workdir / "storage", count)
+        images.generate(workdir / "images")
+
+        port = free_port()
+        proc = start_server(workdir, port, groq_url, args.stub_ocr)
+        try:
+            wait_until_ready(port)
+            ctx = Context(workdir / "images", count)
+            results = asyncio.run(run_all(f"http://127.0.0.1:{port}", routes, ctx, args))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    report = {
+        "meta": {
+            "kind": "driver",
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "records_per_collection": count,
+            "duration_per_route_s": args.duration,
+            "concurrency": args.concurrency,
+            "stub_ocr": args.stub_ocr,
+            "fake_groq": {"latency_ms": args.groq_latency_ms, "tail": args.groq_tail,
+                          "error_rate": args.groq_error_rate, "rate_429": args.groq_429_rate,
+                          "responses": dict(groq_config.stats)}
+        },
+        "routes": results
+    }
+    if args.out:
+        write_json(args.out, report)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Fake Groq server (aiohttp) thay cho GROQ_API_URL khi benchmark
+
+Trả lời theo định dạng OpenAI chat completions (có khối usage), nội dung hợp lệ
+với từng loại prompt (JSON khi phân tích ghi chú, một từ khi phân tích cảm xúc...).
+Có thể bơm thêm độ trễ (phân phối log-normal, đuôi dài), lỗi 5xx (chung hoặc theo model) và 429.
+Khi phát lại trace (replay.py), phản hồi và độ trễ lấy từ các lần gọi Groq đã ghi.
+
+Cách chạy:
+    python bench/fake_groq.py --port 9100 --latency-ms 300 --tail 0.6 --error-rate 0.01 --rate-429 0.05
+    GROQ_API_URL=http://127.0.0.1:9100/openai/v1/chat/completions GROQ_API_KEY=bench python main.py
+
+GET /stats trả về số request đã nhận theo kết quả.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from common import REPO_ROOT
+sys.path.insert(0, str(REPO_ROOT))
+from app.capture import llm_key, system_key
+
+CHAT_PATH = "/openai/v1/chat/completions"
+
+class RecordedResponses:
+    """
+    Phản hồi Groq đã ghi trong trace (app/capture.py)
+
+    Tra theo toàn bộ messages; nếu prompt khác (dữ liệu lúc phát lại khác lúc ghi)
+    thì dùng lần lượt các phản hồi đã ghi cho cùng system prompt.
+    """
+
+    def __init__(self, exchanges: List[Dict]):
+        self.by_key: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
+        self.by_system: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
+        for exchange in exchanges:
+            entry = (exchange["content"], exchange.get("latency_ms", 0.0))
+            self.by_key[exchange["key"]].append(entry)
+            self.by_system[exchange["system_key"]].append(entry)
+        self._cursor: Counter = Counter()
+
+    def _next(self, table: Dict[str, List], key: str) -> Optional[Tuple[str, float]]:
+        entries = table.get(key)
+        if not entries:
+            return None
+        entry = entries[self._cursor[key] % len(entries)]
+        self._cursor[key] += 1
+        return entry
+
+    def lookup(self, messages: List[Dict]) -> Tuple[Optional[Tuple[str, float]], str]:
+        """Trả về ((nội dung, latency_ms) hoặc None, nguồn phản hồi)"""
+        entry = self._next(self.by_key, llm_key(messages))
+        if entry:
+            return entry, "recorded"
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        entry = self._next(self.by_system, system_key(system))
+        return entry, "recorded_fallback" if entry else "synthetic"
+
+@dataclass
+class FakeGroqConfig:
+    latency_ms: float = 200.0   # Trung vị độ trễ
+    tail: float = 0.5           # Độ lệch chuẩn của log-normal (0 = cố định)
+    error_rate: float = 0.0     # Tỉ lệ trả 500
+    rate_429: float = 0.0       # Tỉ lệ trả 429
+    retry_after: float = 0.2    # Giá trị header Retry-After cho 429
+    seed: Optional[int] = None
+    recorded: Optional[RecordedResponses] = None  # Phát lại phản hồi đã ghi thay cho nội dung giả
+    recorded_latency: bool = True  # Dùng độ trễ đã ghi thay cho latency_ms/tail
+    capacity: int = 0           # Số request xử lý cùng lúc tối đa, phần dư xếp hàng (0 = không giới hạn)
+    model_errors: Dict[str, float] = field(default_factory=dict)  # Tỉ lệ trả 500 riêng theo model (thay error_rate)
+    stats: Counter = field(default_factory=Counter)
+
+def _reply_for(messages) -> str:
+    """Nội dung trả lời hợp lệ với từng loại prompt của AIService"""
+    prompt = messages[-1]["content"] if messages else ""
+    if '"category"' in prompt:
+        return json.dumps({
+            "category": "medication",
+            "extracted_datetime": "2030-01-01 08:00",
+            "priority": "high",
+            "should_create_reminder": True,
+            "reminder_suggestion": "Uống thuốc huyết áp",
+            "analysis": "Ghi chú về lịch uống thuốc"
+        }, ensure_ascii=False)
+    if "CHỈ MỘT TỪ" in prompt:
+        return "vui_vẻ"
+    if "TÓM TẮT NGÀY" in prompt:
+        return "Hôm qua bà vui vẻ, đi dạo buổi sáng và uống thuốc đúng giờ. Huyết áp ổn định. Ngày mai nên hỏi thăm bà về buổi gặp bạn cũ."
+    if "Tóm tắt" in prompt:
+        return "Hôm nay bà có một ngày vui vẻ bên con cháu."
+    return "Dạ, cháu nghe bà kể đây ạ. Hôm nay bà thấy trong người thế nào ạ?"
+
+def _approx_tokens(text: str) -> int:
+    return max(len(text) // 4, 1)
+
+def create_app(config: FakeGroqConfig) -> web.Application:
+    rng = random.Random(config.seed)
+    capacity = asyncio.Semaphore(config.capacity) if config.capacity else None
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        if capacity is None:
+            return await complete(request)
+        async with capacity:
+            return await complete(request)
+
+    async def complete(request: web.Request) -> web.Response:
+        body = await request.json()
+        messages = body.get("messages", [])
+        recorded = None
+        if config.recorded:
+            recorded, source = config.recorded.lookup(messages)
+            config.stats[source] += 1
+        if recorded and config.recorded_latency:
+            delay = recorded[1] / 1000
+        else:
+            delay = config.latency_ms / 1000 * (math.exp(rng.gauss(0, config.tail)) if config.tail else 1)
+        await asyncio.sleep(delay)
+
+        roll = rng.random()
+        if roll < config.rate_429:
+            config.stats["429"] += 1
+            return web.json_response({"error": {"message": "Rate limit reached"}}, status=429,
+                                     headers={"Retry-After": str(config.retry_after)})
+        if roll < config.rate_429 + config.model_errors.get(body.get("model"), config.error_rate):
+            config.stats["500"] += 1
+            return web.json_response({"error": {"message": "Internal error"}}, status=500)
+
+        content = recorded[0] if recorded else _reply_for(messages)
+        prompt_tokens = sum(_approx_tokens(m.get("content", "")) for m in messages)
+        completion_tokens = min(_approx_tokens(content), body.get("max_tokens") or 1000)
+        config.stats["200"] += 1
+        return web.json_response({
+            "id": f"chatcmpl-fake-{sum(config.stats.values())}",
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(dict(config.stats))
+
+    app = web.Application()
+    app.router.add_post(CHAT_PATH, chat_completions)
+    app.router.add_get("/stats", stats)
+    return app
+
+def start_in_thread(config: FakeGroqConfig, port: int) -> str:
+    """Chạy fake server trong thread nền, trả về URL dùng cho GROQ_API_URL"""
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(create_app(config))
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="fake-groq", daemon=True).start()
+    ready.wait(10)
+    return f"http://127.0.0.1:{port}{CHAT_PATH}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--tail", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--capacity", type=int, default=0, help="Số request xử lý cùng lúc (0 = không giới hạn)")
+    parser.add_argument("--model-error", action="append", default=[], metavar="MODEL=RATE",
+                        help="Tỉ lệ lỗi 500 riêng cho một model (vd. llama-3.1-8b-instant=1.0)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = FakeGroqConfig(args.latency_ms, args.tail, args.error_rate, args.rate_429, args.retry_after, args.seed,
+                            capacity=args.capacity,
+                            model_errors={m: float(r) for m, r in (item.split("=", 1) for item in args.model_error)})
+    print(f"Fake Groq: http://127.0.0.1:{args.port}{CHAT_PATH}")
+    web.run_app(create_app(config), host="127.0.0.1", port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
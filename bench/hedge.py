@@ -0,0 +1,106 @@
+"""
+Benchmark: hedging khi gọi Groq (AIService.call_groq_api) với latency đuôi dài
+
+Các bước:
+1. Chạy fake Groq (fake_groq.py) với latency log-normal (--latency-ms, --tail)
+2. Gọi call_groq_api --requests lần với --concurrency luồng song song, lần lượt tắt và bật hedging
+3. Báo cáo p50/p95/p99/p99.9, số request thực gửi tới Groq (tỉ lệ gửi thêm) và các metric groq_hedge*
+
+Cách chạy:
+    python bench/hedge.py --requests 3000 --concurrency 16 --latency-ms 50 --tail 1.0 --out hedge.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from common import REPO_ROOT, free_port, git_commit, latency_summary, write_json
+
+async def run_calls(requests: int, concurrency: int):
+    from app.services.ai_service import AIService
+
+    latencies = []
+    failures = 0
+    cursor = iter(range(requests))
+
+    async def worker():
+        nonlocal failures
+        for _ in cursor:
+            start = time.perf_counter()
+            content = await AIService.call_groq_api("Hôm nay bà thấy hơi mệt", "Bạn là trợ lý AI thân thiện.")
+            latencies.append(time.perf_counter() - start)
+            failures += content is None
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    summary = latency_summary(latencies, time.perf_counter() - start)
+    summary["p999_ms"] = round(sorted(latencies)[max(int(len(latencies) * 0.999) - 1, 0)] * 1000, 3)
+    summary["failures"] = failures
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--tail", type=float, default=1.0)
+    parser.add_argument("--percentile", type=float, default=95.0, help="GROQ_HEDGE_PERCENTILE")
+    parser.add_argument("--budget", type=float, default=0.05, help="GROQ_HEDGE_BUDGET")
+    parser.add_argument("--seed", type=int, default=3)
+    parser.add_argument("--out", type=Path, help="File JSON kết quả (mặc định in ra stdout)")
+    args = parser.parse_args()
+
+    # Cấu hình phải có trước khi import app (app.config đọc env lúc import)
+    port = free_port()
+    os.environ.update(
+        GROQ_API_URL=f"http://127.0.0.1:{port}/openai/v1/chat/completions", GROQ_API_KEY="bench",
+        LLM_SLOTS=str(args.concurrency * 4), GROQ_HEDGE_PERCENTILE=str(args.percentile),
+        GROQ_HEDGE_BUDGET=str(args.budget)
+    )
+    sys.path.insert(0, str(REPO_ROOT))
+    import fake_groq
+    from app.metrics import render_metrics
+    from app.services.hedging import GROQ_HEDGE
+
+    config = fake_groq.FakeGroqConfig(args.latency_ms, args.tail, seed=args.seed)
+    fake_groq.start_in_thread(config, port)
+
+    runs = {}
+    for name, enabled in (("off", False), ("on", True)):
+        GROQ_HEDGE.enabled = enabled
+        sent_before = sum(config.stats.values())
+        result = asyncio.run(run_calls(args.requests, args.concurrency))
+        result.pop("histogram")
+        result["groq_requests"] = sum(config.stats.values()) - sent_before
+        result["extra_request_ratio"] = round(result["groq_requests"] / args.requests - 1, 4)
+        runs[name] = result
+
+    runs["on"]["hedge_metrics"] = {
+        line.split(" ")[0]: float(line.split(" ")[1])
+        for line in render_metrics().splitlines()
+        if line.startswith(("groq_hedges_total", "groq_hedge_saved_seconds_sum", "groq_hedge_saved_seconds_count"))
+    }
+    report = {
+        "meta": {
+            "kind": "hedge",
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "fake_groq": {"latency_ms": args.latency_ms, "tail": args.tail},
+            "percentile": args.percentile,
+            "budget": args.budget
+        },
+        "runs": runs
+    }
+    if args.out:
+        write_json(args.out, report)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
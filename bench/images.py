@@ -0,0 +1,116 @@
+"""
+Sinh bộ ảnh mẫu cho OCR: chữ tiếng Việt trên nền giấy, nhiều kích thước/định dạng
+
+Ảnh được sinh lúc chạy (không commit file nhị phân vào repo):
+- note_small.png:    ghi chú ngắn, 800x600
+- prescription.jpg:  đơn thuốc nhiều dòng, 1600x2200
+- photo_large.jpg:   ảnh chụp điện thoại 4000x3000, có nhiễu và xoay nhẹ
+- diary_page.png:    trang nhật ký dài
+- blank.png:         ảnh không có chữ (OCR trả rỗng -> 400)
+
+Cách chạy:
+    python bench/images.py --out /tmp/bench_images
+"""
+import argparse
+import json
+import random
+from pathlib import Path
+from typing import Dict, List
+
+FONT_CANDIDATES = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf"
+]
+
+TEXTS = {
+    "note": ["Uống thuốc huyết áp lúc 8 giờ sáng", "Amlodipin 5mg - 1 viên sau ăn"],
+    "prescription": [
+        "ĐƠN THUỐC",
+        "Họ tên: Nguyễn Thị Hoa    Tuổi: 78",
+        "Chẩn đoán: Tăng huyết áp, tiểu đường type 2",
+        "1. Amlodipin 5mg  x 30 viên - sáng 1 viên",
+        "2. Metformin 500mg x 60 viên - sáng 1, tối 1",
+        "3. Aspirin 81mg   x 30 viên - trưa 1 viên",
+        "Tái khám: thứ Hai, ngày 15/12/2025 lúc 9 giờ",
+        "Kiêng mặn, hạn chế đồ ngọt"
+    ],
+    "diary": [
+        "Ngày 20 tháng 11",
+        "Hôm nay trời se lạnh, bà dậy sớm tập dưỡng sinh ở công viên.",
+        "Con gái gọi điện hỏi thăm, cháu Minh được điểm mười môn toán.",
+        "Buổi chiều hàng xóm sang chơi cờ tướng, nói chuyện ngày xưa",
+        "hồi còn ở quê, mùa gặt lúa chín vàng cả cánh đồng.",
+        "Tối ăn canh chua cá lóc, nhớ mẹ nấu ngày trước.",
+        "Ngủ sớm, mai đi khám lại huyết áp."
+    ]
+}
+
+def _font(size: int):
+    from PIL import ImageFont
+    for path in FONT_CANDIDATES:
+        if Path(path).exists():
+            return ImageFont.truetype(path, size)
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+def _render(lines: List[str], size, font_size: int, background=(250, 248, 240)):
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", size, background)
+    draw = ImageDraw.Draw(image)
+    font = _font(font_size)
+    y = font_size * 2
+    for line in lines:
+        draw.text((font_size * 2, y), line, fill=(20, 20, 30), font=font)
+        y += int(font_size * 1.6)
+    return image
+
+def _add_noise(image, amount: int, seed: int = 7):
+    """Nhiễu hạt giống ảnh chụp điện thoại"""
+    from PIL import Image
+    rng = random.Random(seed)
+    noise = Image.effect_noise(image.size, amount).convert("RGB")
+    return Image.blend(image, noise, 0.12 + rng.random() * 0.03)
+
+def generate(out_dir: Path) -> Dict[str, Dict]:
+    """Sinh bộ ảnh mẫu, trả về {tên file: {bytes, kích thước, text gốc}}"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    specs = {}
+
+    image = _render(TEXTS["note"], (800, 600), 36)
+    image.save(out_dir / "note_small.png")
+    specs["note_small.png"] = TEXTS["note"]
+
+    image = _render(TEXTS["prescription"], (1600, 2200), 48)
+    image.save(out_dir / "prescription.jpg", quality=90)
+    specs["prescription.jpg"] = TEXTS["prescription"]
+
+    image = _add_noise(_render(TEXTS["diary"], (4000, 3000), 90, background=(235, 230, 215)), 40)
+    image = image.rotate(2.5, expand=False, fillcolor=(235, 230, 215))
+    image.save(out_dir / "photo_large.jpg", quality=92)
+    specs["photo_large.jpg"] = TEXTS["diary"]
+
+    image = _render(TEXTS["diary"], (1800, 1400), 40)
+    image.save(out_dir / "diary_page.png")
+    specs["diary_page.png"] = TEXTS["diary"]
+
+    image = _render([], (600, 400), 20)
+    image.save(out_dir / "blank.png")
+    specs["blank.png"] = []
+
+    return {
+        name: {"bytes": (out_dir / name).stat().st_size, "lines": lines}
+        for name, lines in specs.items()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", type=Path, required=True)
+    args = parser.parse_args()
+    print(json.dumps(generate(args.out), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
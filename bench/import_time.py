@@ -0,0 +1,72 @@
+"""
+Benchmark: Thời gian khởi động (import app + create_app)
+
+Mỗi lần đo chạy trong một process Python mới để giống cold start thật:
+- framework_ms: import fastapi (phần không phụ thuộc code của app)
+- app_ms: import app + create_app() sau khi fastapi đã được import
+- heavy_modules: các module nặng bị nạp trong lúc khởi động (phải rỗng)
+
+Thoát với mã 1 nếu trung vị app_ms vượt --budget-ms hoặc có module nặng bị nạp,
+để dùng làm chốt chặn trong CI.
+
+Cách chạy:
+    python bench/import_time.py --runs 7 --budget-ms 150
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Các module chỉ được nạp khi thực sự cần (OCR, ảnh, gọi AI, ngrok, notebook, tìm kiếm)
+HEAVY_MODULES = ["pytesseract", "PIL", "aiohttp", "pyngrok", "nest_asyncio", "dotenv", "uvicorn", "numpy"]
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+import fastapi, fastapi.responses
+t1 = time.perf_counter()
+import app
+app.create_app()
+t2 = time.perf_counter()
+print(json.dumps({{
+    "framework_ms": (t1 - t0) * 1000,
+    "app_ms": (t2 - t1) * 1000,
+    "heavy_modules": [m for m in {heavy!r} if m in sys.modules]
+}}))
+"""
+
+def measure_once(workdir: str) -> dict:
+    code = PROBE.format(root=str(REPO_ROOT), heavy=HEAVY_MODULES)
+    out = subprocess.run([sys.executable, "-c", code], cwd=workdir, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="Ngân sách cho app_ms (trung vị)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        runs = [measure_once(workdir) for _ in range(args.runs)]
+
+    heavy = sorted({m for r in runs for m in r["heavy_modules"]})
+    result = {
+        "runs": args.runs,
+        "framework_ms_median": round(statistics.median(r["framework_ms"] for r in runs), 1),
+        "app_ms_median": round(statistics.median(r["app_ms"] for r in runs), 1),
+        "app_ms_max": round(max(r["app_ms"] for r in runs), 1),
+        "budget_ms": args.budget_ms,
+        "heavy_modules": heavy
+    }
+    result["ok"] = result["app_ms_median"] <= args.budget_ms and not heavy
+    print(json.dumps(result))
+    sys.exit(0 if result["ok"] else 1)
+
+if __name__ == "__main__":
+    main()
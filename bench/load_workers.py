@@ -0,0 +1,133 @@
+"""
+Load test: Throughput (requests/giây) theo số worker
+
+Chạy server thật (start_server) với 1, 2, 4... worker trên một storage mẫu,
+bắn hỗn hợp request đọc (/diaries, /notes, /reminders) và ghi (/memory),
+rồi kiểm tra không mất bản ghi nào khi nhiều worker cùng ghi một file.
+
+Cách chạy:
+    python bench/load_workers.py --workers 1 2 4 --duration 10 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import REPO_ROOT, free_port, latency_summary, wait_until_ready
+
+READ_PATHS = ["/diaries?limit=20", "/notes?limit=20", "/reminders?status=all"]
+
+def seed_storage(storage_dir: Path, records: int):
+    """Tạo storage mẫu: diaries, notes, reminders"""
+    storage_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(42)
+    words = "hôm nay trời đẹp bà đi chợ mua rau cháu về thăm uống thuốc huyết áp khám bệnh".split()
+
+    def text(n):
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    diaries = [{
+        "id": f"diary_{i}", "content": text(80), "summary": text(20), "emotion": "vui_vẻ",
+        "entry_type": "diary", "created_at": f"2025-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}.{i:06d}"
+    } for i in range(records)]
+    notes = [{
+        "id": f"note_{i}", "content": text(30), "category": "medication", "extracted_datetime": None,
+        "priority": "high", "is_reminder": True, "created_at": f"2025-01-01T00:00:00.{i:06d}"
+    } for i in range(records)]
+    reminders = [{
+        "id": f"reminder_{i}", "note_id": f"note_{i}", "title": text(3), "description": text(10),
+        "remind_at": f"2025-02-01T08:00:00.{i:06d}", "is_completed": i % 3 == 0,
+        "created_at": f"2025-01-01T00:00:00.{i:06d}"
+    } for i in range(records)]
+
+    for name, data in [("diaries.json", diaries), ("notes.json", notes), ("reminders.json", reminders)]:
+        with open(storage_dir / name, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+async def drive(port: int, duration: float, concurrency: int, write_ratio: float) -> dict:
+    import aiohttp
+
+    base = f"http://127.0.0.1:{port}"
+    latencies = []
+    errors = 0
+    writes_ok = 0
+    stop_at = time.perf_counter() + duration
+
+    async def worker(session, seed):
+        nonlocal errors, writes_ok
+        rng = random.Random(seed)
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                if rng.random() < write_ratio:
+                    async with session.post(f"{base}/memory", data={"content": "bench", "tags": "bench"}) as resp:
+                        await resp.read()
+                        ok = resp.status == 200
+                        writes_ok += ok
+                else:
+                    async with session.get(base + rng.choice(READ_PATHS)) as resp:
+                        await resp.read()
+                        ok = resp.status == 200
+            except aiohttp.ClientError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*[worker(session, i) for i in range(concurrency)])
+
+    summary = latency_summary(latencies, duration)
+    return {
+        "requests": summary["count"],
+        "errors": errors,
+        "writes_ok": writes_ok,
+        "rps": summary["throughput_rps"],
+        "p50_ms": summary["p50_ms"],
+        "p99_ms": summary["p99_ms"]
+    }
+
+def run(workers: int, args) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        seed_storage(Path(workdir) / "storage", args.records)
+        env = dict(os.environ, PYTHONPATH=str(REPO_ROOT), GROQ_API_KEY="", NGROK_TOKEN="")
+        code = f"from app.server import start_server; start_server(port={port}, ngrok_token=None, workers={workers})"
+        proc = subprocess.Popen([sys.executable, "-c", code], cwd=workdir, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_ready(port)
+            time.sleep(1.0 if workers > 1 else 0.2)  # Chờ mọi worker sẵn sàng
+            result = asyncio.run(drive(port, args.duration, args.concurrency, args.write_ratio))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+        with open(Path(workdir) / "storage" / "memories.json", encoding="utf-8") as f:
+            stored = len(json.load(f))
+
+    result.update({"workers": workers, "memories_stored": stored, "lost_writes": result["writes_ok"] - stored})
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--write-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        print(json.dumps(run(workers, args)))
+
+if __name__ == "__main__":
+    main()
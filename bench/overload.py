@@ -0,0 +1,172 @@
+"""
+Benchmark: hành vi khi quá tải (admission control) - tải open-loop vượt năng lực xử lý
+
+Các bước:
+1. Sinh storage giả (datagen.py) và ảnh mẫu (images.py)
+2. Chạy fake Groq với --groq-capacity request cùng lúc (mô phỏng giới hạn đồng thời của nhà cung cấp)
+3. Với mỗi cấu hình ("limited": giới hạn mặc định trong config, "unlimited": slot/hàng đợi rất lớn),
+   chạy server thật và bắn request theo phân phối Poisson với tốc độ --rate req/s trong --duration giây
+   (open-loop: không chờ phản hồi mới gửi tiếp, giống người dùng thật khi hệ thống chậm)
+4. Hỗn hợp route: /reminders/{id}/complete (critical), /chat (interactive), /entry có phân tích AI (batch)
+5. Theo từng lớp: số request, số 503, goodput (thành công trong --slo-ms mỗi giây), p50/p99 của request thành công
+
+Kỳ vọng: "unlimited" để mọi request cùng xếp hàng nên cùng chậm (p99 vượt SLO, goodput thấp),
+"limited" từ chối sớm phần dư (503 + Retry-After), request được nhận vẫn trong SLO, nhắc nhở không bị ảnh hưởng.
+
+Cách chạy:
+    python bench/overload.py --rate 60 --duration 20 --groq-capacity 4 --stub-ocr --out overload.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+from common import free_port, git_commit, latency_summary, wait_until_ready, write_json
+from driver import Context, start_server
+import datagen
+import fake_groq
+import images
+
+# Lớp -> (method, path mẫu, tỉ lệ)
+MIX = {
+    "critical": ("PUT", "/reminders/{reminder_id}/complete", 0.2),
+    "interactive": ("POST", "/chat", 0.5),
+    "batch": ("POST", "/entry", 0.3),
+}
+
+UNLIMITED_ENV = {
+    "OCR_SLOTS": "10000", "OCR_QUEUE_SIZE": "10000",
+    "LLM_SLOTS": "10000", "LLM_QUEUE_SIZE": "10000",
+    "STORAGE_WRITE_SLOTS": "10000", "STORAGE_WRITE_QUEUE_SIZE": "10000",
+    "ADMISSION_MAX_WAIT": "3600",
+}
+
+def request_kwargs(kind: str, ctx: Context, rng: random.Random) -> Dict:
+    if kind == "critical":
+        return {"path": f"/reminders/{ctx.reminder_id(rng)}/complete"}
+    if kind == "interactive":
+        return {"path": "/chat", "json": {"message": "Hôm nay bà thấy hơi mệt"}}
+    return {"path": "/entry", "data": ctx.image_form("note_small.png", entry_type="diary", auto_analyze="true")}
+
+async def open_loop(base: str, ctx: Context, args) -> Dict:
+    """Bắn request theo quá trình Poisson, trả về kết quả theo lớp"""
+    import aiohttp
+
+    rng = random.Random(args.seed)
+    kinds = list(MIX)
+    weights = [MIX[kind][2] for kind in kinds]
+    results: Dict[str, List] = {kind: [] for kind in kinds}  # (status, giây, retry_after)
+
+    async def fire(session, kind: str):
+        method = MIX[kind][0]
+        kwargs = request_kwargs(kind, ctx, rng)
+        path = kwargs.pop("path")
+        start = time.perf_counter()
+        retry_after = None
+        try:
+            async with session.request(method, base + path, **kwargs) as resp:
+                await resp.read()
+                status = resp.status
+                retry_after = resp.headers.get("Retry-After")
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status = 0
+        results[kind].append((status, time.perf_counter() - start, retry_after))
+
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+    tasks = []
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        start = time.perf_counter()
+        next_at = start
+        while next_at - start < args.duration:
+            await asyncio.sleep(max(next_at - time.perf_counter(), 0))
+            kind = rng.choices(kinds, weights=weights)[0]
+            tasks.append(asyncio.create_task(fire(session, kind)))
+            next_at += rng.expovariate(args.rate)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    slo = args.slo_ms / 1000
+    report = {}
+    for kind, samples in results.items():
+        ok = [seconds for status, seconds, _ in samples if 200 <= status < 300]
+        rejected = [(seconds, retry_after) for status, seconds, retry_after in samples if status == 503]
+        summary = latency_summary(ok, elapsed)
+        summary.pop("histogram")
+        report[kind] = {
+            "sent": len(samples),
+            "ok": len(ok),
+            "rejected_503": len(rejected),
+            "other_errors": len(samples) - len(ok) - len(rejected),
+            "goodput_rps": round(sum(1 for seconds in ok if seconds <= slo) / args.duration, 2),
+            "rejected_p99_ms": latency_summary([seconds for seconds, _ in rejected], elapsed)["p99_ms"],
+            "retry_after_max_s": max((int(r) for _, r in rejected if r), default=None),
+            "ok_latency": summary
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=60.0, help="Số request mỗi giây (Poisson)")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--count", type=int, default=1000, help="Số bản ghi mỗi collection")
+    parser.add_argument("--slo-ms", type=float, default=3000.0, help="Request thành công chậm hơn mức này không tính vào goodput")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Timeout phía client (giây)")
+    parser.add_argument("--groq-latency-ms", type=float, default=200.0)
+    parser.add_argument("--groq-tail", type=float, default=0.3)
+    parser.add_argument("--groq-capacity", type=int, default=4, help="Số request fake Groq xử lý cùng lúc")
+    parser.add_argument("--configs", nargs="*", default=["limited", "unlimited"], choices=["limited", "unlimited"])
+    parser.add_argument("--stub-ocr", action="store_true", help="Không gọi tesseract")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, help="File JSON kết quả (mặc định in ra stdout)")
+    args = parser.parse_args()
+
+    runs = {}
+    for name in args.configs:
+        groq_config = fake_groq.FakeGroqConfig(args.groq_latency_ms, args.groq_tail, seed=1,
+                                               capacity=args.groq_capacity)
+        groq_url = fake_groq.start_in_thread(groq_config, free_port())
+        with tempfile.TemporaryDirectory() as tmp:
+            workdir = Path(tmp)
+            datagen.generate(workdir / "storage", args.count)
+            images.generate(workdir / "images")
+
+            port = free_port()
+            proc = start_server(workdir, port, groq_url, args.stub_ocr,
+                                extra_env=UNLIMITED_ENV if name == "unlimited" else None)
+            try:
+                wait_until_ready(port)
+                ctx = Context(workdir / "images", args.count)
+                runs[name] = asyncio.run(open_loop(f"http://127.0.0.1:{port}", ctx, args))
+            finally:
+                proc.terminate()
+                proc.wait()
+        runs[name]["groq_responses"] = dict(groq_config.stats)
+        print(f"Xong cấu hình {name}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "kind": "overload",
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "rate_rps": args.rate,
+            "duration_s": args.duration,
+            "slo_ms": args.slo_ms,
+            "mix": {kind: spec[2] for kind, spec in MIX.items()},
+            "fake_groq": {"latency_ms": args.groq_latency_ms, "tail": args.groq_tail, "capacity": args.groq_capacity}
+        },
+        "runs": runs
+    }
+    if args.out:
+        write_json(args.out, report)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Phát lại traffic thật đã ghi (CAPTURE_TRAFFIC=1, app/capture.py) vào server local
+
+- Giữ nguyên khoảng cách thời gian giữa các request, nhân tốc độ theo --speed
+  (1 = như thật, 10 = nhanh gấp 10, 0 = nhanh nhất có thể với --concurrency)
+- Groq được thay bằng fake_groq.py phát lại đúng phản hồi (và độ trễ) đã ghi,
+  nên hai lần chạy trên cùng trace + cùng storage ban đầu cho kết quả tất định
+- Storage ban đầu: bản sao --storage (snapshot lúc bắt đầu ghi) hoặc dữ liệu sinh bởi datagen.py
+- Gửi lại header đã ghi (có X-Request-Timeout); trace không chứa token, chỉ user id của từng request:
+  gửi lại trong X-User-Id, hoặc với --tenant-secret thì ký lại thành X-User-Token (server chạy cùng secret)
+
+Kết quả cùng định dạng với driver.py, so sánh hai lần chạy bằng compare.py:
+    CAPTURE_TRAFFIC=1 python main.py                       # ghi vào storage/captures/
+    python bench/replay.py storage/captures --speed 10 --storage snapshot/ --out before.json
+    python bench/replay.py storage/captures --speed 10 --storage snapshot/ --out after.json
+    python bench/compare.py before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from common import REPO_ROOT, free_port, git_commit, latency_summary, wait_until_ready, write_json
+import datagen
+import fake_groq
+from driver import start_server
+
+TENANT_HEADER = "x-user-id"
+TENANT_TOKEN_HEADER = "x-user-token"
+
+def load_trace(trace: Path) -> List[Dict]:
+    """Đọc một file trace hoặc mọi trace_*.jsonl trong thư mục, sắp theo thời điểm nhận"""
+    files = sorted(trace.glob("trace_*.jsonl")) if trace.is_dir() else [trace]
+    records = []
+    for path in files:
+        with open(path, encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+class RequestBuilder:
+    """Dựng lại request aiohttp từ bản ghi trace (file upload đọc từ blobs/, có cache)"""
+
+    def __init__(self, blob_dir: Path, tenant_secret: Optional[str] = None):
+        self.blob_dir = blob_dir
+        self.tenant_secret = tenant_secret
+        self._blobs: Dict[str, bytes] = {}
+        self._tokens: Dict[str, str] = {}
+
+    def tenant_headers(self, user_id: str) -> Dict[str, str]:
+        """Header tenant cho user id: token ký lại bằng --tenant-secret, không có secret thì X-User-Id"""
+        if not self.tenant_secret:
+            return {TENANT_HEADER: user_id}
+        if user_id not in self._tokens:
+            sys.path.insert(0, str(REPO_ROOT))
+            from app.tenancy import sign_tenant
+            self._tokens[user_id] = sign_tenant(user_id, self.tenant_secret)
+        return {TENANT_TOKEN_HEADER: self._tokens[user_id]}
+
+    def blob(self, digest: str) -> bytes:
+        if digest not in self._blobs:
+            self._blobs[digest] = (self.blob_dir / digest).read_bytes()
+        return self._blobs[digest]
+
+    def build(self, record: Dict) -> Dict:
+        import aiohttp
+
+        # Mọi header đã ghi (deadline, Idempotency-Key...) được gửi lại nguyên vẹn, cộng header tenant
+        headers = dict(record.get("headers", {}))
+        if record.get("user_id"):
+            headers.update(self.tenant_headers(record["user_id"]))
+        kwargs = {"headers": headers}
+        body = record.get("body")
+        if body is None:
+            return kwargs
+        if "parts" in body:
+            # aiohttp tự sinh boundary mới
+            headers.pop("content-type", None)
+            form = aiohttp.FormData()
+            for part in body["parts"]:
+                if "blob" in part:
+                    form.add_field(part["name"], self.blob(part["blob"]),
+                                   filename=part["filename"], content_type=part["content_type"])
+                else:
+                    form.add_field(part["name"], part["value"])
+            kwargs["data"] = form
+        elif "text" in body:
+            kwargs["data"] = body["text"].encode("utf-8")
+        else:
+            kwargs["data"] = self.blob(body["blob"])
+        return kwargs
+
+async def replay(base: str, records: List[Dict], builder: RequestBuilder, speed: float, concurrency: int) -> Dict:
+    import aiohttp
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+    mismatches: Counter = Counter()
+    lag: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    first_ts = records[0]["ts"]
+
+    async def send(session, record, started):
+        route = f"{record['method']} {record.get('route') or record['path']}"
+        if speed > 0:
+            delay = (record["ts"] - first_ts) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        async with semaphore:
+            if speed > 0:
+                lag.append(max(time.perf_counter() - started - (record["ts"] - first_ts) / speed, 0))
+            url = base + record["path"] + (f"?{record['query']}" if record.get("query") else "")
+            start = time.perf_counter()
+            try:
+                async with session.request(record["method"], url, **builder.build(record)) as resp:
+                    await resp.read()
+                    status = resp.status
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                status = "error"
+            latencies[route].append(time.perf_counter() - start)
+            statuses[route][str(status)] += 1
+            if status != record.get("status"):
+                mismatches[route] += 1
+
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0), timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*[send(session, record, started) for record in records])
+        elapsed = time.perf_counter() - started
+
+    routes = []
+    for route in sorted(latencies):
+        result = {"route": route}
+        result.update(latency_summary(latencies[route], elapsed))
+        result["statuses"] = dict(statuses[route])
+        result["status_mismatches"] = mismatches[route]
+        routes.append(result)
+    overall = latency_summary([v for values in latencies.values() for v in values], elapsed)
+    overall["max_schedule_lag_ms"] = round(max(lag) * 1000, 3) if lag else None
+    return {"elapsed_s": round(elapsed, 3), "overall": overall, "routes": routes}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", type=Path, help="Thư mục capture hoặc một file trace_*.jsonl")
+    parser.add_argument("--speed", type=float, default=1.0, help="Hệ số tốc độ (0 = nhanh nhất có thể)")
+    parser.add_argument("--concurrency", type=int, default=256, help="Số request đồng thời tối đa")
+    parser.add_argument("--limit", type=int, help="Chỉ phát lại N request đầu")
+    parser.add_argument("--storage", type=Path, help="Thư mục storage ban đầu (snapshot)")
+    parser.add_argument("--scale", choices=list(datagen.SCALES), default="1k", help="Dùng datagen nếu không có --storage")
+    parser.add_argument("--synthetic-latency", action="store_true",
+                        help="Groq dùng độ trễ giả lập (--groq-latency-ms) thay cho độ trễ đã ghi")
+    parser.add_argument("--groq-latency-ms", type=float, default=200.0)
+    parser.add_argument("--stub-ocr", action="store_true", help="Không gọi tesseract")
+    parser.add_argument("--tenant-secret", help="TENANT_SECRET cho server phát lại (ký lại token từ user id trong trace)")
+    parser.add_argument("--out", type=Path, help="File JSON kết quả (mặc định in ra stdout)")
+    args = parser.parse_args()
+
+    records = load_trace(args.trace)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        sys.exit(f"Không có request nào trong {args.trace}")
+    blob_dir = (args.trace if args.trace.is_dir() else args.trace.parent) / "blobs"
+
+    exchanges = [exchange for record in records for exchange in record.get("llm", [])]
+    groq_config = fake_groq.FakeGroqConfig(latency_ms=args.groq_latency_ms, tail=0, seed=1,
+                                           recorded=fake_groq.RecordedResponses(exchanges),
+                                           recorded_latency=not args.synthetic_latency)
+    groq_url = fake_groq.start_in_thread(groq_config, free_port())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        if args.storage:
+            shutil.copytree(args.storage, workdir / "storage")
+        else:
+            datagen.generate(workdir / "storage", datagen.SCALES[args.scale])
+
+        port = free_port()
+        extra_env = {"TENANT_SECRET": args.tenant_secret} if args.tenant_secret else None
+        proc = start_server(workdir, port, groq_url, args.stub_ocr, extra_env)
+        try:
+            wait_until_ready(port)
+            result = asyncio.run(replay(f"http://127.0.0.1:{port}", records, RequestBuilder(blob_dir, args.tenant_secret),
+                                        args.speed, args.concurrency))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    report = {
+        "meta": {
+            "kind": "replay",
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "trace": str(args.trace),
+            "requests": len(records),
+            "tenants": len({record.get("user_id") for record in records}),
+            "trace_span_s": round(records[-1]["ts"] - records[0]["ts"], 3),
+            "speed": args.speed,
+            "concurrency": args.concurrency,
+            "storage": str(args.storage) if args.storage else f"datagen {args.scale}",
+            "stub_ocr": args.stub_ocr,
+            "elapsed_s": result["elapsed_s"],
+            "fake_groq": dict(groq_config.stats)
+        },
+        "overall": result["overall"],
+        "routes": result["routes"]
+    }
+    if args.out:
+        write_json(args.out, report)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    for route in result["routes"]:
+        print(f"{route['route']:<50} n={route['count']} p50={route['p50_ms']} p95={route['p95_ms']} "
+              f"p99={route['p99_ms']} mismatches={route['status_mismatches']}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: độ trễ tìm kiếm BM25 (SearchIndex) theo số bản ghi
+
+Build index trực tiếp từ dữ liệu datagen.py (không qua server/storage), sau đó đo
+p50/p95/p99 cho một tập truy vấn có dấu/không dấu. Mặc định văn bản dùng từ vựng
+Zipf (--vocabulary) để độ dài postings giống văn bản thật; --vocabulary 0 dùng
+WORDS phân bố đều của datagen (trường hợp xấu nhất: mỗi từ có trong gần mọi bản ghi).
+Thoát với mã 1 nếu p95 vượt --budget-ms.
+
+Cách chạy:
+    python bench/search_bench.py --records 1000000 --budget-ms 10
+"""
+import argparse
+import json
+import random
+import resource
+import sys
+import time
+
+from common import REPO_ROOT, latency_summary, git_commit
+import datagen
+
+sys.path.insert(0, str(REPO_ROOT))
+from app.services.search_service import SearchIndex
+
+QUERIES = [
+    "uong thuoc", "uống thuốc huyết áp", "que huong", "canh chua cá",
+    "tết nguyên đán", "bac si dan kieng man", "chiến tranh", "co tuong hang xom",
+    "tái khám bệnh viện thứ hai", "đám cưới"
+]
+
+def build(records: int, seed: int, vocabulary: int) -> SearchIndex:
+    """Chia đều số bản ghi cho nhật ký, ghi chú, ký ức"""
+    index = SearchIndex()
+    per_kind = records // 3
+    gen = datagen.Generator(per_kind, seed, vocabulary=vocabulary)
+    for kind, factory in (("diary", gen.diaries), ("note", gen.notes), ("memory", gen.memories)):
+        for record in factory():
+            index.add(kind, record)
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100_000, help="Tổng số bản ghi được index")
+    parser.add_argument("--queries", type=int, default=200, help="Số lần truy vấn")
+    parser.add_argument("--budget-ms", type=float, default=10.0)
+    parser.add_argument("--vocabulary", type=int, default=4000, help="Số âm tiết Zipf (0 = WORDS phân bố đều)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = build(args.records, args.seed, args.vocabulary)
+    build_s = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    index.search(QUERIES[0])  # nạp numpy
+    latencies = []
+    per_query = {}
+    start = time.perf_counter()
+    for _ in range(args.queries):
+        query = rng.choice(QUERIES)
+        t0 = time.perf_counter()
+        total, _ = index.search(query, limit=10)
+        latencies.append(time.perf_counter() - t0)
+        per_query[query] = total
+    summary = latency_summary(latencies, time.perf_counter() - start)
+    summary.pop("histogram")
+
+    postings = sum(len(docs) for docs, _ in index.postings.values())
+    result = {
+        "commit": git_commit(),
+        "records": index.live_docs,
+        "vocabulary": args.vocabulary,
+        "terms": len(index.postings),
+        "postings": postings,
+        "build_s": round(build_s, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "matches_per_query": per_query,
+        "budget_ms": args.budget_ms,
+        **summary,
+        "ok": summary["p95_ms"] <= args.budget_ms
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(0 if result["ok"] else 1)
+
+if __name__ == "__main__":
+    main()
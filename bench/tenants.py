@@ -0,0 +1,194 @@
+"""
+Benchmark: bộ nhớ và latency khi một process phục vụ nhiều tenant (mặc định 10k người dùng)
+
+Các bước:
+1. Sinh dữ liệu cho --tenants tenant (datagen.py, --records bản ghi mỗi collection) trong storage/tenants/
+2. Chạy server thật (1 worker) trong process con với TENANT_CACHE_SIZE = --cache-size
+3. Lượt "sweep": mỗi tenant 2 request đọc (/search, /memories?tag=, /diaries) - tenant nguội, build index từ file
+4. Lượt "zipf": --requests request, tenant chọn theo phân bố Zipf (ít gia đình dùng nhiều,
+   đa số thỉnh thoảng mới mở app), có --write-ratio request ghi /memory
+5. Đo RSS của server (VmRSS, đỉnh VmHWM) sau khởi động và sau mỗi lượt, số tenant đang nạp (/metrics)
+
+Thoát với mã 1 nếu RSS đỉnh vượt --rss-budget-mb hoặc p99 lượt zipf vượt --budget-ms.
+
+Cách chạy:
+    python bench/tenants.py --tenants 10000 --records 20 --requests 20000 --out tenants.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from common import REPO_ROOT, free_port, git_commit, latency_summary, wait_until_ready, write_json
+import datagen
+
+sys.path.insert(0, str(REPO_ROOT))
+from app.tenancy import tenant_dir
+
+QUERIES = ["uống thuốc", "que huong", "bác sĩ", "tết nguyên đán", "canh chua", "cháu về thăm"]
+
+def tenant_id(i: int) -> str:
+    return f"family_{i:05d}"
+
+def seed_tenants(workdir: Path, tenants: int, records: int) -> float:
+    """Dữ liệu riêng cho từng tenant (seed khác nhau), trả về số giây đã sinh"""
+    start = time.perf_counter()
+    for i in range(tenants):
+        datagen.generate(workdir / tenant_dir(tenant_id(i)), records, seed=i)
+    return time.perf_counter() - start
+
+def rss_mb(pid: int) -> Dict[str, Optional[float]]:
+    """RSS hiện tại và đỉnh (MB) của process, đọc từ /proc (chỉ Linux)"""
+    values: Dict[str, Optional[float]] = {"rss_mb": None, "peak_rss_mb": None}
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    values["rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+                elif line.startswith("VmHWM:"):
+                    values["peak_rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return values
+
+async def tenant_metrics(session, base: str) -> Dict[str, float]:
+    """Các metric tenant_cache_* của server"""
+    async with session.get(f"{base}/metrics") as resp:
+        text = await resp.text()
+    return {
+        line.split(" ")[0]: float(line.split(" ")[1])
+        for line in text.splitlines() if line.startswith("tenant_cache_")
+    }
+
+async def drive(base: str, plan: List[int], concurrency: int, write_ratio: float, seed: int) -> Dict:
+    """Bắn lần lượt các request trong plan (chỉ số tenant) với concurrency worker"""
+    import aiohttp
+
+    latencies = []
+    statuses: Dict[int, int] = {}
+    cursor = iter(plan)
+
+    async def worker(session, worker_seed):
+        rng = random.Random(worker_seed)
+        for i in cursor:
+            headers = {"X-User-Id": tenant_id(i)}
+            roll = rng.random()
+            start = time.perf_counter()
+            try:
+                if roll < write_ratio:
+                    request = session.post(f"{base}/memory", data={"content": "bench", "tags": "bench"}, headers=headers)
+                elif roll < 0.5:
+                    request = session.get(f"{base}/search", params={"q": rng.choice(QUERIES)}, headers=headers)
+                elif roll < 0.8:
+                    request = session.get(f"{base}/memories", params={"tag": rng.choice(datagen.TAGS)}, headers=headers)
+                else:
+                    request = session.get(f"{base}/diaries", params={"limit": 10}, headers=headers)
+                async with request as resp:
+                    await resp.read()
+                    status = resp.status
+            except aiohttp.ClientError:
+                status = 0
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*[worker(session, seed + w) for w in range(concurrency)])
+    summary = latency_summary(latencies, time.perf_counter() - start)
+    summary["statuses"] = statuses
+    return summary
+
+async def run_phases(port: int, pid: int, args) -> Dict:
+    import aiohttp
+
+    base = f"http://127.0.0.1:{port}"
+    rng = random.Random(args.seed)
+    phases = {}
+    async with aiohttp.ClientSession() as session:
+        await asyncio.sleep(args.warmup_wait)  # Chờ warm-up nền của server xong
+        phases["startup"] = {**rss_mb(pid), "tenant_cache": await tenant_metrics(session, base)}
+
+        # Sweep: mọi tenant đều nguội, không ghi
+        sweep = list(range(args.tenants)) * 2
+        rng.shuffle(sweep)
+        result = await drive(base, sweep, args.concurrency, 0.0, args.seed)
+        phases["sweep"] = {**result, **rss_mb(pid), "tenant_cache": await tenant_metrics(session, base)}
+
+        # Zipf: hạng r có trọng số 1 / r^s, thứ tự hạng ngẫu nhiên so với id tenant
+        ranks = list(range(args.tenants))
+        rng.shuffle(ranks)
+        weights = [1 / (r + 1) ** args.zipf for r in range(args.tenants)]
+        plan = rng.choices(ranks, weights=weights, k=args.requests)
+        result = await drive(base, plan, args.concurrency, args.write_ratio, args.seed + 1000)
+        result["distinct_tenants"] = len(set(plan))
+        phases["zipf"] = {**result, **rss_mb(pid), "tenant_cache": await tenant_metrics(session, base)}
+    return phases
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=10_000)
+    parser.add_argument("--records", type=int, default=20, help="Số bản ghi mỗi collection của một tenant")
+    parser.add_argument("--requests", type=int, default=20_000, help="Số request lượt zipf")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Số mũ Zipf khi chọn tenant")
+    parser.add_argument("--write-ratio", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--cache-size", type=int, default=256, help="TENANT_CACHE_SIZE của server")
+    parser.add_argument("--warmup-wait", type=float, default=2.0)
+    parser.add_argument("--rss-budget-mb", type=float, default=512.0)
+    parser.add_argument("--budget-ms", type=float, default=250.0, help="p99 tối đa của lượt zipf (gồm thời gian chờ trong hàng đợi, 1 worker)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, help="File JSON kết quả (mặc định in ra stdout)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        generate_s = seed_tenants(workdir, args.tenants, args.records)
+        print(f"Đã sinh dữ liệu {args.tenants} tenant sau {generate_s:.1f}s", file=sys.stderr)
+
+        port = free_port()
+        env = dict(os.environ, PYTHONPATH=str(REPO_ROOT), GROQ_API_KEY="", NGROK_TOKEN="",
+                   PROFILE_SAMPLE_RATE="0", REMINDER_SCHEDULER="1", TENANT_CACHE_SIZE=str(args.cache_size))
+        code = f"from app.server import start_server; start_server(port={port}, ngrok_token=None, workers=1)"
+        proc = subprocess.Popen([sys.executable, "-c", code], cwd=workdir, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_ready(port)
+            phases = asyncio.run(run_phases(port, proc.pid, args))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    peak = phases["zipf"]["peak_rss_mb"]
+    p99 = phases["zipf"]["p99_ms"]
+    report = {
+        "meta": {
+            "kind": "tenants",
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "tenants": args.tenants,
+            "records_per_collection": args.records,
+            "cache_size": args.cache_size,
+            "concurrency": args.concurrency,
+            "zipf": args.zipf,
+            "generate_s": round(generate_s, 1)
+        },
+        "phases": phases,
+        "ok": (peak is None or peak <= args.rss_budget_mb) and p99 is not None and p99 <= args.budget_ms
+    }
+    if args.out:
+        write_json(args.out, report)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    sys.exit(0 if report["ok"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark: Peak RSS khi nhận N upload lớn đồng thời
+
+So sánh hai đường xử lý /entry:
+- before: đọc toàn bộ file vào RAM + giữ thêm bản base64 (cách cũ)
+- after:  UploadService nhận theo chunk, spool ra đĩa, OCR đọc trực tiếp từ spool
+
+Mỗi chế độ chạy trong một server uvicorn riêng để đo VmHWM (peak RSS) độc lập.
+OCR được thay bằng hàm chỉ mở ảnh (Pillow lazy) để không cần cài tesseract;
+dùng --real-ocr để chạy tesseract thật.
+
+Cách chạy:
+    python bench/upload_memory.py --concurrency 8 --size-mb 20
+"""
+import argparse
+import asyncio
+import base64
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import REPO_ROOT, free_port, wait_until_ready
+
+def read_proc_status(pid: int, field: str) -> int:
+    """Đọc một trường (kB) trong /proc/<pid>/status, trả về bytes"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def make_image(path: Path, size_mb: int):
+    """Tạo ảnh BMP không nén có dung lượng xấp xỉ size_mb"""
+    from PIL import Image
+    side = int((size_mb * 1024 * 1024 / 3) ** 0.5)
+    Image.new("RGB", (side, side), (200, 180, 160)).save(path, format="BMP")
+
+# ========== SERVER (chạy trong process con) ==========
+
+def serve(mode: str, port: int, real_ocr: bool):
+    sys.path.insert(0, str(REPO_ROOT))
+
+    import uvicorn
+    import pytesseract
+    from fastapi import File, UploadFile, Form
+    from app.app import create_app
+    from app.database import StorageManager
+    from app.services.ocr_service import OCRService
+
+    if not real_ocr:
+        pytesseract.image_to_string = lambda image, lang=None, **kwargs: f"bench {image.size[0]}x{image.size[1]}"
+
+    app = create_app()
+
+    if mode == "before":
+        # Tái hiện đường xử lý cũ: file.read() + base64
+        async def legacy_entry(file: UploadFile = File(...), entry_type: str = Form(...)):
+            contents = await file.read()
+            extracted_text = await OCRService.extract_text_from_image(contents)
+            image_base64 = base64.b64encode(contents).decode('utf-8')
+            StorageManager.save_diary({
+                "id": f"diary_{time.time_ns()}",
+                "content": extracted_text,
+                "image_base64": image_base64,
+                "entry_type": "diary",
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+            })
+            return {"success": True}
+
+        app.router.routes = [r for r in app.router.routes if getattr(r, "path", None) != "/entry"]
+        app.post("/entry")(legacy_entry)
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+# ========== DRIVER ==========
+
+async def fire_uploads(port: int, image_path: Path, concurrency: int) -> float:
+    import aiohttp
+
+    async def one(session):
+        data = aiohttp.FormData()
+        data.add_field("entry_type", "diary")
+        data.add_field("auto_analyze", "false")
+        data.add_field("file", open(image_path, "rb"), filename="bench.bmp", content_type="image/bmp")
+        async with session.post(f"http://127.0.0.1:{port}/entry", data=data) as resp:
+            await resp.read()
+            return resp.status
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=600)) as session:
+        statuses = await asyncio.gather(*[one(session) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    failed = [s for s in statuses if s != 200]
+    if failed:
+        raise RuntimeError(f"{len(failed)} request lỗi: {failed[:5]}")
+    return elapsed
+
+def run_mode(mode: str, image_path: Path, concurrency: int, real_ocr: bool) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        cmd = [sys.executable, str(Path(__file__).resolve()), "--serve", mode, "--port", str(port)]
+        if real_ocr:
+            cmd.append("--real-ocr")
+        proc = subprocess.Popen(cmd, cwd=workdir)
+        try:
+            wait_until_ready(port)
+            rss_idle = read_proc_status(proc.pid, "VmRSS")
+            elapsed = asyncio.run(fire_uploads(port, image_path, concurrency))
+            peak = read_proc_status(proc.pid, "VmHWM")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "upload_bytes": image_path.stat().st_size,
+        "rss_idle_mb": round(rss_idle / 2**20, 1),
+        "rss_peak_mb": round(peak / 2**20, 1),
+        "rss_growth_mb": round((peak - rss_idle) / 2**20, 1),
+        "elapsed_s": round(elapsed, 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=15)
+    parser.add_argument("--mode", choices=["before", "after", "both"], default="both")
+    parser.add_argument("--real-ocr", action="store_true")
+    parser.add_argument("--serve", choices=["before", "after"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.real_ocr)
+        return
+
+    modes = ["before", "after"] if args.mode == "both" else [args.mode]
+    with tempfile.TemporaryDirectory() as tmp:
+        image_path = Path(tmp) / "bench.bmp"
+        make_image(image_path, args.size_mb)
+        for mode in modes:
+            print(json.dumps(run_mode(mode, image_path, args.concurrency, args.real_ocr)))
+
+if __name__ == "__main__":
+    main()
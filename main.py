@@ -4,17 +4,18 @@ Memory & Diary OCR API - Main Entry Point
 import os
 from dotenv import load_dotenv
 from app.server import start_server
+from app.config import SERVER_PORT, SERVER_WORKERS
 
 # Load environment variables
 load_dotenv()
 
 if __name__ == "__main__":
     NGROK_TOKEN = os.getenv("NGROK_TOKEN", "")
-    
+
     if not NGROK_TOKEN:
         print("\n⚠️  CẢNH BÁO: Chưa cấu hình NGROK_TOKEN trong file .env!")
         print("📝 Lấy token tại: https://dashboard.ngrok.com/get-started/your-authtoken")
         print("🔧 Server sẽ chạy mà không có Ngrok public URL.\n")
-        start_server(port=8000, ngrok_token=None)
+        start_server(port=SERVER_PORT, ngrok_token=None, workers=SERVER_WORKERS)
     else:
-        start_server(port=8000, ngrok_token=NGROK_TOKEN)
\ No newline at end of file
+        start_server(port=SERVER_PORT, ngrok_token=NGROK_TOKEN, workers=SERVER_WORKERS)
@@ -0,0 +1,45 @@
+"""HedgePolicy: bản không được dùng vẫn được báo qua on_loser (để ghi sổ lời gọi Groq)"""
+import asyncio
+
+from app.services.hedging import HedgePolicy
+
+def policy() -> HedgePolicy:
+    hedge = HedgePolicy(enabled=True, percentile=0.5, budget=1.0, min_samples=1)
+    for _ in range(10):
+        hedge.histogram("task/model").observe(0.01)  # Ngưỡng hedge = GROQ_HEDGE_MIN_DELAY
+    hedge._tokens = 5.0
+    return hedge
+
+def run(hedge: HedgePolicy, delays):
+    """Lần gửi thứ i chờ delays[i] giây rồi trả ("200", i); trả (kết quả, các lần gọi on_loser)"""
+    losers = []
+    sent = iter(range(len(delays)))
+
+    async def send():
+        index = next(sent)
+        await asyncio.sleep(delays[index])
+        return ("200", index)
+
+    result = asyncio.run(hedge.run(
+        "task/model", send, lambda result: result[0] == "200", lambda: True,
+        lambda result, seconds: losers.append((result, seconds))
+    ))
+    return result, losers
+
+def test_cancelled_primary_reported():
+    result, losers = run(policy(), [5.0, 0.0])
+    assert result == ("200", 1)
+    assert len(losers) == 1
+    assert losers[0][0] is None and losers[0][1] > 0
+
+def test_cancelled_hedge_reported():
+    hedge = policy()
+    delay = hedge.delay("task/model")
+    result, losers = run(hedge, [delay + 0.05, 5.0])
+    assert result == ("200", 0)
+    assert [loser[0] for loser in losers] == [None]
+
+def test_no_hedge_no_loser():
+    result, losers = run(HedgePolicy(enabled=False), [0.0])
+    assert result == ("200", 0)
+    assert losers == []
@@ -0,0 +1,81 @@
+"""IdempotencyMiddleware: request trùng đang chờ giữ body trong file spool, chạy lại thì app nhận đủ body"""
+import asyncio
+import os
+
+from app.config import UPLOAD_SPOOL_THRESHOLD
+from app.idempotency import BufferedBody, IdempotencyMiddleware
+
+BODY = os.urandom(UPLOAD_SPOOL_THRESHOLD * 3 + 123)
+CHUNK = 100_000
+
+def request(body: bytes):
+    """receive() gửi body theo từng chunk CHUNK byte"""
+    chunks = [body[i:i + CHUNK] for i in range(0, len(body), CHUNK)]
+
+    async def receive():
+        if chunks:
+            chunk = chunks.pop(0)
+            return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+        await asyncio.sleep(3600)
+
+    return receive
+
+def test_buffered_body_spools_and_replays():
+    async def scenario():
+        body = BufferedBody()
+        for i in range(0, len(BODY), CHUNK):
+            await body.write(BODY[i:i + CHUNK])
+        assert getattr(body.file, "_rolled")  # Quá UPLOAD_SPOOL_THRESHOLD: đã nằm trên đĩa
+        received = b""
+        while True:
+            message = await body.next_message()
+            received += message["body"]
+            if not message["more_body"]:
+                break
+        body.close()
+        return received
+
+    assert asyncio.run(scenario()) == BODY
+
+def test_waiting_retry_reexecutes_with_full_body(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    received = []
+
+    async def app(scope, receive, send):
+        data = b""
+        while True:
+            message = await receive()
+            data += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        received.append(data)
+        if len(received) == 1:
+            await asyncio.sleep(0.2)  # Request trùng đến khi lần đầu còn chạy
+            status = 503  # Lỗi tạm thời: không lưu, request trùng được chạy lại
+        else:
+            status = 200
+        await send({"type": "http.response.start", "status": status, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    middleware = IdempotencyMiddleware(app)
+    scope = {
+        "type": "http", "method": "POST", "path": "/entry",
+        "headers": [(b"idempotency-key", b"k-1"), (b"content-type", b"application/octet-stream")]
+    }
+
+    async def call(delay: float):
+        await asyncio.sleep(delay)
+        statuses = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        await middleware(scope, request(BODY), send)
+        return statuses[0]
+
+    async def scenario():
+        return await asyncio.gather(call(0), call(0.05))
+
+    assert asyncio.run(scenario()) == [503, 200]
+    assert received == [BODY, BODY]
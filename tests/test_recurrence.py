@@ -0,0 +1,69 @@
+"""Sinh lần nhắc của chuỗi lặp (app/services/recurrence.py)"""
+from datetime import datetime
+from itertools import islice
+
+from app.services import recurrence
+
+def make_series(remind_at: str, rule: dict) -> dict:
+    start = datetime.fromisoformat(remind_at)
+    return {"id": "series_t", "remind_at": remind_at, "recurrence": recurrence.validate_rule(rule, start)}
+
+def keys(moments) -> list:
+    return [recurrence.occurrence_key(m) for m in moments]
+
+def test_weekly_dtstart_mid_week_skips_earlier_slots():
+    # Thứ 4 09:00, luật Thứ 2-4-6 lúc 08:00: Thứ 2 và Thứ 4 tuần đầu nằm trước dtstart
+    series = make_series("2024-05-01T09:00", {"freq": "weekly", "weekdays": [0, 2, 4], "times": ["08:00"]})
+    assert keys(islice(recurrence.iter_occurrences(series), 3)) == [
+        "2024-05-03T08:00", "2024-05-06T08:00", "2024-05-08T08:00"
+    ]
+
+def test_count_does_not_include_skipped_slots():
+    series = make_series("2024-05-01T09:00", {"freq": "weekly", "weekdays": [0, 2, 4], "times": ["08:00"], "count": 3})
+    assert keys(recurrence.iter_occurrences(series)) == ["2024-05-03T08:00", "2024-05-06T08:00", "2024-05-08T08:00"]
+
+def test_count_applies_when_starting_mid_series():
+    series = make_series("2024-05-01T08:00", {"freq": "daily", "times": ["08:00", "20:00"], "count": 5})
+    assert keys(recurrence.iter_occurrences(series, datetime(2024, 5, 2, 12, 0))) == [
+        "2024-05-02T20:00", "2024-05-03T08:00"
+    ]
+
+def test_date_only_until_includes_whole_day():
+    series = make_series("2024-05-01T08:00", {"freq": "daily", "times": ["08:00", "20:00"], "until": "2024-05-02"})
+    assert keys(recurrence.iter_occurrences(series)) == [
+        "2024-05-01T08:00", "2024-05-01T20:00", "2024-05-02T08:00", "2024-05-02T20:00"
+    ]
+
+def test_datetime_until_is_exact():
+    series = make_series("2024-05-01T08:00", {"freq": "daily", "times": ["08:00", "20:00"], "until": "2024-05-02T08:00"})
+    assert keys(recurrence.iter_occurrences(series))[-1] == "2024-05-02T08:00"
+
+def test_start_far_after_dtstart_jumps_to_period():
+    series = make_series("2020-01-01T07:30", {"freq": "hourly", "interval": 3})
+    assert keys(islice(recurrence.iter_occurrences(series, datetime(2024, 5, 1, 12, 0)), 2)) == [
+        "2024-05-01T13:30", "2024-05-01T16:30"
+    ]
+
+def test_expand_is_half_open():
+    series = make_series("2024-05-01T08:00", {"freq": "daily", "times": ["08:00"]})
+    records = recurrence.expand(series, datetime(2024, 5, 2, 8, 0), datetime(2024, 5, 4, 8, 0))
+    assert [r["id"] for r in records] == ["series_t@2024-05-02T08:00", "series_t@2024-05-03T08:00"]
+
+def test_mark_occurrence_collapses_into_completed_through():
+    series = make_series("2024-05-01T08:00", {"freq": "daily", "times": ["08:00"]})
+    # Hoàn thành vượt trước: giữ trong exceptions
+    recurrence.mark_occurrence(series, datetime(2024, 5, 2, 8, 0), {"completed": True})
+    assert "completed_through" not in series
+    assert list(series["exceptions"]) == ["2024-05-02T08:00"]
+    # Lấp chỗ trống: cả hai gộp vào completed_through
+    recurrence.mark_occurrence(series, datetime(2024, 5, 1, 8, 0), {"completed": True})
+    assert series["completed_through"] == "2024-05-02T08:00"
+    assert series["exceptions"] == {}
+    assert recurrence.is_done(series, datetime(2024, 5, 1, 8, 0))
+    assert not recurrence.is_done(series, datetime(2024, 5, 3, 8, 0))
+
+def test_mark_occurrence_keeps_snoozes():
+    series = make_series("2024-05-01T08:00", {"freq": "daily", "times": ["08:00"]})
+    recurrence.mark_occurrence(series, datetime(2024, 5, 1, 8, 0), {"snoozed_until": "2024-05-01T08:10"})
+    assert "completed_through" not in series
+    assert series["exceptions"]["2024-05-01T08:00"] == {"snoozed_until": "2024-05-01T08:10"}
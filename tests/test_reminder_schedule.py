@@ -0,0 +1,72 @@
+"""Lịch đẩy nhắc nhở trong process (ReminderSchedule): mỗi lần nhắc chỉ được đẩy một lần"""
+import time
+from datetime import datetime, timedelta
+
+from app.services import recurrence
+from app.services.reminder_service import ReminderSchedule
+
+def hourly_series(first: datetime) -> dict:
+    return {
+        "id": "series_a",
+        "title": "Uống thuốc",
+        "remind_at": first.isoformat(timespec="minutes"),
+        "recurrence": recurrence.validate_rule({"freq": "hourly"}, first),
+        "is_completed": False
+    }
+
+def floor_minute(moment: datetime) -> datetime:
+    return moment.replace(second=0, microsecond=0)
+
+def test_single_reminder_fires_once():
+    schedule = ReminderSchedule()
+    due = floor_minute(datetime.now()) - timedelta(minutes=5)
+    reminder = {"id": "r1", "title": "Đi khám", "remind_at": due.isoformat(), "is_completed": False}
+    schedule.reconcile("reminder", [reminder])
+    assert [payload["id"] for payload, _ in schedule.pop_due(time.time())] == ["r1"]
+    schedule.reconcile("reminder", [reminder])
+    schedule.add("reminder", reminder)
+    assert schedule.pop_due(time.time()) == []
+
+def test_series_fired_occurrence_not_refired_after_reconcile():
+    schedule = ReminderSchedule()
+    now = datetime.now()
+    # Các lần: -150, -90, -30, +30 phút; -30 phút nằm trong REMINDER_MISSED_GRACE_SECONDS nên được đẩy
+    series = hourly_series(floor_minute(now) - timedelta(minutes=150))
+    schedule.reconcile("reminder", [series])
+
+    fired = schedule.pop_due(now.timestamp())
+    assert len(fired) == 1
+    assert fired[0][1] == (floor_minute(now) - timedelta(minutes=30)).timestamp()
+
+    # Ghi khác vào reminders.json (vd. một ghi chú mới) -> reconcile lại cùng chuỗi
+    schedule.reconcile("reminder", [series])
+    schedule.reconcile("reminder", [series])
+    schedule.add("reminder", series)
+    assert schedule.pop_due(now.timestamp()) == []
+    assert schedule.next_due() == (floor_minute(now) + timedelta(minutes=30)).timestamp()
+
+def test_series_schedules_next_occurrence_after_firing():
+    schedule = ReminderSchedule()
+    now = datetime.now()
+    series = hourly_series(floor_minute(now) - timedelta(minutes=30))
+    schedule.reconcile("reminder", [series])
+    assert len(schedule.pop_due(now.timestamp())) == 1
+
+    later = now + timedelta(minutes=31)
+    schedule.reconcile("reminder", [series])
+    fired = schedule.pop_due(later.timestamp())
+    assert [payload["id"] for payload, _ in fired] == [
+        recurrence.occurrence_id("series_a", floor_minute(now) + timedelta(minutes=30))
+    ]
+    schedule.reconcile("reminder", [series])
+    assert schedule.pop_due(later.timestamp()) == []
+
+def test_removed_series_forgets_last_fired():
+    schedule = ReminderSchedule()
+    now = datetime.now()
+    series = hourly_series(floor_minute(now) - timedelta(minutes=30))
+    schedule.reconcile("reminder", [series])
+    schedule.pop_due(now.timestamp())
+    schedule.reconcile("reminder", [])
+    assert schedule.last_fired == {}
+    assert schedule.next_due() is None
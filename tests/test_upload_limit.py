@@ -0,0 +1,74 @@
+"""UploadLimitMiddleware: upload chunked (không Content-Length) quá lớn bị từ chối 413 ngay trên luồng nhận"""
+import asyncio
+import json
+
+from fastapi import FastAPI, File, UploadFile
+
+from app.services.upload_service import UploadLimitMiddleware, UploadService
+
+LIMIT = 256 * 1024
+CHUNK = 16 * 1024
+BOUNDARY = b"xyz123"
+
+def multipart(size: int) -> bytes:
+    return (
+        b"--" + BOUNDARY + b"\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="a.png"\r\n'
+        b"Content-Type: image/png\r\n\r\n" + b"\x01" * size + b"\r\n--" + BOUNDARY + b"--\r\n"
+    )
+
+def make_app():
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        with await UploadService.receive(file, max_bytes=LIMIT) as received:
+            return {"size": received.size, "sha256": received.sha256}
+
+    return UploadLimitMiddleware(app, max_bytes=LIMIT + 1024)
+
+def call(app, body: bytes, content_length: bool = False):
+    """Gửi body theo từng chunk; trả (status, JSON, số byte app đã đọc)"""
+    chunks = [body[i:i + CHUNK] for i in range(0, len(body), CHUNK)]
+    headers = [(b"content-type", b"multipart/form-data; boundary=" + BOUNDARY)]
+    if content_length:
+        headers.append((b"content-length", str(len(body)).encode()))
+    scope = {"type": "http", "method": "POST", "path": "/upload", "raw_path": b"/upload", "query_string": b"",
+             "headers": headers, "http_version": "1.1", "scheme": "http", "server": ("test", 80), "root_path": ""}
+    sent = 0
+    response = {"body": b""}
+
+    async def receive():
+        nonlocal sent
+        if chunks:
+            chunk = chunks.pop(0)
+            sent += len(chunk)
+            return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        else:
+            response["body"] += message.get("body", b"")
+
+    asyncio.run(app(scope, receive, send))
+    return response["status"], json.loads(response["body"]), sent
+
+def test_small_chunked_upload_accepted():
+    status, data, _ = call(make_app(), multipart(100_000))
+    assert status == 200 and data["size"] == 100_000
+
+def test_chunked_upload_over_limit_stops_early():
+    body = multipart(LIMIT * 8)
+    status, data, sent = call(make_app(), body)
+    assert status == 413 and "MB" in data["detail"]
+    assert sent <= LIMIT + 1024 + CHUNK  # Không đọc tiếp phần còn lại của body
+
+def test_content_length_over_limit_rejected_before_reading():
+    status, _, sent = call(make_app(), multipart(LIMIT * 2), content_length=True)
+    assert status == 413 and sent == 0
+
+def test_file_over_limit_within_form_overhead():
+    status, _, _ = call(make_app(), multipart(LIMIT + 100))
+    assert status == 413